@@ -19,6 +19,214 @@ cum_meta_analysis_ref = 'Cumulative Meta-Analysis: Lau, Joseph, et al. "Cumulati
 subgroup_ma_ref = "Subgroup Meta-Analysis: subgroup ma reference placeholder"
 loo_ma_ref = "Leave-one-out Meta-Analysis: LOO ma reference placeholder"
 
+##################################
+#  closed-form meta methods      #
+##################################
+# For inverse-variance fixed effect and DerSimonian-Laird random effects
+# (the models fit by rma.uni for these methods), the summary of any subset
+# of the studies follows from the sums of the weights, the squared weights,
+# the weighted effects and the weighted squared effects over the subset.
+# Cumulative MA takes these as running sums and leave-one-out MA as the
+# totals minus each study's contribution, so there is no need to refit the
+# model (and build a new data object) for each subset.
+closed.form.methods <- list(binary.fixed.inv.var="FE", binary.random="DL",
+                            continuous.fixed="FE", continuous.random="DL")
+
+closed.form.model <- function(fname, om.data, params, min.studies=2) {
+    # the model ("FE" or "DL") if the meta method results for fname can be
+    # computed in closed form, NULL otherwise
+    model <- closed.form.methods[[fname]]
+    if (is.null(model))
+        return(NULL)
+    if (model == "DL" && !identical(as.character(params$rm.method), "DL"))
+        return(NULL)
+    n <- length(om.data@study.names)
+    y <- om.data@y
+    SE <- om.data@SE
+    # (otherwise the base methods compute the effects from the raw data)
+    if (n < min.studies || length(y) != n || length(SE) != n || any(is.na(y)) || any(is.na(SE)) || any(SE <= 0))
+        return(NULL)
+    model
+}
+
+closed.form.stats <- function(model, k, sum.w, sum.w2, sum.wy, qe.sums, re.sums, conf.level) {
+    # The summaries of a number of subsets of k studies each, given the sums
+    # over each subset (vectors, with one entry per subset). qe.sums(b.fe)
+    # returns Q = sum w (y - b.fe)^2 over each subset, given its fixed-effect
+    # estimate; this takes a second pass over the studies, as the expanded
+    # form sum w y^2 - b.fe^2 sum w cancels badly when y is large relative
+    # to its spread. re.sums(tau2) returns the sums of the random-effects
+    # weights 1/(v + tau2) and of the weighted effects over each subset, as
+    # the rows of a matrix.
+    # note: conf.level is given as, e.g., 95, rather than .95.
+    alpha <- 1.0-(conf.level/100.0)
+    mult <- abs(qnorm(alpha/2.0))
+    b.fe <- sum.wy/sum.w
+    QE <- qe.sums(b.fe)
+    QEp <- pchisq(QE, df=k-1, lower.tail=FALSE)
+    trP <- sum.w - sum.w2/sum.w
+    if (model == "FE") {
+        tau2 <- rep(0, length(k))
+        b <- b.fe
+        se <- sqrt(1/sum.w)
+    } else {
+        tau2 <- pmax(0, (QE - (k-1))/trP)
+        sums <- re.sums(tau2)
+        b <- sums[2,]/sums[1,]
+        se <- sqrt(1/sums[1,])
+    }
+    zval <- b/se
+    # I^2 and H^2 relative to the `typical' within-study variance, as rma.uni
+    vt <- (k-1)/trP
+    list(b=b, se=se, zval=zval, pval=2*pnorm(abs(zval), lower.tail=FALSE),
+         ci.lb=b - mult*se, ci.ub=b + mult*se, tau2=tau2, k=k, QE=QE, QEp=QEp,
+         I2=100*tau2/(vt + tau2), H2=tau2/vt + 1)
+}
+
+closed.form.result <- function(stats, i) {
+    # the ith subset's summary, as the .overall methods return it
+    res <- lapply(stats, function(values) values[[i]])
+    res$b <- c(res$b)
+    res
+}
+
+cum.ma.closed.form <- function(fname, om.data, params) {
+    # Returns the list of cumulative results (studies 1 through i, for each
+    # i), as the loop in cum.ma.binary/cum.ma.continuous would build it, or
+    # NULL if fname isn't one of closed.form.methods.
+    model <- closed.form.model(fname, om.data, params)
+    if (is.null(model))
+        return(NULL)
+    y <- om.data@y
+    v <- om.data@SE^2
+    w <- 1/v
+    k <- seq_along(y)
+    qe.sums <- function(b.fe) {
+        # the weighted Welford update: adding study i to the prefix adds
+        # w[i]*(y[i] - b.fe[i-1])*(y[i] - b.fe[i]) to Q, with no
+        # cancellation between large sums (the first term is 0)
+        b.prev <- c(b.fe[1], b.fe[-length(b.fe)])
+        cumsum(w*(y - b.prev)*(y - b.fe))
+    }
+    re.sums <- function(tau2) {
+        # the random-effects weights depend on each prefix's tau^2
+        vapply(k, function(i) {
+            w.re <- 1/(v[1:i] + tau2[i])
+            c(sum(w.re), sum(w.re*y[1:i]))
+        }, numeric(2))
+    }
+    stats <- closed.form.stats(model, k, cumsum(w), cumsum(w^2), cumsum(w*y),
+                               qe.sums, re.sums, params$conf.level)
+
+    cum.results <- array(list(NULL), dim=c(length(y)))
+    # a single study is summarized as in get.res.for.one.binary.study
+    # (for one study, tau^2 is 0/0)
+    alpha <- 1.0-(params$conf.level/100.0)
+    mult <- abs(qnorm(alpha/2.0))
+    se.1 <- om.data@SE[1]
+    cum.results[[1]] <- list("b"=c(y[1]), "ci.lb"=y[1] - mult*se.1, "ci.ub"=y[1] + mult*se.1, "se"=se.1)
+    for (i in k[-1]) {
+        cum.results[[i]] <- closed.form.result(stats, i)
+    }
+    cum.results
+}
+
+loo.ma.closed.form <- function(fname, om.data, params) {
+    # Returns the list of leave-one-out results (all of the studies but the
+    # ith, for each i), as the loop in loo.ma.binary/loo.ma.continuous
+    # would build it, or NULL if fname isn't one of closed.form.methods.
+    # (with two studies, each subset is a single study; the loop handles that)
+    model <- closed.form.model(fname, om.data, params, min.studies=3)
+    if (is.null(model))
+        return(NULL)
+    y <- om.data@y
+    v <- om.data@SE^2
+    w <- 1/v
+    k <- rep(length(y) - 1, length(y))
+    qe.sums <- function(b.fe) {
+        # leaving out study i takes w[i]*d[i]^2*W/(W - w[i]) from the Q
+        # of all of the studies, where d is the deviation from their
+        # estimate (b.fe is that of each subset, so isn't needed)
+        W <- sum(w)
+        d <- y - sum(w*y)/W
+        sum(w*d^2) - w*d^2 - (w*d)^2/(W - w)
+    }
+    re.sums <- function(tau2) {
+        # the random-effects weights depend on each subset's tau^2, so
+        # this takes one pass over the studies per distinct tau^2; the
+        # left-out study's terms are then subtracted from the sums over
+        # all of them. Only when the data are homogeneous enough that
+        # tau^2 is truncated at 0 are there few; with heterogeneous data
+        # every tau^2 differs and this is N passes (O(N^2)).
+        tau2.vals <- unique(tau2)
+        sums <- vapply(tau2.vals, function(t) {
+            w.re <- 1/(v + t)
+            c(sum(w.re), sum(w.re*y))
+        }, numeric(2))
+        sums <- sums[, match(tau2, tau2.vals), drop=FALSE]
+        w.out <- 1/(v + tau2)
+        rbind(sums[1,] - w.out, sums[2,] - w.out*y)
+    }
+    stats <- closed.form.stats(model, k, sum(w) - w, sum(w^2) - w^2, sum(w*y) - w*y,
+                               qe.sums, re.sums, params$conf.level)
+
+    loo.results <- array(list(NULL), dim=c(length(y)))
+    for (i in seq_along(y)) {
+        loo.results[[i]] <- closed.form.result(stats, i)
+    }
+    loo.results
+}
+
+subgroup.ma.closed.form <- function(fname, om.data, params, cov.vals, subgroup.list) {
+    # Returns the list of the subgroups' results (in the order of
+    # subgroup.list) followed by the overall result, as subgroup.ma.binary/
+    # subgroup.ma.continuous would build it, or NULL if fname isn't one of
+    # closed.form.methods. The sums are taken over each subgroup, and the
+    # overall sums are theirs.
+    model <- closed.form.model(fname, om.data, params, min.studies=1)
+    if (is.null(model))
+        return(NULL)
+    y <- om.data@y
+    v <- om.data@SE^2
+    w <- 1/v
+    group <- match(cov.vals, subgroup.list)
+    n.groups <- length(subgroup.list)
+    sums <- rowsum(cbind(1, w, w^2, w*y), group, reorder=TRUE)
+    sums <- rbind(sums, colSums(sums))
+    qe.sums <- function(b.fe) {
+        # over the subgroups, then over all of the studies
+        c(rowsum(w*(y - b.fe[group])^2, group, reorder=TRUE),
+          sum(w*(y - b.fe[n.groups + 1])^2))
+    }
+    re.sums <- function(tau2) {
+        # one pass over the studies for the subgroups (each with its own
+        # tau^2) and one for all of them
+        w.re <- 1/(v + tau2[group])
+        w.all <- 1/(v + tau2[n.groups + 1])
+        t(rbind(rowsum(cbind(w.re, w.re*y), group, reorder=TRUE),
+                c(sum(w.all), sum(w.all*y))))
+    }
+    stats <- closed.form.stats(model, sums[,1], sums[,2], sums[,3], sums[,4],
+                               qe.sums, re.sums, params$conf.level)
+
+    subgroup.results <- array(list(NULL), dim=c(n.groups + 1))
+    alpha <- 1.0-(params$conf.level/100.0)
+    mult <- abs(qnorm(alpha/2.0))
+    for (i in 1:(n.groups + 1)) {
+        if (sums[i, 1] == 1) {
+            # a single study is summarized as in get.res.for.one.binary.study
+            # (for one study, tau^2 is 0/0)
+            in.group <- if (i <= n.groups) group == i else TRUE
+            y.1 <- y[in.group]
+            se.1 <- om.data@SE[in.group]
+            subgroup.results[[i]] <- list("b"=c(y.1), "ci.lb"=y.1 - mult*se.1, "ci.ub"=y.1 + mult*se.1, "se"=se.1)
+        } else {
+            subgroup.results[[i]] <- closed.form.result(stats, i)
+        }
+    }
+    subgroup.results
+}
+
 ##################################
 #  binary cumulative MA          #
 ##################################
@@ -37,37 +245,40 @@ cum.ma.binary <- function(fname, binary.data, params){
     plot.data <- create.plot.data.binary(binary.data, params, res.overall)
     # data for standard forest plot
     
-    # iterate over the binaryData elements, adding one study at a time
-    cum.results <- array(list(NULL), dim=c(length(binary.data@study.names)))
+    cum.results <- cum.ma.closed.form(fname, binary.data, params.tmp)
+    # otherwise, iterate over the binaryData elements, adding one study at a time
+    if (is.null(cum.results)) {
+        cum.results <- array(list(NULL), dim=c(length(binary.data@study.names)))
     
-    for (i in 1:length(binary.data@study.names)){
-        # build a BinaryData object including studies
-        # 1 through i
-        y.tmp <- binary.data@y[1:i]
-        SE.tmp <- binary.data@SE[1:i]
-        names.tmp <- binary.data@study.names[1:i]
-        bin.data.tmp <- NULL
-        if (length(binary.data@g1O1) > 0){
-            # if we have group level data for 
-            # group 1, outcome 1, then we assume
-            # we have it for all groups
-            g1O1.tmp <- binary.data@g1O1[1:i]
-            g1O2.tmp <- binary.data@g1O2[1:i]
-            g2O1.tmp <- binary.data@g2O1[1:i]
-            g2O2.tmp <- binary.data@g2O2[1:i]
-            bin.data.tmp <- new('BinaryData', g1O1=g1O1.tmp, 
-                               g1O2=g1O2.tmp , g2O1=g2O1.tmp, 
-                               g2O2=g2O2.tmp, y=y.tmp, SE=SE.tmp, study.names=names.tmp)
-        } else {
-            bin.data.tmp <- new('BinaryData', y=y.tmp, SE=SE.tmp, study.names=names.tmp)
+        for (i in 1:length(binary.data@study.names)){
+            # build a BinaryData object including studies
+            # 1 through i
+            y.tmp <- binary.data@y[1:i]
+            SE.tmp <- binary.data@SE[1:i]
+            names.tmp <- binary.data@study.names[1:i]
+            bin.data.tmp <- NULL
+            if (length(binary.data@g1O1) > 0){
+                # if we have group level data for 
+                # group 1, outcome 1, then we assume
+                # we have it for all groups
+                g1O1.tmp <- binary.data@g1O1[1:i]
+                g1O2.tmp <- binary.data@g1O2[1:i]
+                g2O1.tmp <- binary.data@g2O1[1:i]
+                g2O2.tmp <- binary.data@g2O2[1:i]
+                bin.data.tmp <- new('BinaryData', g1O1=g1O1.tmp, 
+                                   g1O2=g1O2.tmp , g2O1=g2O1.tmp, 
+                                   g2O2=g2O2.tmp, y=y.tmp, SE=SE.tmp, study.names=names.tmp)
+            } else {
+                bin.data.tmp <- new('BinaryData', y=y.tmp, SE=SE.tmp, study.names=names.tmp)
+            }
+            # call the parametric function by name, passing along the 
+            # data and parameters. Notice that this method knows
+            # neither what method its calling nor what parameters
+            # it's passing!
+            cur.res <- eval(call(fname, bin.data.tmp, params.tmp))
+            cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
+            cum.results[[i]] <- cur.overall 
         }
-        # call the parametric function by name, passing along the 
-        # data and parameters. Notice that this method knows
-        # neither what method its calling nor what parameters
-        # it's passing!
-        cur.res <- eval(call(fname, bin.data.tmp, params.tmp))
-        cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
-        cum.results[[i]] <- cur.overall 
     }
     study.names <- binary.data@study.names[1] 
     for (count in 2:length(binary.data@study.names)) {
@@ -185,6 +396,75 @@ construct.subgroup.value.info <- function(value.info, subgroup.list) {
 	subgroup.value.info
 }
 
+get.subgroup.data <- function(om.data, cov.val, cov.vals) {
+	if ("BinaryData" %in% class(om.data)) {
+		get.subgroup.data.binary(om.data, cov.val, cov.vals)
+	} else {
+		get.subgroup.data.cont(om.data, cov.val, cov.vals)
+	}
+}
+
+subgroup.fits <- function(fname, om.data, params, indices=NULL) {
+	# Fits fname to each subgroup of (binary or continuous) om.data by the
+	# covariate params$cov_name, or only to the given subgroups (indices
+	# into the unique covariate values), and returns the list of their
+	# .overall results. The subgroups can be fit in several R processes
+	# (see run_subgroup_fits in meta_py_r), and their results passed on to
+	# subgroup.ma.binary/subgroup.ma.continuous as subgroup.results.
+	cov.vals <- get.cov(om.data, as.character(params$cov_name))@cov.vals
+	subgroup.list <- unique(cov.vals)
+	if (is.null(indices))
+		indices <- seq_along(subgroup.list)
+	# (subgroup.ma.binary fits the subgroups with supress.output set,
+	# subgroup.ma.continuous with the params as they are)
+	if ("BinaryData" %in% class(om.data))
+		params$supress.output <- TRUE
+	lapply(subgroup.list[indices], function(cov.val) {
+		res <- eval(call(fname, get.subgroup.data(om.data, cov.val, cov.vals), params))
+		eval(call(paste(fname, ".overall", sep=""), res))
+	})
+}
+
+subgroup.needs.fits <- function(fname, om.data, params) {
+	# FALSE if the subgroups' results are computed in closed form (see
+	# subgroup.ma.closed.form), so there is no point fitting them elsewhere
+	is.null(closed.form.model(fname, om.data, params, min.studies=1))
+}
+
+subgroup.difference.test <- function(subgroup.results) {
+	# the test for differences between the subgroups: Q, the weighted sum of
+	# squares of the subgroups' estimates about their (inverse-variance)
+	# weighted mean, on (number of subgroups - 1) df; the results are those
+	# of the subgroups followed by the overall result, which is left out.
+	# NULL if there aren't two subgroups with a standard error.
+	subgroup.results <- subgroup.results[-length(subgroup.results)]
+	b <- sapply(subgroup.results, function(res) res$b[1])
+	se <- sapply(subgroup.results, function(res) if (is.null(res$se)) NA else res$se[1])
+	w <- 1/se^2
+	b <- b[is.finite(w)]
+	w <- w[is.finite(w)]
+	if (length(b) < 2)
+		return(NULL)
+	Q <- sum(w*(b - sum(w*b)/sum(w))^2)
+	df <- length(b) - 1
+	list(Q=Q, df=df, pval=pchisq(Q, df=df, lower.tail=FALSE))
+}
+
+add.subgroup.difference.test <- function(subgroup.disp, test, digits) {
+	# adds the table of the test (see subgroup.difference.test) to the
+	# summary display
+	if (is.null(test))
+		return(subgroup.disp)
+	digits.str <- paste("%.", digits, "f", sep="")
+	test.array <- array(dim=c(2, 2))
+	test.array[1,] <- c("Q (df)", "p-Val")
+	test.array[2,] <- c(paste(sprintf(digits.str, test$Q), " (", test$df, ")", sep=""),
+						round.display(test$pval, digits=digits))
+	subgroup.disp$table.titles <- c(subgroup.disp$table.titles, "  Test for subgroup differences")
+	subgroup.disp$arrays$arr.subgroup.test <- test.array
+	subgroup.disp
+}
+
 
 bootstrap.binary <- function(fname, omdata, params, cond.means.data=FALSE) {
 	bootstrap(fname, omdata, params, cond.means.data)
@@ -193,7 +473,7 @@ bootstrap.continuous <- function(fname, omdata, params, cond.means.data=FALSE) {
 	bootstrap(fname, omdata, params, cond.means.data)
 }
 
-bootstrap <- function(fname, omdata, params, cond.means.data=FALSE) {
+bootstrap <- function(fname, omdata, params, cond.means.data=FALSE, replicates=NULL, replicates.only=FALSE) {
 	# fname: the function name that runs the basic-meta-analysis
 	# data: the meta analysis object containing the data of interest
 	# data.type: the type of the data (binary or continuous)
@@ -201,6 +481,12 @@ bootstrap <- function(fname, omdata, params, cond.means.data=FALSE) {
 	# boot.params: parameters related to the boot-strapping analysis in particular
 	#      boot.params$R
 	#      boot.params$plot.path
+	#
+	# The replicates can be run in chunks (e.g., by several R processes, with
+	# their own seeds): replicates.only=TRUE runs params$num.bootstrap.replicates
+	# of them and returns list(t0, t, extra.attempts) rather than the results;
+	# passing a list of such chunks as replicates then summarizes them all,
+	# without running any more.
 	
 	
 	require(boot)
@@ -307,7 +593,14 @@ bootstrap <- function(fname, omdata, params, cond.means.data=FALSE) {
 						boot.meta.reg = meta.reg.statistic,
 						boot.meta.reg.cond.means = meta.reg.cond.means.statistic)
 	extra.attempts <- 0
-	boot.res <- boot(omdata.rows, statistic=statistic, R=params$num.bootstrap.replicates)
+	if (is.null(replicates)) {
+		boot.res <- boot(omdata.rows, statistic=statistic, R=params$num.bootstrap.replicates)
+		if (replicates.only)
+			return(list(t0=boot.res$t0, t=boot.res$t, extra.attempts=extra.attempts))
+	} else {
+		boot.res <- combine.boot.replicates(replicates, omdata.rows)
+		extra.attempts <- sum(sapply(replicates, function(chunk) chunk$extra.attempts))
+	}
 	params$extra.attempts <- extra.attempts
 
 	cat("Total extra attempts: "); cat(extra.attempts); cat("\n")
@@ -327,6 +620,18 @@ bootstrap <- function(fname, omdata, params, cond.means.data=FALSE) {
 	
 }
 
+combine.boot.replicates <- function(replicates, data) {
+	# A boot object (as far as boot.ci and plot.custom.boot are concerned)
+	# holding the replicates that were run in chunks, in order; each chunk
+	# is a list(t0, t, ...), t having one row per replicate.
+	t <- do.call(rbind, lapply(replicates, function(chunk) matrix(chunk$t, ncol=length(chunk$t0))))
+	n <- NROW(data)
+	structure(list(t0=replicates[[1]]$t0, t=t, R=nrow(t), data=data, seed=NA,
+				   statistic=NULL, sim="ordinary", stype="i", call=match.call(),
+				   strata=rep(1, n), weights=rep(1/n, n)),
+			  class="boot")
+}
+
 # For making textfile output of data
 construct.boot.res.and.value.info.for.results <- function(results, boot.res, bootstrap.type) {
 	summary <- switch(bootstrap.type,
@@ -516,7 +821,10 @@ loo.ma.binary <- function(fname, binary.data, params){
     res <- eval(call(fname, binary.data, params.tmp))
     res.overall <- eval(call(paste(fname, ".overall", sep=""), res))
     N <- length(binary.data@study.names)
-    for (i in 1:N){
+    closed.form.results <- loo.ma.closed.form(fname, binary.data, params.tmp)
+    if (!is.null(closed.form.results)) {
+        loo.results <- closed.form.results
+    } else for (i in 1:N){
         # get a list of indices, i.e., the subset
         # that is 1:N with i left out
         index.ls <- setdiff(1:N, i)
@@ -628,44 +936,47 @@ cum.ma.continuous <- function(fname, cont.data, params){
     # cumulative plot does not display raw data
     params$fp_col1_str <- "Cumulative Studies"
     
-    # iterate over the continuousData elements, adding one study at a time
-    cum.results <- array(list(NULL), dim=c(length(cont.data@study.names)))
+    cum.results <- cum.ma.closed.form(fname, cont.data, params.tmp)
+    # otherwise, iterate over the continuousData elements, adding one study at a time
+    if (is.null(cum.results)) {
+        cum.results <- array(list(NULL), dim=c(length(cont.data@study.names)))
     
-    for (i in 1:length(cont.data@study.names)){
-        # build a ContinuousData object including studies
-        # 1 through i
-        y.tmp <- cont.data@y[1:i]
-        SE.tmp <- cont.data@SE[1:i]
-        names.tmp <- cont.data@study.names[1:i]
-        cont.data.tmp <- NULL
-        if (length(cont.data@N1) > 0){
-            # if we have group level data for 
-            # group 1, outcome 1, then we assume
-            # we have it for all groups
-            N1.tmp <- cont.data@N1[1:i]
-            mean1.tmp <- cont.data@mean1[1:i]
-            sd1.tmp <- cont.data@sd1[1:i]
-            N2.tmp <- cont.data@N2[1:i]
-            mean2.tmp <- cont.data@mean2[1:i]
-            sd2.tmp <- cont.data@sd2[1:i]
-            cont.data.tmp <- new('ContinuousData', 
-                               N1=N1.tmp, mean1=mean1.tmp , sd1=sd1.tmp, 
-                               N2=N2.tmp, mean2=mean2.tmp, sd2=sd2.tmp,
-                               y=y.tmp, SE=SE.tmp, 
-                               study.names=names.tmp)
-        }
-        else{
-            cont.data.tmp <- new('ContinuousData', 
-                                y=y.tmp, SE=SE.tmp, 
-                                study.names=names.tmp)
+        for (i in 1:length(cont.data@study.names)){
+            # build a ContinuousData object including studies
+            # 1 through i
+            y.tmp <- cont.data@y[1:i]
+            SE.tmp <- cont.data@SE[1:i]
+            names.tmp <- cont.data@study.names[1:i]
+            cont.data.tmp <- NULL
+            if (length(cont.data@N1) > 0){
+                # if we have group level data for 
+                # group 1, outcome 1, then we assume
+                # we have it for all groups
+                N1.tmp <- cont.data@N1[1:i]
+                mean1.tmp <- cont.data@mean1[1:i]
+                sd1.tmp <- cont.data@sd1[1:i]
+                N2.tmp <- cont.data@N2[1:i]
+                mean2.tmp <- cont.data@mean2[1:i]
+                sd2.tmp <- cont.data@sd2[1:i]
+                cont.data.tmp <- new('ContinuousData', 
+                                   N1=N1.tmp, mean1=mean1.tmp , sd1=sd1.tmp, 
+                                   N2=N2.tmp, mean2=mean2.tmp, sd2=sd2.tmp,
+                                   y=y.tmp, SE=SE.tmp, 
+                                   study.names=names.tmp)
+            }
+            else{
+                cont.data.tmp <- new('ContinuousData', 
+                                    y=y.tmp, SE=SE.tmp, 
+                                    study.names=names.tmp)
+            }
+            # call the parametric function by name, passing along the 
+            # data and parameters. Notice that this method knows
+            # neither what method its calling nor what parameters
+            # it's passing!
+            cur.res <- eval(call(fname, cont.data.tmp, params.tmp))
+            cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
+            cum.results[[i]] <- cur.overall
         }
-        # call the parametric function by name, passing along the 
-        # data and parameters. Notice that this method knows
-        # neither what method its calling nor what parameters
-        # it's passing!
-        cur.res <- eval(call(fname, cont.data.tmp, params.tmp))
-        cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
-        cum.results[[i]] <- cur.overall
     }
     study.names <- c()
     study.names <- cont.data@study.names[1] 
@@ -895,7 +1206,10 @@ loo.ma.continuous <- function(fname, cont.data, params){
     res <- eval(call(fname, cont.data, params.tmp))
     res.overall <- eval(call(paste(fname, ".overall", sep=""), res))
     N <- length(cont.data@study.names)
-    for (i in 1:N){
+    closed.form.results <- loo.ma.closed.form(fname, cont.data, params.tmp)
+    if (!is.null(closed.form.results)) {
+        loo.results <- closed.form.results
+    } else for (i in 1:N){
         # get a list of indices, i.e., the subset
         # that is 1:N with i left out
         index.ls <- setdiff(1:N, i)
@@ -995,7 +1309,9 @@ loo.ma.continuous <- function(fname, cont.data, params){
 ########################
 #  binary subgroup MA  #
 ########################
-subgroup.ma.binary <- function(fname, binary.data, params){
+subgroup.ma.binary <- function(fname, binary.data, params, subgroup.results=NULL){
+    # subgroup.results: the subgroups' results, if they have been fit
+    # elsewhere (see subgroup.fits)
     # assert that the argument is the correct type
     if (!("BinaryData" %in% class(binary.data))) stop("Binary data expected.")
     cov.name <- as.character(params$cov_name)
@@ -1006,8 +1322,16 @@ subgroup.ma.binary <- function(fname, binary.data, params){
     #params.tmp$write.to.file <- FALSE
 	params.tmp$supress.output <- TRUE
     subgroup.list <- unique(cov.vals)
+    closed.form.results <- subgroup.ma.closed.form(fname, binary.data, params, cov.vals, subgroup.list)
+    if (!is.null(closed.form.results)) {
+        subgroup.results <- closed.form.results
+    } else {
+        if (is.null(subgroup.results)) {
+            subgroup.results <- subgroup.fits(fname, binary.data, params)
+        }
+        subgroup.results <- c(subgroup.results, list(NULL))
+    }
     grouped.data <- array(list(NULL),c(length(subgroup.list)+1))
-    subgroup.results <- array(list(NULL), c(length(subgroup.list)+1))
     col3.nums <- NULL
     col3.denoms <- NULL
     col4.nums <- NULL
@@ -1022,15 +1346,18 @@ subgroup.ma.binary <- function(fname, binary.data, params){
       col3.denoms <- c(col3.denoms, bin.data.tmp@g1O1 + bin.data.tmp@g1O2, sum(bin.data.tmp@g1O1 + bin.data.tmp@g1O2)) 
       col4.nums <- c(col4.nums, bin.data.tmp@g2O1, sum(bin.data.tmp@g2O1)) 
       col4.denoms <- c(col4.denoms, bin.data.tmp@g2O1 + bin.data.tmp@g2O2, sum(bin.data.tmp@g2O1 + bin.data.tmp@g2O2)) 
-      cur.res <- eval(call(fname, bin.data.tmp, params.tmp))
-      cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
-      subgroup.results[[count]] <- cur.overall
       count <- count + 1
     }
-    res <- eval(call(fname, binary.data, params.tmp))
-    res.overall <- eval(call(paste(fname, ".overall", sep=""), res))
+    if (is.null(closed.form.results)) {
+        res <- eval(call(fname, binary.data, params.tmp))
+        subgroup.results[[count]] <- eval(call(paste(fname, ".overall", sep=""), res))
+    } else {
+        # the closed-form results include the overall one, so there is no
+        # need to fit all of the studies (none of the closed-form methods
+        # has references of its own)
+        res <- subgroup.results[[count]]
+    }
     grouped.data[[count]] <- binary.data
-    subgroup.results[[count]] <- res.overall
     subgroup.names <- paste("Subgroup ", subgroup.list, sep="")
     subgroup.names <- c(subgroup.names, "Overall")
     metric.name <- pretty.metric.name(as.character(params$measure))
@@ -1045,6 +1372,7 @@ subgroup.ma.binary <- function(fname, binary.data, params){
 		binary.fixed.peto	 = binary.fixed.peto.value.info(),
 		binary.random	     = binary.random.value.info())
     subgroup.disp <- create.subgroup.display(subgroup.results, subgroup.names, params, model.title, data.type="binary")
+    subgroup.disp <- add.subgroup.difference.test(subgroup.disp, subgroup.difference.test(subgroup.results), params$digits)
     forest.path <- paste(params$fp_outpath, sep="")
     # pack up the data for forest plot.
     subgroup.data <- list("subgroup.list"=subgroup.list, "grouped.data"=grouped.data, "results"=subgroup.results, 
@@ -1104,7 +1432,8 @@ get.subgroup.data.binary <- function(binary.data, cov.val, cov.vals) {
 #  continuous subgroup MA  #
 #############################
 
-subgroup.ma.continuous <- function(fname, cont.data, params){
+subgroup.ma.continuous <- function(fname, cont.data, params, subgroup.results=NULL){
+    # subgroup.results: as in subgroup.ma.binary
     if (!("ContinuousData" %in% class(cont.data))) stop("Continuous data expected.")
     params.tmp <- params
     cov.name <- as.character(params$cov_name)
@@ -1114,8 +1443,16 @@ subgroup.ma.continuous <- function(fname, cont.data, params){
     #params.tmp$write.to.file <- FALSE
 	params.tmp$supress.output <- TRUE
     subgroup.list <- unique(cov.vals)
+    closed.form.results <- subgroup.ma.closed.form(fname, cont.data, params, cov.vals, subgroup.list)
+    if (!is.null(closed.form.results)) {
+        subgroup.results <- closed.form.results
+    } else {
+        if (is.null(subgroup.results)) {
+            subgroup.results <- subgroup.fits(fname, cont.data, params)
+        }
+        subgroup.results <- c(subgroup.results, list(NULL))
+    }
     grouped.data <- array(list(NULL),c(length(subgroup.list)+1))
-    subgroup.results <- array(list(NULL), c(length(subgroup.list)+1))
     col3.nums <- NULL
     col3.denoms <- NULL
     col4.nums <- NULL
@@ -1125,15 +1462,16 @@ subgroup.ma.continuous <- function(fname, cont.data, params){
       # build a ContinuousData object 
       cont.data.tmp <- get.subgroup.data.cont(cont.data, i, cov.vals) 
       grouped.data[[count]] <- cont.data.tmp
-      cur.res <- eval(call(fname, cont.data.tmp, params))
-      cur.overall <- eval(call(paste(fname, ".overall", sep=""), cur.res))
-      subgroup.results[[count]] <- cur.overall
       count <- count + 1
     }
-    res <- eval(call(fname, cont.data, params))
-    res.overall <- eval(call(paste(fname, ".overall", sep=""), res))
+    if (is.null(closed.form.results)) {
+        res <- eval(call(fname, cont.data, params))
+        subgroup.results[[count]] <- eval(call(paste(fname, ".overall", sep=""), res))
+    } else {
+        # (see subgroup.ma.binary)
+        res <- subgroup.results[[count]]
+    }
     grouped.data[[count]] <- cont.data
-    subgroup.results[[count]] <- res.overall
     subgroup.names <- paste("Subgroup ", subgroup.list, sep="")
     subgroup.names <- c(subgroup.names, "Overall")
     metric.name <- pretty.metric.name(as.character(params$measure))
@@ -1144,6 +1482,7 @@ subgroup.ma.continuous <- function(fname, cont.data, params){
 						 continuous.fixed  = continuous.fixed.value.info(),
 						 continuous.random = continuous.random.value.info())		   
     subgroup.disp <- create.overall.display(subgroup.results, subgroup.names, params, model.title, data.type="continuous")
+    subgroup.disp <- add.subgroup.difference.test(subgroup.disp, subgroup.difference.test(subgroup.results), params$digits)
     forest.path <- paste(params$fp_outpath, sep="")
     # pack up the data for forest plot.
     subgroup.data <- list("subgroup.list"=subgroup.list, "grouped.data"=grouped.data, "results"=subgroup.results, 
@@ -24,15 +24,15 @@
 #	iter:
 #	retpermdist:
 #	makepermdisthist:
+#	counts: the (summed) permutation.counts of random permutations that
+#		were run in chunks, e.g., by run_permutation_test in meta_py_r, which
+#		reports a running p-value as they go and can stop early; if given,
+#		no permutations are run here (and the permutation distribution is
+#		not returned).
 #
 ############################################################################
-permuted.ma <- function(
-	# meta-analysis parameters
-	data, method, intercept=TRUE, level=95, digits=4, knha=FALSE, weighted=TRUE,
-	# Permutation parameters
-	exact=FALSE, iter=1000, retpermdist=FALSE) {
-	
-	ma.res <- rma.uni(yi, vi,
+permuted.ma.model <- function(data, method, intercept=TRUE, level=95, digits=4, knha=FALSE, weighted=TRUE) {
+	rma.uni(yi, vi,
 		intercept=intercept,
 		data=data,
 		slab=data$slab, 
@@ -41,6 +41,24 @@ permuted.ma <- function(
 		level=level,
 		digits=digits,
 		weighted=weighted)
+}
+
+permuted.ma <- function(
+	# meta-analysis parameters
+	data, method, intercept=TRUE, level=95, digits=4, knha=FALSE, weighted=TRUE,
+	# Permutation parameters
+	exact=FALSE, iter=1000, retpermdist=FALSE, counts=NULL) {
+	
+	ma.res <- permuted.ma.model(data, method, intercept, level, digits, knha, weighted)
+
+	if (!is.null(counts)) {
+		pvals <- permutation.pvals(counts, level)
+		return(list(
+			"Summary"=permutation.summary(ma.res, pvals, digits),
+			"res"=pvals,
+			"res.info"=permutest.value.info(FALSE, meta.reg.mode=FALSE, chunked=TRUE)
+			))
+	}
 
 	perm.res <- permutest(ma.res, exact=exact, iter=iter,
               retpermdist=FALSE, digits=digits)
@@ -53,28 +71,38 @@ permuted.ma <- function(
 		)
 }
 
+permuted.meta.reg.model <- function(data, method, mods, level=95, digits=4, btt=NULL) {
+	mods.str <- make.mods.str(mods)
+	regression.wrapper(data, mods.str, method, level, digits, btt)
+}
+
 permuted.meta.reg <- function (
 	# meta-regresion parameters
 	data, method, mods, intercept=TRUE, level=95, digits=4, knha=FALSE, btt=NULL,
 	# Permutation parameters
-	exact=FALSE, iter=1000, retpermdist=FALSE,
+	exact=FALSE, iter=1000, retpermdist=FALSE, counts=NULL,
 	# Other parameters
 	include.meta.reg.summary=TRUE # show regular meta regression results too in output
 	) {
 
-	mods.str <- make.mods.str(mods)
-	
 	# obtain regression result rma.uni
-	reg.res <- regression.wrapper(data, mods.str, method, level, digits, btt)
+	reg.res <- permuted.meta.reg.model(data, method, mods, level, digits, btt)
 
-	perm.res <- permutest(reg.res, exact=exact, iter=iter,
-              retpermdist=retpermdist, digits=digits)
-	summary <- paste(capture.output(perm.res), collapse="\n")
+	if (is.null(counts)) {
+		perm.res <- permutest(reg.res, exact=exact, iter=iter,
+	              retpermdist=retpermdist, digits=digits)
+		summary <- paste(capture.output(perm.res), collapse="\n")
+		res.info <- permutest.value.info(retpermdist)
+	} else {
+		perm.res <- permutation.pvals(counts, level)
+		summary <- permutation.summary(reg.res, perm.res, digits)
+		res.info <- permutest.value.info(FALSE, chunked=TRUE)
+	}
 
 	results <- list(
 		"Permuted Meta-Regression Summary"=summary,
 		"res"=perm.res,
-		"res.info"=permutest.value.info(retpermdist)
+		"res.info"=res.info
 		)
 
 	if (include.meta.reg.summary) {
@@ -97,12 +125,20 @@ permuted.meta.reg <- function (
 	results
 }
 
-permutest.value.info <- function(retpermdist, meta.reg.mode=TRUE) {
+permutest.value.info <- function(retpermdist, meta.reg.mode=TRUE, chunked=FALSE) {
 	info = list(
 			pval = list(type="vector", description='p-value(s) based on the permutation test.'),
 			QMp = list(type="vector", description='p-value for the omnibus test of coefficients based on the permutation test.')
 	)
 	
+	if (chunked) {
+		info = c(info, list(
+				QMp.se = list(type="vector", description='Monte Carlo standard error of QMp.'),
+				iter = list(type="vector", description='number of permutations run.'),
+				exact = list(type="vector", description='whether all of the permutations were run.')
+		))
+	}
+	
 	if (retpermdist && meta.reg.mode) {
 		additional.info = list(
 				zval.perm = list(type="data.frame", description='values of the test statistics of the coefficients under the various permutations'),
@@ -113,3 +149,89 @@ permutest.value.info <- function(retpermdist, meta.reg.mode=TRUE) {
 	return(info)
 }
 
+############################################################################
+# Permutations in chunks
+#
+# permutation.counts runs a number of random permutations of a fitted model
+# and counts the permuted test statistics that are at least as extreme as
+# the observed ones; the counts of several chunks add up
+# (add.permutation.counts) and give the p-values at any point
+# (permutation.pvals), along with the Monte Carlo error of the omnibus
+# p-value, so that a caller can report them as the chunks come in and stop
+# once that is small enough. If there are no more distinct permutations
+# than the caller would run in all, the first chunk runs all of them (the
+# exact test) and there is no need for any more.
+############################################################################
+permutation.data <- function(om.data) {
+	# the data frame permuted.ma takes, from an openmetar data object
+	data.frame(yi=om.data@y, vi=om.data@SE^2, slab=om.data@study.names)
+}
+
+permutation.model <- function(fname, ...) {
+	# the model that fname (permuted.ma or permuted.meta.reg) permutes, fit
+	# with those of the arguments it takes
+	model.f <- get(paste(fname, ".model", sep=""))
+	args <- list(...)
+	do.call(model.f, args[names(args) %in% names(formals(model.f))])
+}
+
+permutation.exact.iter <- function(res) {
+	# (an upper bound on) the number of distinct permutations of a fitted
+	# model: the sign flips of the effects for an intercept-only model, the
+	# orderings of the moderators otherwise
+	if (res$int.only) 2^res$k else factorial(res$k)
+}
+
+permutation.counts <- function(res, iter, digits=4, max.iter=iter) {
+	# iter random permutations, or all of them if there are no more than
+	# max.iter, the number of permutations the caller will run in all
+	exact <- permutation.exact.iter(res) <= max.iter
+	perm.res <- permutest(res, exact=exact, iter=iter, retpermdist=TRUE, digits=digits)
+	tol <- sqrt(.Machine$double.eps)
+	zval.perm <- as.matrix(perm.res$zval.perm)
+	# (permutest may run all the permutations of its own accord, too)
+	list(iter=nrow(zval.perm), exact=exact || nrow(zval.perm) < iter,
+		 zval.ge=colSums(sweep(zval.perm, 2, c(res$zval) - tol, ">=")),
+		 zval.le=colSums(sweep(zval.perm, 2, c(res$zval) + tol, "<=")),
+		 QM.ge=sum(perm.res$QM.perm >= res$QM - tol))
+}
+
+add.permutation.counts <- function(counts, more.counts) {
+	if (is.null(counts))
+		return(more.counts)
+	added <- Map("+", counts, more.counts)
+	added$exact <- counts$exact || more.counts$exact
+	added
+}
+
+permutation.pvals <- function(counts, level=95) {
+	# (two-sided for the coefficients, as permutest)
+	pval <- pmin(1, 2*pmin(counts$zval.ge, counts$zval.le)/counts$iter)
+	QMp <- counts$QM.ge/counts$iter
+	# the standard error is that of (QM.ge + 1)/(iter + 2), which isn't 0
+	# when none (or all) of the permutations were as extreme
+	QMp.adj <- (counts$QM.ge + 1)/(counts$iter + 2)
+	# (the exact test has no Monte Carlo error)
+	QMp.se <- if (counts$exact) 0 else sqrt(QMp.adj*(1 - QMp.adj)/counts$iter)
+	mult <- abs(qnorm((1 - level/100)/2))
+	list(pval=pval, QMp=QMp, QMp.se=QMp.se,
+		 QMp.ci.lb=max(0, QMp - mult*QMp.se), QMp.ci.ub=min(1, QMp + mult*QMp.se),
+		 iter=counts$iter, exact=counts$exact, level=level)
+}
+
+permutation.summary <- function(res, pvals, digits) {
+	coeffs <- data.frame(estimate=c(res$b), se=c(res$se), zval=c(res$zval), "pval*"=pvals$pval,
+						 ci.lb=c(res$ci.lb), ci.ub=c(res$ci.ub), check.names=FALSE)
+	rownames(coeffs) <- rownames(res$b)
+	paste(c(if (pvals$exact) sprintf("Permutation test: all %d permutations (exact test)", pvals$iter)
+			else sprintf("Permutation test: %d random permutations", pvals$iter),
+			"",
+			sprintf("Test of Moderators: QM(df = %d) = %s, p-val* = %s (Monte Carlo SE %s, %s%% CI %s to %s)",
+					length(res$btt), round(res$QM, digits), round(pvals$QMp, digits),
+					round(pvals$QMp.se, digits), pvals$level,
+					round(pvals$QMp.ci.lb, digits), round(pvals$QMp.ci.ub, digits)),
+			"",
+			"Model Results:",
+			capture.output(round(coeffs, digits))),
+		  collapse="\n")
+}
@@ -10,6 +10,10 @@ test.all <- function() {
   
   cont.data <- create.cont.data(params)
   try.errors <- test.cont.functions(cont.data, params, try.errors)
+  try.errors <- test.closed.form(binary.data, cont.data, params, try.errors)
+  try.errors <- test.permutation.chunks(binary.data, try.errors)
+  try.errors <- test.subgroup.closed.form(binary.data, params, try.errors)
+  try.errors <- test.subgroup.output(binary.data, params, try.errors)
   
   params <- set.params(data.type="diagnostic")
   diagnostic.data <- create.diag.data(params)
@@ -144,6 +148,123 @@ test.cont.functions <- function(cont.data, params, try.errors) {
   try.errors
 }
 
+test.closed.form <- function(binary.data, cont.data, params, try.errors) {
+  # the closed-form cumulative and leave-one-out results should match
+  # refitting each subset
+  values <- c("b", "se", "pval", "ci.lb", "ci.ub", "QE", "tau2", "I2")
+  fnames.and.data <- list(binary.fixed.inv.var=binary.data, binary.random=binary.data,
+                          continuous.fixed=cont.data, continuous.random=cont.data)
+  for (fname in names(fnames.and.data)) {
+    om.data <- fnames.and.data[[fname]]
+    N <- length(om.data@y)
+    subsets <- list(cum=lapply(2:N, function(i) 1:i), loo=lapply(1:N, function(i) setdiff(1:N, i)))
+    closed.form.results <- list(cum=cum.ma.closed.form(fname, om.data, params)[2:N],
+                                loo=loo.ma.closed.form(fname, om.data, params))
+    for (meta.method in names(subsets)) {
+      for (i in seq_along(subsets[[meta.method]])) {
+        index.ls <- subsets[[meta.method]][[i]]
+        res <- rma.uni(yi=om.data@y[index.ls], sei=om.data@SE[index.ls], level=params$conf.level,
+                       method=closed.form.methods[[fname]])
+        for (name in values) {
+          closed.form.value <- closed.form.results[[meta.method]][[i]][[name]]
+          if (!isTRUE(all.equal(as.numeric(res[[name]]), as.numeric(closed.form.value), tolerance=1e-6))) {
+            try.errors[[paste(meta.method, "closed form", fname, i, name)]] <- closed.form.value
+          }
+        }
+      }
+    }
+  }
+  # Q shouldn't lose precision when the effects are far from 0 relative to
+  # their spread
+  shifted.data <- binary.data
+  shifted.data@y <- binary.data@y + 1e6
+  for (closed.form.f in list(cum=cum.ma.closed.form, loo=loo.ma.closed.form)) {
+    QE <- sapply(closed.form.f("binary.fixed.inv.var", binary.data, params)[-1], function(res) res$QE)
+    shifted.QE <- sapply(closed.form.f("binary.fixed.inv.var", shifted.data, params)[-1], function(res) res$QE)
+    if (!isTRUE(all.equal(QE, shifted.QE, tolerance=1e-6))) {
+      try.errors[["closed form QE of shifted effects"]] <- shifted.QE
+    }
+  }
+  try.errors
+}
+
+test.subgroup.closed.form <- function(binary.data, params, try.errors) {
+  # the closed-form subgroup (and overall) results should match fitting
+  # each subgroup
+  values <- c("b", "se", "pval", "ci.lb", "ci.ub", "QE", "tau2", "I2")
+  cov.vals <- c('1','1','2','2','1','2','2','1')
+  subgroup.list <- unique(cov.vals)
+  for (fname in c("binary.fixed.inv.var", "binary.random")) {
+    closed.form.results <- subgroup.ma.closed.form(fname, binary.data, params, cov.vals, subgroup.list)
+    for (i in 1:(length(subgroup.list) + 1)) {
+      index.ls <- if (i <= length(subgroup.list)) cov.vals == subgroup.list[i] else TRUE
+      res <- rma.uni(yi=binary.data@y[index.ls], sei=binary.data@SE[index.ls], level=params$conf.level,
+                     method=closed.form.methods[[fname]])
+      for (name in values) {
+        closed.form.value <- closed.form.results[[i]][[name]]
+        if (!isTRUE(all.equal(as.numeric(res[[name]]), as.numeric(closed.form.value), tolerance=1e-6))) {
+          try.errors[[paste("subgroup closed form", fname, i, name)]] <- closed.form.value
+        }
+      }
+    }
+    if (is.null(subgroup.difference.test(closed.form.results))) {
+      try.errors[[paste("subgroup difference test", fname)]] <- closed.form.results
+    }
+  }
+  try.errors
+}
+
+test.subgroup.output <- function(binary.data, params, try.errors) {
+  # a closed-form subgroup meta-analysis gives what fitting the subgroups
+  # and all of the studies does
+  values <- c("b", "se", "pval", "ci.lb", "ci.ub", "QE", "tau2", "I2")
+  cov.vals <- c('1','1','2','2','1','2','2','1')
+  binary.data@covariates <- list(new('CovariateValues', cov.name="groups", cov.vals=cov.vals,
+                                     cov.type="factor", ref.var="1"))
+  params$cov_name <- "groups"
+  for (fname in c("binary.fixed.inv.var", "binary.random")) {
+    results <- subgroup.ma.binary(fname, binary.data, params)
+    overall.fit <- eval(call(paste(fname, ".overall", sep=""), eval(call(fname, binary.data, params))))
+    fitted.results <- c(subgroup.fits(fname, binary.data, params), list(overall.fit))
+    for (i in seq_along(fitted.results)) {
+      for (name in values) {
+        value <- results$res[[i]][[name]]
+        if (!isTRUE(all.equal(as.numeric(fitted.results[[i]][[name]]), as.numeric(value), tolerance=1e-6))) {
+          try.errors[[paste("subgroup output", fname, i, name)]] <- value
+        }
+      }
+    }
+    if (!identical(results$References, subgroup_ma_ref) || !file.exists(results$images[[1]])) {
+      try.errors[[paste("subgroup output", fname)]] <- results
+    }
+  }
+  try.errors
+}
+
+test.permutation.chunks <- function(binary.data, try.errors) {
+  # permutations run in chunks add up, and permuted.ma summarizes them
+  data <- permutation.data(binary.data)
+  model <- permutation.model("permuted.ma", data=data, method="DL")
+  set.seed(1)
+  counts <- add.permutation.counts(permutation.counts(model, 100), permutation.counts(model, 150))
+  pvals <- permutation.pvals(counts)
+  if (counts$iter != 250 || counts$exact || pvals$QMp < 0 || pvals$QMp > 1 || pvals$QMp.se <= 0) {
+    try.errors[["permutation chunks"]] <- pvals
+  }
+  # with no more than 2^8 permutations to be run in all, the first chunk
+  # runs all of them
+  exact.counts <- permutation.counts(model, 100, max.iter=2^8)
+  exact.pvals <- permutation.pvals(exact.counts)
+  if (!exact.counts$exact || exact.counts$iter != 2^8 || exact.pvals$QMp.se != 0) {
+    try.errors[["exact permutation test"]] <- exact.pvals
+  }
+  results <- try(permuted.ma(data, method="DL", counts=counts), silent=TRUE)
+  if (class(results) == "try-error") {
+    try.errors[["permuted.ma (chunked)"]] <- results
+  }
+  try.errors
+}
+
 test.diag.functions <- function(diagnostic.data, params, try.errors) {
    diag.fnames <- create.diag.fnames()
    for (fname in diag.fnames) {
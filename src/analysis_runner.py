@@ -0,0 +1,346 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Runs analyses off the GUI thread.                                        #
+#                                                                           #
+#  An analysis is described by an AnalysisJob: a list of steps, each of     #
+#  which talks to R. The data for the analysis (a meta_py_r.RDataObject)    #
+#  is pulled out of the model when the job is made, on the GUI thread, so   #
+#  later edits to the spreadsheet do not affect queued jobs. Jobs are run,  #
+#  one at a time, by an AnalysisRunner thread which holds                 #
+#  meta_py_r.R_LOCK while running a job (calls to R from the GUI thread     #
+#  meanwhile raise meta_py_r.RBusy rather than wait), and which reports     #
+#  back via (Qt) signals:                                                   #
+#                                                                           #
+#     jobStarted(job)                                                       #
+#     jobProgress(job, steps done, total steps, label of the next step)     #
+#                 (or the progress within a step that reports its own,      #
+#                 e.g., the replicates of a bootstrap or the permutations   #
+#                 of a permutation test)                                    #
+#     jobFinished(job, result)                                              #
+#     jobFailed(job, error message)                                         #
+#     jobCancelled(job)                                                     #
+#                                                                           #
+#  Since these are emitted from the runner thread, slots connected to them  #
+#  are invoked on the GUI thread.                                           #
+#                                                                           #
+#############################################################################
+
+import Queue
+import threading
+
+from PyQt4.QtCore import QThread, SIGNAL
+
+import meta_py_r
+
+class AnalysisError(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+
+class AnalysisJob(object):
+    '''
+    An analysis to be run by the AnalysisRunner. steps is a list of
+    (label, function) tuples; the functions are called in order (with no
+    arguments) and the value returned by the last one is the result of the
+    job.
+
+    A job that is cancelled while one of its steps is running stops once
+    that step has finished (we can't interrupt R); its result is discarded.
+
+    Housekeeping jobs (e.g., loading the R libraries at startup) are quiet:
+    they can't be cancelled, and the GUI only mentions them in passing.
+    '''
+    def __init__(self, description, steps, quiet=False):
+        self.description = description
+        self.steps = steps
+        self.quiet = quiet
+        self.cancelled = False
+        self._report_progress = None
+
+    def cancel(self):
+        if not self.quiet:
+            self.cancelled = True
+
+    def step_progress(self, done, total, label):
+        ''' For long steps to report their progress (while the job is running) '''
+        if self._report_progress is not None:
+            self._report_progress(done, total, label)
+
+    def run(self, report_progress=None):
+        self._report_progress = report_progress
+        result = None
+        for step_index, (label, step_f) in enumerate(self.steps):
+            if self.cancelled:
+                raise JobCancelled()
+            if report_progress is not None:
+                report_progress(step_index, len(self.steps), label)
+            result = step_f()
+        if self.cancelled:
+            raise JobCancelled()
+        if report_progress is not None:
+            report_progress(len(self.steps), len(self.steps), "done")
+        return result
+
+###
+# job builders; these must be called on the GUI thread, since they read the model.
+# (a job without data is still made; it fails when it is run, so that the
+# runner reports it via jobFailed)
+def _check_data(data):
+    if data is None:
+        raise AnalysisError("There is neither sufficient raw data nor entered effects/CIs "
+                            "to run an analysis.")
+
+def _data_step(data):
+    def create_data():
+        _check_data(data)
+        return data.create()
+    return ("creating data object", create_data)
+
+def make_ma_job(model, data_type, method, params, meta_f_str=None, pool=None):
+    '''
+    A job running method (a binary or continuous method) with the given
+    params on the current outcome/follow-up/groups of model; if meta_f_str
+    is given (e.g., "cum.ma") the corresponding meta-method is run instead.
+    If a (r_worker_pool.RWorkerPool) pool is given, the subgroups of a
+    subgroup meta-analysis are fit in parallel.
+    '''
+    if data_type == "binary":
+        data = meta_py_r.ma_dataset_to_simple_binary_robj(model, execute=False)
+        run_ma_f = meta_py_r.run_binary_ma
+    elif data_type == "continuous":
+        data = meta_py_r.ma_dataset_to_simple_continuous_robj(model, execute=False)
+        run_ma_f = meta_py_r.run_continuous_ma
+    else:
+        raise ValueError("unknown data type %s" % data_type)
+
+    if meta_f_str is None:
+        run_step = (method, lambda: run_ma_f(method, params))
+    elif pool is not None and meta_f_str.startswith("subgroup.ma"):
+        run_step = ("%s (%s)" % (meta_f_str, method),
+                    lambda: pool.run_subgroup_ma(data, meta_f_str, method, params))
+    else:
+        run_step = ("%s (%s)" % (meta_f_str, method),
+                    lambda: meta_py_r.run_meta_method(meta_f_str, method, params))
+    return AnalysisJob("%s analysis: %s" % (data_type, method), [_data_step(data), run_step])
+
+def make_diagnostic_job(model, method_names, list_of_params, meta_f_str=None, pool=None):
+    '''
+    A job running the diagnostic methods (one per metric) over model; if a
+    (r_worker_pool.RWorkerPool) pool is given, the metrics are analyzed in
+    parallel by its workers.
+    '''
+    data = meta_py_r.ma_dataset_to_simple_diagnostic_robj(model, execute=False)
+    data_step = _data_step(data)
+    label = ", ".join(method_names)
+    if meta_f_str is not None:
+        label = "%s (%s)" % (meta_f_str, label)
+
+    if pool is not None:
+        # (the workers create the data object)
+        def run_f():
+            _check_data(data)
+            if meta_f_str is None:
+                return pool.run_diagnostic_multi(data, method_names, list_of_params)
+            return pool.run_meta_method_diag(data, meta_f_str, method_names, list_of_params)
+        return AnalysisJob("diagnostic analysis: %s" % ", ".join(method_names), [(label, run_f)])
+
+    if meta_f_str is None:
+        run_f = lambda: meta_py_r.run_diagnostic_multi(method_names, list_of_params)
+    else:
+        run_f = lambda: meta_py_r.run_meta_method_diag(meta_f_str, method_names, list_of_params)
+    return AnalysisJob("diagnostic analysis: %s" % ", ".join(method_names),
+                       [data_step, (label, run_f)])
+
+def make_meta_regression_job(model, data_type, studies, covariates, metric,
+                             fixed_effects=False, conf_level=None):
+    ''' A meta-regression over studies, on the given covariates '''
+    if data_type == "diagnostic":
+        data = meta_py_r.ma_dataset_to_simple_diagnostic_robj(model, metric=metric,
+                                covs_to_include=covariates, studies=studies, execute=False)
+    elif data_type == "continuous":
+        data = meta_py_r.ma_dataset_to_simple_continuous_robj(model,
+                                covs_to_include=covariates, studies=studies, execute=False)
+    else:
+        data = meta_py_r.ma_dataset_to_simple_binary_robj(model, include_raw_data=False,
+                                covs_to_include=covariates, studies=studies, execute=False)
+
+    def run_regression():
+        result = meta_py_r.run_meta_regression(model.dataset, studies, covariates, metric,
+                                               fixed_effects=fixed_effects,
+                                               conf_level=conf_level)
+        if isinstance(result, str):
+            # then there was an error!
+            raise AnalysisError("Sorry, there was an error performing the regression.\n%s" % result)
+        return result
+
+    return AnalysisJob("meta-regression: %s" % ", ".join([cov.name for cov in covariates]),
+                       [_data_step(data), ("meta-regression", run_regression)])
+
+
+def make_bootstrap_job(model, data_type, method, params, pool=None,
+                       seed=meta_py_r.DEFAULT_BOOTSTRAP_SEED):
+    '''
+    A job bootstrapping method (params["num.bootstrap.replicates"] times,
+    see bootstrap in meta_methods.r) over the current outcome/follow-up/
+    groups of model. The replicates are run in chunks, in parallel if a
+    (r_worker_pool.RWorkerPool) pool is given; the job reports its progress
+    after each chunk and can be cancelled between chunks. The results only
+    depend on seed, not on the pool.
+    '''
+    if data_type == "binary":
+        data = meta_py_r.ma_dataset_to_simple_binary_robj(model, execute=False)
+    elif data_type == "continuous":
+        data = meta_py_r.ma_dataset_to_simple_continuous_robj(model, execute=False)
+    else:
+        raise ValueError("unknown data type %s" % data_type)
+
+    def run_bootstrap():
+        kw = {"seed":seed, "is_cancelled":lambda: job.cancelled,
+              "progress_f":lambda done, total: job.step_progress(done, total,
+                                "bootstrap (%s): %d of %d replicates" % (method, done, total))}
+        if pool is not None:
+            return pool.run_bootstrap(data, method, params, **kw)
+        return meta_py_r.run_bootstrap(method, params, **kw)
+
+    job = AnalysisJob("%s bootstrap: %s" % (data_type, method),
+                      [_data_step(data), ("bootstrap (%s)" % method, run_bootstrap)])
+    return job
+
+def make_permutation_job(model, data_type, args, iter, seed=meta_py_r.DEFAULT_BOOTSTRAP_SEED):
+    '''
+    A job running a permutation test of the (intercept only) model fit with
+    args (method, level, ...; see permuted.ma in permutation.r) to the
+    effects of the current outcome/follow-up/groups of model. The job
+    reports the permutations done, and the running p-value, after each
+    chunk of them and can be cancelled between chunks; it stops before iter
+    permutations once the p-value is precise enough (see
+    meta_py_r.run_permutation_test).
+    '''
+    if data_type == "binary":
+        data = meta_py_r.ma_dataset_to_simple_binary_robj(model, execute=False)
+    elif data_type == "continuous":
+        data = meta_py_r.ma_dataset_to_simple_continuous_robj(model, execute=False)
+    else:
+        raise ValueError("unknown data type %s" % data_type)
+
+    def progress(done, total, pvals):
+        job.step_progress(done, total, "permutation test: %d of %d permutations, p = %.4f (SE %.4f)" % \
+                                            (done, total, pvals["QMp"], pvals["QMp.se"]))
+
+    def run_permutation_test():
+        return meta_py_r.run_permutation_test("permuted.ma", args, iter,
+                                              data_name="permutation.data(%s)" % data.var_name,
+                                              seed=seed, progress_f=progress,
+                                              is_cancelled=lambda: job.cancelled)
+
+    job = AnalysisJob("%s permutation test" % data_type,
+                      [_data_step(data), ("permutation test", run_permutation_test)])
+    return job
+
+
+class AnalysisRunner(QThread):
+    '''
+    Runs submitted AnalysisJobs, in order, on its own thread; see the top of
+    this module for the signals it emits.
+    '''
+    def __init__(self, parent=None):
+        super(AnalysisRunner, self).__init__(parent)
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = []
+        self.current_job = None
+
+    def submit(self, job):
+        self._lock.acquire()
+        try:
+            self._pending.append(job)
+        finally:
+            self._lock.release()
+        self._queue.put(job)
+        if not self.isRunning():
+            self.start()
+        return job
+
+    def pending_jobs(self):
+        ''' The jobs that have been submitted, but not yet started '''
+        self._lock.acquire()
+        try:
+            return list(self._pending)
+        finally:
+            self._lock.release()
+
+    def is_busy(self):
+        return self.current_job is not None or len(self.pending_jobs()) > 0
+
+    def cancel(self, job=None):
+        ''' Cancels job or, if it is None, the current and all pending jobs '''
+        if job is not None:
+            job.cancel()
+            return
+        for pending_job in self.pending_jobs():
+            pending_job.cancel()
+        current_job = self.current_job
+        if current_job is not None:
+            current_job.cancel()
+
+    def stop(self, timeout=None):
+        '''
+        Cancels everything and stops the thread. Returns False if it did not
+        stop within timeout (milliseconds) because R is still busy.
+        '''
+        self.cancel()
+        self._queue.put(None)
+        if timeout is None:
+            return self.wait()
+        return self.wait(timeout)
+
+    def run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._lock.acquire()
+            try:
+                self._pending.remove(job)
+            finally:
+                self._lock.release()
+
+            if job.cancelled:
+                self.emit(SIGNAL("jobCancelled"), job)
+                continue
+
+            self.current_job = job
+            self.emit(SIGNAL("jobStarted"), job)
+            report_progress = lambda done, total, label: \
+                                self.emit(SIGNAL("jobProgress"), job, done, total, label)
+            meta_py_r.R_LOCK.acquire()
+            try:
+                try:
+                    # starting R (if need be) turns off its C stack check,
+                    # which would fail on this thread; see meta_py_r.init_R
+                    meta_py_r.init_R()
+                    # (the GUI doesn't wait for R to set this, see
+                    # meta_py_r.set_global_conf_level)
+                    meta_py_r.sync_global_conf_level()
+                    outcome = ("jobFinished", job, job.run(report_progress))
+                except JobCancelled:
+                    outcome = ("jobCancelled", job)
+                except Exception, e:
+                    meta_py_r.reset_Rs_working_dir()
+                    if job.cancelled:
+                        outcome = ("jobCancelled", job)
+                    else:
+                        outcome = ("jobFailed", job, "%s" % e)
+            finally:
+                meta_py_r.R_LOCK.release()
+                # cleared before we report back, so that is_busy() is
+                # accurate in the slots
+                self.current_job = None
+            self.emit(SIGNAL(outcome[0]), *outcome[1:])
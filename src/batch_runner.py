@@ -0,0 +1,371 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Runs analyses over many datasets from the command line, without the      #
+#  GUI, e.g.:                                                               #
+#                                                                           #
+#    python batch_runner.py -o results --jobs 4 specs.json data/*.oma       #
+#                                                                           #
+#  The analyses are given in a spec file: either JSON (a dictionary, or a   #
+#  list of them) or method_and_params.append({...}) records, as in          #
+#  test_meta_analysis. Each spec is a dictionary like                       #
+#                                                                           #
+#    {"name": "random OR",            # optional; names the output          #
+#     "meta_f_str": None,             # or, e.g., "cum.ma"                  #
+#     "method": "binary.random",      # a list, for diagnostic data         #
+#     "parameters": {...},            # a list, for diagnostic data         #
+#     "outcome": ..., "follow_up": ..., "groups": [...]}  # optional        #
+#                                                                           #
+#  For each dataset and spec, the results are written to                    #
+#  <out dir>/<dataset>/<spec name>.json (both the texts and the numeric     #
+#  values), and the plots to <out dir>/<dataset>/<spec name>/, where        #
+#  <dataset> is the file name without its extension (prefixed with the      #
+#  name of its directory, or suffixed with an index, if several of the      #
+#  files would otherwise end up in the same place). A summary               #
+#  of all of the runs is written to <out dir>/summary.json. CSV files are   #
+#  imported as they are by the import wizard; the --csv-* options take the  #
+#  place of the wizard's pages.                                             #
+#                                                                           #
+#############################################################################
+
+import argparse
+import ast
+import copy
+import glob
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import traceback
+
+import numpy as np
+
+import analysis_runner
+import ma_dataset
+import main_wizard
+import meta_py_r
+import oma_journal
+import r_worker_pool
+from ma_data_table_model import DatasetModel
+
+SPEC_FILE_RECORD = "method_and_params.append("
+WORK_DIR_PREFIX = ".work_"
+
+###
+# specs
+def load_specs(spec_path):
+    '''
+    Reads the analysis specs in spec_path; see the top of this module for
+    the format.
+    '''
+    f = open(spec_path)
+    try:
+        text = f.read()
+    finally:
+        f.close()
+
+    if SPEC_FILE_RECORD in text:
+        # method_and_params.append({...}) records
+        specs = []
+        for record in text.split(SPEC_FILE_RECORD)[1:]:
+            record = record.strip()
+            specs.append(ast.literal_eval(record[:record.rindex(")")]))
+    else:
+        specs = json.loads(text)
+        if isinstance(specs, dict):
+            specs = [specs]
+
+    for spec_index, spec in enumerate(specs):
+        spec.pop("results", None)
+        if spec.get("meta_f_str") in ("None", ""):
+            spec["meta_f_str"] = None
+        spec.setdefault("meta_f_str", None)
+        spec.setdefault("name", "analysis_%s" % (spec_index+1))
+    return specs
+
+###
+# datasets
+def _file_stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _output_dir_names(paths):
+    '''
+    The names of the output directories for the files at paths (one each):
+    the file names without extension, prefixed with the name of the
+    directory the file is in if that alone is ambiguous, and suffixed with
+    an index if even that is.
+    '''
+    stems = [_file_stem(path) for path in paths]
+    names = []
+    for path, stem in zip(paths, stems):
+        if stems.count(stem) > 1:
+            stem = "%s_%s" % (os.path.basename(os.path.dirname(path)), stem)
+        names.append(stem)
+
+    unique_names, taken, indices = [], set(names), {}
+    for name in names:
+        if names.count(name) == 1:
+            unique_names.append(name)
+            continue
+        index = indices.get(name, 0) + 1
+        while "%s_%s" % (name, index) in taken:
+            index += 1
+        indices[name] = index
+        taken.add("%s_%s" % (name, index))
+        unique_names.append("%s_%s" % (name, index))
+    return unique_names
+
+def load_model(path, csv_options):
+    ''' Returns a DatasetModel for the .oma or .csv file at path '''
+    if path.lower().endswith(".csv"):
+        return import_csv(path, csv_options)
+
+    dataset, state = oma_journal.load(path)
+    model = DatasetModel(dataset=dataset, add_blank_study=len(dataset) < 1)
+    if state is None:
+        state = model.make_reasonable_stateful_dict(dataset)
+    model.set_state(state)
+    model.update_column_indices()
+    return model
+
+def import_csv(path, csv_options):
+    '''
+    Makes a new dataset with a single outcome from the CSV file at path,
+    the way the import wizard does.
+    '''
+    data_type = csv_options.data_type
+    effect = csv_options.effect
+    headers, rows = main_wizard.read_csv(path, has_headers=csv_options.has_headers,
+                            from_excel=csv_options.from_excel,
+                            delimiter=csv_options.delimiter, quotechar=csv_options.quotechar)
+    if len(rows) == 0:
+        raise ValueError("No data in %s" % path)
+    expected_headers = main_wizard.get_required_header_labels(data_type, csv_options.sub_type, effect)
+    covariate_names, covariate_types = main_wizard.get_csv_covariates(rows, headers, expected_headers)
+
+    dataset = ma_dataset.Dataset(title=_file_stem(path), is_diag=data_type == "diagnostic")
+    model = DatasetModel(dataset=dataset)
+    outcome_name = csv_options.outcome_name or _file_stem(path)
+    model.add_new_outcome(outcome_name, data_type, sub_type=csv_options.sub_type)
+    model.set_current_outcome(outcome_name)
+    if data_type in ("binary", "continuous"):
+        model.current_effect = effect
+    for name, cov_type in zip(covariate_names, covariate_types):
+        model.add_covariate(name, cov_type)
+    model.import_csv_rows(rows)
+    return model
+
+def apply_spec(model, spec):
+    ''' Displays the outcome, follow up, groups and metric the spec asks for '''
+    if spec.get("outcome") is not None:
+        model.set_current_outcome(spec["outcome"])
+    if spec.get("follow_up") is not None:
+        model.set_current_follow_up(spec["follow_up"])
+    if spec.get("groups") is not None:
+        model.set_current_groups(spec["groups"])
+
+    if model.get_current_outcome_type() != "diagnostic":
+        measure = spec["parameters"].get("measure")
+        if measure is not None and measure != model.current_effect:
+            model.set_current_metric(measure)
+            model.try_to_update_outcomes()
+
+###
+# running analyses
+def _r_path(path):
+    return path.replace("\\", "/")
+
+def _with_outpath(params, out_dir, default_name):
+    params = copy.deepcopy(params)
+    plot_name = os.path.basename(params.get("fp_outpath") or default_name)
+    params["fp_outpath"] = _r_path(os.path.join(out_dir, plot_name))
+    return params
+
+def run_spec(model, spec, out_dir):
+    '''
+    Runs the analysis described by spec over model; the plots are put in
+    out_dir. Returns the (parsed) results.
+    '''
+    apply_spec(model, spec)
+    data_type = model.get_current_outcome_type()
+    if data_type == "diagnostic":
+        list_of_params = [_with_outpath(params, out_dir, "forest_%s.png" % params["measure"].lower()) \
+                            for params in spec["parameters"]]
+        job = analysis_runner.make_diagnostic_job(model, spec["method"], list_of_params,
+                                                  meta_f_str=spec["meta_f_str"])
+    else:
+        params = _with_outpath(spec["parameters"], out_dir, "forest.png")
+        job = analysis_runner.make_ma_job(model, data_type, spec["method"], params,
+                                          meta_f_str=spec["meta_f_str"])
+    return job.run()
+
+def _collect_images(results, out_dir):
+    '''
+    Copies the plots in the results (some of which are always written to
+    r_tmp) to out_dir; returns the image names mapped to their new paths.
+    '''
+    images = {}
+    for image_name, image_path in results["images"].items():
+        new_path = os.path.join(out_dir, os.path.basename(image_path))
+        if os.path.exists(image_path) and \
+                os.path.abspath(image_path) != os.path.abspath(new_path):
+            shutil.copy(image_path, new_path)
+        images[image_name] = new_path
+    return images
+
+def _jsonable(value):
+    ''' numpy arrays and numbers to lists and python numbers; nan to None (null) '''
+    if isinstance(value, dict):
+        return dict([(k, _jsonable(v)) for k, v in value.items()])
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def write_results(results, spec, data_path, json_path, image_dir):
+    output = {"file":data_path,
+              "name":spec["name"],
+              "meta_f_str":spec["meta_f_str"],
+              "method":spec["method"],
+              "parameters":spec["parameters"],
+              "texts":results["texts"],
+              "values":_jsonable(results.get("values", {})),
+              "images":_collect_images(results, image_dir),
+              "image_order":results["image_order"],
+              # (the plot data in image_params_paths lives in the R working
+              # directory, which doesn't outlast the run)
+              }
+    f = open(json_path, "w")
+    try:
+        json.dump(output, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+
+def process_file(task):
+    '''
+    Runs all of the specs over the dataset in a file; task is a (path,
+    specs, output directory, name of the dataset's output directory, csv
+    options) tuple. Returns a summary of each run.
+    '''
+    path, specs, out_dir, dataset_dir_name, csv_options = task
+    summary = []
+    try:
+        model = load_model(path, csv_options)
+    except Exception, e:
+        traceback.print_exc()
+        return [{"file":path, "name":None, "status":"failed", "error":"%s" % e}]
+
+    dataset_dir = os.path.join(out_dir, dataset_dir_name)
+    for spec in specs:
+        image_dir = os.path.join(dataset_dir, spec["name"])
+        json_path = os.path.join(dataset_dir, "%s.json" % spec["name"])
+        if not os.path.exists(image_dir):
+            os.makedirs(image_dir)
+        try:
+            results = run_spec(model, spec, image_dir)
+            write_results(results, spec, path, json_path, image_dir)
+            summary.append({"file":path, "name":spec["name"], "status":"ok", "output":json_path})
+        except Exception, e:
+            traceback.print_exc()
+            summary.append({"file":path, "name":spec["name"], "status":"failed", "error":"%s" % e})
+            # R goes back to the application's working directory on errors
+            meta_py_r.execute_r_string("setwd('%s')" % _r_path(os.getcwd()))
+    return summary
+
+def init_batch_worker(out_dir):
+    ''' Each process works (i.e., R writes its r_tmp files) in a directory of its own '''
+    work_dir = os.path.join(out_dir, "%s%s" % (WORK_DIR_PREFIX, os.getpid()))
+    if not os.path.exists(os.path.join(work_dir, "r_tmp")):
+        os.makedirs(os.path.join(work_dir, "r_tmp"))
+    r_worker_pool.init_worker(work_dir)
+
+def run_batch(data_paths, specs, out_dir, csv_options, n_jobs=1):
+    '''
+    Runs the specs over each of the files in data_paths, in n_jobs processes
+    (one per core if n_jobs is 0); returns the summary of all of the runs,
+    in order.
+    '''
+    data_paths = [os.path.abspath(path) for path in data_paths]
+    out_dir = os.path.abspath(out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    if not n_jobs:
+        n_jobs = multiprocessing.cpu_count()
+    tasks = [(path, specs, out_dir, dataset_dir_name, csv_options) for path, dataset_dir_name \
+                in zip(data_paths, _output_dir_names(data_paths))]
+
+    cwd = os.getcwd()
+    try:
+        if n_jobs == 1:
+            init_batch_worker(out_dir)
+            summaries = map(process_file, tasks)
+        else:
+            pool = multiprocessing.Pool(min(n_jobs, len(tasks)), init_batch_worker, (out_dir,))
+            try:
+                summaries = pool.map(process_file, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        os.chdir(cwd)
+        for work_dir in glob.glob(os.path.join(out_dir, WORK_DIR_PREFIX + "*")):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = [run for file_summary in summaries for run in file_summary]
+    f = open(os.path.join(out_dir, "summary.json"), "w")
+    try:
+        json.dump(summary, f, indent=2)
+    finally:
+        f.close()
+    return summary
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Runs OpenMeta[analyst] analyses over datasets, without the GUI.")
+    parser.add_argument("spec_file", help="the analyses to run (JSON, or method_and_params.append records)")
+    parser.add_argument("data_files", nargs="+", help=".oma or .csv files")
+    parser.add_argument("-o", "--out-dir", default="batch_results", help="where to put the results")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of files to process in parallel (0 = one per core)")
+
+    csv_group = parser.add_argument_group("CSV import")
+    csv_group.add_argument("--csv-data-type", dest="data_type", default="binary",
+                           choices=["binary", "continuous", "diagnostic"])
+    csv_group.add_argument("--csv-sub-type", dest="sub_type", default=None,
+                           help="e.g., proportions, means, smd, proportion, mean")
+    csv_group.add_argument("--csv-effect", dest="effect", default=None,
+                           help="the metric the effect columns are on, e.g., OR")
+    csv_group.add_argument("--csv-outcome", dest="outcome_name", default=None,
+                           help="name of the outcome (by default, the file name)")
+    csv_group.add_argument("--csv-no-headers", dest="has_headers", action="store_false")
+    csv_group.add_argument("--csv-excel", dest="from_excel", action="store_true")
+    csv_group.add_argument("--csv-delimiter", dest="delimiter", default=",")
+    csv_group.add_argument("--csv-quotechar", dest="quotechar", default='"')
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    if args.effect is None:
+        args.effect = {"binary":"OR", "continuous":"MD", "diagnostic":None}[args.data_type]
+    if args.sub_type is None:
+        args.sub_type = {"binary":"proportions", "continuous":"means", "diagnostic":None}[args.data_type]
+
+    specs = load_specs(args.spec_file)
+    summary = run_batch(args.data_files, specs, args.out_dir, args, n_jobs=args.jobs)
+    n_failed = len([run for run in summary if run["status"] != "ok"])
+    print "%s analyses run, %s failed; see %s" % (len(summary), n_failed,
+                                                  os.path.join(args.out_dir, "summary.json"))
+    return 1 if n_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,165 @@
+####################################
+#                                  #
+# Rough benchmarks for the dataset #
+#  back end. Run as:               #
+#                                  #
+#   python benchmarks.py [name]    #
+#                                  #
+####################################
+
+import random
+import sys
+import time
+
+import numpy as np
+
+import ma_dataset
+import meta_globals
+
+def deep_sizeof(obj, seen=None):
+    '''
+    Approximate number of bytes used by obj and everything it (recursively)
+    refers to; objects are only counted once. Strings, numbers, etc. that
+    are shared with the rest of the program (e.g., interned metric names)
+    are counted too, so this is an upper bound.
+    '''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, np.ndarray):
+        return size if obj.base is None else size + obj.nbytes
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for x in obj:
+            size += deep_sizeof(x, seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(obj.__dict__, seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+def _make_binary_dataset(n_studies, n_arms):
+    dataset = ma_dataset.Dataset()
+    group_names = ["tx %s" % i for i in range(n_arms)]
+    for study_index in range(n_studies):
+        study = ma_dataset.Study(study_index, name="study %s" % study_index)
+        outcome = ma_dataset.Outcome("mortality", meta_globals.BINARY)
+        study.add_outcome(outcome, group_names=group_names)
+        ma_unit = study.get_ma_unit("mortality", "first")
+        for i, group_name in enumerate(group_names):
+            ma_unit.set_raw_data_for_group(group_name, [10+i, 100])
+        dataset.add_study(study)
+    return dataset
+
+def _fill_all_effect_slots(dataset):
+    ''' Allocates every effect dictionary, as MetaAnalyticUnit used to '''
+    for study in dataset.studies:
+        for follow_ups in study.outcomes_to_follow_ups.values():
+            for ma_unit in follow_ups.values():
+                group_names = ma_unit.get_group_names()
+                for effect in meta_globals.BINARY_TWO_ARM_METRICS:
+                    for g1 in group_names:
+                        for g2 in [g for g in group_names if g != g1]:
+                            ma_unit._get_or_create_effect_d(effect, "-".join((g1, g2)))
+                for effect in meta_globals.BINARY_ONE_ARM_METRICS:
+                    for group_name in group_names:
+                        ma_unit._get_or_create_effect_d(effect, group_name)
+
+def _bytes_per_study(dataset):
+    return deep_sizeof(dataset.studies) / float(len(dataset.studies))
+
+def ma_unit_memory(n_studies=200):
+    '''
+    Memory per study for binary datasets with 2, 5 and 10 arms, with the
+    effect dictionaries allocated lazily (i.e., only the OR for the first
+    pair of groups has been set) and with all of them allocated.
+    '''
+    print "arms    lazy (bytes/study)    all slots (bytes/study)"
+    for n_arms in (2, 5, 10):
+        dataset = _make_binary_dataset(n_studies, n_arms)
+        for study in dataset.studies:
+            study.get_ma_unit("mortality", "first").set_effect_and_ci("OR",
+                                    "tx 0-tx 1", 0.1, -0.2, 0.4, mult=1.96)
+        lazy = _bytes_per_study(dataset)
+        _fill_all_effect_slots(dataset)
+        eager = _bytes_per_study(dataset)
+        print "%4d    %18.0f    %23.0f" % (n_arms, lazy, eager)
+
+def _make_sortable_dataset(n_studies):
+    '''
+    A binary dataset with (random) names, years, raw data, ORs and a
+    continuous covariate; about a tenth of each are missing.
+    '''
+    rand = random.Random(0)
+    maybe = lambda x: "" if rand.random() < .1 else x
+    dataset = _make_binary_dataset(n_studies, 2)
+    dataset.add_covariate(ma_dataset.Covariate("dose", "continuous"))
+    for study in dataset.studies:
+        study.name = maybe("study %s" % rand.randint(0, n_studies))
+        study.year = maybe(rand.randint(1970, 2013))
+        ma_unit = study.get_ma_unit("mortality", "first")
+        ma_unit.set_raw_data_for_group("tx 0", [maybe(rand.randint(0, 100)), 100])
+        if rand.random() > .1:
+            est = rand.gauss(0, 1)
+            ma_unit.set_effect_and_ci("OR", "tx 0-tx 1", est, est-.5, est+.5, mult=1.96)
+        study.covariate_dict["dose"] = maybe(rand.uniform(0, 10)) or None
+    return dataset
+
+def sort_studies(n_studies=10000):
+    '''
+    Sorting studies by name, year, raw data, outcome and covariate, both
+    with the (old) comparison functions and with sort keys; both have to
+    give the same order.
+    '''
+    dataset = _make_sortable_dataset(n_studies)
+    mult = 1.96
+    raw_data = {"outcome_name":"mortality", "follow_up":"first",
+                "current_groups":["tx 0", "tx 1"], "data_index":0}
+    outcomes = {"outcome_type":meta_globals.BINARY, "outcome_name":"mortality",
+                "follow_up":"first", "current_groups":["tx 0", "tx 1"],
+                "current_effect":"OR", "group_str":"tx 0-tx 1", "data_index":0}
+    sorts = [("name", None), ("year", None), ("raw_data", raw_data),
+             ("outcomes", outcomes), ("dose", None)]
+
+    print "%d studies" % n_studies
+    print "sort by      reverse    cmp (s)    keys (s)"
+    for compare_by, directions in sorts:
+        for reverse in (False, True):
+            rand = random.Random(1)
+            rand.shuffle(dataset.studies)
+            original_order = list(dataset.studies)
+
+            start = time.time()
+            dataset.studies.sort(cmp=dataset.cmp_studies(compare_by=compare_by, reverse=reverse,
+                                        directions_to_ma_unit=directions, mult=mult), reverse=reverse)
+            cmp_time = time.time() - start
+            # (the order of studies with neither a value nor a name is
+            # arbitrary with the comparison functions)
+            get_value = dataset._sort_value_getter(compare_by, reverse, directions, mult)
+            keys = lambda: [dataset._sort_key(study, get_value(study), reverse) for study in dataset.studies]
+            cmp_order = keys()
+
+            dataset.studies[:] = original_order
+            start = time.time()
+            dataset.sort_studies(compare_by=compare_by, reverse=reverse, sort_reverse=reverse,
+                                 directions_to_ma_unit=directions, mult=mult)
+            key_time = time.time() - start
+            if keys() != cmp_order:
+                print "the orders differ when sorting by %s!" % compare_by
+            print "%-12s %-7s %10.3f %11.3f" % (compare_by, reverse, cmp_time, key_time)
+
+BENCHMARKS = {"ma_unit_memory":ma_unit_memory,
+              "sort_studies":sort_studies}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted(BENCHMARKS.keys())
+    for name in names:
+        print "### %s" % name
+        BENCHMARKS[name]()
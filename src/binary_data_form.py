@@ -170,7 +170,12 @@ class BinaryDataForm2(QDialog, forms.ui_binary_data_form.Ui_BinaryDataForm):
         bin_data = build_back_calc_args_dict()
         print("Binary data for back-calculation:", bin_data)
 
-        imputed = meta_py_r.impute_bin_data(bin_data.copy())
+        try:
+            imputed = meta_py_r.impute_bin_data(bin_data.copy())
+        except meta_py_r.RBusy:
+            # (an analysis is running; we'll try again on the next edit)
+            self.back_calc_btn.setEnabled(False)
+            return None
         print("Imputed data: %s", imputed)
 
         # Leave if nothing was imputed
@@ -36,8 +36,7 @@ class CovModel(QAbstractTableModel):
         self.new_data_type = CONTINUOUS if covariate.data_type==FACTOR else FACTOR
 
         # first sort the studies by the cov. of interest
-        self.dataset.studies.sort(\
-            cmp=self.dataset.cmp_studies(compare_by=self.covariate.name))
+        self.dataset.sort_studies(compare_by=self.covariate.name)
         
         self.update_included_studies()
         self.add_cov_with_new_type()
@@ -113,8 +112,7 @@ class CovModel(QAbstractTableModel):
         return alpha_str 
 
     def refresh_cov_values(self):
-        self.dataset.studies.sort(\
-            cmp=self.dataset.cmp_studies(compare_by=self.covariate.name))
+        self.dataset.sort_studies(compare_by=self.covariate.name)
         
         self.update_included_studies()
         cov_d = self.dataset.get_values_for_cov(self.covariate)
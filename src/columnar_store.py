@@ -0,0 +1,503 @@
+#############################################################################################
+#                                                                                           #
+#  Byron C. Wallace                                                                         #
+#  George Dietz                                                                             #
+#  CEBM @ Brown                                                                             #
+#  OpenMeta[analyst]                                                                        #
+#                                                                                           #
+#  Array-backed (columnar) storage for the raw data and effects of a Dataset.               #
+#                                                                                           #
+#  Normally every MetaAnalyticUnit holds a dictionary mapping effects to dictionaries       #
+#  mapping group strings (e.g., 'txA-txB') to small dictionaries of estimates, and every    #
+#  TreatmentGroup holds a list of raw data. For large datasets this is a lot of small       #
+#  Python objects. A 'packed' dataset instead keeps one numpy array (with a row per         #
+#  study) for each outcome/follow-up/group (raw data) and for each                          #
+#  outcome/follow-up/group-pair/metric (effects). The units' effects_dict and the groups'   #
+#  raw_data are replaced by thin views onto rows of these arrays, which behave like the     #
+#  dictionaries/lists they replace, so that the MetaAnalyticUnit and Dataset accessor       #
+#  methods keep working unchanged on top of them.                                           #
+#                                                                                           #
+#  Views pickle and (deep)copy as the plain containers they stand in for; thus saved        #
+#  files are unaffected by whether or not a dataset was packed.                             #
+#                                                                                           #
+#############################################################################################
+
+import numpy as np
+
+# the fields of an effect 'dictionary' (see MetaAnalyticUnit.get_init_effect_d);
+# the last two are only present once the display values have been calculated.
+EFFECT_FIELDS = ["est", "lower", "upper", "SE",
+                 "display_est", "display_lower", "display_upper",
+                 "display_se", "display_conf_level"]
+OPTIONAL_EFFECT_FIELDS = ["display_se", "display_conf_level"]
+_FIELD_INDEX = dict([(field, i) for i, field in enumerate(EFFECT_FIELDS)])
+
+def _to_float(x):
+    if x is None or x == "":
+        return np.nan
+    return float(x)
+
+def _from_float(x, missing=None):
+    if np.isnan(x):
+        return missing
+    return float(x)
+
+
+class ColumnarBlock(object):
+    '''
+    The arrays for one outcome/follow-up. raw_data maps group names to
+    (n_rows x raw_data_length) arrays; effects maps (group_str, effect)
+    tuples to [present, values, optional_set], where present is a boolean
+    array recording which rows (studies) have an entry for this group
+    string, values is an (n_rows x len(EFFECT_FIELDS)) array and
+    optional_set records which of the OPTIONAL_EFFECT_FIELDS have been
+    set (possibly to None) for each row. The latter two are allocated
+    only once a value is actually set. Missing values are NaNs.
+    '''
+    def __init__(self, n_rows, raw_data_length):
+        self.n_rows = n_rows
+        self.raw_data_length = raw_data_length
+        self.raw_data = {}
+        self.effects = {}
+
+    def get_raw_data_array(self, group):
+        if not group in self.raw_data:
+            arr = np.empty((self.n_rows, self.raw_data_length))
+            arr.fill(np.nan)
+            self.raw_data[group] = arr
+        return self.raw_data[group]
+
+    def get_effect_arrays(self, group_str, effect):
+        key = (group_str, effect)
+        if not key in self.effects:
+            self.effects[key] = [np.zeros(self.n_rows, dtype=bool), None, None]
+        return self.effects[key]
+
+    def get_effect_values_array(self, group_str, effect):
+        arrays = self.get_effect_arrays(group_str, effect)
+        if arrays[1] is None:
+            values = np.empty((self.n_rows, len(EFFECT_FIELDS)))
+            values.fill(np.nan)
+            arrays[1] = values
+            arrays[2] = np.zeros((self.n_rows, len(OPTIONAL_EFFECT_FIELDS)), dtype=bool)
+        return arrays[1]
+
+    def clear_effect(self, group_str, effect, row):
+        present, values, optional_set = self.get_effect_arrays(group_str, effect)
+        present[row] = False
+        if values is not None:
+            values[row, :] = np.nan
+            optional_set[row, :] = False
+
+    def group_strings(self, effect, row):
+        return [group_str for (group_str, an_effect), arrays in self.effects.items() \
+                            if an_effect == effect and arrays[0][row]]
+
+    def nbytes(self):
+        n = sum([arr.nbytes for arr in self.raw_data.values()])
+        for arrays in self.effects.values():
+            n += sum([arr.nbytes for arr in arrays if arr is not None])
+        return n
+
+
+class ColumnarStore(object):
+    '''
+    Holds the ColumnarBlocks of a packed dataset, keyed by (outcome, follow_up)
+    names. Row i corresponds to the i-th study of the dataset at the time
+    it was packed (see study_ids).
+    '''
+    def __init__(self, study_ids=None):
+        self.study_ids = list(study_ids or [])
+        self.n_rows = len(self.study_ids)
+        self._rows_by_id = {}
+        for row, study_id in enumerate(self.study_ids):
+            self._rows_by_id.setdefault(study_id, row)
+        self.blocks = {}
+
+    def get_block(self, outcome_name, follow_up, raw_data_length):
+        key = (outcome_name, follow_up)
+        if not key in self.blocks:
+            self.blocks[key] = ColumnarBlock(self.n_rows, raw_data_length)
+        return self.blocks[key]
+
+    def row_for_study_id(self, study_id):
+        try:
+            return self._rows_by_id[study_id]
+        except KeyError:
+            raise ValueError("study id %s was not packed" % (study_id,))
+
+    def get_raw_data_column(self, outcome_name, follow_up, group, index):
+        ''' raw data entry index for the given group, for all (packed) studies '''
+        return self.blocks[(outcome_name, follow_up)].raw_data[group][:, index]
+
+    def get_effect_column(self, outcome_name, follow_up, group_str, effect, field="est"):
+        ''' the given field of the effect for all (packed) studies; NaN where missing '''
+        values = self.blocks[(outcome_name, follow_up)].effects[(group_str, effect)][1]
+        if values is None:
+            column = np.empty(self.n_rows)
+            column.fill(np.nan)
+            return column
+        return values[:, _FIELD_INDEX[field]]
+
+    def nbytes(self):
+        return sum([block.nbytes() for block in self.blocks.values()])
+
+    ###
+    # renaming; the views hold references to the blocks (not their keys),
+    # so we only need to update the keys here.
+    def rename_outcome(self, old_name, new_name):
+        for (outcome_name, follow_up) in self.blocks.keys():
+            if outcome_name == old_name:
+                self.blocks[(new_name, follow_up)] = self.blocks.pop((outcome_name, follow_up))
+
+    def rename_follow_up(self, outcome_name, old_name, new_name):
+        if (outcome_name, old_name) in self.blocks:
+            self.blocks[(outcome_name, new_name)] = self.blocks.pop((outcome_name, old_name))
+
+    def rename_group(self, old_name, new_name):
+        for block in self.blocks.values():
+            if old_name in block.raw_data:
+                block.raw_data[new_name] = block.raw_data.pop(old_name)
+
+    ###
+    # packing/unpacking datasets
+    @staticmethod
+    def pack_dataset(dataset, install_views=True):
+        '''
+        Moves the raw data and effects of all the studies in the dataset into
+        a new ColumnarStore and installs views onto it in their place; returns
+        the store. If install_views is False the dataset is left as it is,
+        i.e., the store is just a (columnar) copy of it.
+        '''
+        store = ColumnarStore([study.id for study in dataset.studies])
+        for row, study in enumerate(dataset.studies):
+            for outcome_name, follow_ups in study.outcomes_to_follow_ups.items():
+                for follow_up, ma_unit in follow_ups.items():
+                    block = store.get_block(outcome_name, follow_up, ma_unit.raw_data_length)
+                    for group_name, group in ma_unit.tx_groups.items():
+                        arr = block.get_raw_data_array(group_name)
+                        raw_data = list(group.raw_data)
+                        # raw data lists may be short if the unit is malformed;
+                        # we just leave the remaining entries missing
+                        for i, x in enumerate(raw_data[:block.raw_data_length]):
+                            arr[row, i] = _to_float(x)
+                        if install_views:
+                            group.raw_data = RawDataView(arr, row, len(raw_data))
+                    effect_names = list(ma_unit.effects_dict.keys())
+                    for effect in effect_names:
+                        for group_str, effect_d in ma_unit.effects_dict[effect].items():
+                            _write_effect(block, row, group_str, effect, effect_d)
+                    if install_views:
+                        ma_unit.effects_dict = EffectsDictView(block, row, effect_names)
+        return store
+
+    @staticmethod
+    def unpack_dataset(dataset):
+        ''' Replaces any views in the dataset with plain lists/dictionaries '''
+        for study in dataset.studies:
+            for follow_ups in study.outcomes_to_follow_ups.values():
+                for ma_unit in follow_ups.values():
+                    if isinstance(ma_unit.effects_dict, EffectsDictView):
+                        ma_unit.effects_dict = ma_unit.effects_dict.to_dict()
+                    for group in ma_unit.tx_groups.values():
+                        if isinstance(group.raw_data, RawDataView):
+                            group.raw_data = list(group.raw_data)
+
+
+def _write_effect(block, row, group_str, effect, effect_d):
+    block.clear_effect(group_str, effect, row)
+    block.get_effect_arrays(group_str, effect)[0][row] = True
+    for field, x in effect_d.items():
+        if field in _FIELD_INDEX:
+            _set_effect_field(block, row, group_str, effect, field, x)
+
+def _set_effect_field(block, row, group_str, effect, field, x):
+    if x is None and field not in OPTIONAL_EFFECT_FIELDS and \
+                    block.get_effect_arrays(group_str, effect)[1] is None:
+        return
+    values = block.get_effect_values_array(group_str, effect)
+    values[row, _FIELD_INDEX[field]] = _to_float(x)
+    if field in OPTIONAL_EFFECT_FIELDS:
+        optional_set = block.get_effect_arrays(group_str, effect)[2]
+        optional_set[row, OPTIONAL_EFFECT_FIELDS.index(field)] = True
+
+
+class RawDataView(object):
+    ''' Stands in for the raw data list of a TreatmentGroup; missing values read as "" '''
+    __slots__ = ("array", "row", "length")
+
+    def __init__(self, array, row, length):
+        self.array = array
+        self.row = row
+        self.length = min(length, array.shape[1])
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("raw data index out of range")
+        return _from_float(self.array[self.row, i], missing="")
+
+    def __setitem__(self, i, x):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("raw data index out of range")
+        self.array[self.row, i] = _to_float(x)
+
+    def __iter__(self):
+        for i in xrange(self.length):
+            yield self[i]
+
+    def __contains__(self, x):
+        return x in list(self)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return list(self)
+
+
+class EffectView(object):
+    '''
+    Stands in for one of the (est, lower, upper, ...) dictionaries; keys are
+    always present except for the optional display fields, which are present
+    only once set (even if set to None).
+    '''
+    __slots__ = ("block", "row", "group_str", "effect")
+
+    def __init__(self, block, row, group_str, effect):
+        self.block = block
+        self.row = row
+        self.group_str = group_str
+        self.effect = effect
+
+    def _values(self):
+        return self.block.get_effect_arrays(self.group_str, self.effect)[1]
+
+    def keys(self):
+        optional_set = self.block.get_effect_arrays(self.group_str, self.effect)[2]
+        if optional_set is None:
+            return [field for field in EFFECT_FIELDS if field not in OPTIONAL_EFFECT_FIELDS]
+        return [field for field in EFFECT_FIELDS if field not in OPTIONAL_EFFECT_FIELDS or \
+                    optional_set[self.row, OPTIONAL_EFFECT_FIELDS.index(field)]]
+
+    def __contains__(self, field):
+        return field in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, field):
+        if not field in _FIELD_INDEX:
+            raise KeyError(field)
+        values = self._values()
+        if values is None:
+            return None
+        return _from_float(values[self.row, _FIELD_INDEX[field]])
+
+    def get(self, field, default=None):
+        if field in self:
+            return self[field]
+        return default
+
+    def __setitem__(self, field, x):
+        if not field in _FIELD_INDEX:
+            raise KeyError("%s cannot be stored in a columnar effect" % field)
+        _set_effect_field(self.block, self.row, self.group_str, self.effect, field, x)
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def values(self):
+        return [self[field] for field in self.keys()]
+
+    def copy(self):
+        return self.to_dict()
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return self.to_dict() == dict(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return self.to_dict()
+
+
+class EffectGroupsView(object):
+    ''' Stands in for effects_dict[effect], mapping group strings to EffectViews '''
+    __slots__ = ("block", "row", "effect")
+
+    def __init__(self, block, row, effect):
+        self.block = block
+        self.row = row
+        self.effect = effect
+
+    def keys(self):
+        return self.block.group_strings(self.effect, self.row)
+
+    def __contains__(self, group_str):
+        key = (group_str, self.effect)
+        return key in self.block.effects and self.block.effects[key][0][self.row]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, group_str):
+        if not group_str in self:
+            raise KeyError(group_str)
+        return EffectView(self.block, self.row, group_str, self.effect)
+
+    def get(self, group_str, default=None):
+        if group_str in self:
+            return self[group_str]
+        return default
+
+    def __setitem__(self, group_str, effect_d):
+        # copy the values over *before* (re)initializing the row, as
+        # effect_d may be a view onto it
+        effect_d = dict(effect_d.items())
+        _write_effect(self.block, self.row, group_str, self.effect, effect_d)
+
+    def pop(self, group_str, *default):
+        if not group_str in self:
+            if default:
+                return default[0]
+            raise KeyError(group_str)
+        effect_d = self[group_str].to_dict()
+        self.block.clear_effect(group_str, self.effect, self.row)
+        return effect_d
+
+    def items(self):
+        return [(group_str, self[group_str]) for group_str in self.keys()]
+
+    def values(self):
+        return [self[group_str] for group_str in self.keys()]
+
+    def to_dict(self):
+        return dict([(group_str, self[group_str].to_dict()) for group_str in self.keys()])
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return self.to_dict()
+
+
+class EffectsDictView(object):
+    ''' Stands in for MetaAnalyticUnit.effects_dict '''
+    __slots__ = ("block", "row", "effect_names")
+
+    def __init__(self, block, row, effect_names):
+        self.block = block
+        self.row = row
+        self.effect_names = list(effect_names)
+
+    def keys(self):
+        return list(self.effect_names)
+
+    def __contains__(self, effect):
+        return effect in self.effect_names
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.effect_names)
+
+    def __getitem__(self, effect):
+        if not effect in self.effect_names:
+            raise KeyError(effect)
+        return EffectGroupsView(self.block, self.row, effect)
+
+    def get(self, effect, default=None):
+        if effect in self:
+            return self[effect]
+        return default
+
+    def __setitem__(self, effect, group_strs_to_effect_ds):
+        if effect in self.effect_names:
+            self.pop(effect)
+        self.effect_names.append(effect)
+        groups_view = self[effect]
+        for group_str, effect_d in dict(group_strs_to_effect_ds).items():
+            groups_view[group_str] = effect_d
+
+    def pop(self, effect, *default):
+        if not effect in self.effect_names:
+            if default:
+                return default[0]
+            raise KeyError(effect)
+        groups_view = self[effect]
+        effect_d = groups_view.to_dict()
+        for group_str in groups_view.keys():
+            groups_view.pop(group_str)
+        self.effect_names.remove(effect)
+        return effect_d
+
+    def items(self):
+        return [(effect, self[effect]) for effect in self.keys()]
+
+    def values(self):
+        return [self[effect] for effect in self.keys()]
+
+    def to_dict(self):
+        return dict([(effect, self[effect].to_dict()) for effect in self.keys()])
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return self.to_dict()
@@ -556,7 +556,11 @@ class ContinuousDataForm(QDialog, forms.ui_continuous_data_form.Ui_ContinuousDat
             # now pass off what we have for this study to the
             # imputation routine
             alpha = self.conf_level_to_alpha()
-            results_from_r = meta_py_r.impute_cont_data(cur_dict, alpha)
+            try:
+                results_from_r = meta_py_r.impute_cont_data(cur_dict, alpha)
+            except meta_py_r.RBusy:
+                # (an analysis is running; we'll try again on the next edit)
+                return None
 
             print "Raw results from R (imputation): %s" % results_from_r
             print results_from_r
@@ -614,9 +618,13 @@ class ContinuousDataForm(QDialog, forms.ui_continuous_data_form.Ui_ContinuousDat
 
         # now pass off what we have for this study to the
         # imputation routine
-        results_from_r = meta_py_r.impute_pre_post_cont_data(params_dict,
+        try:
+            results_from_r = meta_py_r.impute_pre_post_cont_data(params_dict,
                                         float(self.correlation_pre_post.text()),
                                         self.conf_level_to_alpha())
+        except meta_py_r.RBusy:
+            # (an analysis is running; we'll try again on the next edit)
+            return None
  
         print "imputation results from R: %s" % results_from_r
         
@@ -833,7 +841,12 @@ class ContinuousDataForm(QDialog, forms.ui_continuous_data_form.Ui_ContinuousDat
             self.back_calc_btn.setVisible(True)
             
         (group1_data, group2_data, effect_data) = build_data_dicts()
-        imputed = meta_py_r.back_calc_cont_data(group1_data, group2_data, effect_data, self.conf_level)
+        try:
+            imputed = meta_py_r.back_calc_cont_data(group1_data, group2_data, effect_data, self.conf_level)
+        except meta_py_r.RBusy:
+            # (an analysis is running; we'll try again on the next edit)
+            self.back_calc_btn.setEnabled(False)
+            return None
         print("Imputed data: ", imputed)
         
         # Leave if there was a failure
@@ -694,7 +694,12 @@ class DiagnosticDataForm(QDialog, Ui_DiagnosticDataForm):
 
         #if diag_data is not None:
             
-        imputed = meta_py_r.impute_diag_data(diag_data)
+        try:
+            imputed = meta_py_r.impute_diag_data(diag_data)
+        except meta_py_r.RBusy:
+            # (an analysis is running; we'll try again on the next edit)
+            self.back_calc_Btn.setEnabled(False)
+            return None
         print "imputed data: %s" % imputed
         
         # Leave if nothing was imputed
@@ -2,7 +2,7 @@
 #import os
 
 from PyQt4.Qt import QObject, SIGNAL
-from PyQt4.QtGui import QDialog, QDialogButtonBox
+from PyQt4.QtGui import QDialog, QDialogButtonBox, QMessageBox
 
 import forms.ui_edit_forest_plot
 import ma_specs
@@ -138,32 +138,39 @@ class EditPlotWindow(QDialog, forms.ui_edit_forest_plot.Ui_edit_forest_plot_dlg)
         # parameter names in the plot params list
         ma_specs.add_plot_params(self)
 
-        # load things up in the R side
-        meta_py_r.load_vars_for_plot(self.img_params_path)
+        # (all in one go, so that a queued analysis can't get at R in
+        # between; raises RBusy if one is running)
+        with meta_py_r.R_if_available():
+            # load things up in the R side
+            meta_py_r.load_vars_for_plot(self.img_params_path)
 
-        # update relevant variables (on the R side)
-        # with new values -- we also write the updated
-        # params out to disk here
-        meta_py_r.update_plot_params(self.current_param_vals, \
-                                      write_them_out=True, \
-                                      outpath="%s.params" % self.img_params_path)
+            # update relevant variables (on the R side)
+            # with new values -- we also write the updated
+            # params out to disk here
+            meta_py_r.update_plot_params(self.current_param_vals, \
+                                          write_them_out=True, \
+                                          outpath="%s.params" % self.img_params_path)
 
-        # now re-generate the plot data on the R side of
-        # things
-        meta_py_r.regenerate_plot_data()
+            # now re-generate the plot data on the R side of
+            # things
+            meta_py_r.regenerate_plot_data()
 
 
-        # finally, actually make the plot and spit it to disk
-        self.png_path = self.current_param_vals["fp_outpath"]
-        meta_py_r.generate_forest_plot(self.png_path)
+            # finally, actually make the plot and spit it to disk
+            self.png_path = self.current_param_vals["fp_outpath"]
+            meta_py_r.generate_forest_plot(self.png_path)
 
-        #meta_py_r.write_out_plot_data("%s.plotdata" % self.img_params_path)
-        meta_py_r.write_out_plot_data("%s" % self.img_params_path)
+            #meta_py_r.write_out_plot_data("%s.plotdata" % self.img_params_path)
+            meta_py_r.write_out_plot_data("%s" % self.img_params_path)
 
     def regenerate_graph(self):
         # this loads the plot.data into R's environment;
         # the variable name will be plot.data
-        self.update_plot()
+        try:
+            self.update_plot()
+        except meta_py_r.RBusy, e:
+            QMessageBox.information(self, "R is busy", str(e))
+            return
         self.swap_graphic()
 
         # will need to tell it to 
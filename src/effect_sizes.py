@@ -0,0 +1,287 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Vectorized (numpy) effect size computations.                             #
+#                                                                           #
+#  Point estimates, standard errors and confidence intervals for whole      #
+#  columns of studies are computed here in a single call, on the            #
+#  *calculation* scale (e.g., log for ratios). The formulae mirror          #
+#  metafor's escalc (with its default zero-cell correction, i.e.,           #
+#  add=1/2, to="only0") and openmetar's compute.diag.point.estimates;       #
+#  R is used only to cross-check these routines in the tests.               #
+#                                                                           #
+#  Note that *no QT and no R live here*.                                    #
+#                                                                           #
+#############################################################################
+
+import math
+
+import numpy as np
+
+BINARY_TWO_ARM = ["OR", "RD", "RR", "AS", "YUQ", "YUY"]
+BINARY_ONE_ARM = ["PR", "PLN", "PLO", "PAS", "PFT"]
+CONTINUOUS_TWO_ARM = ["MD", "SMD"]
+CONTINUOUS_ONE_ARM = ["TX Mean"]
+DIAGNOSTIC = ["Sens", "Spec", "PLR", "NLR", "DOR"]
+
+# escalc defaults
+DEFAULT_ADD = 0.5
+DEFAULT_TO = "only0"
+
+##################### CONFIDENCE LEVEL MULTIPLIER #######################
+# coefficients for Acklam's rational approximation to the inverse of
+# the standard normal cdf; a single Halley step (using erfc) brings the
+# result to full double precision, i.e., it agrees with R's qnorm.
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+      3.754408661907416e+00)
+_P_LOW = 0.02425
+
+def qnorm(p):
+    ''' inverse of the standard normal cdf (i.e., R's qnorm(p)) '''
+    p = float(p)
+    if p <= 0.0 or p >= 1.0:
+        if p == 0.0:
+            return float("-inf")
+        if p == 1.0:
+            return float("inf")
+        raise ValueError("qnorm is only defined for 0 <= p <= 1 (got %s)" % p)
+
+    if p < _P_LOW:
+        q = math.sqrt(-2*math.log(p))
+        x = (((((_C[0]*q+_C[1])*q+_C[2])*q+_C[3])*q+_C[4])*q+_C[5]) / \
+                ((((_D[0]*q+_D[1])*q+_D[2])*q+_D[3])*q+1)
+    elif p <= 1-_P_LOW:
+        q = p-0.5
+        r = q*q
+        x = (((((_A[0]*r+_A[1])*r+_A[2])*r+_A[3])*r+_A[4])*r+_A[5])*q / \
+                (((((_B[0]*r+_B[1])*r+_B[2])*r+_B[3])*r+_B[4])*r+1)
+    else:
+        q = math.sqrt(-2*math.log(1-p))
+        x = -(((((_C[0]*q+_C[1])*q+_C[2])*q+_C[3])*q+_C[4])*q+_C[5]) / \
+                 ((((_D[0]*q+_D[1])*q+_D[2])*q+_D[3])*q+1)
+
+    # refinement
+    e = 0.5 * math.erfc(-x/math.sqrt(2)) - p
+    u = e * math.sqrt(2*math.pi) * math.exp(x*x/2.0)
+    return x - u/(1 + x*u/2.0)
+
+def get_mult(conf_level):
+    '''
+    The multiplier for a (two-sided) confidence interval at the given
+    level, e.g., 95 -> 1.959964; this is abs(qnorm(alpha/2)) in R.
+    '''
+    alpha = 1.0-float(conf_level)/100.0
+    return abs(qnorm(alpha/2.0))
+
+##################### HELPERS #######################
+def to_array(values):
+    '''
+    Converts a column of raw data, as stored on the MetaAnalyticUnit
+    objects (i.e., numbers, with None or "" for missing entries), into
+    a float array with NaNs in place of the missing entries.
+    '''
+    if np.isscalar(values) or values is None:
+        values = [values]
+    return np.array([np.nan if x in (None, "") else float(x) for x in values],
+                        dtype=float)
+
+def to_list(arr):
+    ''' the inverse of to_array; NaNs come back as None '''
+    return [None if np.isnan(x) else float(x) for x in np.asarray(arr, dtype=float)]
+
+def _zero_cell_correction(cells, add=DEFAULT_ADD, to=DEFAULT_TO):
+    '''
+    Adds a constant to the cells (a list of equal length arrays, one per
+    cell of the table) as per escalc's 'add' and 'to' arguments.
+    '''
+    cells = [np.array(c, dtype=float) for c in cells]
+    if to == "all":
+        return [c + add for c in cells]
+    if to == "only0":
+        any_zero = np.zeros(cells[0].shape, dtype=bool)
+        for c in cells:
+            any_zero |= (c == 0)
+        return [np.where(any_zero, c + add, c) for c in cells]
+    if to == "if0all":
+        if any([np.any(c == 0) for c in cells]):
+            return [c + add for c in cells]
+    return cells
+
+def est_and_ci(yi, vi, conf_level=95.0):
+    '''
+    Given columns of point estimates and variances (on the calculation
+    scale), returns (est, lower, upper, se) arrays.
+    '''
+    yi = np.asarray(yi, dtype=float)
+    with np.errstate(invalid="ignore"):
+        se = np.sqrt(np.asarray(vi, dtype=float))
+    mult = get_mult(conf_level)
+    return (yi, yi-mult*se, yi+mult*se, se)
+
+##################### BINARY #######################
+def binary_two_arm(metric, e1, n1, e2, n2, add=DEFAULT_ADD, to=DEFAULT_TO):
+    '''
+    Returns (yi, vi) arrays for the two-arm binary metric; e1/e2 are the
+    number of events and n1/n2 the group sizes.
+    '''
+    e1, n1, e2, n2 = [to_array(x) for x in (e1, n1, e2, n2)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ai, bi, ci, di = _zero_cell_correction([e1, n1-e1, e2, n2-e2], add, to)
+        n1i, n2i = ai+bi, ci+di
+        p1i, p2i = ai/n1i, ci/n2i
+
+        if metric == "OR":
+            yi = np.log((ai*di)/(bi*ci))
+            vi = 1.0/ai + 1.0/bi + 1.0/ci + 1.0/di
+        elif metric == "RR":
+            yi = np.log(p1i/p2i)
+            vi = 1.0/ai - 1.0/n1i + 1.0/ci - 1.0/n2i
+        elif metric == "RD":
+            yi = p1i - p2i
+            vi = p1i*(1-p1i)/n1i + p2i*(1-p2i)/n2i
+        elif metric == "AS":
+            yi = np.arcsin(np.sqrt(p1i)) - np.arcsin(np.sqrt(p2i))
+            vi = 1.0/(4*n1i) + 1.0/(4*n2i)
+        elif metric in ("YUQ", "YUY"):
+            odds_ratio = (ai*di)/(bi*ci)
+            sum_of_inverses = 1.0/ai + 1.0/bi + 1.0/ci + 1.0/di
+            if metric == "YUQ":
+                yi = (odds_ratio-1)/(odds_ratio+1)
+                vi = 1.0/4 * (1-yi**2)**2 * sum_of_inverses
+            else:
+                yi = (np.sqrt(odds_ratio)-1)/(np.sqrt(odds_ratio)+1)
+                vi = 1.0/16 * (1-yi**2)**2 * sum_of_inverses
+        else:
+            raise ValueError("unknown two-arm binary metric: %s" % metric)
+    return (yi, vi)
+
+def binary_one_arm(metric, e1, n1, add=DEFAULT_ADD, to=DEFAULT_TO):
+    ''' Returns (yi, vi) arrays for the one-arm binary metric. '''
+    e1, n1 = to_array(e1), to_array(n1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi, mi = _zero_cell_correction([e1, n1-e1], add, to)
+        ni = xi + mi
+        pri = xi/ni
+
+        if metric == "PR":
+            yi = pri
+            vi = pri*(1-pri)/ni
+        elif metric == "PLN":
+            yi = np.log(pri)
+            vi = 1.0/xi - 1.0/ni
+        elif metric == "PLO":
+            yi = np.log(pri/(1-pri))
+            vi = 1.0/xi + 1.0/mi
+        elif metric == "PAS":
+            yi = np.arcsin(np.sqrt(pri))
+            vi = 1.0/(4*ni)
+        elif metric == "PFT":
+            yi = 0.5*(np.arcsin(np.sqrt(xi/(ni+1))) + np.arcsin(np.sqrt((xi+1)/(ni+1))))
+            vi = 1.0/(4*ni + 2)
+        else:
+            raise ValueError("unknown one-arm binary metric: %s" % metric)
+    return (yi, vi)
+
+def binary_effects(metric, e1, n1, e2=None, n2=None, conf_level=95.0):
+    '''
+    (est, lower, upper, se) arrays on the calculation scale for columns of
+    binary data; e2 and n2 are ignored for one-arm metrics.
+    '''
+    if metric in BINARY_ONE_ARM:
+        yi, vi = binary_one_arm(metric, e1, n1)
+    else:
+        yi, vi = binary_two_arm(metric, e1, n1, e2, n2)
+    return est_and_ci(yi, vi, conf_level)
+
+##################### CONTINUOUS #######################
+def _cmi(mi):
+    ''' exact small sample bias correction for Hedges' g '''
+    mi = np.asarray(mi, dtype=float)
+    cmi = np.empty(mi.shape)
+    cmi.fill(np.nan)
+    for i, m in enumerate(mi.flat):
+        if not np.isnan(m) and m > 1:
+            cmi.flat[i] = math.exp(math.lgamma(m/2.0) - math.log(math.sqrt(m/2.0)) - math.lgamma((m-1)/2.0))
+    return cmi
+
+def continuous_two_arm(metric, n1, m1, sd1, n2, m2, sd2):
+    ''' Returns (yi, vi) arrays for the two-arm continuous metric. '''
+    n1, m1, sd1, n2, m2, sd2 = [to_array(x) for x in (n1, m1, sd1, n2, m2, sd2)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if metric == "MD":
+            yi = m1 - m2
+            vi = sd1**2/n1 + sd2**2/n2
+        elif metric == "SMD":
+            mi = n1 + n2 - 2
+            sdpi = np.sqrt(((n1-1)*sd1**2 + (n2-1)*sd2**2)/mi)
+            yi = _cmi(mi) * (m1-m2)/sdpi
+            vi = 1.0/n1 + 1.0/n2 + yi**2/(2*(n1+n2))
+        else:
+            raise ValueError("unknown two-arm continuous metric: %s" % metric)
+    return (yi, vi)
+
+def continuous_one_arm(metric, n1, m1, sd1):
+    ''' Returns (yi, vi) arrays for the one-arm continuous metric. '''
+    n1, m1, sd1 = [to_array(x) for x in (n1, m1, sd1)]
+    if metric != "TX Mean":
+        raise ValueError("unknown one-arm continuous metric: %s" % metric)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (m1, sd1**2/n1)
+
+def continuous_effects(metric, n1, m1, sd1, n2=None, m2=None, sd2=None,
+                       conf_level=95.0):
+    '''
+    (est, lower, upper, se) arrays on the calculation scale for columns of
+    continuous data; the second arm is ignored for one-arm metrics.
+    '''
+    if metric in CONTINUOUS_ONE_ARM:
+        yi, vi = continuous_one_arm(metric, n1, m1, sd1)
+    else:
+        yi, vi = continuous_two_arm(metric, n1, m1, sd1, n2, m2, sd2)
+    return est_and_ci(yi, vi, conf_level)
+
+##################### DIAGNOSTIC #######################
+def diagnostic(metric, tp, fn, fp, tn, add=DEFAULT_ADD, to=DEFAULT_TO):
+    '''
+    Returns (yi, se) arrays for the diagnostic metric, following
+    openmetar's compute.diag.point.estimates (logit scale for Sens and
+    Spec, log scale for the ratios).
+    '''
+    tp, fn, fp, tn = [to_array(x) for x in (tp, fn, fp, tn)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        TP, FN, TN, FP = _zero_cell_correction([tp, fn, tn, fp], add, to)
+        if metric == "Sens":
+            yi = np.log(TP/FN)
+            se = np.sqrt(1.0/TP + 1.0/FN)
+        elif metric == "Spec":
+            yi = np.log(TN/FP)
+            se = np.sqrt(1.0/TN + 1.0/FP)
+        elif metric == "PLR":
+            yi = np.log((TP*(TN+FP))/(FP*(TP+FN)))
+            se = np.sqrt(1.0/TP - 1.0/(TP+FN) + 1.0/FP - 1.0/(TN+FP))
+        elif metric == "NLR":
+            yi = np.log((FN*(TN+FP))/(TN*(TP+FN)))
+            # nb: this is the same as the PLR standard error; this is
+            # how it is (currently) computed on the R side.
+            se = np.sqrt(1.0/TP - 1.0/(TP+FN) + 1.0/FP - 1.0/(TN+FP))
+        elif metric == "DOR":
+            yi = np.log((TP*TN)/(FP*FN))
+            se = np.sqrt(1.0/TP + 1.0/FN + 1.0/FP + 1.0/TN)
+        else:
+            raise ValueError("unknown diagnostic metric: %s" % metric)
+    return (yi, se)
+
+def diagnostic_effects(metric, tp, fn, fp, tn, conf_level=95.0):
+    ''' (est, lower, upper, se) arrays on the calculation scale '''
+    yi, se = diagnostic(metric, tp, fn, fp, tn)
+    return est_and_ci(yi, se**2, conf_level)
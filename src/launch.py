@@ -1,70 +1,109 @@
-import sys, time
-from PyQt4 import QtGui
-from PyQt4.Qt import *
+import os, sys, time
 
-import meta_py_r
-import meta_form
-import meta_globals
-import settings
-from meta_form import DISABLE_NETWORK_STUFF
+# this comes first, so that it can time the imports below
+import startup_profiler
+startup_profiler.start(sys.argv)
+
+with startup_profiler.span("imports"):
+    from PyQt4 import QtGui
+    from PyQt4.Qt import *
+
+    import analysis_runner
+    import meta_py_r
+    import meta_form
+    import meta_globals
+    import method_registry
+    import oma_logging
+    import settings
+
+logger = oma_logging.get_logger(__name__)
 
 SPLASH_DISPLAY_TIME = 0 # TODO: change to 5 seconds in production version
 
-def load_R_libraries(app, splash=None):
-    ''' Loads the R libraries while updating the splash screen'''
-    
+def _load_method_registry():
+    method_registry.load(os.path.join(settings.get_base_path(), method_registry.CACHE_FILE_NAME))
+
+def load_R_libraries(app, splash):
+    '''
+    Loads the R libraries that are needed right away while updating the splash
+    screen (igraph and gemtc are loaded when the network stuff first needs them)
+    '''
     meta_py_r.get_R_libpaths() # print the lib paths
     rloader = meta_py_r.RlibLoader()
-    
-    splash.showMessage("Loading R libraries\n..")
-    app.processEvents()
-    
+
     splash.showMessage("Loading metafor\n....")
     app.processEvents()
-    rloader.load_metafor()
-    
+    startup_profiler.timed("load metafor", rloader.load_metafor)
+
     splash.showMessage("Loading openmetar\n........")
     app.processEvents()
-    rloader.load_openmetar()
-    
-    splash.showMessage("Loading igraph\n............")
-    app.processEvents()
-    rloader.load_igraph()
-    
-    splash.showMessage("Loading grid\n................")
+    startup_profiler.timed("load openmetar", rloader.load_openmetar)
+
+    splash.showMessage("Loading the openmetar methods\n............")
     app.processEvents()
-    rloader.load_grid()
-    
-    if not DISABLE_NETWORK_STUFF:
-        splash.showMessage("Loading gemtc\n...................")
-        app.processEvents()
-        rloader.load_gemtc()
+    startup_profiler.timed("load method registry", _load_method_registry)
+
+def _finish_profiling(quick_start):
+    startup_profiler.finish(settings.get_base_path(), quick_start=quick_start)
+
+def load_R_libraries_job():
+    '''
+    The same, as a (quiet) job for the analysis runner, so that it happens
+    in the background once the main window is up; the analyses that are
+    submitted in the meantime are queued behind it. We're done starting up
+    once it is done.
+    '''
+    rloader = meta_py_r.RlibLoader()
+    steps = [("loading metafor", lambda: startup_profiler.timed("load metafor", rloader.load_metafor)),
+             ("loading openmetar", lambda: startup_profiler.timed("load openmetar", rloader.load_openmetar)),
+             ("loading the openmetar methods",
+                    lambda: startup_profiler.timed("load method registry", _load_method_registry)),
+             ("done", lambda: _finish_profiling(True))]
+    return analysis_runner.AnalysisJob("loading R libraries", steps, quiet=True)
 
 def start():
     app = QtGui.QApplication(sys.argv)
     app.setApplicationName(meta_globals.APPLICATION_NAME)
     app.setOrganizationName(meta_globals.ORGANIZATION_NAME)
-    settings.setup_directories()
-    
-    splash_pixmap = QPixmap(":/misc/splash.png")
-    splash = QSplashScreen(splash_pixmap)
-    splash.show()
-    splash_starttime = time.time()
-    
-    load_R_libraries(app, splash)
-    
-    # Show splash screen for at least SPLASH_DISPLAY_TIME seconds
-    time_elapsed  = time.time() - splash_starttime
-    print("It took %s seconds to load the R libraries" % str(time_elapsed))
-    if time_elapsed < SPLASH_DISPLAY_TIME: # seconds
-        print("Going to sleep for %f seconds" % float(SPLASH_DISPLAY_TIME-time_elapsed))
-        QThread.sleep(int(SPLASH_DISPLAY_TIME-time_elapsed))
-
-    meta = meta_form.MetaForm()
-    splash.finish(meta)
-    meta.show()
+    startup_profiler.timed("load settings", settings.load_settings)
+    oma_logging.configure(str(settings.get_setting("log_levels")))
+    startup_profiler.timed("setup directories", settings.setup_directories)
+    quick_start = settings.get_setting("quick_start")
+
+    if quick_start:
+        # show the main window right away; R is started once it has been
+        # painted, and the R libraries are loaded in the background
+        meta = startup_profiler.timed("create main window", meta_form.MetaForm)
+        meta.show()
+        startup_profiler.timed("first paint", app.processEvents)
+        startup_profiler.timed("start R", meta_py_r.init_R)
+        meta.run_analysis(load_R_libraries_job())
+    else:
+        splash_pixmap = QPixmap(":/misc/splash.png")
+        splash = QSplashScreen(splash_pixmap)
+        splash.show()
+        splash_starttime = time.time()
+
+        splash.showMessage("Loading R libraries\n..")
+        app.processEvents()
+        startup_profiler.timed("start R", meta_py_r.init_R)
+        load_R_libraries(app, splash)
+
+        # Show splash screen for at least SPLASH_DISPLAY_TIME seconds
+        time_elapsed  = time.time() - splash_starttime
+        logger.info("It took %s seconds to load the R libraries", time_elapsed)
+        if time_elapsed < SPLASH_DISPLAY_TIME: # seconds
+            logger.debug("Going to sleep for %f seconds", SPLASH_DISPLAY_TIME-time_elapsed)
+            QThread.sleep(int(SPLASH_DISPLAY_TIME-time_elapsed))
+
+        meta = startup_profiler.timed("create main window", meta_form.MetaForm)
+        splash.finish(meta)
+        meta.show()
+        startup_profiler.timed("first paint", app.processEvents)
+        _finish_profiling(False)
+
     meta.start()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    start()
@@ -12,16 +12,23 @@
 #########################################################################################
 
 # core libraries
+import logging
+
 from PyQt4.Qt import Qt
 from PyQt4 import QtCore
 from PyQt4.QtCore import QAbstractTableModel, QModelIndex, QString, QVariant, SIGNAL
 from PyQt4.QtGui import QIcon
 
 # home-grown
-from ma_dataset import Dataset,Outcome,Study,Covariate
+from ma_dataset import Dataset,Outcome,Study,Covariate,calculate_display_effects_and_cis
 from meta_globals import *
 import calculator_routines as calc_fncs
+import effect_sizes
 import meta_py_r
+import oma_logging
+import scale_conversion
+
+logger = oma_logging.get_logger(__name__)
 
 # number of (empty) rows in the spreadsheet to show
 # following the last study.
@@ -29,9 +36,9 @@ DUMMY_ROWS = 20
 
 def DebugHelper(function):
     def _DebugHelper(*args, **kw):
-        print("Entered %s" % function.func_name)
+        logger.debug("Entered %s", function.func_name)
         res = function(*args, **kw)
-        print("Left %s" % function.func_name)
+        logger.debug("Left %s", function.func_name)
         return res
     return _DebugHelper
 
@@ -62,6 +69,12 @@ class DatasetModel(QAbstractTableModel):
     def __init__(self, filename=QString(), dataset=None, add_blank_study=True):
         super(DatasetModel, self).__init__()
         
+        # formatted values of the (expensive) raw data and outcome cells,
+        # keyed by study id; see _get_cached_display_value
+        self._display_cache = {}
+        self.display_cache_hits = 0
+        self.display_cache_misses = 0
+
         self.conf_level = self.set_conf_level(DEFAULT_CONF_LEVEL)
 
         self.dataset = dataset
@@ -85,7 +98,7 @@ class DatasetModel(QAbstractTableModel):
 
         self.update_current_group_names()
         
-        print("calling update column indices from ma_data_table_model init")
+        logger.debug("calling update column indices from ma_data_table_model init")
         self.update_column_indices()
          
          
@@ -108,7 +121,8 @@ class DatasetModel(QAbstractTableModel):
         
     def set_current_metric(self, metric):
         self.current_effect = metric
-        print "OK! metric updated."
+        self.invalidate_display_cache()
+        logger.debug("OK! metric updated.")
         
     def update_current_outcome(self):
         outcome_names = self.dataset.get_outcome_names()
@@ -118,6 +132,7 @@ class DatasetModel(QAbstractTableModel):
         # when the user edits the currently displayed outcome,
         # the edited outcome is shown in its place
         self.current_outcome = outcome_names[0] if len(outcome_names)>0 else None
+        self.invalidate_display_cache()
         self.reset()
         
     def update_current_time_points(self):
@@ -188,7 +203,7 @@ class DatasetModel(QAbstractTableModel):
             raws = [col+offset for col in range(6)]
             outcomes = [9, 10, 11]
             if sub_type == 'generic_effect': # generic effect and se
-                print("Detected generic effect outcome in update_column_indices")
+                logger.debug("Detected generic effect outcome in update_column_indices")
                 raws = []
                 outcomes = [offset, offset+1] #effect and se
         else: # diagnostic
@@ -202,18 +217,66 @@ class DatasetModel(QAbstractTableModel):
         ''' this method assumes the input can be cast to a float! '''
         float_var = float(float_var)
         precision = num_digits or self.NUM_DIGITS
-        formatted_str = "'%." + str(precision) + "f'" 
-        # kind of hacky; I can't find a better way to make the
-        # number of digits in the formatting parametric. oh well.
-        return eval(formatted_str + "% float_var")
+        return "%.*f" % (precision, float_var)
+
+    ###
+    # Caching of displayed values. Formatting the raw data and (in particular)
+    # the outcomes for display is relatively expensive and data() is called
+    # for every visible cell on every paint event, so the formatted values
+    # are cached per study. Entries are keyed on everything that determines
+    # the displayed value, and are dropped whenever the underlying data may
+    # have changed (see the invalidate_display_cache calls).
+    def invalidate_display_cache(self, study_id=None):
+        ''' Drops cached values for the given study, or for all studies if None '''
+        if study_id is None:
+            self._display_cache = {}
+        else:
+            self._display_cache.pop(study_id, None)
+
+    def get_display_cache_stats(self):
+        n_entries = sum([len(study_cache) for study_cache in self._display_cache.values()])
+        return {"hits":self.display_cache_hits,
+                "misses":self.display_cache_misses,
+                "entries":n_entries}
+
+    def _get_cached_display_value(self, study, column, role, compute_value):
+        key = (self.current_outcome, self.current_time_point, self.get_cur_group_str(),
+               self.current_effect, self.conf_level, column, role)
+        study_cache = self._display_cache.setdefault(study.id, {})
+        if key in study_cache:
+            self.display_cache_hits += 1
+            return study_cache[key]
+        self.display_cache_misses += 1
+        value = compute_value()
+        study_cache[key] = value
+        return value
+
+    def reset(self):
+        # everything may have changed
+        self.invalidate_display_cache()
+        QAbstractTableModel.reset(self)
 
 
 
     def data(self, index, role=Qt.DisplayRole):
         '''
-        Implements the required QTTableModel data method. There is a lot of switching on 
-        role/index/datatype here, but this seems consistent with the QT paradigm (see 
-        Summerfield's book)
+        Implements the required QTTableModel data method. The (formatted) raw data
+        and outcome values are cached; everything else is passed through to
+        _data.
+        '''
+        if index.isValid() and 0 <= index.row() < len(self.dataset) and \
+                role in (Qt.DisplayRole, Qt.EditRole) and self.current_outcome is not None:
+            column = index.column()
+            if column in self.RAW_DATA or column in self.OUTCOMES:
+                study = self.dataset.studies[index.row()]
+                return self._get_cached_display_value(study, column, role,
+                                                      lambda: self._data(index, role))
+        return self._data(index, role)
+
+    def _data(self, index, role=Qt.DisplayRole):
+        '''
+        There is a lot of switching on role/index/datatype here, but this seems 
+        consistent with the QT paradigm (see Summerfield's book)
         '''
 
         # number of digits to show in edit mode. this, I think, is enough.
@@ -287,13 +350,16 @@ class DatasetModel(QAbstractTableModel):
                     eff,grp = self.current_effect, group_str
                     
                     if current_data_type == BINARY:
-                        conv_to_disp_scale = lambda x: meta_py_r.binary_convert_scale(x, eff, convert_to="display.scale")
+                        # n1 is needed for the display scale (Freeman-Tukey)
+                        n1 = None
+                        if eff in scale_conversion.NEEDS_N:
+                            n1 = self.get_cur_raw_data_for_study(index.row())[1]
+                        conv_to_disp_scale = lambda x: scale_conversion.convert_value(x, eff, "binary", n1=n1)
                     elif current_data_type == CONTINUOUS:
-                        conv_to_disp_scale = lambda x: meta_py_r.continuous_convert_scale(x, eff, convert_to="display.scale")
+                        conv_to_disp_scale = lambda x: scale_conversion.convert_value(x, eff, "continuous")
                     
                     if current_data_type == CONTINUOUS and outcome_subtype == 'generic_effect':
                         d_est_and_se = ma_unit.get_display_effect_and_se(eff, grp, conv_to_disp_scale)
-                        print("DEST AND SE: %s" % str(d_est_and_se))
                         outcome_val = d_est_and_se[outcome_index]
                     else: # normal case of no outcome subtype
                         d_est_and_ci = ma_unit.get_display_effect_and_ci(eff, grp, conv_to_disp_scale)
@@ -439,17 +505,17 @@ class DatasetModel(QAbstractTableModel):
             prev_est, prev_lower, prev_upper = ma_unit.get_effect_and_ci(self.current_effect, group_str, self.get_mult())
         if data_type == BINARY:
             prev_est, prev_lower, prev_upper = [binary_display_scale(x) for x in [prev_est, prev_lower, prev_upper]]
-            print("Previous binary: %s" % str([prev_est, prev_lower, prev_upper]))
+            logger.debug("Previous binary: %s", [prev_est, prev_lower, prev_upper])
         elif data_type == CONTINUOUS:
             #prev_est, prev_lower, prev_upper = ma_unit.get_display_effect_and_ci(self.current_effect, group_str)
             prev_est, prev_lower, prev_upper = [continuous_display_scale(x) for x in [prev_est, prev_lower, prev_upper]]
-            print("Previous continuous: %s" % str([prev_est, prev_lower, prev_upper]))
+            logger.debug("Previous continuous: %s", [prev_est, prev_lower, prev_upper])
         elif data_type == DIAGNOSTIC:
             m_str = "Sens" if col in self.OUTCOMES[:3] else "Spec"
             #prev_est, prev_lower, prev_upper = ma_unit.get_display_effect_and_ci(m_str, group_str)
             prev_est, prev_lower, prev_upper = ma_unit.get_effect_and_ci(m_str, group_str, self.get_mult())
             prev_est, prev_lower, prev_upper = [meta_py_r.diagnostic_convert_scale(x, m_str, convert_to="display.scale") for x in [prev_est, prev_lower, prev_upper]]
-            print("Previous diagnostic: %s" % str([prev_est, prev_lower, prev_upper]))
+            logger.debug("Previous diagnostic: %s", [prev_est, prev_lower, prev_upper])
             
         # here we check if there is raw data for this study; 
         # if there is, we don't allow entry of outcomes
@@ -474,8 +540,7 @@ class DatasetModel(QAbstractTableModel):
                 delta = float("-inf")
             else:
                 delta = abs(new_val - d[col])
-                print "new val {0}, prev val {1}".format(new_val, d[col])
-                print "DELTA {0}".format(delta)
+                logger.debug("new val %s, prev val %s; DELTA %s", new_val, d[col], delta)
             epsilon = 10E-6 
             if delta > epsilon:
                 return False, '''You have already entered raw data for this study. If you want to enter the outcome directly, delete the raw data first.'''
@@ -623,7 +688,8 @@ class DatasetModel(QAbstractTableModel):
             
             
         elif column in self.OUTCOMES:
-            print("Value %s in outcomes" % str(value.toString()))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Value %s in outcomes", value.toString())
             
             row = index.row()
             
@@ -642,7 +708,7 @@ class DatasetModel(QAbstractTableModel):
                 # @TODO what to do if the entered estimate contradicts the raw data?
                 display_scale_val, converted_ok = value.toDouble()
                 
-                print("Display scale value: %s" % str(display_scale_val))
+                logger.debug("Display scale value: %s", display_scale_val)
 
             if display_scale_val is None or converted_ok:
                 if not self.is_diag():
@@ -650,7 +716,7 @@ class DatasetModel(QAbstractTableModel):
                     # scale on which the metric is assumed to have been
                     # entered into the 'calculation' scale (e.g., log)
                     calc_scale_val = None
-                    print("Input value is %s" % str(display_scale_val))
+                    logger.debug("Input value is %s", display_scale_val)
 
                     if self.current_effect == "PFT":
                         e1, n1, e2, n2 = self.get_cur_raw_data_for_study(study_index=row)
@@ -676,7 +742,7 @@ class DatasetModel(QAbstractTableModel):
                             #ma_unit.set_display_se(self.current_effect, group_str, display_scale_val)
                     else: # normal case
                         if column == self.OUTCOMES[0]: # estimate
-                            print("Setting estimate: %s" % str(calc_scale_val))
+                            logger.debug("Setting estimate: %s", calc_scale_val)
                             ma_unit.set_effect(self.current_effect, group_str, calc_scale_val)
                             #ma_unit.set_display_effect(self.current_effect, group_str, display_scale_val)
                         elif column == self.OUTCOMES[1]: #lower
@@ -685,12 +751,12 @@ class DatasetModel(QAbstractTableModel):
                         else: #upper
                             ma_unit.set_upper(self.current_effect, group_str, calc_scale_val)
                             #ma_unit.set_display_upper(self.current_effect, group_str, display_scale_val)
-                        print("calculating se")
+                        logger.debug("calculating se")
                         
                         # in normal case, only calculate SE when all data is filled in
                         if None not in ma_unit.get_entered_effect_and_ci(self.current_effect, group_str):              
                             se = ma_unit.calculate_SE_if_possible(self.current_effect, group_str, mult=self.mult)
-                            print("setting se to %s" % str(se))
+                            logger.debug("setting se to %s", se)
                         else:
                             se = None
                         ma_unit.set_SE(self.current_effect, group_str, se)
@@ -758,6 +824,7 @@ class DatasetModel(QAbstractTableModel):
                     new_value = None
             study.covariate_dict[cov_name] = new_value
             
+        self.invalidate_display_cache(study.id)
         self.emit(SIGNAL("dataChanged(QModelIndex, QModelIndex)"), index, index)
 
         # tell the view that an entry in the table has changed, and what the old
@@ -770,11 +837,10 @@ class DatasetModel(QAbstractTableModel):
         if not self.is_diag():
             group_str = self.get_cur_group_str()
 
-            print group_str
-            print "ok checking it; cur outcome: %s. cur group: %s" % (self.current_outcome, group_str)
+            logger.debug("ok checking it; cur outcome: %s. cur group: %s", self.current_outcome, group_str)
             if self.current_outcome is not None:
-                effect_d = self.get_current_ma_unit_for_study(index.row()).effects_dict[self.current_effect][group_str]
-                print effect_d
+                effect_d = self.get_current_ma_unit_for_study(index.row()).get_effect_dict(self.current_effect, group_str)
+                logger.debug("effect dict: %s", effect_d)
                 
                 
                 # if the study has not been explicitly excluded by the user, then we automatically
@@ -1079,7 +1145,7 @@ class DatasetModel(QAbstractTableModel):
         try:
             return self.dataset.covariates[cov_index]
         except:
-            print("There is no covariate at that index")
+            logger.warning("There is no covariate at that index")
             return None
         
     def get_covariate_names(self):
@@ -1143,6 +1209,21 @@ class DatasetModel(QAbstractTableModel):
     def remove_follow_up_from_outcome(self, follow_up_name, outcome_name):
         self.dataset.remove_follow_up_from_outcome(follow_up_name, outcome_name)
         
+    def import_csv_rows(self, rows, progress_f=None):
+        '''
+        Enters rows (lists of strings: the study name, year, raw data and
+        outcome columns and then the covariates) as if they had been typed
+        into the spreadsheet, from the first row on; progress_f, if given,
+        is called with the number of cells entered so far.
+        '''
+        num_cols = len(rows[0])
+        for row, values in enumerate(rows):
+            for col in range(num_cols):
+                if progress_f is not None:
+                    progress_f(row*num_cols + col)
+                value = QVariant(QString(values[col]))
+                self.setData(self.index(row, col+1), value, import_csv=True)
+
     def add_covariate(self, covariate_name, covariate_type, cov_values=None):
         self.dataset.add_covariate(Covariate(covariate_name, covariate_type),
                                    cov_values=cov_values)
@@ -1174,8 +1255,7 @@ class DatasetModel(QAbstractTableModel):
         return prev_outcome
 
     def get_next_follow_up(self):
-        print "\nfollow ups for outcome:"
-        print self.dataset.outcome_names_to_follow_ups[self.current_outcome]
+        logger.debug("follow ups for outcome: %s", self.dataset.outcome_names_to_follow_ups[self.current_outcome])
         t_point = self.current_time_point
         if self.current_time_point >= max(self.dataset.outcome_names_to_follow_ups[self.current_outcome].keys()):
             t_point = 0
@@ -1186,7 +1266,7 @@ class DatasetModel(QAbstractTableModel):
             # assuming the current + 1 exists
             t_point += 1
         follow_up_name = self.get_follow_up_name_for_t_point(t_point)
-        print "\nt_point; name: %s, %s" % (t_point, follow_up_name)
+        logger.debug("t_point; name: %s, %s", t_point, follow_up_name)
         return (t_point, follow_up_name)
         
     def get_previous_follow_up(self):
@@ -1248,12 +1328,12 @@ class DatasetModel(QAbstractTableModel):
             self._next_group_index(group_names)
             
         next_txs = [group_names[self.tx_index_a], group_names[self.tx_index_b]]
-        print "new tx group indices a, b: %s, %s" % (self.tx_index_a, self.tx_index_b)
+        logger.debug("new tx group indices a, b: %s, %s", self.tx_index_a, self.tx_index_b)
         return next_txs
         
 
     def _next_group_indices(self, group_names):
-        print "\ngroup names: %s" % group_names
+        logger.debug("group names: %s", group_names)
         if self.tx_index_b < len(group_names)-1:
             self.tx_index_b += 1
         else:
@@ -1274,7 +1354,7 @@ class DatasetModel(QAbstractTableModel):
             
     def outcome_has_follow_up(self, outcome, follow_up):
         if outcome is None:
-            print("Tried to reference None outcome")
+            logger.warning("Tried to reference None outcome")
             return None
         outcome_d = self.dataset.outcome_names_to_follow_ups[outcome]
 
@@ -1290,20 +1370,21 @@ class DatasetModel(QAbstractTableModel):
         return group in outcome_d[follow_up].tx_groups.keys()
     
     def set_current_groups(self, group_names):
+        self.invalidate_display_cache()
         self.previous_txs = self.current_txs
         self.current_txs = group_names
         self.tx_index_a = self.dataset.get_group_names().index(group_names[0])
         self.tx_index_b = self.dataset.get_group_names().index(group_names[1])
-        print "\ncurrent tx group index a, b: %s, %s" % (self.tx_index_a, self.tx_index_b)
+        logger.debug("current tx group index a, b: %s, %s", self.tx_index_a, self.tx_index_b)
         
     def get_group_names(self):
         return self.dataset.get_group_names()
 
     def sort_studies(self, col, reverse):
         if col == self.NAME:
-            self.dataset.studies.sort(cmp = self.dataset.cmp_studies(compare_by="name", reverse=reverse, mult=self.get_mult()), reverse=reverse)
+            self.dataset.sort_studies(compare_by="name", reverse=reverse, sort_reverse=reverse, mult=self.get_mult())
         elif col == self.YEAR:
-            self.dataset.studies.sort(cmp = self.dataset.cmp_studies(compare_by="year", reverse=reverse, mult=self.get_mult()), reverse=reverse)
+            self.dataset.sort_studies(compare_by="year", reverse=reverse, sort_reverse=reverse, mult=self.get_mult())
         elif col in self.RAW_DATA:
             #data_type = self.dataset.get_outcome_type(self.current_outcome)
             # need this to dig down to find right ma_unit and data we're looking for to compare against
@@ -1311,8 +1392,8 @@ class DatasetModel(QAbstractTableModel):
                                       'follow_up': self.get_follow_up_name_for_t_point(self.current_time_point),
                                       'current_groups': self.get_current_groups(),
                                       'data_index': col - min(self.RAW_DATA)}
-            self.dataset.studies.sort(cmp = self.dataset.cmp_studies(compare_by="raw_data", 
-                reverse=reverse, directions_to_ma_unit=ma_unit_reference_info, mult=self.get_mult()), reverse=reverse)
+            self.dataset.sort_studies(compare_by="raw_data", reverse=reverse, sort_reverse=reverse,
+                                      directions_to_ma_unit=ma_unit_reference_info, mult=self.get_mult())
         elif col in self.OUTCOMES:
             # need this to dig down to find right ma_unit and data we're looking for to compare against
             ma_unit_reference_info = {
@@ -1324,33 +1405,28 @@ class DatasetModel(QAbstractTableModel):
                 'group_str': self.get_cur_group_str(),
                 'data_index': col - min(self.OUTCOMES)
             }
-            self.dataset.studies.sort(cmp = self.dataset.cmp_studies(compare_by="outcomes", 
-                                      reverse=reverse, directions_to_ma_unit=ma_unit_reference_info, mult=self.get_mult()),
-                                      reverse=reverse)
+            self.dataset.sort_studies(compare_by="outcomes", reverse=reverse, sort_reverse=reverse,
+                                      directions_to_ma_unit=ma_unit_reference_info, mult=self.get_mult())
         
             
         # covariates -- note that we assume anything to the right of the outcomes
         # is a covariate
         elif col > self.OUTCOMES[-1]:
             cov = self.get_cov(col)
-            self.dataset.studies.sort(cmp = self.dataset.cmp_studies(\
-                                        compare_by=cov.name, reverse=reverse, mult=self.get_mult()), reverse=reverse)
+            self.dataset.sort_studies(compare_by=cov.name, reverse=reverse, sort_reverse=reverse,
+                                      mult=self.get_mult())
 
         self.reset()
 
     def order_studies(self, ids):
         ''' Shuffles studies vector to the order specified by ids'''
-        ordered_studies = []
-        for an_id in ids:
-            for study in self.dataset.studies:
-                if study.id == an_id:
-                    ordered_studies.append(study)
-                    break
-        self.dataset.studies = ordered_studies
+        studies = [self.dataset.get_study_by_id(an_id) for an_id in ids]
+        self.dataset.set_studies([study for study in studies if study is not None])
         self.reset()
 
     def set_current_outcome(self, outcome_name):
         self.current_outcome = outcome_name
+        self.invalidate_display_cache()
         self.update_column_indices()
         self.update_cur_tx_effect()
         self.emit(SIGNAL("outcomeChanged()"))
@@ -1425,7 +1501,7 @@ class DatasetModel(QAbstractTableModel):
         # given the outcome data type
         data_type = data_model.get_outcome_type(d["current_outcome"])
         
-        print("data_type: ", data_type)
+        logger.debug("data_type: %s", data_type)
 
         all_txs = data_model.get_group_names()
 
@@ -1537,8 +1613,63 @@ class DatasetModel(QAbstractTableModel):
 
     @DebugHelper
     def try_to_update_outcomes(self):
-        for study_index in range(len(self.dataset.studies)):
-            self.update_outcome_if_possible(study_index)
+        # the effects are computed for all of the studies at once (i.e.,
+        # column-wise) rather than one study at a time.
+        study_indices = range(len(self.dataset.studies))
+        effects = self.compute_effects_for_studies(study_indices)
+        for study_index in study_indices:
+            self.update_outcome_if_possible(study_index, effects=effects)
+
+    def _can_compute_outcome_for_study(self, study_index):
+        one_arm_effect = self.current_effect in BINARY_ONE_ARM_METRICS + CONTINUOUS_ONE_ARM_METRICS
+        return self.raw_data_is_complete_for_study(study_index) or \
+                (one_arm_effect and self.raw_data_is_complete_for_study(study_index, first_arm_only=True))
+
+    def compute_effects_for_studies(self, study_indices):
+        '''
+        Computes the effect estimates (and CIs), on the calculation scale,
+        for the current outcome/follow-up/groups of the studies at the
+        given indices for which there is sufficient raw data. This is done
+        in one (vectorized) call for the whole column.
+
+        Returns a dictionary mapping study indices to dictionaries with
+        a "calc_scale" entry holding (est, lower, upper); for diagnostic
+        data these are further keyed by metric.
+        '''
+        study_indices = [study_index for study_index in study_indices if \
+                                self._can_compute_outcome_for_study(study_index)]
+        if len(study_indices) == 0:
+            return {}
+
+        data_type = self.get_current_outcome_type(get_str=False)
+        raw_data = [self.get_cur_raw_data_for_study(study_index) for study_index in study_indices]
+        cols = zip(*raw_data)
+        to_tuples = lambda ests, lowers, uppers: zip(effect_sizes.to_list(ests),
+                                                     effect_sizes.to_list(lowers),
+                                                     effect_sizes.to_list(uppers))
+        effects = {}
+        if data_type == BINARY:
+            e1, n1, e2, n2 = cols
+            ests, lowers, uppers, ses = effect_sizes.binary_effects(
+                                self.current_effect, e1, n1, e2, n2, conf_level=self.conf_level)
+            for study_index, est_and_ci in zip(study_indices, to_tuples(ests, lowers, uppers)):
+                effects[study_index] = {"calc_scale":est_and_ci}
+        elif data_type == CONTINUOUS:
+            n1, m1, sd1, n2, m2, sd2 = cols
+            ests, lowers, uppers, ses = effect_sizes.continuous_effects(
+                                self.current_effect, n1, m1, sd1, n2, m2, sd2, conf_level=self.conf_level)
+            for study_index, est_and_ci in zip(study_indices, to_tuples(ests, lowers, uppers)):
+                effects[study_index] = {"calc_scale":est_and_ci}
+        elif data_type == DIAGNOSTIC:
+            tp, fn, fp, tn = cols
+            for study_index in study_indices:
+                effects[study_index] = {}
+            for metric in DIAGNOSTIC_METRICS:
+                ests, lowers, uppers, ses = effect_sizes.diagnostic_effects(
+                                metric, tp, fn, fp, tn, conf_level=self.conf_level)
+                for study_index, est_and_ci in zip(study_indices, to_tuples(ests, lowers, uppers)):
+                    effects[study_index][metric] = {"calc_scale":est_and_ci}
+        return effects
 
         
     def blank_all_studies(self, include_them):
@@ -1566,7 +1697,7 @@ class DatasetModel(QAbstractTableModel):
         return all([not study.include for study in self.dataset.studies])
 
 
-    def update_outcome_if_possible(self, study_index):
+    def update_outcome_if_possible(self, study_index, effects=None):
         '''
         Rules:
             Checks the parametric study to ascertain if enough raw data has been
@@ -1575,8 +1706,12 @@ class DatasetModel(QAbstractTableModel):
             
             If the raw data is not empty, the outcome should be blanked out.
             If the raw data is empty, the outcome should not be effected
+
+        effects, if given, are the precomputed effects as returned by
+        compute_effects_for_studies.
         '''
         est_and_ci_d = None
+        self.invalidate_display_cache(self.dataset.studies[study_index].id)
         # to index into the effect belonging to the currently displayed groups
         group_str = self.get_cur_group_str() 
         data_type = self.get_current_outcome_type(get_str=False) 
@@ -1593,45 +1728,23 @@ class DatasetModel(QAbstractTableModel):
 
         # we try to compute outcomes if either all raw data is there, or, if we have a one-arm
         # metric then if sufficient raw data exists to compute this
-        if self.raw_data_is_complete_for_study(study_index) or \
-                (one_arm_effect and self.raw_data_is_complete_for_study(study_index, first_arm_only=True)):
+        if self._can_compute_outcome_for_study(study_index):
             
             if not self.dataset.studies[study_index].manually_excluded:
                 # include the study -- note that if the user excluded the study, then
                 # edited the raw data, this will re-include it automatically
                 self.dataset.studies[study_index].include = True
 
-            if data_type == BINARY:
-                e1, n1, e2, n2 = self.get_cur_raw_data_for_study(study_index)
-                if self.current_effect in BINARY_TWO_ARM_METRICS:
-                    est_and_ci_d = meta_py_r.effect_for_study(e1, n1, e2, n2,
-                                                              metric=self.current_effect,
-                                                              conf_level=self.conf_level)
-                else:
-                    # binary, one-arm
-                    est_and_ci_d = meta_py_r.effect_for_study(e1, n1, 
-                                                              two_arm=False,
-                                                              metric=self.current_effect,
-                                                              conf_level=self.conf_level)
-            elif data_type == CONTINUOUS:
-                n1, m1, sd1, n2, m2, sd2 = self.get_cur_raw_data_for_study(study_index)
-                if self.current_effect in CONTINUOUS_TWO_ARM_METRICS:
-                    est_and_ci_d = meta_py_r.continuous_effect_for_study(n1, m1, sd1,
-                                        n2=n2, m2=m2, sd2=sd2, metric=self.current_effect, conf_level=self.conf_level)
-                else:
-                    # continuous, one-arm metric
-                    est_and_ci_d = meta_py_r.continuous_effect_for_study(n1, m1, sd1,
-                                          two_arm=False, metric=self.current_effect, conf_level=self.conf_level)
-                
-            elif data_type == DIAGNOSTIC: 
-                # diagnostic data
-                tp, fn, fp, tn = self.get_cur_raw_data_for_study(study_index)
+            if effects is None:
+                effects = self.compute_effects_for_studies([study_index])
 
+            if data_type in [BINARY, CONTINUOUS]:
+                # n1 is needed for the display scale (Freeman-Tukey) below 
+                n1 = self.get_cur_raw_data_for_study(study_index)[1 if data_type == BINARY else 0]
+                est_and_ci_d = effects[study_index]
+            elif data_type == DIAGNOSTIC: 
                 # sensitivity and specificity
-                ests_and_cis = meta_py_r.diagnostic_effects_for_study(
-                                                  tp, fn, fp, tn,
-                                                  metrics=DIAGNOSTIC_METRICS,
-                                                  conf_level=self.conf_level)
+                ests_and_cis = effects[study_index]
                 
                 ###
                 # now we're going to set the effect estimate/CI on the MA object.
@@ -1682,6 +1795,8 @@ class DatasetModel(QAbstractTableModel):
                 
     def get_cur_raw_data(self, only_if_included=True, only_these_studies=None):
         raw_data = []
+        if only_these_studies is not None:
+            only_these_studies = set(only_these_studies)
         
         for study_index in range(len(self.dataset.studies)):
             if not only_if_included or self.dataset.studies[study_index].include:
@@ -1717,7 +1832,7 @@ class DatasetModel(QAbstractTableModel):
         cur_ma_unit = self.get_current_ma_unit_for_study(study_index)
         
         if None in cur_ma_unit.get_effect_and_se(effect, group_str, self.mult):
-            print "study %s does not have a point estimate" % study_index
+            logger.debug("study %s does not have a point estimate", study_index)
             return False
             
         return "ok -- has all point estimates"
@@ -1735,6 +1850,8 @@ class DatasetModel(QAbstractTableModel):
     def get_cur_ests_and_SEs(self, only_if_included=True, only_these_studies=None, effect=None):
         ests, SEs = [], []
         effect = effect or self.current_effect
+        if only_these_studies is not None:
+            only_these_studies = set(only_these_studies)
         for study_index in xrange(len(self.dataset.studies)):
             if only_these_studies is None or self.dataset.studies[study_index].id in only_these_studies:
                 # issue #171 -- blank studies are *wrongly* set to be included after paste
@@ -1772,6 +1889,7 @@ class DatasetModel(QAbstractTableModel):
         return self.get_current_ma_unit_for_study(study_index).get_raw_data_for_groups(self.current_txs)
 
     def set_current_ma_unit_for_study(self, study_index, new_ma_unit):
+        self.invalidate_display_cache(self.dataset.studies[study_index].id)
         # note that we just assume this exists.
         self.dataset.studies[study_index].outcomes_to_follow_ups[self.current_outcome][self.get_current_follow_up_name()]=new_ma_unit
         
@@ -1842,46 +1960,40 @@ class DatasetModel(QAbstractTableModel):
           ) for study in self.dataset.studies if self.current_outcome in study.outcomes_to_follow_ups])
 
     def recalculate_display_scale(self):
-        effect = self.current_effect
+        '''
+        Recalculates the display scale effects and CIs (at the current
+        confidence level) of the current outcome/follow-up/groups, for all
+        studies at once (see ma_dataset.calculate_display_effects_and_cis).
+        This is called when the model is about to be reset, so the views
+        pick up the new values with that (single) reset.
+        '''
+        self.invalidate_display_cache()
         group_str = self.get_cur_group_str()
         current_data_type = self.dataset.get_outcome_type(self.current_outcome)
-        
-        ma_units = []
+        if current_data_type not in (BINARY, CONTINUOUS, DIAGNOSTIC):
+            return
+
         # Gather ma_units for spreadsheet
-        for study_index in range(len(self.dataset.studies)-1): #-1 is because last study is always blank
-            ma_units.append(self.get_current_ma_unit_for_study(study_index))
-            
-        binary_display_scale = lambda x: meta_py_r.binary_convert_scale(x, self.current_effect, convert_to="display.scale")
-        continuous_display_scale = lambda x: meta_py_r.continuous_convert_scale(x, self.current_effect, convert_to="display.scale")
-                            
-        def get_diagnostic_display_scale(m_str):
-            return lambda x: meta_py_r.diagnostic_convert_scale(x, m_str, convert_to="display.scale") 
-        
-        for index, x in enumerate(ma_units):
-            print("Recalculating display scale for ma_unit %d" % index)
-
-            if current_data_type in [BINARY,CONTINUOUS]:
-                if current_data_type == BINARY:
-                    convert_to_display_scale = binary_display_scale
-                elif current_data_type == CONTINUOUS:
-                    convert_to_display_scale = continuous_display_scale
-                x.calculate_display_effect_and_ci(effect, group_str,
-                                                  convert_to_display_scale,
-                                                  conf_level=self.get_global_conf_level(), mult=self.mult,
-                                                  check_if_necessary=True)
-            elif current_data_type == DIAGNOSTIC:
-                for m_str in ["Sens","Spec"]:
-                    x.calculate_display_effect_and_ci(m_str, group_str,
-                                                      convert_to_display_scale=get_diagnostic_display_scale(m_str),
-                                                      conf_level=self.get_global_conf_level(), mult=self.mult,
-                                                      check_if_necessary=True)
-        print("Finished calculating display effect and cis")
+        ma_units = [self.get_current_ma_unit_for_study(study_index) for \
+                        study_index in range(len(self.dataset.studies)-1)] #-1 is because last study is always blank
+
+        if current_data_type == DIAGNOSTIC:
+            effects = ["Sens", "Spec"]
+        else:
+            effects = [self.current_effect]
+        n_calculated = 0
+        for effect in effects:
+            n_calculated += calculate_display_effects_and_cis(ma_units, effect, group_str,
+                                        TYPE_TO_STR_DICT[current_data_type],
+                                        conf_level=self.get_global_conf_level(), mult=self.mult,
+                                        check_if_necessary=True, groups=self.current_txs)
+        logger.debug("Finished calculating display effect and cis (%d of them)", n_calculated)
 
     def _get_conv_to_display_scale(self, data_type, effect, n1=None):
         ''' Returns appropriate conv_to_display_scale function '''
         
         if None in [data_type, effect]:
-            print("_get_conv_to_display_scale got None for either data_type, or effect")
+            logger.warning("_get_conv_to_display_scale got None for either data_type, or effect")
 
         if data_type == BINARY:
             conv_to_disp_scale = lambda x: meta_py_r.binary_convert_scale(x, effect, convert_to="display.scale", n1=n1)
@@ -1898,7 +2010,7 @@ class DatasetModel(QAbstractTableModel):
         ''' Gets the calc-scale value of the given display_scale value'''
         
         if None in [display_scale_val, data_type, effect]:
-            print("_get_calc_scale_value got None for either display_scale_val, data_type, or effect")
+            logger.warning("_get_calc_scale_value got None for either display_scale_val, data_type, or effect")
         
         calc_scale_val = None
         if data_type == BINARY:
@@ -1922,16 +2034,20 @@ class DatasetModel(QAbstractTableModel):
         elif not (0 < conf_lev < 100):
             raise ValueError(invalid_conf_lev_msg)
         
+        if getattr(self, "conf_level", None) is not None and \
+                        equal_close_enough(self.conf_level, float(conf_lev)):
+            # nothing to do (and, in particular, nothing to recalculate)
+            return conf_lev
+
         self.conf_level = float(conf_lev)
-        print("Set confidence level to: %f" % conf_lev)
+        logger.info("Set confidence level to: %f", conf_lev)
+        self.invalidate_display_cache()
         
         self.mult = meta_py_r.get_mult_from_r(conf_lev)
-        print("mult is now: %s" % str(self.mult))
+        logger.debug("mult is now: %s", self.mult)
         
-        # set in R as well
-        r_str = "set.global.conf.level("+str(float(conf_lev))+")"
-        new_cl_in_R = meta_py_r.ro.r(r_str)[0]
-        print("Set confidence level in R to: %f" % new_cl_in_R)
+        # set in R as well (once openmetar is loaded, if it isn't yet)
+        meta_py_r.set_global_conf_level(self.conf_level)
 
         self.emit(SIGNAL("conf_level_changed()"))
         
@@ -1941,5 +2057,5 @@ class DatasetModel(QAbstractTableModel):
         return self.conf_level
     
     def get_mult(self):
-        print("mult is %s" % str(self.mult))
+        logger.debug("mult is %s", self.mult)
         return self.mult
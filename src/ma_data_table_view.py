@@ -8,11 +8,11 @@
 # Custom QTableView, implements copy/paste and undo/redo.   #
 #############################################################
 
-print("In ma_data_table_view: Importing pyqt4 stuff")
+import logging
+
 from PyQt4 import QtCore, QtGui
 from PyQt4.Qt import *
 
-print("In ma_data_table_view: importing forms")
 import binary_data_form
 import continuous_data_form
 import diagnostic_data_form
@@ -25,6 +25,9 @@ import diagnostic_data_form
 import ma_dataset
 from ma_dataset import *
 from meta_globals import *
+import oma_logging
+
+logger = oma_logging.get_logger(__name__)
 
 # for issue #169 -- normalizing new lines, e.g., for pasting
 # use QRegExp to manipulate QStrings (rather than re)
@@ -33,9 +36,9 @@ _newlines_re  = QRegExp('(\r\n|\r|\r)')
 
 def DebugHelper(function):
     def _DebugHelper(*args, **kw):
-        print("Entered %s" % function.func_name)
+        logger.debug("Entered %s", function.func_name)
         res = function(*args, **kw)
-        print("Left %s" % function.func_name)
+        logger.debug("Left %s", function.func_name)
         return res
     return _DebugHelper
 
@@ -121,7 +124,7 @@ class MADataTable(QtGui.QTableView):
         sort_by_col = self.model().get_current_outcome_type()
         data_type = self.model().get_current_outcome_type()
 
-        print "right click @ column: %s" % column_clicked
+        logger.debug("right click @ column: %s", column_clicked)
         context_menu = QMenu(self)
 
         # add a covariate anywhere
@@ -344,10 +347,11 @@ class MADataTable(QtGui.QTableView):
 
     def cell_content_changed(self, index, old_val, new_val, study_added):        
         # Only make a cell edit if the old values and new values are different
-        try:
-            print("Old val: %s, new val: %s" % (unicode(old_val.toString()), unicode(new_val.toString())))
-        except AttributeError:
-            print("old val: %s, new val: %s" % (str(old_val), str(new_val)))
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug("Old val: %s, new val: %s", unicode(old_val.toString()), unicode(new_val.toString()))
+            except AttributeError:
+                logger.debug("old val: %s, new val: %s", old_val, new_val)
             
         if not self._new_eq_old(old_val, new_val):
             cell_edit = CommandCellEdit(self, index, old_val, new_val,
@@ -450,16 +454,15 @@ class MADataTable(QtGui.QTableView):
 
         lower_row = upper_left_index.row() + len(new_content)
         lower_col = upper_left_index.column() + len(new_content[0])
-        print "lower row: %s, lower col: %s" % (lower_row, lower_col)
+        logger.debug("lower row: %s, lower col: %s", lower_row, lower_col)
         num_studies_pre_paste = len(self.model().dataset)
         studies_pre_paste = list(self.model().dataset.studies)
         lower_right_index = self.model().createIndex(lower_row-1, lower_col-1)
         old_content = self._str_to_matrix(self.copy_contents_in_range(upper_left_index, lower_right_index, to_clipboard=False))
         
-        print "old content: %s" % old_content
-        print "new content: %s" % new_content
-        print "upper left index:"
-        print self._print_index(upper_left_index)
+        logger.debug("old content: %s", old_content)
+        logger.debug("new content: %s", new_content)
+        logger.debug("upper left index: %s", self._index_str(upper_left_index))
 
         paste_command =  CommandPaste(self, new_content, old_content,
                                         upper_left_index, studies_pre_paste,
@@ -472,8 +475,8 @@ class MADataTable(QtGui.QTableView):
         cast to python Unicode strings and returned. If the to_clipboard flag is true, the contents will
         also be copied to the system clipboard
         '''
-        print "upper left index: %s, upper right index: %s" % \
-                (self._print_index(upper_left_index), self._print_index(lower_right_index))
+        logger.debug("upper left index: %s, upper right index: %s",
+                     self._index_str(upper_left_index), self._index_str(lower_right_index))
         text_matrix = []
 
         # +1s are because range() is right interval exclusive
@@ -496,7 +499,7 @@ class MADataTable(QtGui.QTableView):
         if to_clipboard:
             clipboard = QApplication.clipboard()
             clipboard.setText(copied_str)
-        print "copied str: %s" % copied_str
+        logger.debug("copied str: %s", copied_str)
         return copied_str
 
     def paste_contents(self, upper_left_index, source_content):
@@ -531,7 +534,7 @@ class MADataTable(QtGui.QTableView):
                     index = self.model().createIndex(origin_row+src_row, origin_col+src_col)
                     self.model().setData(index, QVariant(source_content[src_row][src_col]))
                 except Exception, e:
-                    print "whoops, exception while pasting: %s" % e
+                    logger.warning("whoops, exception while pasting: %s", e)
 
         self.model().blockSignals(False)
         self.model().reset()
@@ -574,12 +577,12 @@ class MADataTable(QtGui.QTableView):
         for study in studies:
             if study.include and (not study.manually_excluded):
                 num_included += 1
-            print("included: %s, manually excluded: %s" % (str(study.include), str(study.manually_excluded)))
-        print("num included: %d" % num_included)
+            logger.debug("included: %s, manually excluded: %s", study.include, study.manually_excluded)
+        logger.debug("num included: %d", num_included)
         return num_included
 
-    def _print_index(self, index):
-        print "(%s, %s)" % (index.row(), index.column())
+    def _index_str(self, index):
+        return "(%s, %s)" % (index.row(), index.column())
 
     def _add_new_row(self):
         '''
@@ -600,11 +603,7 @@ class MADataTable(QtGui.QTableView):
         return m
 
     def _print_row(self, r):
-        print "length of row: %s" % len(r)
-        for x in r:
-            print x == ""
-            print "%s," % x
-        print "\n"
+        logger.debug("length of row: %s; row: %s", len(r), r)
 
     def _is_blank_row(self, r):
         return len(r) == 1 and r[0] == ""
@@ -702,7 +701,7 @@ class CommandCellEdit(QUndoCommand):
             something_else = added_study,
             )
 
-        print("CommandCellEdit created with parameters: %s" % str(debug_params))
+        logger.debug("CommandCellEdit created with parameters: %s", debug_params)
         #### end debugging output
 
     @DebugHelper
@@ -741,7 +740,9 @@ class CommandCellEdit(QUndoCommand):
         self.ma_data_table_view._enable_analysis_menus_if_appropriate()
         self.ma_data_table_view.resizeColumnsToContents()
 
-        # let everyone know that the data is dirty
+        # let everyone know that the data is dirty (and which study it was;
+        # see oma_journal.JournaledSaver)
+        self.dirty_study_ids = self._get_study_ids()
         self.ma_data_table_view.emit(SIGNAL("dataDirtied()"))
 
     @DebugHelper
@@ -768,11 +769,16 @@ class CommandCellEdit(QUndoCommand):
         # perform an analysis.
         self.ma_data_table_view._enable_analysis_menus_if_appropriate()
         self.ma_data_table_view.resizeColumnsToContents()
+        self.dirty_study_ids = self._get_study_ids()
         self.ma_data_table_view.emit(SIGNAL("dataDirtied()"))
         
     def _get_index(self):
         return self.ma_data_table_view.model().createIndex(self.row, self.col)
 
+    def _get_study_ids(self):
+        studies = self.ma_data_table_view.model().dataset.studies
+        return [studies[self.row].id] if self.row < len(studies) else []
+
     
 class CommandPaste(QUndoCommand):
     '''
@@ -792,8 +798,11 @@ class CommandPaste(QUndoCommand):
         self.new_metric = None
         # is this the first time? 
         self.first_call = True
+        # pasting may add studies and change the metric, and undoing it
+        # replaces the dataset, so we don't know which studies changed
+        self.dirty_study_ids = None
 
-        print("CommandPaste created")
+        logger.debug("CommandPaste created")
     
     @DebugHelper
     def redo(self):
@@ -856,13 +865,14 @@ class CommandEditMAUnit(QUndoCommand):
         self.ma_data_table_view = table_view
         
         # for debugging
-        print("CommandEditMAunit created")
+        logger.debug("CommandEditMAunit created")
     
     @DebugHelper
     def undo(self):
         self.model.set_current_ma_unit_for_study(self.study_index, self.old_ma_unit)
         self.model.reset()
         self.table_view.resizeColumnsToContents()
+        self.dirty_study_ids = [self.model.dataset.studies[self.study_index].id]
         self.ma_data_table_view.emit(SIGNAL("dataDirtied()"))
 
     @DebugHelper
@@ -873,6 +883,7 @@ class CommandEditMAUnit(QUndoCommand):
         
         #self.table_view.model().reset()
         self.table_view.resizeColumnsToContents()
+        self.dirty_study_ids = [self.model.dataset.studies[self.study_index].id]
         self.ma_data_table_view.emit(SIGNAL("dataDirtied()"))
 
 # IS THIS CLASS USED ANYWHERE?
@@ -888,7 +899,7 @@ class CommandEditRawData(QUndoCommand):
         self.new_raw_data_dict = new_raw_data_dict
         self.group_names = self.old_raw_data_dict.keys()
         
-        print("Command Edit RawData created")
+        logger.debug("Command Edit RawData created")
     
     @DebugHelper
     def undo(self):
@@ -913,8 +924,10 @@ class CommandSort(QUndoCommand):
         self.col = col
         self.reverse = reverse_order
         self.previous_order = None
+        # only the order of the studies changes
+        self.dirty_study_ids = []
         
-        print("CommandSort created")
+        logger.debug("CommandSort created")
 
     def redo(self):
         self.previous_order = self.model.get_ordered_study_ids()
@@ -21,10 +21,17 @@ import pdb
 from PyQt4.QtCore import pyqtRemoveInputHook
 import copy
 
+import numpy as np
+
+import columnar_store
 import two_way_dict
+import effect_sizes
 import meta_globals
 #from meta_globals import *
-import meta_py_r
+import oma_logging
+import scale_conversion
+
+logger = oma_logging.get_logger(__name__)
 
 BINARY = meta_globals.BINARY
 CONTINUOUS = meta_globals.CONTINUOUS
@@ -33,14 +40,98 @@ EMPTY_VALS = meta_globals.EMPTY_VALS
 FACTOR = meta_globals.FACTOR
 TYPE_TO_STR_DICT = meta_globals.TYPE_TO_STR_DICT
 
+def _invalidating(method_name):
+    method = getattr(list, method_name)
+    def invalidate_and_call(self, *args):
+        self._by_id = None
+        return method(self, *args)
+    invalidate_and_call.__name__ = method_name
+    return invalidate_and_call
+
+class StudyList(list):
+    '''
+    The studies of a dataset: a list that also keeps an index from study
+    ids to positions (built when first needed, dropped whenever the list
+    changes), so that looking up a study by id doesn't scan the list.
+    Appending (e.g., pasting rows) keeps the index, rather than dropping it.
+    '''
+    def __init__(self, studies=()):
+        list.__init__(self, studies)
+        self._by_id = None
+        self._max_id = -1
+
+    def _index(self):
+        if self._by_id is None:
+            by_id = {}
+            for i, study in enumerate(self):
+                # the first one wins, as with list.index
+                by_id.setdefault(study.id, i)
+            self._by_id = by_id
+            self._max_id = max(by_id) if by_id else -1
+        return self._by_id
+
+    def append(self, study):
+        list.append(self, study)
+        if self._by_id is not None:
+            self._by_id.setdefault(study.id, len(self) - 1)
+            self._max_id = max(self._max_id, study.id)
+
+    insert = _invalidating("insert")
+    remove = _invalidating("remove")
+    pop = _invalidating("pop")
+    sort = _invalidating("sort")
+    reverse = _invalidating("reverse")
+    extend = _invalidating("extend")
+    __setitem__ = _invalidating("__setitem__")
+    __delitem__ = _invalidating("__delitem__")
+    __setslice__ = _invalidating("__setslice__")
+    __delslice__ = _invalidating("__delslice__")
+    __iadd__ = _invalidating("__iadd__")
+    __imul__ = _invalidating("__imul__")
+
+    def __copy__(self):
+        return StudyList(self)
+
+    def __reduce__(self):
+        # pickles as a plain list would (the index is rebuilt on demand)
+        return (StudyList, (list(self),))
+
+    def index_of_id(self, study_id):
+        ''' position of the (first) study with the given id, or None '''
+        return self._index().get(study_id)
+
+    def get_by_id(self, study_id):
+        i = self.index_of_id(study_id)
+        return None if i is None else self[i]
+
+    def max_id(self):
+        self._index()
+        return self._max_id
+
 class Dataset:
+    # see pack(); class-level so that unpickled datasets have it, too
+    columnar_store = None
+
     def __len__(self):
         return len(self.studies)
         
+    def __getstate__(self):
+        # the columnar store (if any) is not saved; the views onto it
+        # pickle as the plain lists/dictionaries they stand in for.
+        state = self.__dict__.copy()
+        state.pop("columnar_store", None)
+        # (a plain list, so that the dataset loads without StudyList, too)
+        state["studies"] = list(state.get("studies", []))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_studies(self.__dict__.get("studies", []))
+
     def __init__(self, title=None, is_diag=False, summary=None):
         self.title = title
         self.summary = summary
-        self.studies = []
+        self.studies = StudyList()
         self.is_diag = is_diag
         self.num_outcomes = 0
         self.num_follow_ups = 0
@@ -56,9 +147,31 @@ class Dataset:
 
     def copy(self):
         cloned = Dataset(self.title, self.summary)
-        cloned.studies = list(self.studies)
+        cloned.set_studies(self.studies)
         cloned.outcome_names_to_follow_ups = copy.deepcopy(self.outcome_names_to_follow_ups)
         return cloned
+
+    def pack(self):
+        '''
+        Moves the raw data and effects of the studies into (numpy) arrays,
+        with one array per outcome/follow-up/group (raw data) and per
+        outcome/follow-up/group-pair/metric (effects); see the columnar_store
+        module. The accessor methods here and on the MetaAnalyticUnit objects
+        work the same either way. Studies added after packing are stored
+        as usual; pack again to include them.
+        '''
+        self.unpack()
+        self.columnar_store = columnar_store.ColumnarStore.pack_dataset(self)
+        return self.columnar_store
+
+    def unpack(self):
+        ''' Undoes pack(), i.e., moves everything back into lists/dictionaries '''
+        if self.columnar_store is not None:
+            columnar_store.ColumnarStore.unpack_dataset(self)
+            self.columnar_store = None
+
+    def is_packed(self):
+        return self.columnar_store is not None
         
     def get_outcome_names(self):
         return sorted(self.outcome_names_to_follow_ups.keys())
@@ -68,6 +181,9 @@ class Dataset:
             raise Exception, "dataset -- change_group_name -- either both outcome and follow_up should be None, \
                                             or else neither should."
     
+        if outcome is None and self.columnar_store is not None:
+            self.columnar_store.rename_group(old_group_name, new_group_name)
+
         for study in self.studies:
             if outcome is None and follow_up is None:
                 # if no outcome/follow-up was specified, we change *all* occurrences of
@@ -83,6 +199,8 @@ class Dataset:
     def change_outcome_name(self, old_outcome_name, new_outcome_name):
         self.outcome_names_to_follow_ups[new_outcome_name] = \
                 self.outcome_names_to_follow_ups.pop(old_outcome_name)
+        if self.columnar_store is not None:
+            self.columnar_store.rename_outcome(old_outcome_name, new_outcome_name)
         for study in self.studies:
             study.outcomes_to_follow_ups[new_outcome_name] = \
                     study.outcomes_to_follow_ups.pop(old_outcome_name)
@@ -109,7 +227,27 @@ class Dataset:
             self.studies.insert(study_index, study)
         
     def remove_study(self, studyid):
-        self.studies = [study for study in self.studies if study.id != studyid]
+        study_index = self.get_study_index(studyid)
+        while study_index is not None:
+            del self.studies[study_index]
+            study_index = self.get_study_index(studyid)
+
+    def set_studies(self, studies):
+        ''' Replaces the studies (with a StudyList holding the given ones) '''
+        self.studies = StudyList(studies)
+
+    def _study_list(self):
+        # in case the studies were replaced by a plain list
+        if not isinstance(self.studies, StudyList):
+            self.set_studies(self.studies)
+        return self.studies
+
+    def get_study_index(self, study_id):
+        ''' index of the study with the given id (None if there's no such study) '''
+        return self._study_list().index_of_id(study_id)
+
+    def get_study_by_id(self, study_id):
+        return self._study_list().get_by_id(study_id)
         
     def num_studies(self):
         return len(self.studies)
@@ -133,9 +271,7 @@ class Dataset:
         return None
         
     def max_study_id(self):
-        if len(self.studies) == 0:
-            return -1
-        return max([study.id for study in self.studies])
+        return self._study_list().max_id()
 
     def remove_covariate(self, covariate):
         cov_index = None # keep record of the remvoed covariate's index.
@@ -242,7 +378,7 @@ class Dataset:
     
     def remove_outcome(self, outcome_name):
         if outcome_name is None:
-            print("Tried to remove a None outcome")
+            logger.warning("Tried to remove a None outcome")
             return
         self.outcome_names_to_follow_ups.pop(outcome_name)
         for study in self.studies:
@@ -267,7 +403,7 @@ class Dataset:
                 ma_unit = cur_outcome[follow_up_name]
                 ma_unit.add_group(group_name)
 
-        print "added group: %s. cur groups: %s" % (group_name, self.get_group_names())
+        logger.debug("added group: %s. cur groups: %s", group_name, self.get_group_names())
         
     def remove_group(self, group_name):
         for study in self.studies:
@@ -275,7 +411,7 @@ class Dataset:
                 cur_outcome = study.outcomes_to_follow_ups[outcome_name]
                 for ma_unit in cur_outcome.values():
                     ma_unit.remove_group(group_name)
-        print "removed group: %s. cur groups: %s" % (group_name, self.get_group_names())
+        logger.debug("removed group: %s. cur groups: %s", group_name, self.get_group_names())
         
     def add_follow_up(self, follow_up_name):
         ''' adds the follow-up to *all* outcomes '''
@@ -320,7 +456,7 @@ class Dataset:
     def get_group_names_for_outcome_fu(self, outcome_name, follow_up):
         group_names = []
         for study in self.studies:
-            print study.name
+            logger.debug("study: %s", study.name)
             if study.outcomes_to_follow_ups.has_key(outcome_name):
                 if study.outcomes_to_follow_ups[outcome_name].has_key(follow_up):
                     cur_ma_unit = study.outcomes_to_follow_ups[outcome_name][follow_up]
@@ -333,6 +469,8 @@ class Dataset:
             raise Exception, "follow up name %s alerady exists for outcome!" % new_name
         for study in self.studies:
             study.outcomes_to_follow_ups[outcome][new_name] = study.outcomes_to_follow_ups[outcome].pop(old_name)
+        if self.columnar_store is not None:
+            self.columnar_store.rename_follow_up(outcome, old_name, new_name)
         # also update the outcomes -> follow-ups dictionary
         follow_up_key= self.outcome_names_to_follow_ups[outcome].get_key(old_name)
         self.outcome_names_to_follow_ups[outcome][follow_up_key] = new_name
@@ -390,15 +528,64 @@ class Dataset:
     def cmp_studies(self, compare_by="name", reverse=True, ordered_list=None, directions_to_ma_unit=None, mult=None):
         '''
         compare studies in various ways -- pass the returned function
-        to the (built-in) sort function.
+        to the (built-in) sort function. (But see sort_studies, which does
+        the same thing, only faster.)
 
-        compare_by is either 'name', 'year' or 'ordered list'; if it's anything else,
-        we assume it's a covariate and sort by that. ordered_list allows
-        you to sort arbitrarily in the order specified by the list.
+        compare_by is either 'name', 'year', 'raw_data', 'outcomes' or 'ordered_list';
+        if it's anything else, we assume it's a covariate and sort by that. ordered_list
+        allows you to sort arbitrarily in the order specified by the list.
         '''
-        
+        if compare_by == "ordered_list":
+            position = self._positions_in(ordered_list)
+            return lambda study_a, study_b : self._meta_cmp_wrapper(study_a, study_b, \
+                                                    position[study_a.name], \
+                                                    position[study_b.name], \
+                                                    reverse=False)
+        get_value = self._sort_value_getter(compare_by, reverse, directions_to_ma_unit, mult)
+        return lambda study_a, study_b : self._meta_cmp_wrapper(study_a, study_b, \
+                                                    get_value(study_a), get_value(study_b), reverse)
 
-        
+    def sort_studies(self, compare_by="name", reverse=True, sort_reverse=False, ordered_list=None,
+                     directions_to_ma_unit=None, mult=None):
+        '''
+        Sorts the studies (in place) exactly as
+
+            studies.sort(cmp=self.cmp_studies(compare_by, reverse, ...), reverse=sort_reverse)
+
+        does, but the value to compare each study by is computed once, up
+        front, rather than twice for every comparison.
+        '''
+        if compare_by == "ordered_list":
+            position = self._positions_in(ordered_list)
+            keys = [position[study.name] for study in self.studies]
+        else:
+            get_value = self._sort_value_getter(compare_by, reverse, directions_to_ma_unit, mult)
+            keys = [self._sort_key(study, get_value(study), reverse) for study in self.studies]
+        order = sorted(range(len(self.studies)), key=keys.__getitem__, reverse=sort_reverse)
+        self.studies[:] = [self.studies[i] for i in order]
+
+    def _positions_in(self, ordered_list):
+        # (the first position, as ordered_list.index would have it)
+        position = {}
+        for i, name in enumerate(ordered_list):
+            position.setdefault(name, i)
+        return position
+
+    def _sort_key(self, study, value, reverse):
+        '''
+        The key that orders studies as _meta_cmp_wrapper does: studies with
+        a value by that; those without one come last (first, if reverse),
+        among themselves by name, and studies without a name last of all.
+        '''
+        empty = -1 if reverse else 1
+        if value not in EMPTY_VALS:
+            return (0, value)
+        if study.name not in EMPTY_VALS:
+            return (empty, (0, study.name))
+        return (empty, (empty, study.name))
+
+    def _sort_value_getter(self, compare_by, reverse, directions_to_ma_unit=None, mult=None):
+        ''' Returns a function of a study giving the value cmp_studies compares it by '''
         # Assign stuff conditionally
         def val_if_key_in_dict(key, dictionary):
             if key in dictionary:
@@ -413,77 +600,40 @@ class Dataset:
              group_str, outcome_type) = [val_if_key_in_dict(x,directions_to_ma_unit) for x in keys]
         
         if compare_by == "name":
-            return lambda study_a, study_b : self._meta_cmp_wrapper(study_a, study_b,\
-                                                            study_a.name, study_b.name, reverse)
+            return lambda study : study.name
         elif compare_by == "year":
-            return lambda study_a, study_b : self._meta_cmp_wrapper(study_a, study_b, study_a.year, \
-                                                                    study_b.year, reverse)
+            return lambda study : study.year
         elif compare_by == 'raw_data':
-            def f(study_a, study_b):
-                ma_unit_A = study_a.get_ma_unit(outcome_name,follow_up)
-                ma_unit_B = study_b.get_ma_unit(outcome_name,follow_up)
-                raw_data_A = ma_unit_A.get_raw_data_for_groups(current_groups)
-                raw_data_B = ma_unit_B.get_raw_data_for_groups(current_groups)
-                study_a_val = raw_data_A[data_index]
-                study_b_val = raw_data_B[data_index]
-                return self._meta_cmp_wrapper(study_a, study_b, study_a_val, study_b_val, reverse)
+            def f(study):
+                ma_unit = study.get_ma_unit(outcome_name,follow_up)
+                return ma_unit.get_raw_data_for_groups(current_groups)[data_index]
             return f
         elif compare_by == 'outcomes':
             if mult is None:
                 raise ValueError("mult must be specified")
             
-            def f(study_a, study_b):
-                ma_unit_A = study_a.get_ma_unit(outcome_name,follow_up)
-                ma_unit_B = study_b.get_ma_unit(outcome_name,follow_up)
-                
-                if outcome_type is BINARY:
-                    to_display_scale = lambda x: meta_py_r.binary_convert_scale(x, current_effect, convert_to="display.scale")
-                elif outcome_type is CONTINUOUS:
-                    to_display_scale = lambda x: meta_py_r.continuous_convert_scale(x, current_effect, convert_to="display.scale")
-                elif outcome_type is DIAGNOSTIC:
-                    to_display_scale = lambda x: meta_py_r.diagnostic_convert_scale(x, current_effect, convert_to="display.scale")
-                
-                if outcome_type in (BINARY,CONTINUOUS):
-                    outcome_data_A = ma_unit_A.get_effect_and_ci(current_effect, group_str, mult)
-                    outcome_data_B = ma_unit_B.get_effect_and_ci(current_effect, group_str, mult)                    
-                    outcome_data_A = [to_display_scale(c_val) for c_val in outcome_data_A]
-                    outcome_data_B = [to_display_scale(c_val) for c_val in outcome_data_B]
-                elif outcome_type == DIAGNOSTIC:
-                    #                                  /\/\/\/\
-                    (outcome_data_A, outcome_data_B) = ([],[])
-                    #                                     |
-                    #                                  \_____/
-                    for diag_metric in ["Sens","Spec"]: # this order corresponds to the order displayed on the spreadsheet
-                        est_and_ci_A = ma_unit_A.get_effect_and_ci(diag_metric, group_str, mult)
-                        est_and_ci_B = ma_unit_B.get_effect_and_ci(diag_metric, group_str, mult)
-                        est_and_ci_A = [to_display_scale(c_val) for c_val in est_and_ci_A]
-                        est_and_ci_B = [to_display_scale(c_val) for c_val in est_and_ci_B]
-                        
-                        outcome_data_A.extend(est_and_ci_A)
-                        outcome_data_B.extend(est_and_ci_B)
-                study_a_val = outcome_data_A[data_index]
-                study_b_val = outcome_data_B[data_index]
-                
-                return self._meta_cmp_wrapper(study_a, study_b, study_a_val, study_b_val, reverse)
+            if outcome_type == DIAGNOSTIC:
+                # Sens (est, lower, upper) then Spec; this order corresponds to
+                # the order displayed on the spreadsheet
+                metric = ["Sens","Spec"][data_index // 3]
+            else:
+                metric = current_effect
+            data_type_str = TYPE_TO_STR_DICT[outcome_type]
+
+            def f(study):
+                ma_unit = study.get_ma_unit(outcome_name,follow_up)
+                c_val = ma_unit.get_effect_and_ci(metric, group_str, mult)[data_index % 3]
+                n1 = None
+                if outcome_type == BINARY and metric in scale_conversion.NEEDS_N:
+                    # (e1, n1, e2, n2) -- the display scale (Freeman-Tukey) needs n1
+                    n1 = ma_unit.get_raw_data_for_groups(current_groups)[1]
+                return scale_conversion.convert_value(c_val, metric, data_type_str, n1=n1)
             return f
-        
-        elif compare_by == "ordered_list":
-            # then just use the list order
-            return lambda study_a, study_b : self._meta_cmp_wrapper(study_a, study_b, \
-                                                    ordered_list.index(study_a.name), \
-                                                    ordered_list.index(study_b.name), \
-                                                    reverse=False)
         else:
             # then we assume that we're sorting by a covariate
             # always want missing values at the 'bottom'
             missing_val = float("-infinity") if reverse else float("infinity")
-            missing_to_zero = lambda d, s : d[s] if s in d else missing_val
-
-            return lambda study_a, study_b : self._meta_cmp_wrapper(study_a,\
-                                                study_b,\
-                                                missing_to_zero(study_a.covariate_dict, compare_by), \
-                                                missing_to_zero(study_b.covariate_dict, compare_by), \
-                                                reverse)
+            return lambda study : study.covariate_dict.get(compare_by, missing_val)
     
 
     def _both_empty(self, a, b):
@@ -516,14 +666,42 @@ class Dataset:
         else:
             return cmp(study_a_val, study_b_val)
 
+
+class _Slotted(object):
+    '''
+    Base for the (numerous, small) classes below that use __slots__ to save
+    memory. Pickles written before these used __slots__ hold a __dict__ as
+    state, and their classes are called without arguments on loading (hence
+    the default arguments of the __init__ methods); both cases are handled
+    here. Unknown attributes in such state are dropped.
+    '''
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict([(attr, getattr(self, attr)) for attr in self.__slots__ if hasattr(self, attr)])
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (__dict__, slots) pair, as pickled by protocol 2
+            d = {}
+            for part in state:
+                d.update(part or {})
+            state = d
+        for attr, value in state.items():
+            if attr in self.__slots__:
+                setattr(self, attr, value)
+
         
-class Study:
+class Study(_Slotted):
     '''
     This class represents a study. It basically holds a 
     list of of meta-analytic units, on which analyses can
     be performed, and some meta-data (e.g., study name)
     '''
-    def __init__(self, id, name="", year=None, include=True):
+    __slots__ = ("id", "year", "name", "N", "notes", "outcomes_to_follow_ups",
+                 "outcomes", "include", "covariate_dict", "manually_excluded")
+
+    def __init__(self, id=None, name="", year=None, include=True):
         # TODO should fiddle with the include field here. 
         # when a study is auto-added, it should be excluded
         # until there is sufficient data
@@ -648,20 +826,12 @@ class MetaAnalyticUnit:
         raw_data = raw_data or \
                     [["" for n in range(self.raw_data_length)] for group in group_names]
 
+        # maps effects to dictionaries mapping group strings to effect
+        # dictionaries; the latter are created lazily, see
+        # update_effects_dict_with_group
         self.effects_dict = {}
-        
-        # now we initialize the outcome dictionaries.
-        if self.outcome.data_type == BINARY:
-            for effect in meta_globals.BINARY_TWO_ARM_METRICS + meta_globals.BINARY_ONE_ARM_METRICS:
-                self.effects_dict[effect]={}
-        elif self.outcome.data_type == CONTINUOUS:
-            # note right now we only have mean difference and standardized mean difference
-            # @TODO hedge's G, cohen's D, glass delta; WV doesn't implement these
-            for effect in meta_globals.CONTINUOUS_TWO_ARM_METRICS + meta_globals.CONTINUOUS_ONE_ARM_METRICS:
-                self.effects_dict[effect]={}                                          
-        elif self.outcome.data_type == DIAGNOSTIC:
-            for effect in meta_globals.DIAGNOSTIC_METRICS:
-                self.effects_dict[effect]={}
+        for effect in self._get_metrics_for_data_type():
+            self.effects_dict[effect] = {}
                 
         # add the two default groups: treatment and control; note that the raw data
         # is held at the *group* level
@@ -684,41 +854,52 @@ class MetaAnalyticUnit:
     def update_effects_dict_with_group(self, new_group):
         '''
         When a new group is added, the effects dictionary will not contain
-        entries for it. Thus this method must be called to update the dictionary
-        with keys corresponding to this group (for one-arm metrics) and 
-        keys corresponding to pairwise combinations of this with other groups.
+        entries for it (for one-arm metrics) or for the pairwise combinations
+        of it with the other groups.
+
+        Note that we no longer create these entries here: with k groups there
+        are k*(k-1) ordered pairs for every two-arm metric, nearly all of which
+        are never filled in. Instead, the effect dictionary for a given
+        effect/group string is created the first time a value is set on it
+        (see _get_or_create_effect_d); until then the getters return the
+        defaults in get_init_effect_d (i.e., None). Here we only make sure
+        that there is an entry for every metric.
         '''
+        for effect in self._get_metrics_for_data_type():
+            if effect not in self.effects_dict:
+                self.effects_dict[effect] = {}
 
-        group_names = self.tx_groups.keys() # existing groups
+    def _get_metrics_for_data_type(self):
         if self.outcome.data_type == BINARY:
-            # we assume that an entry for each effect already exists!
-            for effect in meta_globals.BINARY_TWO_ARM_METRICS:
-                for group in group_names:
-                    # Note that effect sizes that are entered directly
-                    # must correspond to a particular *pair* of tx groups, moreover the 
-                    # order matters i.e., the effect for tx a v. tx b is different than the reverse.
-                    # We take care of this by mapping strings `txA-txB` to effect dictionaries
-                    groups_str = "-".join((new_group, group))
-                    self.effects_dict[effect][groups_str] = self.get_init_effect_d()
-                    # ... and the reverse (see above comment)
-                    groups_str = "-".join((group, new_group))
-                    self.effects_dict[effect][groups_str] = self.get_init_effect_d()
-            for effect in meta_globals.BINARY_ONE_ARM_METRICS:
-                self.effects_dict[effect][new_group] = self.get_init_effect_d()
+            return meta_globals.BINARY_TWO_ARM_METRICS + meta_globals.BINARY_ONE_ARM_METRICS
         elif self.outcome.data_type == CONTINUOUS:
-            for effect in meta_globals.CONTINUOUS_TWO_ARM_METRICS:
-                for group in group_names:
-                    groups_str = "-".join((new_group, group))
-                    self.effects_dict[effect][groups_str] = self.get_init_effect_d()
-                    # and the reverse
-                    groups_str = "-".join((group, new_group))
-                    self.effects_dict[effect][groups_str] = self.get_init_effect_d()                                           
-            for effect in meta_globals.CONTINUOUS_ONE_ARM_METRICS:
-                self.effects_dict[effect][new_group] = self.get_init_effect_d()
+            # @TODO hedge's G, cohen's D, glass delta; WV doesn't implement these
+            return meta_globals.CONTINUOUS_TWO_ARM_METRICS + meta_globals.CONTINUOUS_ONE_ARM_METRICS
         elif self.outcome.data_type == DIAGNOSTIC:
-            # diagnostic data
-            for effect in meta_globals.DIAGNOSTIC_METRICS:
-                self.effects_dict[effect][new_group] = self.get_init_effect_d()
+            return meta_globals.DIAGNOSTIC_METRICS
+        return []
+
+    def _get_effect_d(self, effect, group_str):
+        '''
+        Returns the effect dictionary for effect/group_str if it has been
+        created, otherwise a fresh default one (which is *not* stored; use
+        _get_or_create_effect_d for writing).
+        '''
+        effect_groups = self.effects_dict[effect]
+        if group_str in effect_groups:
+            return effect_groups[group_str]
+        return self.get_init_effect_d()
+
+    def _get_or_create_effect_d(self, effect, group_str):
+        # Note that effect sizes that are entered directly must correspond
+        # to a particular *pair* of tx groups (or a single group, for one-arm
+        # metrics); moreover the order matters i.e., the effect for tx a v. tx b
+        # is different than the reverse. We take care of this by mapping
+        # strings `txA-txB` to effect dictionaries
+        effect_groups = self.effects_dict[effect]
+        if group_str not in effect_groups:
+            effect_groups[group_str] = self.get_init_effect_d()
+        return effect_groups[group_str]
                 
     def calculate_SE_if_possible(self, effect, group_str, est=None, lower=None, upper=None, mult=None):
         if mult is None:
@@ -726,14 +907,14 @@ class MetaAnalyticUnit:
         
         # get SE
         if est is None:
-            est = self.effects_dict[effect][group_str]["est"]
+            est = self._get_effect_d(effect, group_str)["est"]
         if lower is None:
-            lower = self.effects_dict[effect][group_str]["lower"]
+            lower = self._get_effect_d(effect, group_str)["lower"]
         if  upper is None:
-            upper = self.effects_dict[effect][group_str]["upper"]
+            upper = self._get_effect_d(effect, group_str)["upper"]
         
-        print("Using the following values to calculate se:")
-        print("  (est,lower,upper, mult) = (%s,%s,%s, %s)" % (str(est),str(lower),str(upper), str(mult)))
+        logger.debug("Using the following values to calculate se: (est,lower,upper, mult) = (%s,%s,%s, %s)",
+                     est, lower, upper, mult)
         try:
             se = (upper - est)/mult
         except:
@@ -747,25 +928,25 @@ class MetaAnalyticUnit:
         return se
                     
     def set_effect(self, effect, group_str, value):
-        self.effects_dict[effect][group_str]["est"] = value
+        self._get_or_create_effect_d(effect, group_str)["est"] = value
     def set_lower(self, effect, group_str, lower):
-        self.effects_dict[effect][group_str]["lower"] = lower
+        self._get_or_create_effect_d(effect, group_str)["lower"] = lower
     def set_upper(self, effect, group_str, upper):
-        self.effects_dict[effect][group_str]["upper"] = upper
+        self._get_or_create_effect_d(effect, group_str)["upper"] = upper
     def set_SE(self, effect, group_str, se):
-        self.effects_dict[effect][group_str]["SE"] = se
+        self._get_or_create_effect_d(effect, group_str)["SE"] = se
         
     def set_display_effect(self, effect, group_str, value):
-        self.effects_dict[effect][group_str]["display_est"] = value
+        self._get_or_create_effect_d(effect, group_str)["display_est"] = value
     def set_display_lower(self, effect, group_str, lower):
-        self.effects_dict[effect][group_str]["display_lower"] = lower
+        self._get_or_create_effect_d(effect, group_str)["display_lower"] = lower
     def set_display_upper(self, effect, group_str, upper):
-        self.effects_dict[effect][group_str]["display_upper"] = upper
+        self._get_or_create_effect_d(effect, group_str)["display_upper"] = upper
     # Should this exist?
     def set_display_se(self, effect, group_str, se):
-        self.effects_dict[effect][group_str]["display_se"] = se
+        self._get_or_create_effect_d(effect, group_str)["display_se"] = se
         
-    def calculate_display_effect_and_ci(self, effect, group_str, convert_to_display_scale, conf_level=None, mult=None, check_if_necessary=False, n1=None):
+    def calculate_display_effect_and_ci(self, effect, group_str, convert_to_display_scale, conf_level=None, mult=None, check_if_necessary=False):
         if None in [conf_level, mult]:
             raise ValueError("confidence level & mult must be specified")
         
@@ -791,19 +972,19 @@ class MetaAnalyticUnit:
         d_se = se
         #d_se = convert_to_display_scale(se) # this doesn't mean anything...i suppose its just to check to see if we have an se value
         
-        print("results of calculating display effect and ci: (est,low,high,se(calc scale): %s, %s, %s, %s" % (d_est,d_lower,d_upper,se))
+        logger.debug("results of calculating display effect and ci: (est,low,high,se(calc scale): %s, %s, %s, %s", d_est, d_lower, d_upper, se)
         
         self.set_display_effect(effect, group_str, d_est)
         self.set_display_lower(effect, group_str, d_lower)
         self.set_display_upper(effect, group_str, d_upper)
         self.set_display_se(effect, group_str, d_se)
-        self.effects_dict[effect][group_str]["display_conf_level"] = conf_level
+        self._get_or_create_effect_d(effect, group_str)["display_conf_level"] = conf_level
         
         
     def get_display_effect(self, effect, group_str):
         try:
-            if "display_est" in self.effects_dict[effect][group_str]:
-                return self.effects_dict[effect][group_str]["display_est"]
+            if "display_est" in self._get_effect_d(effect, group_str):
+                return self._get_effect_d(effect, group_str)["display_est"]
             else:
                 return None
         except:
@@ -811,18 +992,18 @@ class MetaAnalyticUnit:
             pdb.set_trace()
             
     def get_display_lower(self, effect, group_str):
-        if "display_lower" in self.effects_dict[effect][group_str]:
-            return self.effects_dict[effect][group_str]["display_lower"]
+        if "display_lower" in self._get_effect_d(effect, group_str):
+            return self._get_effect_d(effect, group_str)["display_lower"]
         else:
             return None 
     def get_display_upper(self, effect, group_str):
-        if "display_upper" in self.effects_dict[effect][group_str]:
-            return self.effects_dict[effect][group_str]["display_upper"]
+        if "display_upper" in self._get_effect_d(effect, group_str):
+            return self._get_effect_d(effect, group_str)["display_upper"]
         else:
             return None
     def get_display_se(self, effect, group_str):
-        if "display_se" in self.effects_dict[effect][group_str]:
-            return self.effects_dict[effect][group_str]["display_se"]
+        if "display_se" in self._get_effect_d(effect, group_str):
+            return self._get_effect_d(effect, group_str)["display_se"]
         else:
             return None
     
@@ -842,9 +1023,9 @@ class MetaAnalyticUnit:
         if conf_level is None:
             raise ValueError("Confidence level must be specified")
         
-        existing_display_conf_level = "display_conf_level" in self.effects_dict[effect][group_str].keys()
+        existing_display_conf_level = "display_conf_level" in self._get_effect_d(effect, group_str).keys()
         if existing_display_conf_level:
-            display_cl = self.effects_dict[effect][group_str]["display_conf_level"] # conf level @ which display values were computed
+            display_cl = self._get_effect_d(effect, group_str)["display_conf_level"] # conf level @ which display values were computed
             disp_cl_eq_global_cl = meta_globals.equal_close_enough(
                                             display_cl,
                                             conf_level)
@@ -857,8 +1038,8 @@ class MetaAnalyticUnit:
         return result
          
     def get_estimate(self, effect, group_str):
-        if "est" in self.effects_dict[effect][group_str]:
-            return self.effects_dict[effect][group_str]["est"]
+        if "est" in self._get_effect_d(effect, group_str):
+            return self._get_effect_d(effect, group_str)["est"]
         else:
             return None
 
@@ -878,7 +1059,7 @@ class MetaAnalyticUnit:
             raise Exception("Boundary must be one of 'upper' or 'lower'")
         
         if self.get_se(effect, group_str, mult) is None:
-            return self.effects_dict[effect][group_str][boundary]
+            return self._get_effect_d(effect, group_str)[boundary]
         est = self.get_estimate(effect, group_str)
         se  = self.get_se(effect, group_str, mult)
         if est is None or se is None:
@@ -892,12 +1073,13 @@ class MetaAnalyticUnit:
         
     
     def get_se(self, effect, group_str, mult):
-        if "SE" in self.effects_dict[effect][group_str]:
-            print("SE found: %s" % str(self.effects_dict[effect][group_str]["SE"]))
-            se = self.effects_dict[effect][group_str]["SE"]
+        effect_d = self._get_effect_d(effect, group_str)
+        if "SE" in effect_d:
+            se = effect_d["SE"]
+            logger.debug("SE found: %s", se)
             if se is None:
                 new_se = self.calculate_SE_if_possible(effect, group_str, mult=mult)
-                print("new se is %s" % str(new_se))
+                logger.debug("new se is %s", new_se)
                 return new_se
             return se
         else:
@@ -908,8 +1090,8 @@ class MetaAnalyticUnit:
         '''also calculated se if possible '''
         
         self.set_effect(effect, group_str, est)
-        self.effects_dict[effect][group_str]["lower"] = lower
-        self.effects_dict[effect][group_str]["upper"] = upper
+        self._get_or_create_effect_d(effect, group_str)["lower"] = lower
+        self._get_or_create_effect_d(effect, group_str)["upper"] = upper
         
         se = self.calculate_SE_if_possible(effect, group_str, est, lower, upper, mult=mult)
         self.set_SE(effect, group_str, se)
@@ -925,14 +1107,16 @@ class MetaAnalyticUnit:
                 )
         
     def get_entered_effect_and_ci(self, effect, group_str):
-        return (self.effects_dict[effect][group_str]["est"],
-                self.effects_dict[effect][group_str]["lower"],
-                self.effects_dict[effect][group_str]["upper"],)
+        return (self._get_effect_d(effect, group_str)["est"],
+                self._get_effect_d(effect, group_str)["lower"],
+                self._get_effect_d(effect, group_str)["upper"],)
             
     def get_effect_dict(self, effect, group_str):
-        return self.effects_dict[effect][group_str]
+        ''' Note: this is a (default) copy if no values have been set yet '''
+        return self._get_effect_d(effect, group_str)
     
     def get_group_strings(self, effect):
+        ''' The group strings for which values have been set for effect '''
         return self.effects_dict[effect].keys()
     
     def get_effects_dict(self):
@@ -1022,24 +1206,85 @@ class MetaAnalyticUnit:
         return self.tx_groups.keys()
             
     
-class TreatmentGroup:
-    def __init__(self, id, name, raw_data):
+def calculate_display_effects_and_cis(ma_units, effect, group_str, data_type_str,
+                                      conf_level, mult, check_if_necessary=False, groups=None):
+    '''
+    Does what MetaAnalyticUnit.calculate_display_effect_and_ci does, for all
+    of the given units at once: the SEs and CIs (at mult) and their
+    conversion to the display scale are computed on arrays, and the results
+    are written back in one pass. data_type_str is the data type as
+    scale_conversion knows it ('binary', 'continuous' or 'diagnostic').
+    groups (the names of the treatment groups in group_str) are needed for
+    the metrics whose display scale depends on n1 (Freeman-Tukey).
+    Returns the number of units that were (re)calculated.
+    '''
+    if None in [conf_level, mult]:
+        raise ValueError("confidence level & mult must be specified")
+
+    if check_if_necessary:
+        ma_units = [ma_unit for ma_unit in ma_units if \
+                        ma_unit._should_calculate_display_effect_and_ci_and_se(effect, group_str, conf_level)]
+    if len(ma_units) == 0:
+        return 0
+
+    effect_ds = [ma_unit._get_effect_d(effect, group_str) for ma_unit in ma_units]
+    est, lower, upper, se = [effect_sizes.to_array([effect_d[key] for effect_d in effect_ds]) \
+                                for key in ("est", "lower", "upper", "SE")]
+
+    # as in get_se (i.e., calculate_SE_if_possible), when no SE was stored
+    # and get_lower/get_upper: the CI is computed from the SE if there is one
+    with np.errstate(invalid="ignore"):
+        se = np.where(np.isnan(se), (upper - est)/mult, se)
+        se = np.where(np.isnan(se), (est - lower)/mult, se)
+        se = np.where(np.isnan(se), (upper - lower)/(2*mult), se)
+        has_se = ~np.isnan(se)
+        lower = np.where(has_se, est - mult*se, lower)
+        upper = np.where(has_se, est + mult*se, upper)
+
+    n1 = None
+    if data_type_str == "binary" and effect in scale_conversion.NEEDS_N:
+        if groups is None:
+            raise ValueError("groups must be specified for %s" % effect)
+        # (e1, n1, e2, n2)
+        n1 = [ma_unit.get_raw_data_for_groups(groups)[1] for ma_unit in ma_units]
+    d_est, d_lower, d_upper = [effect_sizes.to_list(scale_conversion.convert_scale(x, effect, data_type_str, n1=n1)) \
+                                    for x in (est, lower, upper)]
+    se = effect_sizes.to_list(se)
+
+    for i, ma_unit in enumerate(ma_units):
+        effect_d = ma_unit._get_or_create_effect_d(effect, group_str)
+        effect_d["display_est"] = d_est[i]
+        effect_d["display_lower"] = d_lower[i]
+        effect_d["display_upper"] = d_upper[i]
+        effect_d["display_se"] = se[i]
+        effect_d["display_conf_level"] = conf_level
+    return len(ma_units)
+
+
+class TreatmentGroup(_Slotted):
+    __slots__ = ("id", "name", "raw_data")
+
+    def __init__(self, id=None, name=None, raw_data=None):
         self.id = id
         self.name = name
         self.raw_data = raw_data    
     
             
-class Outcome:
+class Outcome(_Slotted):
     ''' Holds a few fields that define outcomes. '''
-    def __init__(self, name, data_type, links=None, sub_type=None):
+    __slots__ = ("name", "data_type", "links", "sub_type")
+
+    def __init__(self, name=None, data_type=None, links=None, sub_type=None):
         self.name = name
         self.data_type = data_type
         self.links = links
         self.sub_type = sub_type # more specific than just binary, cont, diag, etc.
        
-class Covariate:
+class Covariate(_Slotted):
     ''' Meta-data about covariates. '''
-    def __init__(self, name, data_type):
+    __slots__ = ("name", "data_type")
+
+    def __init__(self, name=None, data_type="continuous"):
         if not data_type in ("factor", "continuous"):
             raise Exception, \
                 "covariates need to have associated type factor or continuous; %s was given" % data_type
@@ -21,12 +21,17 @@ from PyQt4 import QtCore, QtGui
 
 import copy
 
+import analysis_runner
 import forms.ui_ma_specs
 #import meta_py_r
+import method_registry
 from meta_globals import *
+import oma_logging
 from settings import *
 import diagnostic_explain
 
+logger = oma_logging.get_logger(__name__)
+
 ###
 # ack.. string encoding messiness
 try:
@@ -63,7 +68,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
                                              self.method_changed)
 
         self.data_type = self.model.get_current_outcome_type()
-        print "data type: %s" % self.data_type
+        logger.debug("data type: %s", self.data_type)
         if self.meta_f_str is not None:
             # we pre-prend the data type to the meta-method function
             # name. thus the caller (meta_form) needn't worry about
@@ -124,7 +129,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         self.populate_cbo_box()
 
     def cancel(self):
-        print "(cancel)"
+        logger.debug("(cancel)")
         self.reject()
 
     def select_out_path(self):
@@ -167,20 +172,17 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         if self.data_type not in ["binary","continuous"]:
             raise ValueError("Network Analysis can currently only be done with binary or continuous data")
         
-        meta_py_r.ma_dataset_to_simple_network(table_model=self.model,
+        try:
+            meta_py_r.ma_dataset_to_simple_network(table_model=self.model,
                                      var_name="tmp_obj",
                                      data_type=None,
                                      outcome=None,
                                      follow_up=None,
                                      network_path='./r_tmp/network.png')
+        except meta_py_r.RBusy, e:
+            QMessageBox.information(self, "R is busy", str(e))
 
     def run_ma(self):
-        ###
-        # first, let's fire up a progress bar
-        bar = MetaProgress(self)
-        bar.show()
-        result = None
-        
         # this method is defined statically, below
         add_plot_params(self)
 
@@ -190,29 +192,14 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         if not self.data_type == "diagnostic":
             self.current_param_vals["measure"] = self.model.current_effect 
         
-        # dispatch on type; build an R object, then run the analysis
-        if self.data_type == "binary":
-            # note that this call creates a tmp object in R called
-            # tmp_obj (though you can pass in whatever var name
-            # you'd like)
-            meta_py_r.ma_dataset_to_simple_binary_robj(self.model)
-            if self.meta_f_str is None:
-                result = meta_py_r.run_binary_ma(self.current_method, self.current_param_vals)
-                #pass
-            else:
-                result = meta_py_r.run_meta_method(self.meta_f_str, self.current_method, self.current_param_vals)
-                
-            #_writeout_test_data(self.meta_f_str, self.current_method, self.current_param_vals, result) # FOR MAKING TESTS
-        elif self.data_type == "continuous":
-            meta_py_r.ma_dataset_to_simple_continuous_robj(self.model)
-            if self.meta_f_str is None:
-                # run standard meta-analysis
-                result = meta_py_r.run_continuous_ma(self.current_method, self.current_param_vals)
-            else:
-                # get meta!
-                result = meta_py_r.run_meta_method(self.meta_f_str, self.current_method, self.current_param_vals)
-            
-            #_writeout_test_data(self.meta_f_str, self.current_method, self.current_param_vals, result) # FOR MAKING TESTS
+        # dispatch on type; the job pulls the data out of the model now, and
+        # is run (building the R object, then running the analysis) by the
+        # analysis runner on the main form, which also displays the results.
+        if self.data_type in ("binary", "continuous"):
+            # note that the job creates a tmp object in R called tmp_obj
+            job = analysis_runner.make_ma_job(self.model, self.data_type,
+                        self.current_method, copy.deepcopy(self.current_param_vals),
+                        meta_f_str=self.meta_f_str, pool=self.parent().r_worker_pool)
         elif self.data_type == "diagnostic":
             # add the current metrics (e.g., PLR, etc.) to the method/params
             # dictionary
@@ -247,35 +234,14 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
                 method_names.append(method)
                 list_of_param_vals.append(param_vals)
             
-            # create the DiagnosticData object on the R side -- this is going 
-            # to be the same for all analyses
-            meta_py_r.ma_dataset_to_simple_diagnostic_robj(self.model)
-
-            if self.meta_f_str is None:
-                # regular meta-analysis
-                try:
-                    result = meta_py_r.run_diagnostic_multi(method_names, list_of_param_vals)
-                except Exception, e:
-                    error_message = \
-                        "sorry, something has gone wrong with your analysis. here is a stack trace that probably won't be terribly useful.\n %s"  \
-                                            % e
-                
-                    QMessageBox.critical(self, "analysis failed", error_message)
-                    bar.hide()
-                    # reset Rs working directory 
-                    meta_py_r.reset_Rs_working_dir()
-                    self.accept()
-                #_writeout_test_data(self.meta_f_str, method_names, list_of_param_vals, result, diag=True) # FOR MAKING TESTS
-            else:
-                # in the case of diagnostic, we pass in lists
-                # of param values to the meta_method 
-                result = meta_py_r.run_meta_method_diag(
-                                self.meta_f_str, method_names, list_of_param_vals)
-                #_writeout_test_data(self.meta_f_str, method_names, list_of_param_vals, result, diag=True) # FOR MAKING TESTS
-
-        bar.hide()
-
-        self.parent().analysis(result)
+            # the DiagnosticData object on the R side is the same for all
+            # analyses; in the case of a meta method, we pass in lists of
+            # param values to it
+            job = analysis_runner.make_diagnostic_job(self.model, method_names,
+                        list_of_param_vals, meta_f_str=self.meta_f_str,
+                        pool=self.parent().r_worker_pool)
+
+        self.parent().run_analysis(job)
         self.accept()
 
     def enable_diagnostic_fields(self):
@@ -298,7 +264,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
 
     def method_changed(self):
         if self.parameter_grp_box.layout() is not None:
-            print("Layout items count before: %d" % self.parameter_grp_box.layout().count())
+            logger.debug("Layout items count before: %d", self.parameter_grp_box.layout().count())
         self.clear_param_ui()
         self.current_widgets= []
         self.current_method = self.available_method_d[str(self.method_cbo_box.currentText())]
@@ -344,10 +310,10 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
                 metric = "Sens"
 
         
-        self.available_method_d = meta_py_r.get_available_methods(for_data_type=self.data_type,\
-                                         data_obj_name=tmp_obj_name, metric=metric)
+        self.available_method_d = method_registry.get_registry().get_available_methods(
+                                         self.data_type, tmp_obj_name, metric=metric)
 
-        print "\n\navailable %s methods: %s" % (self.data_type, ", ".join(self.available_method_d.keys()))
+        logger.debug("available %s methods: %s", self.data_type, self.available_method_d.keys())
         
         
         #print("----------------------------------\nAvailable methods dictionary:",self.available_method_d)
@@ -375,7 +341,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
                     method_names.remove('Diagnostic Fixed-Effect Peto')
                     #QMessageBox.warning(self.parent(), "whoops", "removed peto")
                 except:
-                    print("Couldn't remove 'Diagnostic Fixed-Effect Peto' for some reason... don't know why")
+                    logger.warning("Couldn't remove 'Diagnostic Fixed-Effect Peto' for some reason... don't know why")
         
         method_names.sort(reverse=True)
 
@@ -407,7 +373,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         cur_grid_row = 0
         
         # add the method description
-        method_description = meta_py_r.get_method_description(self.current_method)
+        method_description = method_registry.get_registry().get_method_description(self.current_method)
         
         self.add_label(self.parameter_grp_box.layout(), cur_grid_row, \
                             "Description: %s" % method_description)
@@ -452,7 +418,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
             self.plot_tab.setEnabled(True)
                         
     def add_param(self, layout, cur_grid_row, name, value):
-        print "adding param. name: %s, value: %s" % (name, value)
+        logger.debug("adding param. name: %s, value: %s", name, value)
         if isinstance(value, list):
             # then it's an enumeration of values
             self.add_enum(layout, cur_grid_row, name, value)
@@ -464,8 +430,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         elif value.lower() == "string":
             self.add_text_box(layout, cur_grid_row, name)
         else:
-            print "unknown type! throwing up. bleccch."
-            print "name:%s. value: %s" % (name, value)
+            logger.warning("unknown type! name: %s. value: %s", name, value)
             # throw exception here
 
     def add_enum(self, layout, cur_grid_row, name, values):
@@ -512,7 +477,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
             combo_box = self.sender()
             x = combo_box.itemData(index).toString()
             self.current_param_vals[name] = to_type(x)
-            print str(self.current_param_vals) + " -> weirdo sender thing"
+            logger.debug("%s -> weirdo sender thing", self.current_param_vals)
 
         return set_param
 
@@ -576,7 +541,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         '''
         def set_param(x):
             self.current_param_vals[name] = to_type(x)
-            print self.current_param_vals
+            logger.debug("%s", self.current_param_vals)
 
         return set_param
 
@@ -593,7 +558,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         # itself maps to a dictionary with a pretty name and description (assuming
         # they were provided for the given param)
         self.current_params, self.current_defaults, self.var_order, self.param_d = \
-                    meta_py_r.get_params(self.current_method)
+                    method_registry.get_registry().get_params(self.current_method)
 
         ###
         # user selections overwrite the current parameter defaults.
@@ -609,7 +574,7 @@ class MA_Specs(QDialog, forms.ui_ma_specs.Ui_Dialog):
         # override conf.level with global conf.level
         self.current_defaults['conf.level'] = self.conf_level
 
-        print self.current_defaults
+        logger.debug("current defaults: %s", self.current_defaults)
 
 
     def diag_next(self):
@@ -747,30 +712,6 @@ def add_plot_params(specs_form):
     specs_form.current_param_vals["fp_show_summary_line"] = specs_form.show_summary_line.isChecked()
 
 
-def _writeout_test_data(meta_f_str, method, params, results, diag=False):
-    with open('test_data.txt', 'a') as f:
-        f.write("method_and_params.append({\n")
-        f.write("                          'meta_f_str': '%s',\n" % meta_f_str)
-        if diag:
-            f.write("                          'method': %s,\n" % str(method))
-        else:
-            f.write("                          'method': '%s',\n" % method)
-        f.write("                          'parameters': %s,\n" % str(params))
-        f.write("                          'results': %s,\n" % str(results))
-        f.write("                         })\n\n")
-        
-        # Write the data to the disk for sure
-        f.flush()
-        os.fsync(f)
-        
-        
-#    method_and_params.append({'meta_f_str': u'loo.ma.binary',
-#                              'method'    : 'binary.random',
-#                              'parameters': {'conf.level': 95.0, 'digits': 3.0, 'fp_col2_str': u'[default]', 'fp_show_col4': True, 'to': 'only0', 'fp_col4_str': u'Ev/Ctrl', 'fp_xticks': '[default]', 'fp_col3_str': u'Ev/Trt', 'fp_show_col3': True, 'fp_show_col2': True, 'fp_show_col1': True, 'fp_plot_lb': '[default]', 'fp_outpath': u'./r_tmp/forest.png', 'rm.method': 'DL', 'adjust': 0.5, 'fp_plot_ub': '[default]', 'fp_col1_str': u'Studies', 'measure': 'OR', 'fp_xlabel': u'[default]', 'fp_show_summary_line': True},
-#                              'results'   : {'images': {'Leave-one-out Forest plot': './r_tmp/forest.png'}, 'texts': {'Leave-one-out Summary': 'Binary Random-Effects Model\n\nMetric: Odds Ratio\n\n Model Results\n\n Studies           Estimate   Lower bound   Upper bound   Std. error   p-Val  \n\n Overall             0.770       0.485         1.222         0.236     0.267  \n\n - Gonzalez          0.783       0.477         1.285         0.253     0.332  \n\n - Prins             0.796       0.489         1.296         0.249     0.359  \n\n - Giamarellou       0.811       0.513         1.281         0.233     0.369  \n\n - Maller            0.715       0.437         1.172         0.252     0.184  \n\n - Sturm             0.791       0.494         1.265         0.240     0.327  \n\n - Marik             0.864       0.543         1.375         0.237     0.538  \n\n - Muijsken          0.724       0.446         1.175         0.247     0.191  \n\n - Vigano            0.750       0.468         1.200         0.240     0.230  \n\n - Hansen            0.851       0.542         1.336         0.230     0.484  \n\n - De Vries          0.724       0.449         1.166         0.243     0.184  \n\n - Mauracher         0.813       0.515         1.283         0.233     0.375  \n\n - Nordstrom         0.772       0.474         1.257         0.249     0.298  \n\n - Rozdzinski        0.738       0.442         1.231         0.261     0.244  \n\n - Ter Braak         0.726       0.443         1.189         0.252     0.204  \n\n - Tulkens           0.764       0.476         1.227         0.242     0.266  \n\n - Van der Auwera    0.791       0.494         1.265         0.240     0.327  \n\n - Klastersky        0.696       0.458         1.059         0.214     0.091  \n\n - Vanhaeverbeek     0.764       0.476         1.226         0.242     0.265  \n\n - Hollender         0.780       0.486         1.253         0.241     0.304  \n\n\n'}, 'image_var_names': {'loo forest plot': 'loo_forest_plot'}, 'image_params_paths': {'Forest Plot': 'r_tmp/1371578321.65222'}, 'image_order': None},
-#                      })
-
-
 ####
 # simple progress bar
 import forms.ui_running
@@ -224,6 +224,93 @@ class ChooseMetricPage(QWizardPage, forms.ui_choose_metric_page.Ui_WizardPage):
 
 import csv
 
+###
+# reading CSV files; these don't need the wizard, so that they can be used
+# to import CSV files without the GUI (see batch_runner)
+def read_csv(file_path, has_headers=True, from_excel=False, delimiter=",", quotechar='"'):
+    ''' Returns the headers (if any) and the rows (lists of strings) in file_path '''
+    with open(file_path, 'rU') as csvfile:
+        args_csv_reader = {'delimiter': delimiter,
+                           'quotechar': quotechar,
+                           }
+        if from_excel:
+            args_csv_reader = {}
+            args_csv_reader['dialect']='excel'
+        
+        # set up reader object
+        reader = csv.reader(csvfile, **args_csv_reader)
+        
+        headers = []
+        imported_data = []
+        if has_headers:
+            headers = reader.next()
+        for row in reader:
+            imported_data.append(row)
+    return headers, imported_data
+
+def get_required_header_labels(data_type, data_subtype, effect):
+    '''
+    Provides column header labels based on chosen datatype and subtype
+    ** Must be updated if header_data() is ma_data_table_model is changed
+    ''' 
+    raw_cols, outcome_cols = DatasetModel.get_column_indices(data_type, data_subtype)
+    
+    header_labels = []
+    
+    model_cols = [DatasetModel.NAME, DatasetModel.YEAR]
+    model_cols.extend(raw_cols)
+    model_cols.extend(outcome_cols)
+    
+    for col in model_cols:
+        col_name = DatasetModel.helper_basic_horizontal_headerData(
+                        section=col, data_type=meta_globals.STR_TO_TYPE_DICT[data_type], sub_type=data_subtype,
+                        raw_columns=raw_cols, outcome_columns=outcome_cols,
+                        current_effect=effect,
+                        groups=meta_globals.DEFAULT_GROUP_NAMES)
+        col_name = str(col_name.toString())
+        header_labels.append(col_name)
+    return header_labels
+
+def get_csv_covariates(imported_data, headers=[], expected_headers=[]):
+    '''
+    Returns the names and types of the covariates in the imported data,
+    i.e., of the columns beyond the expected ones.
+    '''
+    num_rows = len(imported_data)
+    num_cols = len(imported_data[0])
+    if num_cols > len(expected_headers): # Do we have covariates?
+        num_covariates = num_cols - len(expected_headers)
+        print("There are %d covariates" % num_covariates)
+    else:
+        return [], [] # no covariates to deal with
+    
+    def covariate_name(index, given_name):
+        if str(given_name).strip() == "":
+            return "Covariate "+str(index+1)
+        else:
+            return given_name
+    
+    if headers != []:
+        covariate_names = headers[len(expected_headers):]
+    else:
+        covariate_names = [""]*num_covariates
+    covariate_names = [covariate_name(i, name) for i,name in enumerate(covariate_names)]
+    
+    def covariate_type(data):
+        for x in data:
+            try:
+                float(x)
+            except ValueError:
+                return "factor" # these types are important to get right (look in covariate constructor)
+        return "continuous"     #
+
+    covariate_types = []
+    index_offset = len(expected_headers)
+    for cov_index in range(len(covariate_names)):
+        cov_data = [imported_data[row][index_offset+cov_index] for row in range(num_rows)]
+        covariate_types.append(covariate_type(cov_data))
+    return covariate_names, covariate_types
+
 class CsvImportPage(QWizardPage, forms.ui_csv_import_page.Ui_WizardPage):
     def __init__(self, parent=None):
         super(CsvImportPage, self).__init__(parent)
@@ -352,31 +439,10 @@ class CsvImportPage(QWizardPage, forms.ui_csv_import_page.Ui_WizardPage):
         # More validation??
         
     def _get_required_header_labels(self):
-        '''
-        Provides column header labels based on chosen datatype and subtype
-        ** Must be updated if header_data() is ma_data_table_model is changed
-        ''' 
-        
-        data_type = self.wizard().get_dataset_info()['data_type']
-        data_subtype = self.wizard().get_dataset_info()['sub_type']
-        effect = self.wizard().get_dataset_info()['effect']
-        raw_cols, outcome_cols = DatasetModel.get_column_indices(data_type, data_subtype)
-        
-        header_labels = []
-        
-        model_cols = [DatasetModel.NAME, DatasetModel.YEAR]
-        model_cols.extend(raw_cols)
-        model_cols.extend(outcome_cols)
-        
-        for col in model_cols:
-            col_name = DatasetModel.helper_basic_horizontal_headerData(
-                            section=col, data_type=meta_globals.STR_TO_TYPE_DICT[data_type], sub_type=data_subtype,
-                            raw_columns=raw_cols, outcome_columns=outcome_cols,
-                            current_effect=effect,
-                            groups=meta_globals.DEFAULT_GROUP_NAMES)
-            col_name = str(col_name.toString())
-            header_labels.append(col_name)
-        return header_labels
+        dataset_info = self.wizard().get_dataset_info()
+        return get_required_header_labels(dataset_info['data_type'],
+                                          dataset_info['sub_type'],
+                                          dataset_info['effect'])
     
     def csv_data(self):
         ''' Imported data is a list of rows. A row is a list of
@@ -393,55 +459,17 @@ class CsvImportPage(QWizardPage, forms.ui_csv_import_page.Ui_WizardPage):
             return None
     
     def _handle_covariates_in_extracted_data(self, num_rows, num_cols, headers=[], expected_headers=[]):
-        if num_cols > len(expected_headers): # Do we have covariates?
-            num_covariates = num_cols - len(expected_headers)
-            print("There are %d covariates" % num_covariates)
-        else:
-            return None # no covariates to deal with
-        
-        def covariate_name(index, given_name):
-            if str(given_name).strip() == "":
-                return "Covariate "+str(index+1)
-            else:
-                return given_name
-        
-        if self._hasHeaders():
-            covariate_names = headers[len(expected_headers):]
-        else:
-            covariate_names = [""]*num_covariates
-        self.covariate_names = [covariate_name(i, name) for i,name in enumerate(covariate_names)]
-        
-        def covariate_type(data):
-            for x in data:
-                try:
-                    float(x)
-                except ValueError:
-                    return "factor" # these types are important to get right (look in covariate constructor)
-            return "continuous"     #
-
-        index_offset = len(expected_headers)
-        for cov_index in range(len(covariate_names)):
-            cov_data = [self.imported_data[row][index_offset+cov_index] for row in range(num_rows)]
-            self.covariate_types.append(covariate_type(cov_data))
+        if not self._hasHeaders():
+            headers = []
+        self.covariate_names, self.covariate_types = \
+                get_csv_covariates(self.imported_data, headers, expected_headers)
     
     def extract_data(self):
-        with open(self._get_filepath(), 'rU') as csvfile:
-            args_csv_reader = {'delimiter': self._get_delimter(),
-                               'quotechar': self._get_quotechar(),
-                               }
-            if self._isFromExcel():
-                args_csv_reader = {}
-                args_csv_reader['dialect']='excel'
-            
-            # set up reader object
-            reader = csv.reader(csvfile, **args_csv_reader)
-            
-            self.headers = []
-            self.imported_data = []
-            if self._hasHeaders():
-                self.headers = reader.next()
-            for row in reader:
-                self.imported_data.append(row)
+        self.headers, self.imported_data = read_csv(self._get_filepath(),
+                                has_headers=self._hasHeaders(),
+                                from_excel=self._isFromExcel(),
+                                delimiter=self._get_delimter(),
+                                quotechar=self._get_quotechar())
         self.print_extracted_data() # just for debugging
         
     def print_extracted_data(self):
@@ -9,7 +9,6 @@
 #                                    # 
 ######################################
 
-import pickle
 from PyQt4 import QtCore, QtGui
 from PyQt4.Qt import *
 import copy
@@ -21,10 +20,13 @@ import ma_data_table_model
 import meta_globals
 from meta_globals import *
 import ma_dataset
+import oma_journal
 from settings import *
 
 # additional forms
 import add_new_dialogs
+import analysis_runner
+import r_worker_pool
 import results_window
 import ma_specs 
 import diag_metrics
@@ -37,6 +39,8 @@ import network_view
 import conf_level_dialog
 import main_wizard
 import easter_egg
+import r_calls_dialog
+import oma_logging
 
 # for the help
 import webbrowser
@@ -44,6 +48,9 @@ import webbrowser
 
 
 import forms.ui_running
+
+logger = oma_logging.get_logger(__name__)
+
 class ImportProgress(QDialog, forms.ui_running.Ui_running):
     def __init__(self, parent=None, min_=0, max_=10):
         super(ImportProgress, self).__init__(parent)
@@ -62,6 +69,38 @@ class ImportProgress(QDialog, forms.ui_running.Ui_running):
         return self.progress_bar.maximum()
     def value(self):
         return self.progress_bar.value()
+
+
+class AnalysisProgress(QDialog, forms.ui_running.Ui_running):
+    '''
+    Shows the progress of the analysis that is currently running; unlike
+    the old (modal) progress bar, this does not block the rest of the UI.
+    '''
+    def __init__(self, parent=None):
+        super(AnalysisProgress, self).__init__(parent)
+        self.setupUi(self)
+        self.setModal(False)
+        self.setWindowModality(Qt.NonModal)
+
+        self.status_lbl = QLabel("")
+        self.verticalLayout.insertWidget(0, self.status_lbl)
+        self.cancel_btn = QPushButton("cancel")
+        self.verticalLayout.addWidget(self.cancel_btn)
+
+    def set_job(self, job, n_pending=0):
+        self.setWindowTitle("running %s..." % job.description)
+        self.progress_bar.setRange(0, 0)
+        self._set_status("starting", n_pending)
+
+    def set_progress(self, done, total, label, n_pending=0):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self._set_status(label, n_pending)
+
+    def _set_status(self, label, n_pending):
+        if n_pending > 0:
+            label = "%s (%s more queued)" % (label, n_pending)
+        self.status_lbl.setText(label)
     
 ###############################################################################
 
@@ -113,6 +152,7 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
     
 
         self.out_path = None                # path to output file
+        self.journaled_saver = None         # saves to out_path; see oma_journal
         self.metric_menu_is_set_for = None  # BINARY, CONTINUOUS, or DIAGNOSTIC
 
         # by default, disable meta-regression (until we have covariates)
@@ -120,12 +160,19 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
         
         load_settings()
         self.populate_open_recent_menu()
+        self._setup_analysis_runner()
         
         # The most important code of the entire application
         show_tom = QAction(self)
         show_tom.setShortcut(QKeySequence("T, Shift+O, M"))
         self.addAction(show_tom)
         QObject.connect(show_tom, SIGNAL("triggered()"), self._show_tom)
+
+        # debug panel: statistics of the calls to R
+        show_r_calls = QAction(self)
+        show_r_calls.setShortcut(QKeySequence("Ctrl+Shift+R"))
+        self.addAction(show_r_calls)
+        QObject.connect(show_r_calls, SIGNAL("triggered()"), self._show_r_calls)
         
         
         if DISABLE_NETWORK_STUFF:
@@ -645,6 +692,72 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
             form.show()
 
 
+    ####
+    # analyses are run (one at a time) by the analysis runner, off the GUI
+    # thread; results are passed to analysis() as they come in
+    def _setup_analysis_runner(self):
+        self.analysis_runner = analysis_runner.AnalysisRunner(parent=self)
+        # independent parts of an analysis (e.g., the metrics of a diagnostic
+        # analysis) are run in parallel by the worker pool, if there is one
+        self.r_worker_pool = None
+        n_workers = get_setting("r_workers")
+        if n_workers != 1:
+            self.r_worker_pool = r_worker_pool.RWorkerPool(n_workers)
+        self.analysis_progress = AnalysisProgress(parent=self)
+        QObject.connect(self.analysis_progress.cancel_btn, SIGNAL("clicked()"),
+                        self.cancel_analysis)
+        QObject.connect(self.analysis_runner, SIGNAL("jobStarted"), self._analysis_started)
+        QObject.connect(self.analysis_runner, SIGNAL("jobProgress"), self._analysis_progress)
+        QObject.connect(self.analysis_runner, SIGNAL("jobFinished"), self._analysis_finished)
+        QObject.connect(self.analysis_runner, SIGNAL("jobFailed"), self._analysis_failed)
+        QObject.connect(self.analysis_runner, SIGNAL("jobCancelled"), self._analysis_cancelled)
+
+    def run_analysis(self, job):
+        ''' Queues the (analysis_runner.AnalysisJob) job '''
+        self.analysis_runner.submit(job)
+        self.statusbar.showMessage("queued %s" % job.description, 3000)
+
+    def cancel_analysis(self):
+        self.analysis_runner.cancel()
+
+    def _analysis_started(self, job):
+        if job.quiet:
+            self.statusbar.showMessage(job.description)
+            return
+        self.analysis_progress.set_job(job, len(self.analysis_runner.pending_jobs()))
+        self.analysis_progress.show()
+
+    def _analysis_progress(self, job, done, total, label):
+        if job.quiet:
+            self.statusbar.showMessage("%s: %s" % (job.description, label))
+            return
+        self.analysis_progress.set_progress(done, total, label,
+                                            len(self.analysis_runner.pending_jobs()))
+
+    def _analysis_done(self):
+        if not self.analysis_runner.is_busy():
+            self.analysis_progress.hide()
+
+    def _analysis_finished(self, job, result):
+        if job.quiet:
+            self.statusbar.clearMessage()
+            return
+        self._analysis_done()
+        self.analysis(result)
+
+    def _analysis_failed(self, job, error_message):
+        self._analysis_done()
+        if job.quiet:
+            QMessageBox.critical(self, "whoops", "%s failed:\n %s" % (job.description, error_message))
+            return
+        QMessageBox.critical(self, "analysis failed",
+            "sorry, something has gone wrong with your analysis. here is a stack trace that probably won't be terribly useful.\n %s" \
+                % error_message)
+
+    def _analysis_cancelled(self, job):
+        self._analysis_done()
+        self.statusbar.showMessage("cancelled %s" % job.description, 3000)
+
     def edit_group_name(self, cur_group_name):
         orig_group_name = copy.copy(cur_group_name)
         edit_group_form = edit_group_name_form.EditGroupName(cur_group_name, parent=self)
@@ -934,10 +1047,11 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
         
     def open(self, file_path=None):
         '''
-        This gets called when the user opts to open an existing dataset. Note that we make use
-        of the pickled dataset itself (.oma) and we also look for a corresponding `state`
-        dictionary, which contains things like which outcome was currently displayed, etc.
-        Also note that, as in Excel, the open operation is undoable. 
+        This gets called when the user opts to open an existing dataset. The dataset is
+        read along with the `state` dictionary saved with it, which contains things like
+        which outcome was currently displayed, etc. (see the oma_format module; old,
+        pickled, .oma files are read, too). Also note that, as in Excel, the open
+        operation is undoable. 
         '''
         
         if self.current_data_unsaved:
@@ -964,10 +1078,10 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
 
         add_file_to_recent_files(file_path)
         
-        data_model = None
+        data_model, state_dict = None, None
         print "loading %s..." % file_path
         try:
-            data_model = pickle.load(open(file_path, 'r'))
+            data_model, state_dict = oma_journal.load(file_path)
             print "successfully loaded data"
         except Exception as e:
             msg = "Could not open %s, error: %s" % (file_path, str(e))
@@ -980,12 +1094,12 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
         prev_state_dict = copy.copy(self.model.get_stateful_dict())
         
         self.out_path = file_path
+        # subsequent saves only write what changed relative to data_model
+        self._make_journaled_saver(data_model)
         
-        state_dict = None
-        try:
-            state_dict = pickle.load(open(file_path + ".state"))
+        if state_dict is not None:
             print "found state dictionary: \n%s" % state_dict
-        except:
+        else:
             print "no state dictionary found -- using 'reasonable' defaults"
             state_dict = self.tableView.model().make_reasonable_stateful_dict(data_model)
             print "made state dictionary: \n%s" % state_dict
@@ -1026,10 +1140,9 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
         if change_type_form.exec_():
             modified_dataset = change_type_form.dataset
             # revert to original study ordering
-            modified_dataset.studies.sort(\
-                    cmp=modified_dataset.cmp_studies(compare_by="ordered_list",\
-                                        ordered_list=original_study_order,
-                                        mult=self.model.get_mult()))
+            modified_dataset.sort_studies(compare_by="ordered_list",
+                                          ordered_list=original_study_order,
+                                          mult=self.model.get_mult())
             
             ### use the same state dict as before.
             old_state_dict = self.tableView.model().get_stateful_dict()
@@ -1198,6 +1311,12 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
                 return 
                 
         save_settings()
+        # a running analysis can't be interrupted; if R is still busy after
+        # a few seconds we kill the thread since we're going away anyway
+        if not self.analysis_runner.stop(timeout=3000):
+            self.analysis_runner.terminate()
+        if self.r_worker_pool is not None:
+            self.r_worker_pool.terminate()
         QApplication.quit()
     
     def prompt_to_save_unsaved_data(self):
@@ -1244,15 +1363,17 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
                 
         try:
             print "trying to write data out to: %s" % self.out_path
-            f = open(self.out_path, 'wb')
-            pickle.dump(self.model.dataset, f)
-            f.close()
             # also write out the 'state', which contains things
-            # pertaining to the view
+            # pertaining to the view. note that only the studies that
+            # changed since the last save are written (to the journal).
             d = self.model.get_stateful_dict()
-            f = open(self.out_path + ".state", 'wb')
-            pickle.dump(d, f)
-            f.close()
+            if self.journaled_saver is None or self.journaled_saver.path != self.out_path:
+                self._make_journaled_saver()
+            save_info = self.journaled_saver.save(self.model.dataset, state=d,
+                                                  force=self.current_data_unsaved)
+            logger.debug("wrote %s bytes (%s studies, checkpoint: %s)", save_info["bytes_written"],
+                         save_info["studies_written"], save_info["checkpoint"])
+            self.tableView.undoStack.setClean()
 
             # add dataset to recent files
             add_file_to_recent_files(self.out_path)
@@ -1266,10 +1387,22 @@ class MetaForm(QtGui.QMainWindow, ui_meta.Ui_MainWindow):
 
 
         
+    def _make_journaled_saver(self, dataset=None):
+        '''
+        dataset, if given, is the dataset as it was read from out_path;
+        otherwise the first save writes out everything.
+        '''
+        self.journaled_saver = oma_journal.JournaledSaver(self.out_path, dataset)
+        self.journaled_saver.attach_undo_stack(self.tableView.undoStack)
+
     def _show_tom(self):
         tom_dlg = easter_egg.TomDialog(parent=self)
         tom_dlg.exec_()
 
+    def _show_r_calls(self):
+        r_calls_dlg = r_calls_dialog.RCallsDialog(parent=self)
+        r_calls_dlg.exec_()
+
     def _make_new_dataset_and_setup_spreadsheet(self,dataset_info):
         is_diag = dataset_info['data_type'] == "diagnostic"
         self.new_dataset(is_diag=is_diag)
@@ -1385,13 +1518,10 @@ class CommandImportCSV(QUndoCommand):
         
         progress_bar.setValue(0)
         progress_bar.show()
-        for row in range(num_rows):
-            for col in range(num_cols):
-                progress_bar.setValue(row*num_cols + col)
-                QApplication.processEvents()
-                print("bar_ value: %s" % str([progress_bar.value(),progress_bar.minimum(), progress_bar.maximum()]))
-                value = QVariant(QString(self.imported_data[row][col]))
-                self.main_form.model.setData(self.main_form.model.index(row,col+1), value, import_csv=True)
+        def update_progress(cells_done):
+            progress_bar.setValue(cells_done)
+            QApplication.processEvents()
+        self.main_form.model.import_csv_rows(self.imported_data, progress_f=update_progress)
         
         progress_bar.hide() # we are done
 ####################### END Undo Command for Import CSV #######################
@@ -12,47 +12,178 @@
 #                                                                           #
 #############################################################################
 
-print("Entering meta_py_r for import probably")
+import contextlib
+import ctypes
 import math
 import os
+import threading
+import time
+
+import numpy as np
+
+import effect_sizes
+import oma_logging
+import r_tracing
+import scale_conversion
 from meta_globals import *
 from settings import *
 
-print("the path: %s" % os.getenv("PATH"))
-
-try:
-    print("importing from rpy2")
-    # will fail if not properly configured
-    # good place to debug when trying to get the mac build to work
-    #from rpy2 import robjects as ro
-    import rpy2.robjects as ro
-    print("succesfully imported from rpy2")
-except Exception, e:
-    print e
-    print("rpy2 import problem")
-    #pyqtRemoveInputHook()
-    #pdb.set_trace()
-    raise Exception("rpy2 not properly installed!")
-    print e
-print("importing rpy2.robjects")
-import rpy2.robjects
-print("succesfully imported rpy2.robjects")
+# R is not thread-safe; whoever talks to R (e.g., the analysis runner, which
+# holds it for the duration of an analysis) must hold this lock. The GUI
+# thread does not wait for it, see NonBlockingRfunctionCaller.
+R_LOCK = threading.RLock()
 
-def execute_r_string(r_str):
-    
+# (the R source we execute can be huge; it is only logged, and formatted, at
+# the DEBUG level)
+logger = oma_logging.get_logger(__name__)
+
+# bootstraps are run in chunks of (at most) this many replicates, each with
+# its own seed (see run_bootstrap)
+BOOTSTRAP_CHUNK_SIZE = 250
+DEFAULT_BOOTSTRAP_SEED = 1
+
+# likewise permutation tests (see run_permutation_test), which stop once the
+# omnibus p-value is known to within PERMUTATION_CI_HALFWIDTH (its 95% CI),
+# though not before PERMUTATION_MIN_ITER permutations
+PERMUTATION_CHUNK_SIZE = 1000
+PERMUTATION_CI_HALFWIDTH = 0.005
+PERMUTATION_MIN_ITER = 2000
+
+class Cancelled(Exception):
+    pass
+
+class RBusy(Exception):
+    ''' R is busy (running an analysis) and the caller can't wait for it '''
+    pass
+
+class _RobjectsNotLoaded(object):
+    ''' stands in for rpy2.robjects (ro) until R has been started '''
+    def __getattr__(self, name):
+        return getattr(init_R(), name)
+
+ro = _RobjectsNotLoaded()
+
+def R_is_running():
+    return not isinstance(ro, _RobjectsNotLoaded)
+
+def init_R():
+    '''
+    Starts (embedded) R by importing rpy2, which takes a while; this happens
+    the first time anything here touches ro, unless it is called explicitly
+    beforehand (e.g., by launch, once the main window is up). R starts out
+    in the current working directory. Returns rpy2.robjects.
+
+    R's C stack check is turned off right away, i.e., before R ever runs on
+    another thread (see _disable_C_stack_check).
+    '''
+    global ro
+    R_LOCK.acquire()
     try:
-        print("Executing: %s\n" % r_str)
-        return ro.r(r_str)
+        if R_is_running():
+            return ro
+        logger.debug("the path: %s", os.getenv("PATH"))
+        try:
+            logger.debug("importing from rpy2")
+            # will fail if not properly configured
+            # good place to debug when trying to get the mac build to work
+            import rpy2.robjects
+            logger.debug("succesfully imported from rpy2")
+        except Exception, e:
+            logger.error("rpy2 import problem: %s", e)
+            raise Exception("rpy2 not properly installed!")
+        _disable_C_stack_check(rpy2.robjects)
+        ro = rpy2.robjects
+        return ro
+    finally:
+        R_LOCK.release()
+
+# the R shared library, relative to R.home()
+_LIB_R_PATHS = {"nt":[os.path.join("bin", "x64", "R.dll"), os.path.join("bin", "i386", "R.dll"),
+                      os.path.join("bin", "R.dll")],
+                "posix":[os.path.join("lib", "libR.so"), os.path.join("lib", "libR.dylib")]}
+
+def _disable_C_stack_check(robjects):
+    '''
+    R compares the C stack pointer against the limits of the stack of the
+    thread it was started on and fails with 'C stack usage is too close to
+    the limit' when called from any other thread, e.g., the AnalysisRunner.
+    As R's documentation for embedding R tells us to do in that case, we
+    turn the check off by setting R_CStackLimit to -1.
+    '''
+    r_home = robjects.r("R.home()")[0]
+    for lib_path in _LIB_R_PATHS.get(os.name, []):
+        lib_path = os.path.join(r_home, lib_path)
+        if not os.path.exists(lib_path):
+            continue
+        try:
+            # (R is already loaded, so this just gets us a handle to it)
+            lib_R = ctypes.CDLL(lib_path)
+            ctypes.c_size_t.in_dll(lib_R, "R_CStackLimit").value = ctypes.c_size_t(-1).value
+            logger.debug("disabled R's C stack check (%s)", lib_path)
+            return True
+        except (OSError, ValueError), e:
+            logger.warning("could not disable R's C stack check (%s): %s", lib_path, e)
+            return False
+    logger.warning("could not disable R's C stack check: R library not found in %s", r_home)
+    return False
+
+def _traced_R_call(snippet, size, call, reset_on_error=True):
+    '''
+    Returns call(), which calls R, holding R_LOCK; the call is traced (see
+    r_tracing) with the given snippet and size (the length of the R source
+    or the number of values handed over). All of our calls to R go through
+    here.
+    '''
+    R_LOCK.acquire()
+    start, failed = time.time(), False
+    try:
+        return call()
     except Exception as e:
-        # reset working directory in r then raise the error, hope this will address issue #244
-        print("something bad happened in R")
-        reset_Rs_working_dir()
+        failed = True
+        if reset_on_error:
+            # reset working directory in r then raise the error, hope this will address issue #244
+            logger.warning("something bad happened in R")
+            reset_Rs_working_dir()
         raise e
+    finally:
+        r_tracing.record(r_tracing.find_caller(__name__), time.time() - start,
+                         size, error=failed, snippet=snippet)
+        R_LOCK.release()
+
+def _n_values(values):
+    return sum([len(x) if hasattr(x, "__len__") and not isinstance(x, basestring) else 1 \
+                    for x in values])
+
+def execute_r_string(r_str):
+    ''' Executes r_str in R; each call is traced (see r_tracing) '''
+    logger.debug("Executing: %s", r_str)
+    return _traced_R_call(r_str, len(r_str), lambda: ro.r(r_str))
+
+def call_r_function(function_name, *args, **kw):
+    ''' Calls the R function function_name with the given arguments; traced like execute_r_string '''
+    return _traced_R_call("%s(...)" % function_name, _n_values(args + tuple(kw.values())),
+                          lambda: ro.r[function_name](*args, **kw))
+
+def r_data_frame_str(data_dict):
+    ''' The R source of a data frame made from data_dict (e.g., of parameters) '''
+    return _traced_R_call("data.frame(...)", _n_values(data_dict.values()),
+                          lambda: ro.r['data.frame'](**data_dict).r_repr())
+
+def assign_in_r(var_name, make_r_obj, size=1):
+    '''
+    Sets var_name in R's global environment to the R object make_r_obj()
+    returns; it is called holding R_LOCK, so it may use R to make it.
+    '''
+    def assign():
+        ro.globalenv[var_name] = make_r_obj()
+    _traced_R_call("%s <- ..." % var_name, size, assign)
 
 #################### R Library Loader ####################
+_loaded_r_libs = set()
+
 class RlibLoader:
     def __init__(self):
-        print("R Libary loader (RlibLoader) initialized...")
+        logger.debug("R Libary loader (RlibLoader) initialized...")
     def load_metafor(self):
         return self._load_r_lib("metafor")
     def load_openmetar(self):
@@ -70,52 +201,115 @@ class RlibLoader:
         self.load_grid()
         self.load_gemtc()
     def _load_r_lib(self, name):
+        # (the libraries that aren't needed right away, e.g., igraph and gemtc
+        # for the network stuff, are loaded when they are first used)
+        if name in _loaded_r_libs:
+            return (True, "%s package already loaded" % name)
         try:
             execute_r_string("library(%s)" % name)
+            _loaded_r_libs.add(name)
+            if name == "openmetar":
+                _sync_global_conf_level()
             msg = "%s package successfully loaded" % name
-            print(msg)
+            logger.debug("%s", msg)
             return (True, msg)
         except:
             raise Exception("The %s R package is not installed.\nPlease \
 install this package and then re-start OpenMeta." % name)
 #################### END OF R Library Loader ####################
 
+# the global confidence level (openmetar's set.global.conf.level); it is
+# only set in R when it changes, and once openmetar has been loaded
+_global_conf_level = {"wanted":None, "in_R":None}
+
+def set_global_conf_level(conf_level):
+    _global_conf_level["wanted"] = float(conf_level)
+    # (called from the GUI thread; if R is busy, the analysis runner
+    # passes the new level on before its next job)
+    if "openmetar" in _loaded_r_libs and R_LOCK.acquire(False):
+        try:
+            _sync_global_conf_level()
+        finally:
+            R_LOCK.release()
+
+def sync_global_conf_level():
+    ''' Passes the confidence level last set (see set_global_conf_level) on to R '''
+    if "openmetar" in _loaded_r_libs:
+        _sync_global_conf_level()
+
+def _sync_global_conf_level():
+    wanted = _global_conf_level["wanted"]
+    if wanted is None or wanted == _global_conf_level["in_R"]:
+        return
+    new_cl_in_R = execute_r_string("set.global.conf.level(%s)" % wanted)[0]
+    _global_conf_level["in_R"] = wanted
+    logger.info("Set confidence level in R to: %f", new_cl_in_R)
+
 def RfunctionCaller(function):
     def _RfunctionCaller(*args, **kw):
-        print("Using rpy2 interface to R to call %s" % function.func_name)
+        logger.debug("Using rpy2 interface to R to call %s", function.func_name)
         res = function(*args, **kw)
         return res
     return _RfunctionCaller
 
+@contextlib.contextmanager
+def R_if_available():
+    '''
+    Holds R_LOCK for the duration of the with block if it can be had right
+    away, and raises RBusy otherwise; for calls to R from the GUI thread,
+    which should not freeze while an analysis is running. (The thread
+    running the analysis holds R_LOCK already, so it always gets R.)
+    '''
+    if not R_LOCK.acquire(False):
+        raise RBusy("R is busy running an analysis; please try again once it has finished.")
+    try:
+        yield
+    finally:
+        R_LOCK.release()
+
+def NonBlockingRfunctionCaller(function):
+    ''' For the functions called from the GUI thread: these raise RBusy, see R_if_available '''
+    def _NonBlockingRfunctionCaller(*args, **kw):
+        with R_if_available():
+            return function(*args, **kw)
+    _NonBlockingRfunctionCaller.func_name = function.func_name
+    return _NonBlockingRfunctionCaller
+
+@NonBlockingRfunctionCaller
+def execute_r_string_from_gui(r_str):
+    ''' execute_r_string, for the GUI thread (e.g., the R console); raises RBusy if R is busy '''
+    return execute_r_string(r_str)
+
 def get_R_libpaths():
     ''' Returns the libpaths that R looks at, sanity check to make sure it sees the right paths '''
     
     libpaths = execute_r_string(".libPaths()")
-    print("R Lib paths:")
+    logger.info("R Lib paths:")
     for i, path in enumerate(libpaths):
-        print("%d: %s" % (i,path))
+        logger.info("%d: %s", i, path)
     return list(libpaths)
 
 @RfunctionCaller
 def reset_Rs_working_dir():
     ''' resets R's working directory to the the application base_path, not to r_tmp!'''
-    print("resetting R working dir")
+    logger.debug("resetting R working dir")
 
     # Fix paths issue in windows
     base_path = get_base_path()
     base_path = to_posix_path(base_path)
 
-    print("Trying to set base_path to %s" % base_path)
+    logger.debug("Trying to set base_path to %s", base_path)
     r_str = "setwd('%s')" % base_path
-    # Executing r call with escaped backslashes
-    ro.r(r_str)
+    # Executing r call with escaped backslashes (not execute_r_string,
+    # which resets the working directory when a call fails)
+    _traced_R_call(r_str, len(r_str), lambda: ro.r(r_str), reset_on_error=False)
 
-    print("Set R's working directory to %s" % base_path)
+    logger.info("Set R's working directory to %s", base_path)
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def impute_diag_data(diag_data_dict):
-    print "computing 2x2 table via R..."
-    print diag_data_dict
+    logger.debug("computing 2x2 table via R from %s", diag_data_dict)
 
     # rpy2 doesn't know how to handle None types.
     # we can just remove them from the dictionary.
@@ -123,12 +317,12 @@ def impute_diag_data(diag_data_dict):
         if val is None:
             diag_data_dict.pop(param)
 
-    dataf = ro.r['data.frame'](**diag_data_dict)
-    two_by_two = execute_r_string("gimpute.diagnostic.data(%s)" % (dataf.r_repr()))
+    dataf_str = r_data_frame_str(diag_data_dict)
+    two_by_two = execute_r_string("gimpute.diagnostic.data(%s)" % dataf_str)
     
     
     imputed_2x2 =  R_parse_tools.rlist_to_pydict(two_by_two)
-    print ("Imputed 2x2: %s" % str(imputed_2x2))
+    logger.debug("Imputed 2x2: %s", imputed_2x2)
     
     return imputed_2x2
 
@@ -148,21 +342,22 @@ def R_fn_with_dataframe_arg(data_dict, R_fn_name):
         if val is None:
             data_dict.pop(param)
 
-    dataf = ro.r['data.frame'](**data_dict)
-    r_string = R_fn_name + "(" + str(dataf.r_repr()) + ")"
+    dataf_str = r_data_frame_str(data_dict)
+    r_string = R_fn_name + "(" + str(dataf_str) + ")"
     
-    print("executing (from R_fn_with_dataframe_arg: %s" % r_string)
+    logger.debug("executing (from R_fn_with_dataframe_arg: %s", r_string)
     R_result = execute_r_string(r_string)
     
     res_as_dict = R_parse_tools.recursioner(R_result)
     return res_as_dict
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def impute_bin_data(bin_data_dict):
     remove_value(None, bin_data_dict)
 
-    dataf = ro.r['data.frame'](**bin_data_dict)
-    two_by_two = execute_r_string("gimpute.bin.data(%s)" % (dataf.r_repr()))
+    dataf_str = r_data_frame_str(bin_data_dict)
+    two_by_two = execute_r_string("gimpute.bin.data(%s)" % dataf_str)
     
     res_as_dict = R_parse_tools.recursioner(two_by_two)
             
@@ -171,18 +366,19 @@ def impute_bin_data(bin_data_dict):
     return res_as_dict
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def back_calc_cont_data(group1_data, group2_data, effect_data, conf_level):
     remove_value(None, group1_data)
     remove_value(None, group2_data)
     remove_value(None, effect_data)
     
-    dataf_grp1 = ro.r['data.frame'](**group1_data)
-    dataf_grp2 = ro.r['data.frame'](**group2_data)
-    dataf_effect = ro.r['data.frame'](**effect_data)
+    dataf_grp1_str = r_data_frame_str(group1_data)
+    dataf_grp2_str = r_data_frame_str(group2_data)
+    dataf_effect_str = r_data_frame_str(effect_data)
     
-    r_res = execute_r_string("gimpute.cont.data(%s,%s,%s,%s)" % (dataf_grp1.r_repr(),
-                                                     dataf_grp2.r_repr(),
-                                                     dataf_effect.r_repr(),
+    r_res = execute_r_string("gimpute.cont.data(%s,%s,%s,%s)" % (dataf_grp1_str,
+                                                     dataf_grp2_str,
+                                                     dataf_effect_str,
                                                      str(conf_level)))
     
     res_as_dict = R_parse_tools.recursioner(r_res)
@@ -270,7 +466,7 @@ class R_parse_tools:
             raise ValueError("Expected a singleton list but this list has more than one entry")
         
         # special case of a factor ve
-        if type(singleton_list) == rpy2.robjects.vectors.FactorVector:
+        if type(singleton_list) == ro.vectors.FactorVector:
             return execute_r_string("as.character(%s)" % singleton_list.r_repr())[0]
         
         scalar = singleton_list[0]
@@ -312,8 +508,9 @@ class R_parse_tools:
 
 # This should be renamed as it is not doing back-calculation from effects
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def impute_cont_data(cont_data_dict, alpha):
-    print "computing continuous data via R..."
+    logger.debug("computing continuous data via R...")
     
     # first check that we have some data;
     # if not, there's no sense in trying to
@@ -330,7 +527,7 @@ def impute_cont_data(cont_data_dict, alpha):
     # append alpha argument (for CI level); close function call (parens)
     r_str += "alpha=%s)" % alpha
     
-    print "attempting to execute: %s" % r_str
+    logger.debug("attempting to execute: %s", r_str)
     c_data = execute_r_string(r_str)
     
     results = R_parse_tools.recursioner(c_data)
@@ -338,6 +535,7 @@ def impute_cont_data(cont_data_dict, alpha):
     return results
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def impute_pre_post_cont_data(cont_data_dict, correlation, alpha):
     if len(cont_data_dict.items()) == 0:
         return {"succeeded":False}
@@ -348,7 +546,7 @@ def impute_pre_post_cont_data(cont_data_dict, correlation, alpha):
     
     r_str = "".join(r_str)
     r_str += "correlation=%s, alpha=%s)" % (correlation, alpha)
-    print "attempting to execute: %s" % r_str
+    logger.debug("attempting to execute: %s", r_str)
     c_data = execute_r_string(r_str)
     pythonized_data = R_parse_tools.recursioner(c_data)
     
@@ -356,21 +554,36 @@ def impute_pre_post_cont_data(cont_data_dict, correlation, alpha):
     return pythonized_data
 
 ##################### DEALING WITH CONFIDENCE LEVEL IN R #######################
-@RfunctionCaller
 def get_mult_from_r(confidence_level):
-    alpha = 1-float(confidence_level)/100.0
-    r_str = "abs(qnorm(%s/2))" % str(alpha)
-    mult = execute_r_string(r_str)
-    return mult[0]
+    # no longer calls out to R; kept under its historical name
+    return effect_sizes.get_mult(confidence_level)
 ################################################################################
 
 @RfunctionCaller
 def none_to_null(x):
     if x is None:
-        return ro.r['as.null']()
+        return call_r_function("as.null")
     return x
 
-def get_params(method_name):
+###
+# the openmetar methods; these are catalogued, once, by method_registry,
+# which is what the rest of the program should ask about methods.
+@RfunctionCaller
+def get_openmetar_version():
+    return str(execute_r_string("as.character(packageVersion('openmetar'))")[0])
+
+@RfunctionCaller
+def list_openmetar_functions():
+    return [str(f) for f in execute_r_string("lsf.str('package:openmetar')")]
+
+@RfunctionCaller
+def get_method_info(method_name, function_names):
+    '''
+    Returns a dictionary with the parameters (and their defaults and the
+    order in which to display them) of the method, the pretty names and
+    descriptions of the parameters and those of the method itself.
+    function_names are the functions in openmetar.
+    '''
     param_list = execute_r_string("%s.parameters()" % method_name)
     # note that we're assuming that the last entry of param_list, as provided
     # by the corresponding R routine, is the order to display the variables
@@ -382,107 +595,45 @@ def get_params(method_name):
     if param_d.has_key("var_order"):
         order_vars = list(param_d["var_order"])
 
-    pretty_names_and_descriptions = get_pretty_names_and_descriptions_for_params(
-                                        method_name, param_list)
-
-    return (R_parse_tools.recursioner(param_d['parameters']),
-            R_parse_tools.recursioner(param_d['defaults']),
-            order_vars,
-            pretty_names_and_descriptions,
-            )
-
-     
-@RfunctionCaller
-def get_pretty_names_and_descriptions_for_params(method_name, param_list):
-    method_list = execute_r_string("lsf.str('package:openmetar')")
     pretty_names_f = "%s.pretty.names" % method_name
-    params_d = {}
-    if pretty_names_f in method_list:
+    pretty_names_d = {}
+    if pretty_names_f in function_names:
         # try to match params to their pretty names and descriptions
-        pretty_names_and_descriptions = execute_r_string("%s()" % pretty_names_f)
         # this dictionary is assumed to be as follows:
-        #      params_d[param] --> {"pretty.name":XX, "description":XX}
-        params_d = R_parse_tools.recursioner(pretty_names_and_descriptions)
+        #      pretty_names_d[param] --> {"pretty.name":XX, "description":XX}
+        pretty_names_d = R_parse_tools.recursioner(execute_r_string("%s()" % pretty_names_f))
+
+    # the pretty name & description of the method itself
+    pretty_name = pretty_names_d.get("pretty.name", method_name)
+    description = pretty_names_d.get("description", "None provided.")
 
     # fill in entries for parameters for which pretty names/descriptions were
     # not provided-- these are just place-holders to make processing this
     # easier
-    names_index = param_list.names.index("parameters") 
-    param_names = param_list[names_index].names # pull out the list
-    for param in param_names:
-        if not param in params_d.keys():
-            params_d[param] = {"pretty.name":param, "description":"None provided"}
-    
-    return params_d
+    for param in param_d["parameters"].names:
+        if not param in pretty_names_d.keys():
+            pretty_names_d[param] = {"pretty.name":param, "description":"None provided"}
 
+    return {"parameters":R_parse_tools.recursioner(param_d['parameters']),
+            "defaults":R_parse_tools.recursioner(param_d['defaults']),
+            "var_order":order_vars,
+            "param_pretty_names":pretty_names_d,
+            "pretty_name":pretty_name,
+            "description":description}
 
 @RfunctionCaller
-def get_available_methods(for_data_type=None, data_obj_name=None, metric=None):
+def check_feasibility(method_names, data_obj_name, metric):
     '''
-    Returns a list of methods available in OpenMeta for the particular data_type
-    (if one is given). Excludes "*.parameters" methods
+    Calls <method>.is.feasible(data object, metric) for each of the methods,
+    all in one go; returns a list of booleans. (So each of the methods
+    must have an is.feasible function.)
     '''
-    method_list = execute_r_string("lsf.str('package:openmetar')")
-
-    # the following constitute 'special' or 'reserved' function
-    # names that are used by meta-analyst to parse out available
-    # methods and their parameters. we exclude these from the list
-    # of available meta-analytic routines.
-    # 
-    # by convention, the methods available for a data type (e.g., binary)
-    # start with the name of the data type. furthermore, the parameters
-    # for those methods are returned by a method with a name
-    # ending in ".parameters"
-    special_endings = [".parameters", ".is.feasible", ".overall",
-                       ".regression", "transform.f", ".pretty.names",".value.info",
-                       "is.feasible.for.funnel"]
-    is_special = lambda f: any([f.endswith(ending) for ending in special_endings])
-    all_methods = [method for method in method_list if not is_special(method)]
-    if for_data_type is not None:
-        all_methods = [method for method in all_methods if method.startswith(for_data_type)]
-
-    # now, if a data object handle was provided, check which methods are feasible
-    if data_obj_name is not None:
-        # we will return a dictionary mapping pretty
-        # names (optionally) to method names; if no pretty name exists,
-        # then we just map the method name to itself.
-        # note that if more than one method exists with the same pretty name
-        # it will be overwritten!
-        feasible_methods = {}
-        for method in all_methods:
-            is_feasible = True
-            # we check if the author of this method has provided an is.feasible
-            # routine; if so, we will call it. otherwise, we assume that we can
-            # invoke the corresponding routine (i.e., we assume it's feasible)
-            is_feas_f = "%s.is.feasible" % method
-            if is_feas_f in method_list:
-                # we need to pass along the metric along with the data 
-                # object to assess if a given method is feasible (e.g,.
-                # PETO for binary data only makes sense for 'OR')
-                is_feasible = execute_r_string("%s(%s, '%s')" % (is_feas_f, data_obj_name, metric))[0]
- 
-            if is_feasible:
-                # do we have a pretty name?
-                pretty_names_f = "%s.pretty.names" % method
-                if pretty_names_f in method_list:
-                    pretty_name = execute_r_string("%s()$pretty.name" % pretty_names_f)[0]
-                    feasible_methods[pretty_name] = method
-                else:
-                    # no? then just map to the function name
-                    feasible_methods[method] = method
-    return feasible_methods
-
-@RfunctionCaller
-def get_method_description(method_name):
-    pretty_names_f = "%s.pretty.names" % method_name
-    method_list = execute_r_string("lsf.str('package:openmetar')")
-    description = "None provided."
-    if pretty_names_f in method_list:
-        try:
-            description = execute_r_string("%s()$description" % pretty_names_f)[0]
-        except:
-            pass
-    return description
+    if len(method_names) == 0:
+        return []
+    feas_fs = ", ".join(["'%s.is.feasible'" % method for method in method_names])
+    feasible = execute_r_string("sapply(c(%s), function(f) isTRUE(as.logical(do.call(f, list(%s, '%s')))[1]))" % \
+                                    (feas_fs, data_obj_name, metric))
+    return [bool(x) for x in feasible]
 
 
 #def ma_dataset_to_binary_robj(table_model, var_name):
@@ -500,6 +651,7 @@ def draw_network(edge_list, unconnected_vertices, network_path = '"./r_tmp/netwo
     implementing a method on the R side that takes a graph/
     edge list. We may want to change this eventually.
     '''
+    RlibLoader().load_igraph()
     if len(edge_list) > 0:
         edge_str = ", ".join([" '%s' " % x for x in edge_list])
         execute_r_string("el <- matrix(c(%s), nc=2, byrow=TRUE)" % edge_str)
@@ -508,7 +660,7 @@ def draw_network(edge_list, unconnected_vertices, network_path = '"./r_tmp/netwo
         execute_r_string("g <- graph.empty()") 
     
     if len(unconnected_vertices) > 0:
-        print unconnected_vertices
+        logger.debug("unconnected vertices: %s", unconnected_vertices)
         vertices_str = ", ".join([" '%s' " % x for x in unconnected_vertices])
         execute_r_string("g <- add.vertices(g, %s, name=c(%s))" % (len(unconnected_vertices), vertices_str))
     execute_r_string("png(%s)" % network_path)
@@ -516,177 +668,254 @@ def draw_network(edge_list, unconnected_vertices, network_path = '"./r_tmp/netwo
     execute_r_string("dev.off()")
     return "r_tmp/network.png"
     
+###
+# Data objects (BinaryData, ContinuousData, DiagnosticData) are handed to R
+# as typed vectors, rather than as R source to be parsed; among other
+# things this means study names and factor levels reach R as is (no more
+# latin-1 mangling, see issue #73).
+_INTEGER_SLOTS = ("years",)
+_CHARACTER_SLOTS = ("study.names",)
+
+def _is_missing(x):
+    return x is None or (isinstance(x, basestring) and x.strip() == "")
+
+def _float_vector(values):
+    return ro.FloatVector([ro.NA_Real if _is_missing(x) else float(x) for x in values])
+
+def _int_vector(values):
+    return ro.IntVector([ro.NA_Integer if _is_missing(x) else int(x) for x in values])
+
+def _str_vector(values):
+    return ro.StrVector([ro.NA_Character if _is_missing(x) else unicode(x) for x in values])
+
+def _slot_vector(slot, values):
+    if slot in _INTEGER_SLOTS:
+        return _int_vector(values)
+    if slot in _CHARACTER_SLOTS:
+        return _str_vector(values)
+    return _float_vector(values)
+
+
+class RDataObject(object):
+    '''
+    The data for an openmetar data object: its R class (e.g., 'BinaryData'),
+    the values of its slots (a list of (slot name, list of values) tuples)
+    and its covariates (see _covariate_values). This is plain python, so it
+    can be made on the GUI thread and created in R later, or shipped off to
+    an R worker process.
+    '''
+    def __init__(self, r_class, slots, covariates, var_name="tmp_obj"):
+        self.r_class = r_class
+        self.slots = slots
+        self.covariates = covariates
+        self.var_name = var_name
+
+    def create(self):
+        ''' Creates the object in R, as var_name '''
+        # (the size of a data object is the number of values handed over)
+        _traced_R_call("new('%s') as %s" % (self.r_class, self.var_name), self.size(),
+                       self._create)
+
+    def _create(self):
+        # (holding R_LOCK)
+        kw = dict([(slot, _slot_vector(slot, values)) for slot, values in self.slots])
+        kw["covariates"] = ro.r['list'](*[_covariate_values_robj(cov) for cov in self.covariates])
+        ro.globalenv[self.var_name] = ro.r['new'](self.r_class, **kw)
+
+    def size(self):
+        return sum([len(values) for slot, values in self.slots]) + \
+               sum([len(cov["cov.vals"]) for cov in self.covariates])
+
+
+def _covariate_values(cov, study_ids, dataset):
+    '''
+    The values of covariate cov for the given studies (in the same order),
+    as a dictionary of CovariateValues slots.
+    '''
+    cov_value_d = dataset.get_values_for_cov(cov.name, ids_for_keys=True)
+    cov_values = [cov_value_d.get(study_id) for study_id in study_ids]
+
+    ## setting the reference variable to the first entry
+    # for now -- this only matters for factors, obviously. With no
+    # studies, cov.vals is just an empty vector.
+    ref_var = u"NA" if not cov_values or cov_values[0] is None else unicode(cov_values[0])
+    return {"cov.name":cov.name, "cov.vals":cov_values,
+            "cov.type":TYPE_TO_STR_DICT[cov.data_type], "ref.var":ref_var}
+
+def _covariate_values_robj(cov_values):
+    if cov_values["cov.type"] == TYPE_TO_STR_DICT[CONTINUOUS]:
+        vals = _float_vector(cov_values["cov.vals"])
+    else:
+        # factor
+        vals = _str_vector(cov_values["cov.vals"])
+    return ro.r['new']('CovariateValues', **{"cov.name":unicode(cov_values["cov.name"]),
+                                             "cov.vals":vals,
+                                             "cov.type":cov_values["cov.type"],
+                                             "ref.var":cov_values["ref.var"]})
+
+def list_of_covariate_values(dataset, study_ids, cov_list=None):
+    ''' the values of the covariates (by default, all of them) for the given studies '''
+    if cov_list is None:
+        # then use all covariates that belong to the dataset
+        cov_list = dataset.covariates
+    return [_covariate_values(cov, study_ids, dataset) for cov in cov_list]
+
+def _study_slots(studies, ests, SEs):
+    # issue #139 -- also grab the years
+    return [("y", ests), ("SE", SEs), ("study.names", [study.name for study in studies]),
+            ("years", [study.year for study in studies])]
+
+def _make_data_object(r_class, slots, covariates, var_name, execute):
+    data = RDataObject(r_class, slots, covariates, var_name=var_name)
+    if execute:
+        data.create()
+        logger.debug("ok.")
+    return data
+
+
 @RfunctionCaller
 def ma_dataset_to_simple_continuous_robj(table_model, var_name="tmp_obj",
-                                         covs_to_include=None, studies=None):
-    r_str = None
-    
+                                         covs_to_include=None, studies=None,
+                                         execute=True):
+    '''
+    Creates a ContinuousData object in R and returns its RDataObject; if
+    execute is False, the object is not created (e.g., so that the analysis
+    runner can create it later).
+    '''
     if studies is None:
-        # grab all studies. note: the list is pulled out in reverse order from the 
+        # grab all studies. note: the list is pulled out in reverse order from the
         # model, so we, er, reverse it.
         studies = table_model.get_studies()
     # the study_ids preserve the ordering
     study_ids = [study.id for study in studies]
-    study_names = ", ".join(["\"" + study.name + "\"" for study in studies])
-    
-    # issue #139 -- also grab the years
-    none_to_str = lambda n : str(n) if n is not None else "" # this will produce NA ints
-    study_years = ", ".join(["as.integer(%s)" % none_to_str(study.year) for study in studies])
-
-    ests, SEs = table_model.get_cur_ests_and_SEs(only_these_studies=study_ids)    
-    ests_str = ", ".join(_to_strs(ests))
-    SEs_str = ", ".join(_to_strs(SEs))
-    
-    cov_str = list_of_cov_value_objects_str(table_model.dataset,
-                                            study_ids,
-                                            cov_list=covs_to_include,)
 
+    ests, SEs = table_model.get_cur_ests_and_SEs(only_these_studies=study_ids)
+    slots = _study_slots(studies, ests, SEs)
+    covariates = list_of_covariate_values(table_model.dataset, study_ids,
+                                          cov_list=covs_to_include)
 
     # first try and construct an object with raw data -- note that if
     # we're using a one-armed metric for cont. data, we just use y/SE
     if (not table_model.current_effect in ONE_ARM_METRICS) and \
                          table_model.included_studies_have_raw_data():
-        print "we have raw data... parsing, parsing, parsing"
-            
+        logger.debug("we have raw data... parsing, parsing, parsing")
+
         raw_data = table_model.get_cur_raw_data(only_these_studies=study_ids)
-        Ns1_str    = _get_str(raw_data, 0)
-        means1_str = _get_str(raw_data, 1)
-        SDs1_str   = _get_str(raw_data, 2)
-        Ns2_str    = _get_str(raw_data, 3)
-        means2_str = _get_str(raw_data, 4)
-        SDs2_str   = _get_str(raw_data, 5)
-
-        r_str = "%s <- new('ContinuousData', \
-                                     N1=c(%s), mean1=c(%s), sd1=c(%s), \
-                                     N2=c(%s), mean2=c(%s), sd2=c(%s), \
-                                     y=c(%s), SE=c(%s), study.names=c(%s),\
-                                    years=c(%s), covariates=%s)" \
-                        % (var_name, Ns1_str, means1_str, SDs1_str,
-                            Ns2_str, means2_str, SDs2_str,
-                            ests_str, SEs_str, study_names, study_years, cov_str)
-         
+        slots = [(slot, _get_col(raw_data, i, reverse=True)) for i, slot in \
+                    enumerate(("N1", "mean1", "sd1", "N2", "mean2", "sd2"))] + slots
     else:
-        print "no raw data (or one-arm)... using effects"
-        r_str = "%s <- new('ContinuousData', \
-                            y=c(%s), SE=c(%s), study.names=c(%s),\
-                            years=c(%s), covariates=%s)" \
-                            % (var_name, ests_str, SEs_str, \
-                                study_names, study_years, cov_str)
-        
-    # character encodings for R
-    r_str = _sanitize_for_R(r_str)
-    print "executing: %s" % r_str
-    execute_r_string(r_str)
-    print "ok."
-    return r_str
-    
-    
-def _get_str(M, col_index, reverse=True):
-    x = _get_col(M, col_index)
-    if reverse:
-        x.reverse()
-    return ", ".join(_to_strs(x))
-    
+        logger.debug("no raw data (or one-arm)... using effects")
+
+    return _make_data_object('ContinuousData', slots, covariates, var_name, execute)
+
 
 @RfunctionCaller
-def ma_dataset_to_simple_binary_robj(table_model, var_name="tmp_obj", 
+def ma_dataset_to_simple_binary_robj(table_model, var_name="tmp_obj",
                                      include_raw_data=True, covs_to_include=None,
-                                     studies=None):
+                                     studies=None, execute=True):
     '''
     This converts a DatasetModel to an OpenMetaData (OMData) R object. We use type DatasetModel
     rather than a DataSet model directly to access the current variables. Furthermore, this allows
     us to check which studies (if any) were excluded by the user.
-    
+
     By 'simple' we mean that this method returns a single outcome single follow-up (defined as the
     the currently selected, as indicated by the model object) data object.
 
+    Returns the RDataObject; if execute is False, the object is not
+    created in R.
+
      @TODO
         - implement methods for more advanced conversions, i.e., for multiple outcome
             datasets (althought this will be implemented in some other method)
     '''
-    r_str = None
-    
     if studies is None:
-        # grab the study names. note: the list is pulled out in reverse order from the 
+        # grab the study names. note: the list is pulled out in reverse order from the
         # model, so we, er, reverse it.
         studies = table_model.get_studies(only_if_included=True)
 
     study_ids = [study.id for study in studies]
 
-    # issue #139 -- also grab the years
-    none_to_str = lambda n : str(n) if n is not None else "" # this will produce NA ints
-    study_years = ", ".join(["as.integer(%s)" % none_to_str(study.year) for study in studies])
-    study_names = ", ".join(["\"" + study.name + "\"" for study in studies])
-    
     ests, SEs = table_model.get_cur_ests_and_SEs(only_if_included=True, only_these_studies=study_ids)
-    ests_str = ", ".join(_to_strs(ests))
-    SEs_str = ", ".join(_to_strs(SEs))
-
-            
-    # generate the covariate string
-    cov_str = list_of_cov_value_objects_str(table_model.dataset, study_ids,
-                                            cov_list=covs_to_include)
-    
+    slots = _study_slots(studies, ests, SEs)
+    covariates = list_of_covariate_values(table_model.dataset, study_ids,
+                                          cov_list=covs_to_include)
 
     # first try and construct an object with raw data
     if include_raw_data and table_model.included_studies_have_raw_data():
-        print "ok; raw data has been entered for all included studies"
-        
+        logger.debug("ok; raw data has been entered for all included studies")
+
         # now figure out the raw data
         raw_data = table_model.get_cur_raw_data(only_these_studies=study_ids)
-    
+
         g1_events = _get_col(raw_data, 0)
-        
-        g1O1_str = ", ".join(_to_strs(g1_events))
         g1_totals = _get_col(raw_data, 1)
-        
         g1O2 = [(total_i-event_i) for total_i, event_i in zip(g1_totals, g1_events)]
-        g1O2_str = ", ".join(_to_strs(g1O2))
-    
-        # now, for group 2; we only set up the string
-        # for group two if we have a two-arm metric
-        g2O1_str, g2O2_str = "0", "0" # the 0s are just to satisfy R; not used
-        if table_model.current_effect in TWO_ARM_METRICS:  
-            g2_events = _get_col(raw_data, 2)
-            g2O1_str = ", ".join(_to_strs(g2_events))
 
+        # now, for group 2; we only fill in group two
+        # if we have a two-arm metric
+        g2O1, g2O2 = [0], [0] # the 0s are just to satisfy R; not used
+        if table_model.current_effect in TWO_ARM_METRICS:
+            g2O1 = _get_col(raw_data, 2)
             g2_totals = _get_col(raw_data, 3)
-            g2O2 = [(total_i-event_i) for total_i, event_i in zip(g2_totals, g2_events)]
-            g2O2_str = ", ".join(_to_strs(g2O2))
-                    
-        # actually creating a new object on the R side seems the path of least resistance here.
-        # the alternative would be to try and create a representation of the R object on the 
-        # python side, but this would require more work and I'm not sure what the benefits
-        # would be
-        r_str = "%s <- new('BinaryData', g1O1=c(%s), g1O2=c(%s), g2O1=c(%s), g2O2=c(%s), \
-                            y=c(%s), SE=c(%s), study.names=c(%s), years=c(%s), covariates=%s)" % \
-                            (var_name, g1O1_str, g1O2_str, g2O1_str, g2O2_str, \
-                             ests_str, SEs_str, study_names, study_years, cov_str)
+            g2O2 = [(total_i-event_i) for total_i, event_i in zip(g2_totals, g2O1)]
+
+        slots = [("g1O1", g1_events), ("g1O2", g1O2), ("g2O1", g2O1), ("g2O2", g2O2)] + slots
 
     elif table_model.included_studies_have_point_estimates():
-        print "not sufficient raw data, but studies have point estimates..."
+        logger.debug("not sufficient raw data, but studies have point estimates...")
+    else:
+        logger.debug("there is neither sufficient raw data nor entered effects/CIs. I cannot run an analysis.")
+        # @TODO complain to the user here
+        return None
 
-        r_str = "%s <- new('BinaryData', y=c(%s), SE=c(%s), study.names=c(%s), years=c(%s), covariates=%s)" \
-                            % (var_name, ests_str, SEs_str, study_names, study_years, cov_str)
-        
-               
+    return _make_data_object('BinaryData', slots, covariates, var_name, execute)
+
+
+@RfunctionCaller
+def ma_dataset_to_simple_diagnostic_robj(table_model, var_name="tmp_obj",
+                                         metric="Sens", covs_to_include=None,
+                                         effects_on_disp_scale=False,
+                                         studies=None, execute=True):
+    '''
+    This converts a DatasetModel to an OpenMetaData (OMData) R object. We use type DatasetModel
+    rather than a DataSet model directly to access the current variables. Furthermore, this allows
+    us to check which studies (if any) were excluded by the user.
+
+    Returns the RDataObject; if execute is False, the object is not
+    created in R.
+    '''
+    # grab the study names. note: the list is pulled out in reverse order from the
+    # model, so we, er, reverse it.
+    if studies is None:
+        studies = table_model.get_studies(only_if_included=True)
+    study_ids = [study.id for study in studies]
+
+    y_ests, y_SEs = table_model.get_cur_ests_and_SEs(only_if_included=True, effect=metric)
+    slots = _study_slots(studies, y_ests, y_SEs)
+    covariates = list_of_covariate_values(table_model.dataset, study_ids,
+                                          cov_list=covs_to_include)
+
+    # first try and construct an object with raw data
+    if table_model.included_studies_have_raw_data():
+        logger.debug("ok; raw data has been entered for all included studies")
+
+        # grab the raw data; the order is
+        # tp, fn, fp, tn
+        raw_data = table_model.get_cur_raw_data()
+        slots = [("TP", _get_col(raw_data, 0)), ("FN", _get_col(raw_data, 1)),
+                 ("TN", _get_col(raw_data, 3)), ("FP", _get_col(raw_data, 2))] + slots
+
+    elif table_model.included_studies_have_point_estimates(effect=metric):
+        logger.debug("not sufficient raw data, but studies have point estimates...")
     else:
-        print "there is neither sufficient raw data nor entered effects/CIs. I cannot run an analysis."
+        logger.debug("there is neither sufficient raw data nor entered effects/CIs. I cannot run an analysis.")
         # @TODO complain to the user here
-    
+        return None
 
-    ### Relevant for Issue #73
-    # ok, it seems R uses latin-1 for its unicode encodings,
-    # whereas QT uses UTF8. this can cause situations where
-    # rpy2 throws up on this call due to it not being able
-    # to parse a character; so we sanitize. This isn't great,
-    # because sometimes characters get garbled...
-    r_str = _sanitize_for_R(r_str)
-    print "executing: %s" % r_str
-    execute_r_string(r_str)
-    print "ok."
-    return r_str
+    return _make_data_object('DiagnosticData', slots, covariates, var_name, execute)
 
+
+@NonBlockingRfunctionCaller
 def ma_dataset_to_simple_network(table_model,
                                  var_name="tmp_obj",
                                  studies=None,
@@ -699,6 +928,7 @@ def ma_dataset_to_simple_network(table_model,
     
     if data_type not in [BINARY, CONTINUOUS]:
         raise ValueError("Given data type: '%s' is unknown." % str(data_type))
+    RlibLoader().load_gemtc()
     
     if studies is None:
         # we will exclude studies later on if they do not have full raw_data
@@ -714,7 +944,7 @@ def ma_dataset_to_simple_network(table_model,
             if not _data_blank_or_none(*raw_data):
                 groups_to_include.append(group)
                 break
-    print("groups to include: %s" % str(groups_to_include))
+    logger.debug("groups to include: %s", groups_to_include)
     
     
     ############ Make 'treatments' data frame in R ###################
@@ -819,135 +1049,11 @@ def _make_table_string_from_dict(table_dict):
     return table_str
 
 
-def _sanitize_for_R(a_str):
-    # may want to do something fancier in the future...
-    return a_str.encode('latin-1', 'ignore')
-    
-    
-    # Mysterious fix for issue #73. For some reason, R doesn't throw up anymore
-    # when non-latin characters are given. Maybe this was fixed in R at some
-    # point by a 3rd party.
-    #return a_str
-
-
-@RfunctionCaller
-def ma_dataset_to_simple_diagnostic_robj(table_model, var_name="tmp_obj",
-                                         metric="Sens", covs_to_include=None,
-                                         effects_on_disp_scale=False, 
-                                         studies=None):
-    '''
-    This converts a DatasetModel to an OpenMetaData (OMData) R object. We use type DatasetModel
-    rather than a DataSet model directly to access the current variables. Furthermore, this allows
-    us to check which studies (if any) were excluded by the user.
-
-
-    '''
-    r_str = None
-    
-    # grab the study names. note: the list is pulled out in reverse order from the 
-    # model, so we, er, reverse it.
-    if studies is None:
-        studies = table_model.get_studies(only_if_included=True)
-    study_ids = [study.id for study in studies]
-
-    study_names = ", ".join(["\"" + study.name + "\"" for study in studies])
-    # issue #139 -- also grab the years
-    study_years = ", ".join(["as.integer(%s)" % study.year for study in studies])
-
-    y_ests, y_SEs = table_model.get_cur_ests_and_SEs(only_if_included=True, effect=metric)
-
-    y_ests_str = ", ".join(_to_strs(y_ests))
-    y_SEs_str = ", ".join(_to_strs(y_SEs))
-
-    # generate the covariate string
-    cov_str = list_of_cov_value_objects_str(table_model.dataset,
-                                            study_ids,
-                                            cov_list=covs_to_include)
-
-
-    # first try and construct an object with raw data
-    if table_model.included_studies_have_raw_data():
-        print "ok; raw data has been entered for all included studies"
-        
-        # grab the raw data; the order is 
-        # tp, fn, fp, tn
-        raw_data = table_model.get_cur_raw_data()
-
-        ### assembling TP, FP, TN and FN strings ...
-        tps_str = ", ".join(_to_strs(_get_col(raw_data, 0)))
-        fns_str = ", ".join(_to_strs(_get_col(raw_data, 1)))
-        fps_str = ", ".join(_to_strs(_get_col(raw_data, 2)))
-        tns_str = ", ".join(_to_strs(_get_col(raw_data, 3)))
-        
-        # actually creating a new object on the R side seems the path of least resistance here.
-        # the alternative would be to try and create a representation of the R object on the 
-        # python side, but this would require more work and I'm not sure what the benefits
-        # would be
-        r_str = "%s <- new('DiagnosticData', TP=c(%s), FN=c(%s), TN=c(%s), FP=c(%s), \
-                            y=c(%s), SE=c(%s), study.names=c(%s), years=c(%s), covariates=%s)" % \
-                            (var_name, tps_str, fns_str, tns_str, fps_str, \
-                             y_ests_str, y_SEs_str, study_names, study_years, cov_str)
-        
-    elif table_model.included_studies_have_point_estimates(effect=metric):
-        print "not sufficient raw data, but studies have point estimates..."
-
-        r_str = "%s <- new('DiagnosticData', y=c(%s), SE=c(%s), study.names=c(%s), \
-                                    years=c(%s), covariates=%s)" \
-                            % (var_name, y_ests_str, y_SEs_str, study_names, study_years, cov_str)
-                            
-    else:
-        print "there is neither sufficient raw data nor entered effects/CIs. I cannot run an analysis."
-        # @TODO complain to the user here
-    
-    # character (unicode) encodings for R
-    r_str = _sanitize_for_R(r_str)
-    execute_r_string(r_str)
-    print "ok."
-    return r_str
-
-
-def cov_to_str(cov, study_ids, dataset, \
-                named_list=True, return_cov_vals=False):
-    '''
-    The string is constructed so that the covariate
-    values are in the same order as the 'study_names'
-    list.
-    '''
-    cov_str = None
-    if named_list:
-        cov_str = "%s=c(" % cov.name
-    else:
-        cov_str = "c("
-
-    cov_value_d = dataset.get_values_for_cov(cov.name, ids_for_keys=True)
-    
-    # get the study ids in the same order as the names
-    cov_values = []
-   
-    for study_id in study_ids:
-        if cov.data_type == CONTINUOUS:
-            if cov_value_d.has_key(study_id):
-                cov_values.append("%s" % cov_value_d[study_id])
-            else:
-                cov_values.append("NA")
-        else:
-            if cov_value_d.has_key(study_id):
-                # factor; note the string.
-                cov_values.append("'%s'" % unicode(str(cov_value_d[study_id]).encode('latin1'), 'latin1'))
-            else:
-                cov_values.append("NA")
-    cov_str += ",".join(cov_values) + ")"
-    
-    if return_cov_vals:
-        return (cov_str, cov_values)
-    return cov_str
-        
-
 @RfunctionCaller
 def run_continuous_ma(function_name, params, res_name = "result", cont_data_name="tmp_obj"):
-    params_df = ro.r['data.frame'](**params)
-    r_str = "%s<-%s(%s, %s)" % (res_name, function_name, cont_data_name, params_df.r_repr())
-    print "\n\n(run_continuous_ma): executing:\n %s\n" % r_str
+    params_str = r_data_frame_str(params)
+    r_str = "%s<-%s(%s, %s)" % (res_name, function_name, cont_data_name, params_str)
+    logger.debug("(run_continuous_ma): executing:\n %s", r_str)
     execute_r_string(r_str)
     result = execute_r_string("%s" % res_name)
     return parse_out_results(result)
@@ -955,10 +1061,10 @@ def run_continuous_ma(function_name, params, res_name = "result", cont_data_name
 
 @RfunctionCaller
 def run_binary_ma(function_name, params, res_name="result", bin_data_name="tmp_obj"):
-    params_df = ro.r['data.frame'](**params)
+    params_str = r_data_frame_str(params)
     r_str = "%s<-%s(%s, %s)" % (res_name, function_name, bin_data_name,\
-                                    params_df.r_repr())
-    print "\n\n(run_binary_ma): executing:\n %s\n" % r_str
+                                    params_str)
+    logger.debug("(run_binary_ma): executing:\n %s", r_str)
     execute_r_string(r_str)
     result = execute_r_string("%s" % res_name)
     return parse_out_results(result)
@@ -974,6 +1080,8 @@ def _to_R_param_str(param):
         if param:
             return "TRUE"
         return "FALSE"
+    elif isinstance(param, (list, tuple)):
+        return "c(%s)" % ",".join([str(_to_R_param_str(x)) for x in param])
     return param
     
 def _to_R_params(params):
@@ -1000,7 +1108,7 @@ def run_diagnostic_multi(function_names, list_of_params, res_name="result", diag
     #execute_r_string("f.names <- c(%s)" % ",".join(["'%s'" % f_name for f_name in function_names]))
     #result = execute_r_string("multiple.diagnostic(f.names, list.of.params, %s)" % diag_data_name)
 
-    print("Got here is run diagnostic multi w/o error")
+    logger.debug("Got here is run diagnostic multi w/o error")
     return parse_out_results(result)
 
 # HELPS WITH DEBUGGING
@@ -1016,13 +1124,14 @@ def run_diagnostic_ma(function_name, params, res_name="result", diag_data_name="
     r_str = "%s<-%s(%s, %s)" % \
                         (res_name, function_name, diag_data_name, params_str) 
     
-    print "\n\n(run_diagnostic_ma): executing:\n %s\n" % r_str
+    logger.debug("(run_diagnostic_ma): executing:\n %s", r_str)
     execute_r_string(r_str)
     result = execute_r_string("%s" % res_name)
     return parse_out_results(result)
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def load_vars_for_plot(params_path, return_params_dict=False):
     ''' 
     loads the three necessary (for plot generation) variables
@@ -1034,9 +1143,9 @@ def load_vars_for_plot(params_path, return_params_dict=False):
         cur_path = "%s.%s" % (params_path, var)
         if os.path.exists(cur_path):
             load_in_R(cur_path)
-            print "loaded %s" % cur_path
+            logger.debug("loaded %s", cur_path)
         else:
-            print "whoops -- couldn't load %s" % cur_path
+            logger.warning("whoops -- couldn't load %s", cur_path)
             return False
 
     if return_params_dict:
@@ -1047,23 +1156,26 @@ def load_vars_for_plot(params_path, return_params_dict=False):
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def write_out_plot_data(params_out_path, plot_data_name="plot.data"):
     execute_r_string("save.plot.data(%s, '%s')" % (plot_data_name, params_out_path))
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def load_in_R(fpath):
     ''' loads what is presumed to be .Rdata into the R environment '''
     execute_r_string("load('%s')" % fpath)
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def update_plot_params(plot_params, plot_params_name="params",
                         write_them_out=False, outpath=None):
     # first cast the params to an R data frame to make it
     # R-palatable
-    params_df = ro.r['data.frame'](**plot_params)
-    execute_r_string("tmp.params <- %s" % params_df.r_repr())
+    params_str = r_data_frame_str(plot_params)
+    execute_r_string("tmp.params <- %s" % params_str)
    
     for param_name in plot_params:
         execute_r_string("%s$%s <- tmp.params$%s" % \
@@ -1074,6 +1186,7 @@ def update_plot_params(plot_params, plot_params_name="params",
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def regenerate_plot_data(om_data_name="om.data", res_name="res",           
                             plot_params_name="params", plot_data_name="plot.data"):
     
@@ -1096,51 +1209,154 @@ def regenerate_plot_data(om_data_name="om.data", res_name="res",
                             (om_data_name, plot_params_name, res_name))
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def generate_reg_plot(file_path, params_name="plot.data"): 
     execute_r_string("meta.regression.plot(%s, '%s')" % (params_name, file_path))
 
 
 @RfunctionCaller
+@NonBlockingRfunctionCaller
 def generate_forest_plot(file_path, side_by_side=False, params_name="plot.data"):
     if side_by_side:
-        print "generating a side-by-side forest plot..."
+        logger.debug("generating a side-by-side forest plot...")
         execute_r_string("two.forest.plots(%s, '%s')" % (params_name, file_path))
     else:
-        print("generating a forest plot....")
+        logger.debug("generating a forest plot....")
         execute_r_string("forest.plot(%s, '%s')" % (params_name, file_path))
 
+###
+# converting R results into python in a single pass over the R objects,
+# without going through their string representations
+def _r_attr(r_obj, name):
+    try:
+        return r_obj.do_slot(name)
+    except LookupError:
+        return None
+
+def _na_to_None(x, na):
+    return None if x is na else x
+
+def r_to_py(r_obj, keep_names=False):
+    '''
+    Converts an R object (as handed back by rpy2) to python: numeric and
+    logical vectors become numpy arrays (matrices keep their dimensions),
+    character vectors and factors lists of strings, named lists (including
+    data frames) dictionaries and other lists lists. Vectors of length one
+    become scalars. NAs become nan (numbers) or None; objects we don't know
+    what to do with (functions, calls, ...) become None, too.
+
+    If keep_names is True, named vectors become dictionaries as well (e.g.,
+    c("Forest Plot"=forest.path)).
+    '''
+    vectors = ro.vectors
+    names = _r_attr(r_obj, "names")
+    if isinstance(r_obj, vectors.ListVector):
+        values = [r_to_py(x, keep_names) for x in r_obj]
+        if names is None:
+            return values
+        return dict(zip(names, values))
+    elif keep_names and names is not None and isinstance(r_obj, vectors.Vector):
+        return dict([(name, r_to_py(r_obj.rx(i+1))) for i, name in enumerate(names)])
+    elif isinstance(r_obj, vectors.FactorVector):
+        values = [_na_to_None(x, ro.NA_Character) for x in r_obj.iter_labels()]
+    elif isinstance(r_obj, vectors.StrVector):
+        values = [_na_to_None(x, ro.NA_Character) for x in r_obj]
+    elif isinstance(r_obj, (vectors.FloatVector, vectors.IntVector, vectors.BoolVector)):
+        if isinstance(r_obj, vectors.FloatVector):
+            # (R's NA_real_ is a nan)
+            values = np.array(r_obj, dtype=float)
+        else:
+            values = np.array([np.nan if (x is ro.NA_Integer or x is ro.NA_Logical) else x \
+                                for x in r_obj], dtype=float)
+            if not np.isnan(values).any():
+                values = values.astype(bool if isinstance(r_obj, vectors.BoolVector) else int)
+        dim = _r_attr(r_obj, "dim")
+        if dim is not None and len(values) > 1:
+            # R matrices are stored column-major
+            return values.reshape(tuple(dim), order="F")
+        return values.item() if len(values) == 1 else values
+    else:
+        return None
+    return values[0] if len(values) == 1 else values
+
+# the entries of metafor's results that we keep for each metric of a
+# diagnostic analysis (which has no res.info)
+_MA_RESULT_NAMES = ("b", "se", "ci.lb", "ci.ub", "pval", "tau2", "QE", "QEp", "I2", "H2", "k")
+_SUMMARY_SUFFIX = " Summary"
+
+def _named_values(r_list, wanted=None):
+    names = _r_attr(r_list, "names")
+    if names is None:
+        return {}
+    r_list_d = dict(zip(names, r_list))
+    if wanted is None:
+        wanted = r_list_d.keys()
+    return dict([(name, r_to_py(r_list_d[name])) for name in wanted if name in r_list_d])
+
+def _result_values(result):
+    '''
+    Pulls the numeric results of an analysis out of the (dictionary of the)
+    R result: the values in 'res' that are listed in 'res.info' (or all of
+    them if there is no res.info), i.e., estimates, confidence intervals,
+    tau2, QE, I2, per-study yi, vi, etc., along with the weights and the
+    study names, if these are there.
+
+    Diagnostic analyses have no 'res'; their values are those of the
+    metafor results of each metric (under '<metric> Summary'), keyed by the
+    (pretty) name of the metric, e.g., values["Sensitivity"]["b"].
+    '''
+    values = {}
+    if "res" in result:
+        wanted = None
+        if "res.info" in result:
+            wanted = _r_attr(result["res.info"], "names") or []
+        values.update(_named_values(result["res"], wanted))
+    else:
+        for text_n, summary in result.items():
+            if not (text_n.endswith(_SUMMARY_SUFFIX) and isinstance(summary, ro.vectors.ListVector)):
+                continue
+            summary_d = dict(zip(_r_attr(summary, "names") or [], summary))
+            if "MAResults" in summary_d:
+                values[text_n[:-len(_SUMMARY_SUFFIX)]] = _named_values(summary_d["MAResults"],
+                                                                     _MA_RESULT_NAMES)
+    if "weights" in result:
+        weights = r_to_py(result["weights"])
+        values["weights"] = np.atleast_1d(weights) if weights is not None else None
+    if "input_data" in result:
+        try:
+            values["study.names"] = list(result["input_data"].do_slot("study.names"))
+        except LookupError:
+            pass
+    return values
+
 def parse_out_results(result):
     # parse out text field(s). note that "plot names" is 'reserved', i.e., it's
     # a special field which is assumed to contain the plot variable names
-    # in R (for graphics manipulation).
+    # in R (for graphics manipulation). The numeric results (see
+    # _result_values) are returned as 'values'.
     text_d = {}
     image_var_name_d, image_params_paths_d, image_path_d  = {}, {}, {}
     image_order = None
     
     # Turn result into a nice dictionary
     result = dict(zip(list(result.names), list(result)))
+    values = _result_values(result)
     
 
     for text_n, text in result.items():
         # some special cases, notably the plot names and the path for a forest
         # plot. TODO in the case of diagnostic data, we're probably going to 
         # need to parse out multiple forest plot param objects...
-        print text_n
-        print "\n--------\n"
+        logger.debug("result: %s", text_n)
+        # (these are NULL, i.e., None, if there are no plots)
         if text_n == "images":
-            image_path_d = R_parse_tools.recursioner(text)
+            image_path_d = r_to_py(text, keep_names=True) or {}
         elif text_n == "image_order":
             image_order = list(text)
         elif text_n == "plot_names":
-            if str(text) == "NULL":
-                image_var_name_d = {}
-            else:
-                image_var_name_d = R_parse_tools.recursioner(text)
+            image_var_name_d = r_to_py(text, keep_names=True) or {}
         elif text_n == "plot_params_paths":
-            if str(text) == "NULL":
-                image_params_paths_d = {}
-            else:
-                image_params_paths_d = R_parse_tools.recursioner(text)
+            image_params_paths_d = r_to_py(text, keep_names=True) or {}
         elif text_n == "References":
             references_list = list(text)
             references_list.append('metafor: Viechtbauer, Wolfgang. "Conducting meta-analyses in R with the metafor package." Journal of 36 (2010).')
@@ -1160,7 +1376,7 @@ def parse_out_results(result):
         elif "gui.ignore" in text_n:
             pass
         else:
-            if type(text)==rpy2.robjects.vectors.StrVector:
+            if type(text)==ro.vectors.StrVector:
                 text_d[text_n] = text[0]
             else:
                 text_d[text_n]=str(text)
@@ -1169,7 +1385,8 @@ def parse_out_results(result):
                  "image_var_names":image_var_name_d,
                  "texts":text_d,
                  "image_params_paths":image_params_paths_d,
-                 "image_order":image_order}
+                 "image_order":image_order,
+                 "values":values}
     
     return to_return
 
@@ -1178,7 +1395,7 @@ def make_weights_str(results):
     
     # This function assumes that 'weights' and 'input_data' are actually in the results
     if not ("weights" in results and "input_data" in results and "input_params" in results):
-        print("Uh oh")
+        logger.warning("Uh oh")
         raise Exception("make_weights_str() requires 'weights','input_data', and 'input_params' in the results")
     
     digits = results["input_params"].rx2("digits")[0]
@@ -1208,43 +1425,15 @@ def run_binary_fixed_meta_regression(selected_cov, bin_data_name="tmp_obj",
     params = {"conf.level": conf_level,
               "digits": 3,
               "method": method_str}
-    params_df = ro.r['data.frame'](**params)
+    params_str = r_data_frame_str(params)
     r_str = "%s<-binary.fixed.meta.regression(%s, %s, %s)" % \
-            (res_name, bin_data_name, params_df.r_repr(), "'"+ selected_cov + "'")
-    print "\n\n(run_binary_ma): executing:\n %s\n" % r_str
+            (res_name, bin_data_name, params_str, "'"+ selected_cov + "'")
+    logger.debug("(run_binary_ma): executing:\n %s", r_str)
     execute_r_string(r_str)
     result = execute_r_string("%s" % res_name)
     return parse_out_results(result)
 
 
-def _gen_cov_vals_obj_str(cov, study_ids, dataset): 
-    values_str, cov_vals = cov_to_str(cov, study_ids, dataset, named_list=False,
-                                      return_cov_vals=True)
-    ref_var = cov_vals[0].replace("'", "") # arbitrary
-
-    ## setting the reference variable to the first entry
-    # for now -- this only matters for factors, obviously
-
-    r_str = "new('CovariateValues', cov.name='%s', cov.vals=%s, \
-                    cov.type='%s', ref.var='%s')" % \
-                (cov.name, values_str, TYPE_TO_STR_DICT[cov.data_type], ref_var)
-    return r_str
-
-
-def list_of_cov_value_objects_str(dataset, study_ids, cov_list=None):
-    ''' makes r_string of covariate objects with their values '''
-    
-    r_cov_str = []
-    if cov_list is None:
-        # then use all covariates that belong to the dataset
-        cov_list = dataset.covariates
-    for cov in cov_list:
-        r_cov_str.append(_gen_cov_vals_obj_str(cov, study_ids, dataset))
-    r_cov_str = "list(" + ",".join(r_cov_str) + ")"
-
-    return r_cov_str
-
-
 @RfunctionCaller
 def run_meta_regression(dataset, study_names, cov_list, metric_name,
                         data_name="tmp_obj", results_name="results_obj",
@@ -1261,14 +1450,14 @@ def run_meta_regression(dataset, study_names, cov_list, metric_name,
               "method": method_str,
               "rm.method": "ML",
               "measure": metric_name}
-    params_df = ro.r['data.frame'](**params)
+    params_str = r_data_frame_str(params)
 
     # create a lit of covariate objects on the R side
     r_str = "%s<- meta.regression(%s, %s)" % \
-                            (results_name, data_name, str(params_df.r_repr()))
+                            (results_name, data_name, str(params_str))
 
 
-    print "\n\n(run_meta_regression): executing:\n %s\n" % r_str
+    logger.debug("(run_meta_regression): executing:\n %s", r_str)
 
     ### TODO -- this is hacky
 
@@ -1293,11 +1482,9 @@ def run_meta_method_diag(meta_function_name, function_names, list_of_params,
     # list of parameter objects
     r_params_str = "list(%s)" % ",".join([_to_R_params(p) for p in list_of_params])
     r_str = "list.of.params <- %s" % r_params_str
-    print(r_str)
     execute_r_string(r_str)
     # list of function names
     r_str = "f.names <- c(%s)" % ",".join(["'%s'" % f_name for f_name in function_names])
-    print(r_str)
     execute_r_string(r_str)
 
     multi_meta_function_name = \
@@ -1306,7 +1493,6 @@ def run_meta_method_diag(meta_function_name, function_names, list_of_params,
          "cum.ma.diagnostic":"multiple.cum.ma.diagnostic"}[meta_function_name]
 
     r_str = "%s(f.names, list.of.params, %s)" % (multi_meta_function_name, diag_data_name)
-    print(r_str)
     result = execute_r_string(r_str)
     
     return parse_out_results(result)
@@ -1320,11 +1506,11 @@ def run_meta_method(meta_function_name, function_name, params, \
     (on the R side). The meta-method called is specified by the meta_function_name
     argument. 
     '''
-    params_df = ro.r['data.frame'](**params)
+    params_str = r_data_frame_str(params)
     r_str = "%s<-%s('%s', %s, %s)" % \
-            (res_name, meta_function_name, function_name, data_name, params_df.r_repr())
+            (res_name, meta_function_name, function_name, data_name, params_str)
 
-    print "\n\n(run_meta_method): executing:\n %s\n" % r_str
+    logger.debug("(run_meta_method): executing:\n %s", r_str)
 
     execute_r_string(r_str)
     result = execute_r_string("%s" % res_name)
@@ -1335,92 +1521,235 @@ def run_meta_method(meta_function_name, function_name, params, \
     return parse_out_results(result)  
 
 
+@RfunctionCaller
+def subgroup_fit_indices(function_name, params, data_name="tmp_obj"):
+    '''
+    The subgroups (indices into the unique values of the covariate
+    params["cov_name"], from 1) of the data in data_name that function_name
+    has to be fit to for a subgroup meta-analysis; none, if their results
+    are computed in closed form (see subgroup.ma.closed.form in
+    meta_methods.r).
+    '''
+    params_str = r_data_frame_str(params)
+    args = (function_name, data_name, params_str)
+    if not execute_r_string("subgroup.needs.fits('%s', %s, %s)" % args)[0]:
+        return []
+    n_subgroups = execute_r_string("length(unique(get.cov(%s, as.character(%s$cov_name))@cov.vals))" % \
+                                        (data_name, params_str))[0]
+    return range(1, n_subgroups + 1)
+
+@RfunctionCaller
+def run_subgroup_fits(function_name, params, indices, data_name="tmp_obj"):
+    '''
+    Fits function_name to the given subgroups (see subgroup_fit_indices) of
+    the data in data_name and returns their results serialized, as a
+    string, so they can be passed on to run_subgroup_ma in another R.
+    '''
+    params_str = r_data_frame_str(params)
+    r_str = "rawToChar(serialize(subgroup.fits('%s', %s, %s, c(%s)), NULL, ascii=TRUE))" % \
+                (function_name, data_name, params_str, ",".join([str(i) for i in indices]))
+    return execute_r_string(r_str)[0]
+
+@RfunctionCaller
+def run_subgroup_ma(meta_function_name, function_name, params, subgroup_fits=None,
+                    res_name="result", data_name="tmp_obj"):
+    '''
+    Like run_meta_method for subgroup.ma.binary or subgroup.ma.continuous,
+    with the (serialized) results of the subgroups, in order, as returned by
+    run_subgroup_fits, if they have been fit elsewhere.
+    '''
+    if not subgroup_fits:
+        return run_meta_method(meta_function_name, function_name, params,
+                               res_name=res_name, data_name=data_name)
+    assign_in_r("subgroup.fits.serialized", lambda: ro.StrVector(subgroup_fits),
+                size=len(subgroup_fits))
+    execute_r_string("subgroup.results <- do.call(c, lapply(subgroup.fits.serialized, "
+                     "function(fits) unserialize(charToRaw(fits))))")
+    params_str = r_data_frame_str(params)
+    r_str = "%s<-%s('%s', %s, %s, subgroup.results=subgroup.results)" % \
+            (res_name, meta_function_name, function_name, data_name, params_str)
+    execute_r_string(r_str)
+    return parse_out_results(execute_r_string(res_name))
+
+def bootstrap_chunk_sizes(n_replicates, chunk_size=BOOTSTRAP_CHUNK_SIZE):
+    ''' The numbers of replicates in the chunks of a bootstrap of n_replicates '''
+    return [min(chunk_size, n_replicates - start) for start in xrange(0, n_replicates, chunk_size)]
+
+@RfunctionCaller
+def run_bootstrap_replicates(function_name, params, n_replicates, data_name="tmp_obj"):
+    '''
+    Runs n_replicates replicates of the bootstrap of function_name over the
+    data in data_name (see bootstrap in meta_methods.r), without
+    summarizing them; returns a dictionary holding t0, t (an array with
+    one row per replicate) and extra.attempts, the number of resamples
+    that had to be redrawn.
+    '''
+    params = dict(params)
+    params["num.bootstrap.replicates"] = n_replicates
+    params_str = r_data_frame_str(params)
+    r_str = "bootstrap('%s', %s, %s, replicates.only=TRUE)" % \
+                (function_name, data_name, params_str)
+    chunk = r_to_py(execute_r_string(r_str))
+    t0 = np.atleast_1d(chunk["t0"])
+    return {"t0":t0, "t":np.reshape(chunk["t"], (n_replicates, len(t0))),
+            "extra.attempts":int(chunk["extra.attempts"])}
+
+def _bootstrap_replicates_robj(chunks):
+    return ro.r['list'](*[ro.r['list'](**{"t0":_float_vector(chunk["t0"]),
+                                          "t":ro.r['matrix'](_float_vector(np.ravel(chunk["t"])),
+                                                             nrow=len(chunk["t"]), byrow=True),
+                                          "extra.attempts":chunk["extra.attempts"]}) \
+                            for chunk in chunks])
+
+def _run_tasks_here(tasks, seed):
+    # (like RWorkerPool.imap, in our own R; the data is already here)
+    for i, (data, function_name, args, kw) in enumerate(tasks):
+        execute_r_string("set.seed(%d)" % (seed + i))
+        yield globals()[function_name](*args, **kw)
+
+@RfunctionCaller
+def run_bootstrap(function_name, params, data=None, imap_f=None, seed=DEFAULT_BOOTSTRAP_SEED,
+                  chunk_size=BOOTSTRAP_CHUNK_SIZE, progress_f=None, is_cancelled=None,
+                  res_name="result", data_name="tmp_obj"):
+    '''
+    Runs the bootstrap of function_name (params["num.bootstrap.replicates"]
+    replicates) over the data in data_name and returns the parsed results.
+
+    The replicates are run in chunks of chunk_size, the i-th with R's seed
+    set to seed + i, so the results depend only on seed and chunk_size:
+    not on where, or in what order, the chunks were run. By default they
+    are run one after another in our R; imap_f(tasks, seed) (e.g.,
+    RWorkerPool.imap, with data the RDataObject for data_name) runs them
+    elsewhere, yielding their results in order. After each chunk,
+    progress_f(replicates done, replicates) is called and, if is_cancelled()
+    is true, Cancelled is raised.
+    '''
+    sizes = bootstrap_chunk_sizes(int(params["num.bootstrap.replicates"]), chunk_size)
+    tasks = [(data, "run_bootstrap_replicates", (function_name, params, size), {"data_name":data_name}) \
+                for size in sizes]
+    chunk_results = (imap_f or _run_tasks_here)(tasks, seed)
+    chunks, n_done = [], 0
+    for chunk in chunk_results:
+        chunks.append(chunk)
+        n_done += len(chunk["t"])
+        if progress_f is not None:
+            progress_f(n_done, sum(sizes))
+        if is_cancelled is not None and is_cancelled():
+            raise Cancelled()
+
+    assign_in_r("boot.replicates", lambda: _bootstrap_replicates_robj(chunks),
+                size=sum([np.size(chunk["t"]) for chunk in chunks]))
+    params_str = r_data_frame_str(params)
+    r_str = "%s<-bootstrap('%s', %s, %s, replicates=boot.replicates)" % \
+                (res_name, function_name, data_name, params_str)
+    execute_r_string(r_str)
+    return parse_out_results(execute_r_string(res_name))
+
+@RfunctionCaller
+def run_permutation_test(function_name, args, iter, data_name="tmp_obj",
+                         seed=DEFAULT_BOOTSTRAP_SEED, chunk_size=PERMUTATION_CHUNK_SIZE,
+                         ci_halfwidth=PERMUTATION_CI_HALFWIDTH, min_iter=PERMUTATION_MIN_ITER,
+                         progress_f=None, is_cancelled=None, res_name="result"):
+    '''
+    Runs (at most) iter random permutations of function_name (permuted.ma or
+    permuted.meta.reg, in permutation.r) over the data frame in data_name,
+    with the other arguments in args, and returns the parsed results.
+
+    The permutations are run in chunks of chunk_size, the i-th with R's
+    seed set to seed + i. After each chunk, progress_f(permutations done,
+    iter, p-values) is called with the running estimates (pval, QMp, QMp.se,
+    QMp.ci.lb and QMp.ci.ub; see permutation.pvals) and, if is_cancelled()
+    is true, Cancelled is raised. Once at least min_iter permutations are
+    done, the test stops as soon as the half-width of the confidence
+    interval of QMp is at most ci_halfwidth (pass None to run all of them).
+    If there are no more than iter distinct permutations, the first chunk
+    runs all of them (the exact test) and is the only one.
+    '''
+    execute_r_string("perm.args <- c(list(data=%s), %s)" % (data_name, _to_R_params(args)))
+    execute_r_string("perm.model <- do.call(permutation.model, c(list('%s'), perm.args))" % function_name)
+    execute_r_string("perm.counts <- NULL")
+    level = args.get("level", 95)
+    digits = args.get("digits", 4)
+
+    n_done, i = 0, 0
+    while n_done < iter:
+        size = min(chunk_size, iter - n_done)
+        execute_r_string("set.seed(%d)" % (seed + i))
+        execute_r_string("perm.counts <- add.permutation.counts(perm.counts, "
+                         "permutation.counts(perm.model, %d, %d, max.iter=%d))" % (size, digits, iter))
+        i += 1
+        pvals = r_to_py(execute_r_string("permutation.pvals(perm.counts, %s)" % level))
+        # (the number of permutations actually run, which differs from the
+        # sizes of the chunks for the exact test)
+        n_done = int(pvals["iter"])
+        if progress_f is not None:
+            progress_f(n_done, n_done if pvals["exact"] else iter, pvals)
+        if is_cancelled is not None and is_cancelled():
+            raise Cancelled()
+        if pvals["exact"]:
+            logger.info("%s: ran all %d permutations (exact test)", function_name, n_done)
+            break
+        if ci_halfwidth is not None and n_done >= min_iter and \
+                (pvals["QMp.ci.ub"] - pvals["QMp.ci.lb"])/2.0 <= ci_halfwidth:
+            logger.info("%s: stopped after %d of %d permutations (QMp %s, SE %s)",
+                        function_name, n_done, iter, pvals["QMp"], pvals["QMp.se"])
+            break
+
+    execute_r_string("%s<-do.call(%s, c(perm.args, list(counts=perm.counts)))" % (res_name, function_name))
+    return parse_out_results(execute_r_string(res_name))
+
 def _get_c_str_for_col(m, i):
     return ", ".join(_get_col(m, i))
 
-def _to_strs(v):
-    return [str(x) for x in v]
-
-def _get_col(m, i):
+def _get_col(m, i, reverse=False):
     col_vals = []
     for x in m:
         col_vals.append(x[i])
+    if reverse:
+        col_vals.reverse()
     return col_vals
 
 
-@RfunctionCaller
 def diagnostic_effects_for_study(tp, fn, fp, tn, metrics=["Spec", "Sens"],
                                  conf_level=95.0):
-    # first create a diagnostic data object
-    r_str = "diag.tmp <- new('DiagnosticData', TP=c(%s), FN=c(%s), TN=c(%s), FP=c(%s))" % \
-                            (tp, fn, tn, fp)
-                            
-    print "\n\n(diagnostic_effects_for_study): executing:\n %s\n" % r_str
-    execute_r_string(r_str)
-    
     # this will map metrics to est., lower, upper
     effects_dict = {}
     for metric in metrics:
-        ###
-        # Curiously (annoyingly), updating the params dictionary, then recasting it using the
-        # ro.r['data.frame'](** params) call will not overwrite the existing
-        # structure on the R side -- i.e., you will keep getting the same metric
-        # here. Hence the somewhat ugly strategy of constructing the whole
-        # named list on the R side anew on each iteration
-        #####
-
-        r_res = execute_r_string("get.res.for.one.diag.study(diag.tmp, \
-                        list('to'='only0', 'measure'='{0}', 'conf.level'={1:.6f}, 'adjust'=.5))".format(metric, conf_level))
-        est, lower, upper = r_res[0][0], r_res[1][0], r_res[2][0]
-        calc_estimates = (est, lower, upper)
+        ests, lowers, uppers, ses = effect_sizes.diagnostic_effects(metric,
+                                            tp, fn, fp, tn, conf_level=conf_level)
+        calc_estimates = (float(ests[0]), float(lowers[0]), float(uppers[0]))
         disp_estimates = [diagnostic_convert_scale(x, metric) for x in calc_estimates]
         effects_dict[metric] = {"calc_scale":calc_estimates, "display_scale":disp_estimates}
-        
 
     return effects_dict
     
 
-@RfunctionCaller
 def continuous_effect_for_study(n1, m1, sd1, se1=None, n2=None, m2=None,
                                 sd2=None, se2=None, metric="MD", two_arm=True,
                                 conf_level=95.0):
     
     point_est, se = None, None
-    if two_arm:
-        if not None in [se1, se2] and metric=="MD":
-            # in this case, we have means & standard errors (but no sample size/ sds)
-            # thus we compute the point estimate and se directly
-            point_est = m1-m2
-            se = math.sqrt(sum([x**2 for x in [se1, se2]]))
-        else:
-            r_str = "escalc('%s', n1i=c(%s), n2i=c(%s), m1i=c(%s), m2i=c(%s), sd1i=c(%s), sd2i=c(%s))" %\
-                                (metric, n1, n2, m1, m2, sd1, sd2)
-    
-            
-            effect = execute_r_string(r_str)
-            # the first 0 indexes into the study; the second, into the point estimate
-            # (the escalc method is general and thus expects an array of studies)
-            point_est = effect[0][0]
-            se = math.sqrt(effect[1][0])
+    if two_arm and not None in [se1, se2] and metric=="MD":
+        # in this case, we have means & standard errors (but no sample size/ sds)
+        # thus we compute the point estimate and se directly
+        point_est = m1-m2
+        se = math.sqrt(sum([x**2 for x in [se1, se2]]))
+        mult = effect_sizes.get_mult(conf_level)
+        lower, upper = (point_est-mult*se, point_est+mult*se)
     else:
-        # only one-arm
-        point_est = m1
-        # eesh; this was only over n until 
-        # 3/28/13.
-        se = sd1/math.sqrt(n1)
-    
-    alpha = 1.0-(conf_level/100.0)
-    r_str = "abs(qnorm(%s))" % str(alpha/2.0)
-    mult = execute_r_string(r_str)[0]
-    #print("Alpha:",alpha)
-    #print("mult:" ,mult)
-    lower, upper = (point_est-mult*se, point_est+mult*se)
+        if not two_arm:
+            # only one-arm; note that the se here is sd/sqrt(n)
+            # (this was only over n until 3/28/13.)
+            n2, m2, sd2 = None, None, None
+        ests, lowers, uppers, ses = effect_sizes.continuous_effects(metric,
+                                            n1, m1, sd1, n2, m2, sd2, conf_level=conf_level)
+        point_est, lower, upper = float(ests[0]), float(lowers[0]), float(uppers[0])
+
     est_and_ci = (point_est, lower, upper)
     transformed_est_and_ci = continuous_convert_scale(est_and_ci, metric)
     return {"calc_scale":est_and_ci, "display_scale":transformed_est_and_ci}
 
 
-@RfunctionCaller
 def effect_for_study(e1, n1, e2=None, n2=None, two_arm=True, 
                 metric="OR", conf_level=95):
     '''
@@ -1437,36 +1766,15 @@ def effect_for_study(e1, n1, e2=None, n2=None, two_arm=True,
     n2 -- size of group 2
     --
     '''
-    print metric
-    r_str = None
-    if two_arm:
-        # notice that we're using WV's escalc routine here
-        r_str = "escalc(measure='%s', ai=c(%s), n1i=c(%s), ci=c(%s), n2i=c(%s))" %\
-                        (metric, e1, n1, e2, n2)
-    else:
-        r_str = "escalc(measure='%s', xi=c(%s), ni=c(%s))" % (metric, e1, n1)        
-             
-    #print "calling out to R: %s" % r_str
-    effect = execute_r_string(r_str)
-
-    #print "result: %s" % effect
-    point_est = effect[0][0]
-    se = math.sqrt(effect[1][0])
-    
-    #print "point_est: ", point_est
-    #print "var:", effect[1][0]
-
-    # scalar for computing confidence interval
-    alpha = 1.0-(conf_level/100.0)
-    r_str = "abs(qnorm(%s))" % str(alpha/2.0)
-    mult = execute_r_string(r_str)[0]
+    if not two_arm:
+        e2, n2 = None, None
+    ests, lowers, uppers, ses = effect_sizes.binary_effects(metric, e1, n1, e2, n2,
+                                                             conf_level=conf_level)
 
     # note that the point estimate, lower & upper are all computed
     # and returned on the calculation scale (e.g., log in the case of
     # ratios)
-    lower, upper = (point_est-mult*se, point_est+mult*se)
-    
-    print "%s, %s, %s" % (lower, point_est, upper)
+    point_est, lower, upper = float(ests[0]), float(lowers[0]), float(uppers[0])
 
     # we return both the transformed and untransformed scales here
     est_and_ci = (point_est, lower, upper)
@@ -1484,32 +1792,20 @@ def diagnostic_convert_scale(x, metric_name, convert_to="display.scale"):
     return generic_convert_scale(x, metric_name, "diagnostic", convert_to)
 
 
-@RfunctionCaller
 def generic_convert_scale(x, metric_name, data_type, convert_to="display.scale", n1=None):
-    r_str = "trans.f <- %s.transform.f('%s')" % (data_type, metric_name)
-    execute_r_string(r_str)
-
+    '''
+    Converts x (a scalar or a list/tuple of values) to the display or calculation
+    scale. This no longer calls out to R; see the scale_conversion module, which
+    should be used directly when converting whole columns.
+    '''
     if x is None or x == "":
         return None
     islist = isinstance(x, list) or isinstance(x, tuple) # being loose with what qualifies as a 'list' here.
-    if islist:
-        execute_r_string("x <- c%s" % str(x))
-        if metric_name == "PFT":
-            execute_r_string("ni<-c%s" % str((n1,)*len(x)))
-    else:
-        execute_r_string("x <- %s" % str(x))
-        if metric_name == "PFT":
-            execute_r_string("ni<-%s" % str(n1))
-    
-    if metric_name == "PFT":
-        transformed = execute_r_string("trans.f$%s(x=x, ni=ni)" % convert_to)
-    else:
-        transformed = execute_r_string("trans.f$%s(x)" % convert_to)
-    transformed_ls = [x_i for x_i in transformed]
     if not islist:
         # scalar
-        return transformed_ls[0]
-    return transformed_ls
+        return scale_conversion.convert_value(x, metric_name, data_type, convert_to, n1)
+    transformed = scale_conversion.convert_scale(x, metric_name, data_type, convert_to, n1)
+    return effect_sizes.to_list(transformed)
 
 
 @RfunctionCaller
@@ -1,7 +1,7 @@
 from PyQt4.Qt import *
 
+import analysis_runner
 import forms.ui_meta_reg
-import meta_py_r
 
 class MetaRegForm(QDialog, forms.ui_meta_reg.Ui_cov_reg_dialog):
     
@@ -57,20 +57,6 @@ class MetaRegForm(QDialog, forms.ui_meta_reg.Ui_cov_reg_dialog):
             else:
                 at_least_one_study_does_not_have_vals = True
 
-        if self.is_diagnostic:
-            meta_py_r.ma_dataset_to_simple_diagnostic_robj(self.model,\
-                                                    metric=current_effect,
-                                                    covs_to_include=selected_covariates,
-                                                    studies=studies)    
-        elif self.model.get_current_outcome_type() == "continuous":
-            meta_py_r.ma_dataset_to_simple_continuous_robj(self.model,\
-                                                    covs_to_include=selected_covariates,
-                                                    studies=studies) 
-        else:
-            meta_py_r.ma_dataset_to_simple_binary_robj(self.model, include_raw_data=False,\
-                                                    covs_to_include=selected_covariates,
-                                                    studies=studies)
-
     
         # fixed or random effects meta-regression?
         fixed_effects = False
@@ -92,20 +78,15 @@ class MetaRegForm(QDialog, forms.ui_meta_reg.Ui_cov_reg_dialog):
                 return
 
 
-        result = meta_py_r.run_meta_regression(self.model.dataset, studies,
-                                               selected_covariates,
-                                               current_effect,
-                                               fixed_effects=fixed_effects,
-                                               conf_level=self.model.get_global_conf_level())
-        if isinstance(result, str):
-            # then there was an error!
-            QMessageBox.critical(self,
-                                "Whoops.",
-                                "Sorry, there was an error performing the regression.\n%s" % \
-                                result)
-        else:
-            self.parent().analysis(result)
-            self.accept()
+        # the regression is run by the analysis runner on the main form; errors
+        # are reported (and results shown) there
+        job = analysis_runner.make_meta_regression_job(self.model,
+                                    self.model.get_current_outcome_type(),
+                                    studies, selected_covariates, current_effect,
+                                    fixed_effects=fixed_effects,
+                                    conf_level=self.model.get_global_conf_level())
+        self.parent().run_analysis(job)
+        self.accept()
         
     def _populate_combo_box(self):
         studies = self.model.get_studies(only_if_included=True)
@@ -0,0 +1,183 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  A catalog of the meta-analytic methods in openmetar: their names,        #
+#  parameters (with defaults and display order), pretty names and           #
+#  descriptions.                                                            #
+#                                                                           #
+#  None of this depends on the data, so it is fetched from R once per       #
+#  session (and cached on disk, keyed by the version of openmetar, so that  #
+#  usually not even that); only the feasibility of the methods for the      #
+#  data at hand is asked of R each time, in a single call.                  #
+#                                                                           #
+#############################################################################
+
+import copy
+import cPickle
+import os
+
+import meta_py_r
+import oma_logging
+
+logger = oma_logging.get_logger(__name__)
+
+CACHE_FILE_NAME = "openmetar_methods.cache"
+CACHE_FORMAT = 1
+
+# the following constitute 'special' or 'reserved' function
+# names that are used by meta-analyst to parse out available
+# methods and their parameters. we exclude these from the list
+# of available meta-analytic routines.
+#
+# by convention, the methods available for a data type (e.g., binary)
+# start with the name of the data type. furthermore, the parameters
+# for those methods are returned by a method with a name
+# ending in ".parameters"
+SPECIAL_ENDINGS = [".parameters", ".is.feasible", ".overall",
+                   ".regression", "transform.f", ".pretty.names", ".value.info",
+                   "is.feasible.for.funnel"]
+
+def is_special(function_name):
+    return any([function_name.endswith(ending) for ending in SPECIAL_ENDINGS])
+
+
+class MethodRegistry(object):
+    '''
+    The methods in (a given version of) openmetar. functions are the names
+    of all of the functions in the package; method_info maps method names
+    to what meta_py_r.get_method_info returns for them.
+    '''
+    def __init__(self, openmetar_version, functions, method_info):
+        self.openmetar_version = openmetar_version
+        self.functions = set(functions)
+        self.methods = sorted([f for f in functions if not is_special(f)])
+        self.method_info = method_info
+
+    @classmethod
+    def build(cls, openmetar_version=None):
+        ''' Asks R about all of the methods '''
+        if openmetar_version is None:
+            openmetar_version = meta_py_r.get_openmetar_version()
+        functions = meta_py_r.list_openmetar_functions()
+        method_info = {}
+        for method in functions:
+            if not is_special(method) and "%s.parameters" % method in functions:
+                method_info[method] = meta_py_r.get_method_info(method, functions)
+        return cls(openmetar_version, functions, method_info)
+
+    @classmethod
+    def load(cls, cache_path=None):
+        '''
+        Reads the registry from cache_path, if it is there and was made for
+        the openmetar that is loaded; otherwise it is built (and written to
+        cache_path, if given).
+        '''
+        openmetar_version = meta_py_r.get_openmetar_version()
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                f = open(cache_path, "rb")
+                try:
+                    cached = cPickle.load(f)
+                finally:
+                    f.close()
+                if cached["format"] == CACHE_FORMAT and \
+                        cached["openmetar_version"] == openmetar_version:
+                    logger.info("read the openmetar method registry from %s", cache_path)
+                    return cls(openmetar_version, cached["functions"], cached["method_info"])
+            except Exception, e:
+                logger.warning("couldn't read the method registry cache (%s); rebuilding it", e)
+
+        registry = cls.build(openmetar_version)
+        if cache_path is not None:
+            try:
+                registry.save(cache_path)
+            except (IOError, OSError), e:
+                logger.warning("couldn't write the method registry cache: %s", e)
+        return registry
+
+    def save(self, cache_path):
+        f = open(cache_path, "wb")
+        try:
+            cPickle.dump({"format":CACHE_FORMAT,
+                          "openmetar_version":self.openmetar_version,
+                          "functions":sorted(self.functions),
+                          "method_info":self.method_info}, f, 2)
+        finally:
+            f.close()
+
+    def _info(self, method_name):
+        if method_name not in self.method_info:
+            # not catalogued (e.g., there is no .parameters function); ask R
+            self.method_info[method_name] = meta_py_r.get_method_info(method_name,
+                                                                      self.functions)
+        return self.method_info[method_name]
+
+    def get_methods(self, for_data_type=None):
+        ''' The names of the methods (for the data type, if given) '''
+        if for_data_type is None:
+            return list(self.methods)
+        return [method for method in self.methods if method.startswith(for_data_type)]
+
+    def get_params(self, method_name):
+        '''
+        Returns (parameters, defaults, order of the parameters, pretty names
+        and descriptions of the parameters) for the method; these are
+        copies, so the caller may modify them.
+        '''
+        info = self._info(method_name)
+        return copy.deepcopy((info["parameters"], info["defaults"], info["var_order"],
+                              info["param_pretty_names"]))
+
+    def get_pretty_name(self, method_name):
+        return self._info(method_name)["pretty_name"]
+
+    def get_method_description(self, method_name):
+        return self._info(method_name)["description"]
+
+    def get_available_methods(self, for_data_type, data_obj_name, metric=None):
+        '''
+        Returns a dictionary mapping the pretty names of the methods (for
+        for_data_type) that are feasible for the data object (in R) named
+        data_obj_name to the method names; if no pretty name exists, then
+        we just map the method name to itself. note that if more than one
+        method exists with the same pretty name it will be overwritten!
+        '''
+        methods = self.get_methods(for_data_type)
+        # we check if the author of a method has provided an is.feasible
+        # routine; if so, we will call it. otherwise, we assume that we can
+        # invoke the corresponding routine (i.e., we assume it's feasible).
+        # we need to pass along the metric along with the data object to
+        # assess if a given method is feasible (e.g,. PETO for binary data
+        # only makes sense for 'OR')
+        to_check = [method for method in methods if "%s.is.feasible" % method in self.functions]
+        feasible = dict(zip(to_check, meta_py_r.check_feasibility(to_check, data_obj_name, metric)))
+
+        feasible_methods = {}
+        for method in methods:
+            if feasible.get(method, True):
+                if "%s.pretty.names" % method in self.functions:
+                    feasible_methods[self.get_pretty_name(method)] = method
+                else:
+                    feasible_methods[method] = method
+        return feasible_methods
+
+
+###
+# the registry for this session
+_registry = None
+
+def load(cache_path=None):
+    ''' Loads (or builds) the registry for this session; see MethodRegistry.load '''
+    global _registry
+    _registry = MethodRegistry.load(cache_path)
+    return _registry
+
+def get_registry():
+    ''' The registry for this session; it is built the first time we need it '''
+    if _registry is None:
+        load()
+    return _registry
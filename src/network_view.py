@@ -55,10 +55,14 @@ class ViewDialog(QDialog, forms.ui_network_view.Ui_network_view_dialog):
     def graph_network(self, outcome, follow_up):
         data_type = self.model.get_outcome_type(outcome, get_str=False)
         
-        img_path = meta_py_r.ma_dataset_to_simple_network(
+        try:
+            img_path = meta_py_r.ma_dataset_to_simple_network(
                                       table_model=self.model,
                                       data_type=data_type,
                                       outcome=outcome,
                                       follow_up=follow_up)
+        except meta_py_r.RBusy, e:
+            QMessageBox.information(self, "R is busy", str(e))
+            return
         pixmap = QPixmap(img_path)
         self.scene.addPixmap(pixmap)
\ No newline at end of file
@@ -0,0 +1,837 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Reading and writing .oma files.                                          #
+#                                                                           #
+#  Version 1 .oma files are simply the pickled Dataset (plus a separate     #
+#  pickled 'state' dictionary in <file>.oma.state). These are still read,   #
+#  but files are now written in version 2 of the format: a versioned        #
+#  container of typed blocks, each of which holds a JSON header and         #
+#  (optionally) some numpy arrays, and may be zlib-compressed:              #
+#                                                                           #
+#    file header | blocks ... | index block | trailer                       #
+#                                                                           #
+#  The blocks are the dataset meta-data (META), the study index (STDY),     #
+#  the covariate values (COVS), the view state (STAT) and one columnar      #
+#  block of raw data and effects per outcome/follow-up (UNIT), laid out    #
+#  as in the columnar_store module. The index maps blocks to offsets, and  #
+#  the trailer points to the index. Files are read through (copy-on-write) #
+#  mmap; the arrays of uncompressed blocks are views onto the mapping, and  #
+#  the studies' data for an outcome is only built when it is first needed.  #
+#  Saving appends only those blocks that changed, followed by a             #
+#  new index and trailer; files are compacted once they contain too many    #
+#  superseded blocks. Because the old trailers are left in place, a file    #
+#  whose last save was interrupted is read as of the previous save.         #
+#                                                                           #
+#############################################################################
+
+import base64
+import copy
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import StringIO
+import struct
+import UserDict
+import zlib
+
+import numpy as np
+
+import columnar_store
+import ma_dataset
+import oma_logging
+import two_way_dict
+
+try:
+    from PyQt4.QtCore import QString
+except ImportError:
+    QString = None
+
+logger = oma_logging.get_logger(__name__)
+
+MAGIC = "\x89OMA\r\n\x1a\n"
+FORMAT_VERSION = 2
+END_MARKER = "OMA2-END"
+
+_FILE_HEADER = struct.Struct("<8sHH4x")     # magic, version, flags
+BLOCK_HEADER = struct.Struct("<4sB3xQI")   # tag, flags, payload length, crc32
+_TRAILER = struct.Struct("<Q8s")            # offset of the index, END_MARKER
+_JSON_LENGTH = struct.Struct("<I")
+
+# block types
+META = "META"
+STUDIES = "STDY"
+COVARIATES = "COVS"
+STATE = "STAT"
+UNIT = "UNIT"
+INDEX = "INDX"
+
+# block flags
+COMPRESSED = 1
+
+# the arrays of (uncompressed) blocks are views onto a copy-on-write mapping
+# of the file, so that they can be modified without touching the file. Not
+# on Windows, though, where a file cannot be replaced while it is mapped.
+_MAP_IN_PLACE = os.name != "nt"
+
+# when more than this fraction of a file would be taken up by superseded
+# blocks after an (appending) save, the file is rewritten instead
+COMPACT_THRESHOLD = 0.5
+
+# the attributes of Datasets that are written out separately; everything
+# else (title, notes, ...) goes into the META block as is
+_DATASET_STRUCTURE = ("studies", "covariates", "outcome_names_to_follow_ups", "columnar_store")
+
+
+class OmaFormatError(Exception):
+    pass
+
+
+###
+# (de)serialization of blocks
+def _json_default(obj):
+    # QStrings occasionally find their way into datasets
+    if hasattr(obj, "toUtf8"):
+        return unicode(obj.toUtf8(), "utf8")
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("%r cannot be written to an .oma file" % (obj,))
+
+def encode_payload(header, arrays=None):
+    '''
+    Returns the JSON-able header dictionary and the arrays (a dictionary
+    mapping names to numpy arrays) as a string; the arrays follow the JSON,
+    8-byte aligned.
+    '''
+    arrays = arrays or {}
+    specs, chunks, offset = {}, [], 0
+    for name in sorted(arrays.keys()):
+        data = np.ascontiguousarray(arrays[name]).tostring()
+        specs[name] = {"dtype":arrays[name].dtype.str, "shape":list(arrays[name].shape),
+                       "offset":offset}
+        padding = -len(data) % 8
+        chunks.extend([data, "\0"*padding])
+        offset += len(data) + padding
+
+    header = dict(header)
+    header["_arrays"] = specs
+    json_str = json.dumps(header, default=_json_default, sort_keys=True)
+    json_str += " " * (-(len(json_str) + _JSON_LENGTH.size) % 8)
+    return _JSON_LENGTH.pack(len(json_str)) + json_str + "".join(chunks)
+
+def decode_payload(payload, offset=0, copy=True):
+    '''
+    The inverse of encode_payload, for the payload starting at offset. The
+    arrays are copied out of payload, unless copy is False and payload is
+    writable (e.g., a copy-on-write mmap), in which case they are views onto it.
+    '''
+    json_length = _JSON_LENGTH.unpack_from(payload, offset)[0]
+    start = offset + _JSON_LENGTH.size + json_length
+    header = json.loads(payload[offset + _JSON_LENGTH.size:start])
+    arrays = {}
+    for name, spec in header.pop("_arrays").items():
+        dtype = np.dtype(str(spec["dtype"]))
+        shape = tuple(spec["shape"])
+        count = reduce(lambda x, y: x*y, shape, 1)
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+            continue
+        arr = np.frombuffer(payload, dtype=dtype, count=count, offset=start+spec["offset"])
+        if copy or not arr.flags.writeable:
+            arr = arr.copy()
+        arrays[name] = arr.reshape(shape)
+    return header, arrays
+
+def write_block(f, tag, payload, compress=False):
+    ''' Writes the block at the current position of f; returns its offset and size '''
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= COMPRESSED
+    offset = f.tell()
+    f.write(BLOCK_HEADER.pack(tag, flags, len(payload), zlib.crc32(payload) & 0xffffffff))
+    f.write(payload)
+    return offset, BLOCK_HEADER.size + len(payload)
+
+def read_block(buf, offset, expected_tag=None):
+    ''' Returns the tag and (decompressed) payload of the block at offset in buf '''
+    if offset + BLOCK_HEADER.size > len(buf):
+        raise OmaFormatError("block at %s lies beyond the end of the file" % offset)
+    tag, flags, length, crc = BLOCK_HEADER.unpack_from(buf, offset)
+    start = offset + BLOCK_HEADER.size
+    if start + length > len(buf):
+        raise OmaFormatError("block at %s is truncated" % offset)
+    if expected_tag is not None and tag != expected_tag:
+        raise OmaFormatError("expected a %s block at %s, found '%s'" % (expected_tag, offset, tag))
+    payload = buffer(buf, start, length)
+    if zlib.crc32(payload) & 0xffffffff != crc:
+        raise OmaFormatError("%s block at %s is corrupt" % (tag, offset))
+    if flags & COMPRESSED:
+        payload = zlib.decompress(payload)
+    return tag, payload
+
+def _digest(payload):
+    return hashlib.md5(payload).hexdigest()
+
+
+###
+# datasets -> blocks
+def _outcome_to_json(outcome):
+    return {"data_type":outcome.data_type, "sub_type":outcome.sub_type, "links":outcome.links}
+
+###
+# the dataset attributes and the state dictionary can hold just about
+# anything; the types that JSON does not have (or would silently turn into
+# something else) are written as {"__<type>__": ...} objects.
+def _encode_value(x):
+    if x is None or isinstance(x, (bool, int, long, float)):
+        return x
+    if isinstance(x, np.generic):
+        return _encode_value(x.item())
+    if QString is not None and isinstance(x, QString):
+        return {"__qstring__":unicode(x)}
+    if isinstance(x, str):
+        if _is_ascii(x):
+            return x
+        return {"__bytes__":base64.b64encode(x)}
+    if isinstance(x, unicode):
+        return {"__unicode__":x}
+    if isinstance(x, list):
+        return [_encode_value(y) for y in x]
+    if isinstance(x, tuple):
+        return {"__tuple__":[_encode_value(y) for y in x]}
+    if isinstance(x, dict):
+        if all([isinstance(key, str) and _is_ascii(key) and not key.startswith("__") for key in x.keys()]):
+            return dict([(key, _encode_value(value)) for key, value in x.items()])
+        return {"__dict__":[[_encode_value(key), _encode_value(value)] for key, value in x.items()]}
+    raise TypeError("%r cannot be written to an .oma file" % (x,))
+
+def _is_ascii(s):
+    try:
+        s.decode("ascii")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def _decode_value(x):
+    if isinstance(x, unicode):
+        try:
+            return str(x)
+        except UnicodeEncodeError:
+            # (written before values were tagged)
+            return x
+    if isinstance(x, list):
+        return [_decode_value(y) for y in x]
+    if isinstance(x, dict):
+        if len(x) == 1:
+            tag, value = x.items()[0]
+            if tag == "__qstring__":
+                return value if QString is None else QString(value)
+            if tag == "__bytes__":
+                return base64.b64decode(value)
+            if tag == "__unicode__":
+                return value
+            if tag == "__tuple__":
+                return tuple([_decode_value(y) for y in value])
+            if tag == "__dict__":
+                return dict([(_decode_value(key), _decode_value(y)) for key, y in value])
+        return dict([(str(key), _decode_value(value)) for key, value in x.items()])
+    return x
+
+def _meta_block(dataset):
+    attributes = dict([(attr, _encode_value(value)) for attr, value in dataset.__dict__.items() \
+                            if attr not in _DATASET_STRUCTURE])
+    outcomes = {}
+    for study in dataset.studies:
+        for outcome in study.outcomes:
+            outcomes.setdefault(outcome.name, _outcome_to_json(outcome))
+        for follow_ups in study.outcomes_to_follow_ups.values():
+            for ma_unit in follow_ups.values():
+                outcomes.setdefault(ma_unit.outcome.name, _outcome_to_json(ma_unit.outcome))
+    follow_ups = dict([(outcome_name, sorted(follow_ups_d.items())) for \
+                    outcome_name, follow_ups_d in dataset.outcome_names_to_follow_ups.items()])
+    return {"format_version":FORMAT_VERSION,
+            "attributes":attributes,
+            "outcomes":outcomes,
+            "follow_ups":follow_ups,
+            "covariates":[[cov.name, cov.get_type_str()] for cov in dataset.covariates]}
+
+def _studies_block(dataset):
+    effect_name_sets = []
+    studies = []
+    for study in dataset.studies:
+        units = []
+        for outcome_name, follow_ups in study.outcomes_to_follow_ups.items():
+            for follow_up, ma_unit in follow_ups.items():
+                groups = [[group.id, group_name, len(group.raw_data)] for \
+                                group_name, group in ma_unit.tx_groups.items()]
+                effect_names = sorted(ma_unit.effects_dict.keys())
+                if not effect_names in effect_name_sets:
+                    effect_name_sets.append(effect_names)
+                units.append([outcome_name, follow_up, groups, effect_name_sets.index(effect_names)])
+        # (the names and notes are whatever was typed in, as are factor
+        # covariates' values; they're encoded as the dataset attributes are)
+        studies.append({"id":study.id, "name":_encode_value(study.name), "year":study.year, "N":study.N,
+                        "notes":_encode_value(study.notes), "include":study.include,
+                        "manually_excluded":study.manually_excluded,
+                        "outcomes":[outcome.name for outcome in study.outcomes],
+                        "units":units})
+    return {"effect_name_sets":effect_name_sets, "studies":studies}
+
+def _is_number(x):
+    return isinstance(x, (int, long, float)) and not isinstance(x, bool)
+
+def _covariates_block(dataset):
+    '''
+    Continuous covariates (i.e., those whose values are all numbers) are
+    stored as arrays, with NaN for None; anything else goes in the JSON.
+    '''
+    names = [cov.name for cov in dataset.covariates]
+    for study in dataset.studies:
+        names.extend([name for name in study.covariate_dict.keys() if not name in names])
+
+    encodings, arrays = [], {}
+    for i, name in enumerate(names):
+        absent = [row for row, study in enumerate(dataset.studies) if not name in study.covariate_dict]
+        values = [study.covariate_dict.get(name) for study in dataset.studies]
+        if all([x is None or _is_number(x) for x in values]):
+            arrays["values.%s" % i] = np.array([np.nan if x is None else x for x in values], dtype=float)
+            encodings.append({"name":name, "absent":absent})
+        else:
+            encodings.append({"name":name, "absent":absent, "values":_encode_value(values)})
+    return {"covariates":encodings}, arrays
+
+def _unit_block(outcome_name, follow_up, block):
+    header = {"outcome":outcome_name, "follow_up":follow_up,
+              "raw_data_length":block.raw_data_length,
+              "groups":sorted(block.raw_data.keys()),
+              "effects":sorted(block.effects.keys())}
+    arrays = {}
+    for i, group in enumerate(header["groups"]):
+        arrays["raw.%s" % i] = block.raw_data[group]
+    for i, key in enumerate(header["effects"]):
+        present, values, optional_set = block.effects[key]
+        arrays["present.%s" % i] = present
+        if values is not None:
+            arrays["values.%s" % i] = values
+            arrays["optional_set.%s" % i] = optional_set
+    return header, arrays
+
+def _dataset_blocks(dataset, state=None):
+    '''
+    Returns a list of (key, tag, payload) tuples for the blocks of dataset;
+    keys are the tags, except for UNIT blocks, whose keys are (outcome name,
+    follow up) tuples.
+    '''
+    blocks = [(META, META, encode_payload(_meta_block(dataset))),
+              (STUDIES, STUDIES, encode_payload(_studies_block(dataset))),
+              (COVARIATES, COVARIATES, encode_payload(*_covariates_block(dataset)))]
+    if state is not None:
+        blocks.append((STATE, STATE, encode_payload({"state":_encode_value(state)})))
+    store = columnar_store.ColumnarStore.pack_dataset(dataset, install_views=False)
+    for (outcome_name, follow_up), block in sorted(store.blocks.items()):
+        payload = encode_payload(*_unit_block(outcome_name, follow_up, block))
+        blocks.append(((outcome_name, follow_up), UNIT, payload))
+    return blocks
+
+
+###
+# reading
+def is_v2_file(path):
+    try:
+        f = open(path, "rb")
+        try:
+            return f.read(len(MAGIC)) == MAGIC
+        finally:
+            f.close()
+    except IOError:
+        return False
+
+
+class OmaReader(object):
+    '''
+    Reads (version 2) .oma files; use as, e.g.,
+
+        reader = OmaReader(path)
+        try:
+            dataset = reader.read_dataset(outcome_names=["mortality"])
+        finally:
+            reader.close()
+
+    (or in a with statement). The file is memory-mapped and the blocks are
+    only decoded as they are read. The arrays of uncompressed blocks are
+    views onto the mapping (which is copy-on-write, so they can be modified),
+    which is therefore only closed once they are gone, i.e., the datasets
+    read may outlive the reader.
+    '''
+    def __init__(self, path, data=None):
+        '''
+        If data is given, it is read as the contents of a file (see
+        dataset_to_string) and path is only used in error messages.
+        '''
+        self.path = path
+        self._file, self._buf = None, None
+        self._in_place = data is None and _MAP_IN_PLACE
+        try:
+            if data is None:
+                self._file = open(path, "rb")
+                size = os.fstat(self._file.fileno()).st_size
+            else:
+                size = len(data)
+            if size < _FILE_HEADER.size + _TRAILER.size:
+                raise OmaFormatError("%s is too short to be an .oma file" % path)
+            if data is None:
+                access = mmap.ACCESS_COPY if self._in_place else mmap.ACCESS_READ
+                self._buf = mmap.mmap(self._file.fileno(), 0, access=access)
+            else:
+                self._buf = data
+            magic, version, flags = _FILE_HEADER.unpack_from(self._buf, 0)
+            if magic != MAGIC:
+                raise OmaFormatError("%s is not a version 2 .oma file" % path)
+            if version > FORMAT_VERSION:
+                raise OmaFormatError("%s was written by a newer version of OpenMeta (format version %s)" \
+                                            % (path, version))
+            self.index, self.valid_end = self._find_index()
+        except:
+            self.close()
+            raise
+
+    def _find_index(self):
+        '''
+        Returns the index of the last complete save along with the offset
+        just past its trailer. Normally this is the trailer at the end of
+        the file, but if the last save was interrupted we look further back.
+        '''
+        end = len(self._buf)
+        while end >= _FILE_HEADER.size + _TRAILER.size:
+            marker_at = self._buf.rfind(END_MARKER, _FILE_HEADER.size, end)
+            if marker_at < 0:
+                break
+            trailer_at = marker_at + len(END_MARKER) - _TRAILER.size
+            if trailer_at >= _FILE_HEADER.size:
+                index_offset = _TRAILER.unpack_from(self._buf, trailer_at)[0]
+                try:
+                    tag, payload = read_block(self._buf, index_offset, expected_tag=INDEX)
+                    return json.loads(str(payload)), trailer_at + _TRAILER.size
+                except (OmaFormatError, struct.error, ValueError, zlib.error):
+                    pass
+            end = marker_at + len(END_MARKER) - 1
+        raise OmaFormatError("could not find an index in %s" % self.path)
+
+    def close(self):
+        # with in-place arrays the mapping is left to be closed once the
+        # arrays (which keep a reference to it) are garbage collected
+        if isinstance(self._buf, mmap.mmap) and not self._in_place:
+            self._buf.close()
+        self._buf = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, entry, expected_tag):
+        tag, payload = read_block(self._buf, entry[0], expected_tag)
+        if self._in_place and isinstance(payload, buffer):
+            # not compressed, so the arrays can be views onto the mapping
+            return decode_payload(self._buf, entry[0] + BLOCK_HEADER.size, copy=False)
+        return decode_payload(payload)
+
+    def has_block(self, tag):
+        return tag in self.index["blocks"]
+
+    def read_block(self, tag):
+        ''' the (header, arrays) of the META, STDY, COVS or STAT block '''
+        return self._read(self.index["blocks"][tag], tag)
+
+    def get_unit_keys(self):
+        ''' (outcome name, follow up) tuples, one per UNIT block '''
+        return [(outcome_name, follow_up) for outcome_name, follow_up, offset, size, digest \
+                        in self.index["units"]]
+
+    def get_outcome_names(self):
+        return sorted(set([outcome_name for outcome_name, follow_up in self.get_unit_keys()]))
+
+    def read_unit_block(self, outcome_name, follow_up, n_rows):
+        ''' Returns the given outcome/follow-up as a ColumnarBlock '''
+        for an_outcome, a_follow_up, offset, size, digest in self.index["units"]:
+            if (an_outcome, a_follow_up) == (outcome_name, follow_up):
+                header, arrays = self._read([offset, size, digest], UNIT)
+                break
+        else:
+            raise KeyError((outcome_name, follow_up))
+        block = columnar_store.ColumnarBlock(n_rows, header["raw_data_length"])
+        for i, group in enumerate(header["groups"]):
+            block.raw_data[group] = arrays["raw.%s" % i]
+        for i, (group_str, effect) in enumerate(header["effects"]):
+            block.effects[(group_str, effect)] = [arrays["present.%s" % i],
+                                                  arrays.get("values.%s" % i),
+                                                  arrays.get("optional_set.%s" % i)]
+        return block
+
+    def read_state(self):
+        ''' the state dictionary saved with the dataset, or None '''
+        if not self.has_block(STATE):
+            return None
+        return _decode_value(self.read_block(STATE)[0]["state"])
+
+    def read_dataset(self, outcome_names=None, packed=False):
+        '''
+        Builds the Dataset. If outcome_names is given only those outcomes are
+        read (and the dataset will only contain those); if packed is True,
+        the dataset is returned packed, i.e., the studies' raw data and effects
+        are views onto the arrays read from the file (see Dataset.pack).
+
+        The MetaAnalyticUnits of an outcome are only built once the outcome
+        is first accessed (in any of the studies); see _LazyOutcomes.
+        '''
+        meta = self.read_block(META)[0]
+        study_records = self.read_block(STUDIES)[0]
+        if outcome_names is None:
+            outcome_names = meta["follow_ups"].keys()
+        outcome_names = set(outcome_names)
+
+        dataset = ma_dataset.Dataset()
+        for attr, value in meta["attributes"].items():
+            setattr(dataset, str(attr), _decode_value(value))
+        for outcome_name, follow_ups in meta["follow_ups"].items():
+            if outcome_name in outcome_names:
+                dataset.outcome_names_to_follow_ups[outcome_name] = two_way_dict.TwoWayDict()
+                for i, follow_up in follow_ups:
+                    dataset.outcome_names_to_follow_ups[outcome_name][i] = follow_up
+        dataset.covariates = [ma_dataset.Covariate(name, data_type) for name, data_type in meta["covariates"]]
+
+        n_rows = len(study_records["studies"])
+        store = columnar_store.ColumnarStore([record["id"] for record in study_records["studies"]])
+        for outcome_name, follow_up in self.get_unit_keys():
+            if outcome_name in outcome_names:
+                store.blocks[(outcome_name, follow_up)] = self.read_unit_block(outcome_name, follow_up, n_rows)
+
+        loader = _OutcomeLoader(meta["outcomes"], study_records, store, packed)
+        for row, record in enumerate(study_records["studies"]):
+            study = ma_dataset.Study(record["id"], _decode_value(record["name"]), record["year"], record["include"])
+            study.N = record["N"]
+            study.notes = _decode_value(record["notes"])
+            study.manually_excluded = record["manually_excluded"]
+            study.outcomes = [loader.get_outcome(row, name) for name in record["outcomes"] \
+                                    if name in outcome_names]
+            pending = set([unit[0] for unit in record["units"] if unit[0] in outcome_names])
+            study.outcomes_to_follow_ups = _LazyOutcomes(loader, row, pending)
+            dataset.studies.append(study)
+
+        if self.has_block(COVARIATES):
+            cov_header, cov_arrays = self.read_block(COVARIATES)
+            for i, encoding in enumerate(cov_header["covariates"]):
+                if "values" in encoding:
+                    values = _decode_value(encoding["values"])
+                else:
+                    values = [None if np.isnan(x) else float(x) for x in cov_arrays["values.%s" % i]]
+                absent = set(encoding["absent"])
+                for row, study in enumerate(dataset.studies):
+                    if not row in absent:
+                        study.covariate_dict[encoding["name"]] = values[row]
+
+        if packed:
+            dataset.columnar_store = store
+        return dataset
+
+
+class _OutcomeLoader(object):
+    '''
+    Builds the MetaAnalyticUnits of the studies read by OmaReader.read_dataset,
+    one outcome (for all of the studies at once) at a time. If packed, their
+    raw data and effects are views onto the store; otherwise they are plain
+    lists/dictionaries.
+    '''
+    def __init__(self, outcomes_meta, study_records, store, packed):
+        self.outcomes_meta = outcomes_meta
+        self.study_records = study_records
+        self.store = store
+        self.packed = packed
+        # row -> outcome name -> Outcome; a study's units share its Outcomes
+        self._outcomes = {}
+        # row -> the _LazyOutcomes of the study
+        self._lazy_outcomes = {}
+
+    def get_outcome(self, row, name):
+        outcomes = self._outcomes.setdefault(row, {})
+        if not name in outcomes:
+            d = self.outcomes_meta[name]
+            outcomes[name] = ma_dataset.Outcome(name, d["data_type"], d["links"], d["sub_type"])
+        return outcomes[name]
+
+    def register(self, row, lazy_outcomes):
+        self._lazy_outcomes[row] = lazy_outcomes
+
+    def load(self, outcome_name):
+        ''' Builds the given outcome for all of the studies that are still waiting for it '''
+        logger.debug("building the units of outcome %s", outcome_name)
+        for row, record in enumerate(self.study_records["studies"]):
+            lazy_outcomes = self._lazy_outcomes.get(row)
+            if lazy_outcomes is None or not outcome_name in lazy_outcomes._pending:
+                continue
+            follow_ups = {}
+            for a_outcome_name, follow_up, groups, effect_name_set in record["units"]:
+                if a_outcome_name == outcome_name:
+                    follow_ups[follow_up] = self._make_unit(row, outcome_name, follow_up, groups,
+                                                            effect_name_set)
+            lazy_outcomes._pending.discard(outcome_name)
+            lazy_outcomes._data[outcome_name] = follow_ups
+
+    def _make_unit(self, row, outcome_name, follow_up, groups, effect_name_set):
+        block = self.store.blocks[(outcome_name, follow_up)]
+        ma_unit = ma_dataset.MetaAnalyticUnit(self.get_outcome(row, outcome_name), group_names=[])
+        ma_unit.raw_data_length = block.raw_data_length
+        for group_id, group_name, raw_data_length in groups:
+            raw_data = columnar_store.RawDataView(block.get_raw_data_array(group_name),
+                                                  row, raw_data_length)
+            if not self.packed:
+                raw_data = list(raw_data)
+            ma_unit.tx_groups[group_name] = ma_dataset.TreatmentGroup(group_id, group_name, raw_data)
+        effects_dict = columnar_store.EffectsDictView(block, row,
+                                self.study_records["effect_name_sets"][effect_name_set])
+        ma_unit.effects_dict = effects_dict if self.packed else effects_dict.to_dict()
+        return ma_unit
+
+
+class _LazyOutcomes(UserDict.DictMixin, object):
+    '''
+    Stands in for Study.outcomes_to_follow_ups; the outcomes in _pending
+    are built (by the _OutcomeLoader) once they are first looked up. Like
+    the views in columnar_store, it pickles and (deep)copies as the plain
+    dictionary it stands in for.
+    '''
+    def __init__(self, loader, row, pending):
+        self._data = {}
+        self._pending = set(pending)
+        if self._pending:
+            self._loader = loader
+            loader.register(row, self)
+        else:
+            self._loader = None
+
+    def __getitem__(self, outcome_name):
+        if outcome_name in self._pending:
+            self._loader.load(outcome_name)
+        return self._data[outcome_name]
+
+    def __setitem__(self, outcome_name, follow_ups):
+        self._pending.discard(outcome_name)
+        self._data[outcome_name] = follow_ups
+
+    def __delitem__(self, outcome_name):
+        if outcome_name in self._pending:
+            self._pending.discard(outcome_name)
+        else:
+            del self._data[outcome_name]
+
+    def keys(self):
+        return self._data.keys() + list(self._pending)
+
+    def __contains__(self, outcome_name):
+        return outcome_name in self._data or outcome_name in self._pending
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._data) + len(self._pending)
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def copy(self):
+        return self.to_dict()
+
+    def __eq__(self, other):
+        return self.to_dict() == dict(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+
+###
+# writing
+def replace_file(tmp_path, path):
+    # os.rename does not overwrite existing files on Windows
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+def _write_index(f, index):
+    index_offset = f.tell()
+    write_block(f, INDEX, json.dumps(index, default=_json_default))
+    f.write(_TRAILER.pack(index_offset, END_MARKER))
+
+def _write_blocks(f, blocks, compress, old_index=None):
+    '''
+    Writes those blocks that differ from the ones in old_index (all of them,
+    if that is None) to f; returns the new index.
+    '''
+    old_entries = {}
+    if old_index is not None:
+        old_entries = dict([(tag, entry) for tag, entry in old_index["blocks"].items()])
+        for outcome_name, follow_up, offset, size, digest in old_index["units"]:
+            old_entries[(outcome_name, follow_up)] = [offset, size, digest]
+
+    index = {"format_version":FORMAT_VERSION, "blocks":{}, "units":[]}
+    for key, tag, payload in blocks:
+        digest = _digest(payload)
+        entry = old_entries.get(key)
+        if entry is None or entry[2] != digest:
+            offset, size = write_block(f, tag, payload, compress)
+            entry = [offset, size, digest]
+        if tag == UNIT:
+            index["units"].append(list(key) + entry)
+        else:
+            index["blocks"][tag] = entry
+    return index
+
+def _live_bytes(index):
+    entries = index["blocks"].values() + [unit[2:] for unit in index["units"]]
+    return sum([size for offset, size, digest in entries])
+
+def _write_container(f, blocks, compress):
+    f.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+    index = _write_blocks(f, blocks, compress)
+    _write_index(f, index)
+
+def _write_new_file(path, blocks, compress):
+    tmp_path = path + ".tmp"
+    f = open(tmp_path, "wb")
+    try:
+        _write_container(f, blocks, compress)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    replace_file(tmp_path, path)
+    return os.path.getsize(path)
+
+def save_dataset(dataset, path, state=None, compress=False, append=True):
+    '''
+    Writes dataset (and the state dictionary of the model, if given) to
+    path in the version 2 format. If append is True and path already is
+    a version 2 file, only the blocks that changed since it was last saved
+    are written (appended), unless this would leave the file with too much
+    dead space, in which case it is compacted (rewritten).
+
+    Returns a dictionary with the number of bytes written and whether the
+    file was compacted.
+    '''
+    blocks = _dataset_blocks(dataset, state)
+
+    old_index, valid_end = None, None
+    if append and is_v2_file(path):
+        try:
+            reader = OmaReader(path)
+            old_index, valid_end = reader.index, reader.valid_end
+            reader.close()
+        except (OmaFormatError, IOError, mmap.error):
+            old_index = None
+
+    if old_index is not None:
+        f = open(path, "r+b")
+        try:
+            # anything after the last complete save is garbage
+            f.seek(valid_end)
+            f.truncate()
+            index = _write_blocks(f, blocks, compress, old_index)
+            _write_index(f, index)
+            f.flush()
+            os.fsync(f.fileno())
+            file_size = f.tell()
+        finally:
+            f.close()
+        if _live_bytes(index) >= (1-COMPACT_THRESHOLD) * file_size:
+            return {"bytes_written":file_size - valid_end, "compacted":False}
+        compact(path, compress=compress)
+        return {"bytes_written":os.path.getsize(path), "compacted":True}
+
+    return {"bytes_written":_write_new_file(path, blocks, compress), "compacted":False}
+
+def compact(path, compress=False):
+    ''' Rewrites the (version 2) file at path without any superseded blocks '''
+    reader = OmaReader(path)
+    try:
+        blocks = []
+        for tag, entry in sorted(reader.index["blocks"].items()):
+            blocks.append((tag, tag, str(read_block(reader._buf, entry[0], tag)[1])))
+        for outcome_name, follow_up, offset, size, digest in reader.index["units"]:
+            blocks.append(((outcome_name, follow_up), UNIT, str(read_block(reader._buf, offset, UNIT)[1])))
+    finally:
+        reader.close()
+    return _write_new_file(path, blocks, compress)
+
+
+def dataset_to_string(dataset, state=None, compress=False):
+    ''' The contents of the file that save_dataset would write, as a string '''
+    f = StringIO.StringIO()
+    _write_container(f, _dataset_blocks(dataset, state), compress)
+    return f.getvalue()
+
+def dataset_from_string(data, packed=False):
+    ''' The inverse of dataset_to_string; returns a (dataset, state) tuple '''
+    reader = OmaReader("<string>", data=data)
+    try:
+        return reader.read_dataset(packed=packed), reader.read_state()
+    finally:
+        reader.close()
+
+
+###
+# the top-level interface
+def load(path, packed=False):
+    '''
+    Reads the .oma file at path, which may be in either format; returns a
+    (dataset, state dictionary) tuple. The latter is None if no state was
+    saved with the dataset.
+    '''
+    if is_v2_file(path):
+        reader = OmaReader(path)
+        try:
+            return reader.read_dataset(packed=packed), reader.read_state()
+        finally:
+            reader.close()
+    return _load_legacy(path, packed=packed)
+
+def _load_legacy(path, packed=False):
+    ''' Version 1 files: a pickled Dataset, and maybe a pickled state dictionary '''
+    f = open(path, "rb")
+    try:
+        dataset = pickle.load(f)
+    finally:
+        f.close()
+    if packed:
+        dataset.pack()
+
+    state = None
+    if os.path.exists(path + ".state"):
+        try:
+            f = open(path + ".state", "rb")
+            try:
+                state = pickle.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            logger.warning("could not read the state dictionary in %s.state: %s", path, e)
+    return dataset, state
@@ -0,0 +1,378 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Journaled saving of datasets.                                            #
+#                                                                           #
+#  The .oma file (see oma_format) acts as a checkpoint; subsequent saves   #
+#  only append the studies that changed since the last save to a journal   #
+#  (<file>.oma.journal), along with the dataset-level data (title,         #
+#  outcomes, covariates, ...), the order of the studies and the view       #
+#  state. Once the journal gets large it is folded into a new checkpoint   #
+#  in a background thread. Reading a file replays the journal, if there    #
+#  is one, onto the checkpoint; a journal entry that was only partially    #
+#  written (e.g., because we crashed while saving) is ignored.             #
+#                                                                           #
+#  Which studies changed is recorded by the commands on the undo stack of  #
+#  the spreadsheet (see JournaledSaver.attach_undo_stack); for commands    #
+#  that don't record this (and for changes made behind the back of the     #
+#  undo stack) we fall back to comparing digests of all of the studies     #
+#  with those at the time of the last save.                                #
+#                                                                           #
+#############################################################################
+
+import copy
+import cPickle
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+from PyQt4.QtCore import QObject, SIGNAL
+
+import oma_format
+
+JOURNAL_MAGIC = "\x89OMJ\r\n\x1a\n"
+JOURNAL_EXTENSION = ".journal"
+
+# block types
+JOURNAL_HEADER = "JHDR"
+JOURNAL_ENTRY = "JRNL"
+
+# the journal is compacted (folded into the checkpoint) once it is larger
+# than COMPACT_RATIO times the checkpoint, and at least MIN_COMPACT_BYTES
+COMPACT_RATIO = 0.5
+MIN_COMPACT_BYTES = 256*1024
+
+
+def _checkpoint_id(path):
+    ''' Identifies the last complete save in the (version 2) file at path '''
+    reader = oma_format.OmaReader(path)
+    try:
+        index_str = json.dumps(reader.index, sort_keys=True)
+        return "%s:%s" % (reader.valid_end, hashlib.md5(index_str).hexdigest())
+    finally:
+        reader.close()
+
+def _study_digest(study):
+    # a pickle is a convenient canonical form here; it is never written out
+    return hashlib.md5(cPickle.dumps(study, 2)).digest()
+
+def _read_journal(journal_path, checkpoint_id, end=None):
+    '''
+    Returns the entries (header dictionary, journal entry string) in the
+    journal at journal_path along with the offset just past the last
+    complete one, or None if there is no journal for this checkpoint.
+    Only the first end bytes of the journal are read, if end is given.
+    '''
+    if not os.path.exists(journal_path):
+        return None
+    f = open(journal_path, "rb")
+    try:
+        data = f.read() if end is None else f.read(end)
+    finally:
+        f.close()
+    if data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+        return None
+
+    entries = []
+    offset = len(JOURNAL_MAGIC)
+    try:
+        tag, payload = oma_format.read_block(data, offset, JOURNAL_HEADER)
+        if oma_format.decode_payload(payload)[0]["checkpoint"] != checkpoint_id:
+            return None
+        offset = _next_block(data, offset)
+    except (oma_format.OmaFormatError, ValueError, KeyError, struct.error):
+        return None
+    while offset < len(data):
+        try:
+            tag, payload = oma_format.read_block(data, offset, JOURNAL_ENTRY)
+            header, arrays = oma_format.decode_payload(payload)
+        except (oma_format.OmaFormatError, ValueError, KeyError, struct.error, zlib.error):
+            # the remainder was not (completely) written
+            break
+        entries.append((header, arrays["dataset"].tostring()))
+        offset = _next_block(data, offset)
+    return entries, offset
+
+def _next_block(data, offset):
+    ''' the offset of the block following the one at offset '''
+    tag, flags, length, crc = oma_format.BLOCK_HEADER.unpack_from(data, offset)
+    return offset + oma_format.BLOCK_HEADER.size + length
+
+def _find_journal(path):
+    '''
+    Returns (journal path, entries, offset past the last complete entry) for
+    the journal belonging to the checkpoint at path, or None if there is
+    none. Normally the journal is in path + JOURNAL_EXTENSION; however if
+    we crashed while compacting, it may still be in the temporary file.
+    '''
+    if not oma_format.is_v2_file(path):
+        return None
+    checkpoint_id = _checkpoint_id(path)
+    for journal_path in (path + JOURNAL_EXTENSION, path + JOURNAL_EXTENSION + ".tmp"):
+        journal = _read_journal(journal_path, checkpoint_id)
+        if journal is not None:
+            return (journal_path,) + journal
+    return None
+
+def _partial_dataset(dataset, studies):
+    ''' A shallow copy of dataset, with only the given studies '''
+    partial = copy.copy(dataset)
+    partial.set_studies(studies)
+    return partial
+
+def _apply_entry(dataset, header, entry_data):
+    ''' Replays the journal entry onto dataset; returns the state saved with it '''
+    partial, state = oma_format.dataset_from_string(entry_data)
+    for attr, value in partial.__dict__.items():
+        if attr not in ("studies", "columnar_store"):
+            setattr(dataset, attr, value)
+    if header["complete"]:
+        dataset.set_studies(partial.studies)
+    else:
+        studies = dict([(study.id, study) for study in dataset.studies])
+        studies.update(dict([(study.id, study) for study in partial.studies]))
+        dataset.set_studies([studies[study_id] for study_id in header["study_ids"] if study_id in studies])
+    return state
+
+def _replay(path, entries, packed=False):
+    dataset, state = oma_format.load(path)
+    for header, entry_data in entries:
+        state = _apply_entry(dataset, header, entry_data)
+    if packed:
+        dataset.pack()
+    return dataset, state
+
+def load(path, packed=False):
+    '''
+    Like oma_format.load, but replays the journal of the file (if any);
+    returns a (dataset, state) tuple.
+    '''
+    journal = _find_journal(path)
+    if journal is None:
+        return oma_format.load(path, packed=packed)
+    journal_path, entries, end = journal
+    return _replay(path, entries, packed=packed)
+
+
+class JournaledSaver(object):
+    '''
+    Saves datasets to path; the first save writes a full checkpoint (unless
+    the dataset that was read from path is given, see below), subsequent
+    saves append to the journal.
+
+        saver = JournaledSaver(path, dataset)
+        saver.attach_undo_stack(undo_stack)
+        ...
+        saver.save(dataset, state)
+
+    dataset, if given, is the dataset as read (with load) from path; the
+    studies that changed are then determined relative to it.
+
+    Commands on the undo stack may have a dirty_study_ids attribute, the
+    ids of the studies they changed on their last redo() or undo(); only
+    those studies (and any new ones) are then written. If any command that
+    was done or undone since the last save lacks it (or it is None), all
+    studies are checked for changes instead.
+    '''
+    def __init__(self, path, dataset=None):
+        self.path = path
+        # without an undo stack to tell us otherwise, we always look for changes
+        self.dirty = True
+        self._track_dirty = False
+        self._undo_stack = None
+        self._undo_index = 0
+        # the ids of the studies that the commands done/undone since the
+        # last save changed; None if we don't know
+        self._dirty_study_ids = set()
+        self._lock = threading.Lock()
+        self._compaction_thread = None
+        self._digests = None
+        self._journal_end = None
+
+        journal = None
+        if dataset is not None:
+            journal = _find_journal(path)
+            if journal is None and oma_format.is_v2_file(path):
+                journal = (path + JOURNAL_EXTENSION, [], None)
+        if journal is not None:
+            journal_path, entries, self._journal_end = journal
+            if journal_path != path + JOURNAL_EXTENSION:
+                oma_format.replace_file(journal_path, path + JOURNAL_EXTENSION)
+            self._digests = self._get_digests(dataset)
+
+    def attach_undo_stack(self, undo_stack):
+        ''' Any change to the (QUndoStack) undo_stack marks the dataset dirty '''
+        QObject.connect(undo_stack, SIGNAL("indexChanged(int)"), self._undo_index_changed)
+        self._undo_stack = undo_stack
+        self._undo_index = undo_stack.index()
+        self._track_dirty = True
+
+    def _undo_index_changed(self, index):
+        self.dirty = True
+        # the commands between the old and the new index were done (pushed
+        # or redone) or undone
+        first, last = sorted((self._undo_index, index))
+        self._undo_index = index
+        if self._dirty_study_ids is None:
+            return
+        for i in range(first, last):
+            study_ids = getattr(self._undo_stack.command(i), "dirty_study_ids", None)
+            if study_ids is None:
+                self._dirty_study_ids = None
+                return
+            self._dirty_study_ids.update(study_ids)
+
+    def _get_digests(self, dataset):
+        return dict([(study.id, _study_digest(study)) for study in dataset.studies])
+
+    def save(self, dataset, state=None, force=False):
+        '''
+        Saves dataset (and the state dictionary); force marks the dataset
+        dirty (i.e., for changes that did not go through the undo stack).
+        Returns a dictionary with the number of bytes written, the number of
+        studies written and whether or not a full checkpoint was written.
+        '''
+        if self._digests is None:
+            return self.checkpoint(dataset, state)
+
+        if force or not self._track_dirty or self._dirty_study_ids is None:
+            digests = self._get_digests(dataset)
+            changed = [study for study in dataset.studies \
+                        if self._digests.get(study.id) != digests[study.id]]
+        elif self.dirty:
+            changed = [study for study in dataset.studies \
+                        if study.id in self._dirty_study_ids or not study.id in self._digests]
+            digests = dict([(study.id, self._digests.get(study.id)) for study in dataset.studies])
+            digests.update([(study.id, _study_digest(study)) for study in changed])
+        else:
+            digests, changed = self._digests, []
+
+        study_ids = [study.id for study in dataset.studies]
+        complete = len(set(study_ids)) != len(study_ids)
+        if complete:
+            # the study ids are not unique, so we can't merge by id
+            changed = dataset.studies
+
+        entry = _partial_dataset(dataset, changed)
+        entry_data = oma_format.dataset_to_string(entry, state)
+        payload = oma_format.encode_payload({"study_ids":study_ids, "complete":complete},
+                                            {"dataset":np.frombuffer(entry_data, dtype=np.uint8)})
+        self._lock.acquire()
+        try:
+            bytes_written = self._append(payload)
+        finally:
+            self._lock.release()
+
+        self._digests = digests
+        self.dirty = False
+        self._dirty_study_ids = set()
+        self._compact_if_necessary()
+        return {"bytes_written":bytes_written, "studies_written":len(changed), "checkpoint":False}
+
+    def _append(self, payload):
+        journal_path = self.path + JOURNAL_EXTENSION
+        if self._journal_end is None or not os.path.exists(journal_path):
+            self._start_journal(journal_path, _checkpoint_id(self.path))
+        f = open(journal_path, "r+b")
+        try:
+            # drop anything after the last complete entry
+            f.seek(self._journal_end)
+            f.truncate()
+            oma_format.write_block(f, JOURNAL_ENTRY, payload, compress=True)
+            f.flush()
+            os.fsync(f.fileno())
+            bytes_written = f.tell() - self._journal_end
+            self._journal_end = f.tell()
+        finally:
+            f.close()
+        return bytes_written
+
+    def _start_journal(self, journal_path, checkpoint_id, entries=""):
+        f = open(journal_path, "wb")
+        try:
+            f.write(JOURNAL_MAGIC)
+            oma_format.write_block(f, JOURNAL_HEADER, oma_format.encode_payload({"checkpoint":checkpoint_id}))
+            f.write(entries)
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_end = f.tell()
+        finally:
+            f.close()
+
+    def checkpoint(self, dataset, state=None):
+        ''' Writes out the full dataset and discards the journal '''
+        self.wait()
+        save_info = oma_format.save_dataset(dataset, self.path, state=state, append=False)
+        if os.path.exists(self.path + JOURNAL_EXTENSION):
+            os.remove(self.path + JOURNAL_EXTENSION)
+        self._journal_end = None
+        self._digests = self._get_digests(dataset)
+        self.dirty = False
+        self._dirty_study_ids = set()
+        return {"bytes_written":save_info["bytes_written"], "studies_written":len(dataset.studies),
+                "checkpoint":True}
+
+    ###
+    # compaction
+    def _compact_if_necessary(self):
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        checkpoint_size = os.path.getsize(self.path)
+        if self._journal_end > max(MIN_COMPACT_BYTES, COMPACT_RATIO * checkpoint_size):
+            self._compaction_thread = threading.Thread(target=self.compact)
+            self._compaction_thread.daemon = True
+            self._compaction_thread.start()
+
+    def wait(self):
+        ''' Waits for the background compaction (if any) to finish '''
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+            self._compaction_thread = None
+
+    def compact(self):
+        '''
+        Folds the journal into a new checkpoint. Entries that are appended
+        to the journal while we are at it are carried over into the new
+        journal. This only touches the files, so it is safe to call from
+        another thread.
+        '''
+        journal_path = self.path + JOURNAL_EXTENSION
+        self._lock.acquire()
+        try:
+            end = self._journal_end
+            checkpoint_id = _checkpoint_id(self.path)
+        finally:
+            self._lock.release()
+
+        journal = _read_journal(journal_path, checkpoint_id, end)
+        if journal is None:
+            return
+        entries, end = journal
+        dataset, state = _replay(self.path, entries)
+        tmp_path = self.path + ".compacted"
+        oma_format.save_dataset(dataset, tmp_path, state=state, append=False)
+        new_checkpoint_id = _checkpoint_id(tmp_path)
+
+        self._lock.acquire()
+        try:
+            f = open(journal_path, "rb")
+            try:
+                f.seek(end)
+                remaining_entries = f.read(self._journal_end - end)
+            finally:
+                f.close()
+            # the new journal is written first: if we crash before it is
+            # moved into place, _find_journal will still find it.
+            self._start_journal(journal_path + ".tmp", new_checkpoint_id, remaining_entries)
+            oma_format.replace_file(tmp_path, self.path)
+            oma_format.replace_file(journal_path + ".tmp", journal_path)
+        finally:
+            self._lock.release()
@@ -0,0 +1,96 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Logging.                                                                 #
+#                                                                           #
+#  Each module gets its own logger:                                         #
+#                                                                           #
+#     logger = oma_logging.get_logger(__name__)                             #
+#     ...                                                                   #
+#     logger.debug("Recalculating display scale for ma_unit %d", index)     #
+#                                                                           #
+#  Pass the arguments rather than formatting the message yourself: then     #
+#  nothing is formatted (nor written) unless the level is enabled. By       #
+#  default only warnings and errors are; the levels can be set per module   #
+#  with the log_levels setting or the OMA_LOG_LEVELS environment variable   #
+#  (which wins), e.g.,                                                      #
+#                                                                           #
+#     OMA_LOG_LEVELS="info,meta_py_r=debug,ma_data_table_view=debug"        #
+#                                                                           #
+#  where a level without a module name is the level for all of them.        #
+#                                                                           #
+#############################################################################
+
+import logging
+import os
+
+ROOT_LOGGER = "oma"
+ENV_VAR = "OMA_LOG_LEVELS"
+DEFAULT_LEVEL = logging.WARNING
+LOG_FORMAT = "%(levelname)s %(name)s: %(message)s"
+
+_handler = None
+
+def _install_handler():
+    global _handler
+    if _handler is not None:
+        return
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.addHandler(_handler)
+    root.setLevel(DEFAULT_LEVEL)
+    # ours are not for whoever configures the root logger
+    root.propagate = False
+    set_levels(os.environ.get(ENV_VAR, ""))
+
+def _logger_name(module_name):
+    if not module_name:
+        return ROOT_LOGGER
+    # (the same logger, whether the module was imported as part of a package
+    # or not)
+    return "%s.%s" % (ROOT_LOGGER, module_name.split(".")[-1])
+
+def get_logger(module_name):
+    ''' The logger for the module (pass it __name__) '''
+    _install_handler()
+    return logging.getLogger(_logger_name(module_name))
+
+def parse_levels(spec):
+    '''
+    Parses "level,module=level,..." (see the top of this module) into a
+    dictionary mapping module names (None for all of them) to levels;
+    unknown levels are ignored.
+    '''
+    levels = {}
+    for item in (spec or "").split(","):
+        module_name, sep, level_name = item.strip().rpartition("=")
+        level = logging.getLevelName(level_name.strip().upper())
+        if isinstance(level, int):
+            levels[module_name.strip() or None] = level
+    return levels
+
+def set_level(level, module_name=None):
+    ''' Sets the level of the module (of all of them, if no module is given) '''
+    _install_handler()
+    if isinstance(level, basestring):
+        level = logging.getLevelName(level.upper())
+    logging.getLogger(_logger_name(module_name)).setLevel(level)
+
+def set_levels(spec):
+    levels = parse_levels(spec)
+    # the overall level first, so that the module levels override it
+    if None in levels:
+        set_level(levels.pop(None))
+    for module_name, level in levels.items():
+        set_level(level, module_name)
+
+def configure(spec=None):
+    ''' Sets the levels given in spec (i.e., the setting), then those in OMA_LOG_LEVELS '''
+    _install_handler()
+    set_levels(spec)
+    set_levels(os.environ.get(ENV_VAR, ""))
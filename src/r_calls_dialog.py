@@ -0,0 +1,58 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  A debug panel showing the statistics of the calls made to R (see         #
+#  r_tracing); ctrl+shift+R in the main window.                             #
+#                                                                           #
+#############################################################################
+
+from PyQt4.Qt import *
+
+import r_tracing
+
+class RCallsDialog(QDialog):
+    def __init__(self, parent=None):
+        super(RCallsDialog, self).__init__(parent)
+        self.setWindowTitle("Calls to R")
+        self.resize(900, 600)
+
+        self.summary_text = QPlainTextEdit(self)
+        self.summary_text.setReadOnly(True)
+        self.summary_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        font = QFont("Courier")
+        font.setStyleHint(QFont.TypeWriter)
+        self.summary_text.setFont(font)
+
+        self.tracing_enabled = QCheckBox("trace calls", self)
+        self.tracing_enabled.setChecked(r_tracing.TRACER.enabled)
+        refresh_btn = QPushButton("Refresh", self)
+        reset_btn = QPushButton("Reset", self)
+        close_btn = QPushButton("Close", self)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.tracing_enabled)
+        buttons.addStretch()
+        buttons.addWidget(refresh_btn)
+        buttons.addWidget(reset_btn)
+        buttons.addWidget(close_btn)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_text)
+        layout.addLayout(buttons)
+
+        QObject.connect(self.tracing_enabled, SIGNAL("toggled(bool)"), r_tracing.set_enabled)
+        QObject.connect(refresh_btn, SIGNAL("clicked()"), self.refresh)
+        QObject.connect(reset_btn, SIGNAL("clicked()"), self.reset)
+        QObject.connect(close_btn, SIGNAL("clicked()"), self.accept)
+
+        self.refresh()
+
+    def refresh(self):
+        self.summary_text.setPlainText(QString(r_tracing.summary(n_recent=r_tracing.N_RECENT_CALLS)))
+
+    def reset(self):
+        r_tracing.reset()
+        self.refresh()
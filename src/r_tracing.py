@@ -0,0 +1,196 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Tracing of the calls we make to R.                                       #
+#                                                                           #
+#  meta_py_r records every call to R (how long it took, how big the R       #
+#  source or the data handed over was, whether it failed, and who made      #
+#  it) here. The calls are aggregated by caller, i.e., the function         #
+#  outside of meta_py_r that (indirectly) made the call along with the      #
+#  meta_py_r function it called, e.g.,                                      #
+#                                                                           #
+#     ma_data_table_model.update_outcome_if_possible > impute_cont_data     #
+#                                                                           #
+#  with a histogram of their latencies; the most recent calls are kept as   #
+#  well. See summary(), or hit ctrl+shift+R in the main window.             #
+#                                                                           #
+#############################################################################
+
+import collections
+import sys
+import threading
+import time
+
+# upper bounds (in ms) of the buckets of the latency histograms; the last
+# bucket holds everything slower than that
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+N_RECENT_CALLS = 200
+SNIPPET_LENGTH = 100
+
+class CallStats(object):
+    ''' Aggregate statistics of a number of calls '''
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_size = 0
+        self.histogram = [0]*(len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add(self, seconds, size, error):
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.total_size += size
+        ms = seconds*1000
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS_MS) and ms > HISTOGRAM_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.total_size += other.total_size
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {"count":self.count, "errors":self.errors, "total_time":self.total_time,
+                "mean_time":self.mean_time(), "max_time":self.max_time,
+                "total_size":self.total_size,
+                "histogram":zip([str(b) for b in HISTOGRAM_BUCKETS_MS] + ["inf"], self.histogram)}
+
+
+class RCallTracer(object):
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._stats = {}
+            # (time of the call, caller, seconds, size, error, snippet)
+            self._recent = collections.deque(maxlen=N_RECENT_CALLS)
+        finally:
+            self._lock.release()
+
+    def record(self, caller, seconds, size, error=False, snippet=None):
+        if not self.enabled:
+            return
+        self._lock.acquire()
+        try:
+            if caller not in self._stats:
+                self._stats[caller] = CallStats()
+            self._stats[caller].add(seconds, size, error)
+            if snippet is not None:
+                snippet = snippet[:SNIPPET_LENGTH]
+            self._recent.append((time.time(), caller, seconds, size, error, snippet))
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        ''' A dictionary mapping callers to (copies of) their CallStats '''
+        self._lock.acquire()
+        try:
+            stats = {}
+            for caller, caller_stats in self._stats.items():
+                stats[caller] = CallStats()
+                stats[caller].merge(caller_stats)
+            return stats
+        finally:
+            self._lock.release()
+
+    def totals(self):
+        totals = CallStats()
+        for caller_stats in self.stats().values():
+            totals.merge(caller_stats)
+        return totals
+
+    def recent_calls(self):
+        self._lock.acquire()
+        try:
+            return list(self._recent)
+        finally:
+            self._lock.release()
+
+    def summary(self, n_recent=20):
+        ''' A plain text summary of the calls so far '''
+        totals = self.totals()
+        lines = ["%d calls to R, %d failed; %.3fs in total" % \
+                    (totals.count, totals.errors, totals.total_time), ""]
+        lines.append("%-60s %7s %6s %9s %9s %9s %10s" % \
+                    ("caller", "calls", "errors", "total(s)", "mean(ms)", "max(ms)", "size"))
+        by_time = sorted(self.stats().items(), key=lambda item: -item[1].total_time)
+        for caller, caller_stats in by_time:
+            lines.append("%-60s %7d %6d %9.3f %9.2f %9.2f %10d" % \
+                    (caller[:60], caller_stats.count, caller_stats.errors,
+                     caller_stats.total_time, caller_stats.mean_time()*1000,
+                     caller_stats.max_time*1000, caller_stats.total_size))
+
+        lines.extend(["", "latency histogram (ms):"])
+        bounds = ["<=%s" % b for b in HISTOGRAM_BUCKETS_MS] + [">%s" % HISTOGRAM_BUCKETS_MS[-1]]
+        for bound, count in zip(bounds, totals.histogram):
+            lines.append("%8s %7d" % (bound, count))
+
+        lines.extend(["", "most recent calls:"])
+        for call_time, caller, seconds, size, error, snippet in self.recent_calls()[-n_recent:]:
+            lines.append("%s %9.2fms %8d %s %s: %s" % \
+                    (time.strftime("%H:%M:%S", time.localtime(call_time)), seconds*1000,
+                     size, "FAILED" if error else "ok", caller, (snippet or "").replace("\n", " ")))
+        return "\n".join(lines)
+
+
+def find_caller(module_name, skip=("_RfunctionCaller", "_NonBlockingRfunctionCaller")):
+    '''
+    Returns "<module>.<function> > <function>", where the latter is the
+    outermost function in module_name in the current call stack (not
+    counting the functions named in skip, i.e., decorators), and the former
+    is the function that called it.
+    '''
+    frame = sys._getframe(1)
+    inner = None
+    while frame is not None and frame.f_globals.get("__name__") == module_name:
+        if frame.f_code.co_name not in skip:
+            inner = frame.f_code.co_name
+        frame = frame.f_back
+    if frame is None:
+        outer = "?"
+    else:
+        outer = "%s.%s" % (frame.f_globals.get("__name__"), frame.f_code.co_name)
+    return outer if inner is None else "%s > %s" % (outer, inner)
+
+
+###
+# the tracer for this process
+TRACER = RCallTracer()
+
+def record(caller, seconds, size, error=False, snippet=None):
+    TRACER.record(caller, seconds, size, error=error, snippet=snippet)
+
+def get_stats():
+    ''' A dictionary mapping callers to dictionaries of their statistics '''
+    return dict([(caller, caller_stats.as_dict()) for caller, caller_stats in TRACER.stats().items()])
+
+def recent_calls():
+    return TRACER.recent_calls()
+
+def summary(n_recent=20):
+    return TRACER.summary(n_recent)
+
+def reset():
+    TRACER.reset()
+
+def set_enabled(enabled):
+    TRACER.enabled = enabled
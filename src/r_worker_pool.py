@@ -0,0 +1,220 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  A pool of R worker processes.                                            #
+#                                                                           #
+#  Each worker has its own (embedded) R, with metafor and openmetar         #
+#  loaded and the same working directory as the application, so the plots   #
+#  and plot data they write to r_tmp can be used as if they had been made   #
+#  in our own R. Independent analyses are farmed out to the workers and     #
+#  the (parsed) results are collected in the order in which they were       #
+#  submitted; each task seeds R's random number generator from its          #
+#  position, so results do not depend on which worker ran what, or when.    #
+#                                                                           #
+#  Diagnostic analyses over several metrics are split into the groups       #
+#  that openmetar analyzes together (Sens & Spec, NLR & PLR, and the rest   #
+#  one at a time); the results of the groups are merged into what the       #
+#  multiple.* R functions would have returned. Bootstraps are split into    #
+#  chunks of replicates, which are summarized in our own R, and subgroup    #
+#  meta-analyses into the fits of the subgroups, whose results are put      #
+#  together (with the overall result) in our own R.                         #
+#                                                                           #
+#############################################################################
+
+import multiprocessing
+import os
+import re
+
+DEFAULT_SEED = 1
+
+# metrics that openmetar analyzes (and plots) together, in the order in
+# which it does so
+PAIRED_METRICS = [("Sens", "Spec"), ("NLR", "PLR")]
+
+class RWorkerError(Exception):
+    pass
+
+###
+# worker side
+def init_worker(working_dir):
+    ''' Sets up an R worker process; also used by batch_runner '''
+    import meta_py_r
+    os.chdir(working_dir)
+    meta_py_r.execute_r_string("setwd('%s')" % working_dir.replace("\\", "/"))
+    rloader = meta_py_r.RlibLoader()
+    rloader.load_metafor()
+    rloader.load_openmetar()
+
+def _run_task(task):
+    '''
+    Runs an analysis task, a (seed, meta_py_r.RDataObject, meta_py_r function
+    name, args, keyword args) tuple, in this worker.
+    '''
+    import meta_py_r
+    seed, data, function_name, args, kw = task
+    try:
+        if seed is not None:
+            meta_py_r.execute_r_string("set.seed(%d)" % seed)
+        data.create()
+        return getattr(meta_py_r, function_name)(*args, **kw)
+    except Exception, e:
+        # R exceptions don't necessarily survive the trip back
+        raise RWorkerError("%s: %s" % (function_name, e))
+
+###
+# merging results
+def _split_references(references_str):
+    return [re.sub(r"^\d+\. ", "", line) for line in references_str.splitlines() if line.strip()]
+
+def merge_results(results_list):
+    '''
+    Merges the parsed results (see meta_py_r.parse_out_results) of several
+    analyses into one, in order. The values of (diagnostic) analyses are
+    keyed by metric; those of a metric that turns up in more than one of
+    the analyses are merged.
+    '''
+    if len(results_list) == 1:
+        return results_list[0]
+
+    merged = {"images":{}, "image_var_names":{}, "texts":{},
+              "image_params_paths":{}, "image_order":None, "values":{}}
+    references = []
+    for results in results_list:
+        for key in ("images", "image_var_names", "image_params_paths"):
+            merged[key].update(results[key])
+        for name, values in results.get("values", {}).items():
+            if isinstance(values, dict) and isinstance(merged["values"].get(name), dict):
+                merged["values"][name].update(values)
+            else:
+                merged["values"][name] = values
+        for text_n, text in results["texts"].items():
+            if text_n == "References":
+                references.extend([ref for ref in _split_references(text) if ref not in references])
+            else:
+                merged["texts"][text_n] = text
+        if results["image_order"] is not None:
+            merged["image_order"] = (merged["image_order"] or []) + results["image_order"]
+
+    if references:
+        merged["texts"]["References"] = "".join(["%s. %s\n" % (i+1, ref) for i, ref in \
+                                                    enumerate(sorted(references))])
+    return merged
+
+def diagnostic_groups(method_names, list_of_params):
+    '''
+    Splits the (diagnostic) methods and parameters into the groups of
+    metrics that are analyzed together; returns a list of (method names,
+    list of params) tuples.
+    '''
+    metrics = [params["measure"] for params in list_of_params]
+    groups, grouped = [], set()
+    for pair in PAIRED_METRICS:
+        if all([metric in metrics for metric in pair]):
+            indices = [metrics.index(metric) for metric in pair]
+            groups.append(indices)
+            grouped.update(indices)
+    groups.extend([[i] for i in range(len(metrics)) if i not in grouped])
+    return [([method_names[i] for i in indices], [list_of_params[i] for i in indices]) \
+                for indices in groups]
+
+
+class RWorkerPool(object):
+    '''
+    A pool of n_workers R processes (by default, one per core); they are
+    started the first time they are needed.
+
+        pool = RWorkerPool(4)
+        results = pool.run_diagnostic_multi(data, method_names, list_of_params)
+        ...
+        pool.close()
+
+    where data is the meta_py_r.RDataObject for the data object (named
+    tmp_obj) to be analyzed, e.g., as returned by
+    meta_py_r.ma_dataset_to_simple_diagnostic_robj(model, execute=False).
+    '''
+    def __init__(self, n_workers=None, working_dir=None):
+        if not n_workers:
+            n_workers = multiprocessing.cpu_count()
+        self.n_workers = n_workers
+        self.working_dir = working_dir or os.getcwd()
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.n_workers, init_worker, (self.working_dir,))
+        return self._pool
+
+    def map(self, tasks, seed=DEFAULT_SEED):
+        '''
+        Runs the tasks, (RDataObject, meta_py_r function name, args, kw)
+        tuples, and returns their results in order. The i-th task is run with
+        R's random seed set to seed + i (or not set at all, if seed is None).
+        '''
+        return self._get_pool().map(_run_task, self._seeded(tasks, seed), chunksize=1)
+
+    def imap(self, tasks, seed=DEFAULT_SEED):
+        ''' Like map, but yields the results (in order) as they come in '''
+        return self._get_pool().imap(_run_task, self._seeded(tasks, seed), chunksize=1)
+
+    def _seeded(self, tasks, seed):
+        return [(None if seed is None else seed + i,) + tuple(task) for i, task in enumerate(tasks)]
+
+    def run_diagnostic_multi(self, data, method_names, list_of_params, seed=DEFAULT_SEED):
+        ''' Like meta_py_r.run_diagnostic_multi, but with the metric groups run in parallel '''
+        tasks = [(data, "run_diagnostic_multi", (group_methods, group_params), {}) \
+                    for group_methods, group_params in diagnostic_groups(method_names, list_of_params)]
+        return merge_results(self.map(tasks, seed=seed))
+
+    def run_meta_method_diag(self, data, meta_function_name, method_names,
+                             list_of_params, seed=DEFAULT_SEED):
+        ''' Like meta_py_r.run_meta_method_diag, with the metric groups run in parallel '''
+        tasks = [(data, "run_meta_method_diag", (meta_function_name, group_methods, group_params), {}) \
+                    for group_methods, group_params in diagnostic_groups(method_names, list_of_params)]
+        return merge_results(self.map(tasks, seed=seed))
+
+    def run_bootstrap(self, data, function_name, params, **kw):
+        '''
+        Like meta_py_r.run_bootstrap, with the chunks of replicates run in
+        parallel (the results are summarized in our R, which must hold the
+        data, too). If it is cancelled, the chunks still running are
+        abandoned: the workers are stopped (and restarted when next needed).
+        '''
+        import meta_py_r
+        try:
+            return meta_py_r.run_bootstrap(function_name, params, data=data, imap_f=self.imap, **kw)
+        except meta_py_r.Cancelled:
+            self.terminate()
+            raise
+
+    def run_subgroup_ma(self, data, meta_function_name, function_name, params, seed=DEFAULT_SEED):
+        '''
+        Like meta_py_r.run_meta_method for a (binary or continuous) subgroup
+        meta-analysis, with the subgroups fit in parallel; our R must hold
+        the data, too. Methods whose subgroup results are computed in closed
+        form are run in our R only.
+        '''
+        import meta_py_r
+        indices = meta_py_r.subgroup_fit_indices(function_name, params, data_name=data.var_name)
+        tasks = [(data, "run_subgroup_fits", (function_name, params, [i]), {"data_name":data.var_name}) \
+                    for i in indices]
+        subgroup_fits = self.map(tasks, seed=seed) if tasks else None
+        return meta_py_r.run_subgroup_ma(meta_function_name, function_name, params,
+                                         subgroup_fits, data_name=data.var_name)
+
+    def close(self):
+        ''' Waits for the workers to finish their tasks, then stops them '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        ''' Stops the workers right away '''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -17,6 +17,7 @@ import sys
 import ui_results_window
 import edit_forest_plot_form
 import meta_py_r
+import r_tracing
 #import shutil
 
 PageSize = (612, 792)
@@ -28,6 +29,12 @@ SCALE_P = .5 # percent images are to be scaled
 # require to re-generate them (and we invoke a different method!)
 SIDE_BY_SIDE_FOREST_PLOTS = ("NLR and PLR Forest Plot", "Sensitivity and Specificity", "Cumulative Forest Plot")
 ROW_HEIGHT = 15 # by trial-and-error; seems to work very well
+# typed into the console, shows the statistics of the calls to R (and
+# followed by 'reset', resets them)
+R_CALLS_COMMAND = ":r-calls"
+# typed into the console, shows the numeric results of the analysis (or,
+# followed by a name, e.g. a diagnostic metric, just those under it)
+VALUES_COMMAND = ":values"
 
 class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
 
@@ -82,6 +89,8 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
         self.set_psuedo_console_text()
         self.items_to_coords = {}
         self.texts = results["texts"]
+        # the numeric results (estimates, CIs, tau2, weights, ...)
+        self.values = results.get("values", {})
 
 
         # first add the text to self.scene
@@ -109,7 +118,8 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
 
     def set_psuedo_console_text(self):
         text = ["\t\tOpenMeta(analyst)",
-               "This is a pipe to the R console. The image names are as follows:"]
+               "This is a pipe to the R console (type %s for statistics of the calls to R, %s for the numeric results)." % (R_CALLS_COMMAND, VALUES_COMMAND),
+               "The image names are as follows:"]
         if self.image_var_names is not None:
             for image_var_name in self.image_var_names.values():
                 text.append(image_var_name)
@@ -284,12 +294,33 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
         return (txt_item.boundingRect(), position)
 
     def process_console_input(self):
-        res = str(meta_py_r.execute_r_string(self.current_line()))
+        line = self.current_line()
+        if line.startswith(R_CALLS_COMMAND):
+            # not R; statistics of the calls we've made to R (see r_tracing)
+            if line[len(R_CALLS_COMMAND):].strip() == "reset":
+                r_tracing.reset()
+            res = r_tracing.summary()
+        elif line.startswith(VALUES_COMMAND):
+            res = self.values_str(line[len(VALUES_COMMAND):].strip())
+        else:
+            try:
+                res = str(meta_py_r.execute_r_string_from_gui(line))
+            except meta_py_r.RBusy, e:
+                res = str(e)
 
         # echo the result
         self.psuedo_console.append(QString(res))
         self.psuedo_console.append(">> ")
 
+    def values_str(self, name=""):
+        ''' The numeric results (see meta_py_r._result_values), one per line '''
+        values = self.values
+        if name:
+            if not isinstance(values.get(name), dict):
+                return "no values for %s" % name
+            values = values[name]
+        return "\n".join(["%s: %s" % (key, values[key]) for key in sorted(values.keys())])
+
     def current_line(self):
         last_line = self.psuedo_console.toPlainText().split("\n")[-1]
         return str(last_line.replace(">>", "")).strip()
@@ -400,11 +431,6 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
             raise Exception("Invalid format, needs to be either pdf or png!")
         
         if not unscaled_image:
-            # note that the params object will, by convention,
-            # have the (generic) name 'plot.data' -- after this
-            # call, this object will be in the namespace
-            meta_py_r.load_in_R("%s.plotdata" % params_path)
-    
             default_path = {"forest":"forest_plot.pdf",
                             "regression":"regression.pdf"}[plot_type]
     
@@ -415,15 +441,24 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
     
             # now we re-generate it, unless they canceled, of course
             if file_path != "":
-                if plot_type == "forest":
-                    if self._is_side_by_side_fp(title):
-                        meta_py_r.generate_forest_plot(file_path, side_by_side=True)
-                    else:
-                        meta_py_r.generate_forest_plot(file_path)
-                elif plot_type == "regression":
-                    meta_py_r.generate_reg_plot(file_path)
-                else:
-                    print "sorry -- I don't know how to draw %s plots!" % plot_type
+                try:
+                    # (in one go, so that a queued analysis can't get at R in between)
+                    with meta_py_r.R_if_available():
+                        # note that the params object will, by convention,
+                        # have the (generic) name 'plot.data' -- after this
+                        # call, this object will be in the namespace
+                        meta_py_r.load_in_R("%s.plotdata" % params_path)
+                        if plot_type == "forest":
+                            if self._is_side_by_side_fp(title):
+                                meta_py_r.generate_forest_plot(file_path, side_by_side=True)
+                            else:
+                                meta_py_r.generate_forest_plot(file_path)
+                        elif plot_type == "regression":
+                            meta_py_r.generate_reg_plot(file_path)
+                        else:
+                            print "sorry -- I don't know how to draw %s plots!" % plot_type
+                except meta_py_r.RBusy, e:
+                    QMessageBox.information(self, "R is busy", str(e))
         else: # case where we just have the png and can't regenerate the pdf from plot data
             default_path = '.'.join([title.replace(' ','_'),"png"])
             file_path = unicode(QFileDialog.getSaveFileName(self, "OpenMeta[Analyst] -- save plot as", QString(default_path)))
@@ -431,9 +466,13 @@ class ResultsWindow(QMainWindow, ui_results_window.Ui_ResultsWindow):
             
 
     def edit_image(self, params_path, title, png_path, pixmap_item):
-        plot_editor_window = edit_forest_plot_form.EditPlotWindow(\
+        try:
+            plot_editor_window = edit_forest_plot_form.EditPlotWindow(\
                                             params_path, png_path,\
                                             pixmap_item, parent=self)
+        except meta_py_r.RBusy, e:
+            QMessageBox.information(self, "R is busy", str(e))
+            return
         if plot_editor_window is not None:
             plot_editor_window.show()
         else:
@@ -0,0 +1,116 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Conversion between the calculation and display scales of the metrics.   #
+#                                                                           #
+#  This is a Python table of the transformations defined by               #
+#  binary.transform.f, continuous.transform.f and diagnostic.transform.f   #
+#  in openmetar, so that converting (e.g., when repainting or sorting the  #
+#  spreadsheet) does not require calling out to R. The conversions work    #
+#  on whole arrays of values for one metric at a time.                     #
+#                                                                           #
+#############################################################################
+
+import numpy as np
+
+DISPLAY_SCALE = "display.scale"
+CALC_SCALE = "calc.scale"
+
+def _logit(x):
+    return np.log(x/(1-x))
+
+def _invlogit(x):
+    return np.exp(x)/(1+np.exp(x))
+
+def _arcsine_sqrt(x):
+    return np.arcsin(np.sqrt(x))
+
+def _invarcsine_sqrt(x):
+    return np.sin(x)**2
+
+def _identity(x):
+    return x
+
+def _pft(x, ni):
+    ''' metafor's transf.pft; x is a proportion '''
+    xi = x*ni
+    return 0.5*(np.arcsin(np.sqrt(xi/(ni+1))) + np.arcsin(np.sqrt((xi+1)/(ni+1))))
+
+def _ipft(x, ni):
+    ''' metafor's transf.ipft (and transf.ipft.hm, for a single value) '''
+    zi = 0.5*(1 - np.sign(np.cos(2*x)) * \
+                np.sqrt(1 - (np.sin(2*x) + (np.sin(2*x) - 1/np.sin(2*x))/ni)**2))
+    zi = np.where(x > _pft(1.0, ni), 1.0, zi)
+    zi = np.where(x < _pft(0.0, ni), 0.0, zi)
+    # the comparisons above are False for missing n; keep these missing
+    return np.where(np.isnan(ni), np.nan, zi)
+
+# (display scale, calculation scale) functions, mirroring the
+# <data type>.transform.f functions on the R side.
+_LOG = (np.exp, np.log)
+_LOGIT = (_invlogit, _logit)
+_ARCSINE = (_invarcsine_sqrt, _arcsine_sqrt)
+_FREEMAN_TUKEY = (_ipft, _pft)
+_IDENTITY = (_identity, _identity)
+
+TRANSFORMS = {
+    "binary": {"OR":_LOG, "RR":_LOG, "PLN":_LOG,
+               "PLO":_LOGIT,
+               "PAS":_ARCSINE,
+               "PFT":_FREEMAN_TUKEY},
+    # all continuous metrics are on the identity scale
+    "continuous": {},
+    "diagnostic": {"PLR":_LOG, "NLR":_LOG, "DOR":_LOG,
+                   "Sens":_LOGIT, "Spec":_LOGIT, "PPV":_LOGIT, "NPV":_LOGIT, "Acc":_LOGIT},
+}
+
+# metrics whose transformations require the group size(s)
+NEEDS_N = ["PFT"]
+
+def _to_float_array(values):
+    if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+        # already converted (e.g., a whole column); NaN is missing
+        return values.astype(float)
+    return np.array([np.nan if x in (None, "") else float(x) for x in values], dtype=float)
+
+def convert_scale(values, metric_name, data_type, convert_to=DISPLAY_SCALE, n1=None):
+    '''
+    Converts an array (or list) of values for the given metric between
+    the calculation and display scales; returns an array of floats, with
+    NaN where a value (or the corresponding n1, for PFT) is missing.
+
+    data_type is one of 'binary', 'continuous' or 'diagnostic', as for
+    the transform.f functions in R; convert_to is either 'display.scale'
+    or 'calc.scale'. n1 (a scalar or an array of the same length as
+    values) is only used for the Freeman-Tukey (PFT) metric.
+    '''
+    if data_type not in TRANSFORMS:
+        raise ValueError("unknown data type: %s" % data_type)
+    if convert_to not in (DISPLAY_SCALE, CALC_SCALE):
+        raise ValueError("convert_to must be '%s' or '%s'" % (DISPLAY_SCALE, CALC_SCALE))
+
+    x = _to_float_array(values)
+    display_f, calc_f = TRANSFORMS[data_type].get(metric_name, _IDENTITY)
+    f = display_f if convert_to == DISPLAY_SCALE else calc_f
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if metric_name in NEEDS_N and data_type == "binary":
+            if n1 is None or np.isscalar(n1) or isinstance(n1, basestring):
+                n1 = [n1]*len(x)
+            return f(x, _to_float_array(n1))
+        return f(x)
+
+def convert_value(x, metric_name, data_type, convert_to=DISPLAY_SCALE, n1=None):
+    '''
+    Scalar version of convert_scale; returns None if x is missing (or
+    cannot be converted).
+    '''
+    if x is None or x == "":
+        return None
+    converted = convert_scale([x], metric_name, data_type, convert_to, n1)[0]
+    if np.isnan(converted):
+        return None
+    return float(converted)
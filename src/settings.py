@@ -12,6 +12,7 @@ import os
 from PyQt4 import QtCore, QtGui
 from PyQt4.Qt import *
 import meta_py_r
+import startup_profiler
 
 ##################### HANDLE SETTINGS #####################
 
@@ -20,6 +21,9 @@ DEFAULT_SETTINGS = {"splash":True,
                     "digits":3,
                     "recent_files":[],
                     "explain_diag":True,
+                    "r_workers":0, # R worker processes; 0 = one per core, 1 = none
+                    "quick_start":True, # show the main window before loading R
+                    "log_levels":"", # e.g., "info,meta_py_r=debug"; see oma_logging
                     #"method_params":{},
                     }
 
@@ -179,10 +183,13 @@ def setup_directories():
     base_path = make_base_path()
     make_r_tmp()
     
-    meta_py_r.reset_Rs_working_dir() # set working directory on R side
+    if meta_py_r.R_is_running():
+        meta_py_r.reset_Rs_working_dir() # set working directory on R side
+    # (otherwise R will start out in the working directory we set here)
     os.chdir(os.path.normpath(base_path)) # set working directory on python side
     
-    clear_r_tmp() # clear r_tmp
+    with startup_profiler.span("clear r_tmp"):
+        clear_r_tmp() # clear r_tmp
     
     
 def make_base_path():
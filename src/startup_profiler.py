@@ -0,0 +1,213 @@
+#############################################################################
+#                                                                           #
+#  Byron C. Wallace                                                         #
+#  George Dietz                                                             #
+#  CEBM @ Brown                                                             #
+#  OpenMeta[analyst]                                                        #
+#                                                                           #
+#  Startup profiling.                                                       #
+#                                                                           #
+#  The phases of starting up (settings, r_tmp, starting R, loading each R   #
+#  library, creating and painting the main window, ...) are timed as        #
+#  (nested) spans:                                                          #
+#                                                                           #
+#     with startup_profiler.span("clear r_tmp"):                            #
+#         clear_r_tmp()                                                     #
+#                                                                           #
+#  The top-level spans are always recorded, and appended to                 #
+#  startup_timings.log (see finish). If a report is requested, by           #
+#  setting OMA_STARTUP_PROFILE to a path or by launching with               #
+#  --profile-startup <path>, the import of each python module is timed as   #
+#  well, and a report is written to <path> (Chrome trace event JSON, which  #
+#  chrome://tracing and speedscope read) and to <path>.folded (collapsed    #
+#  stacks in microseconds, for flamegraph.pl).                              #
+#                                                                           #
+#############################################################################
+
+import __builtin__
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = "OMA_STARTUP_PROFILE"
+CLI_FLAG = "--profile-startup"
+
+# how long each (top-level) phase of starting up took is appended to this
+# file, one JSON record per start, so that we can keep track of it
+TIMINGS_FILE_NAME = "startup_timings.log"
+
+
+class StartupProfiler(object):
+    ''' Records (nested) spans; see the top of this module '''
+    def __init__(self):
+        self.start_time = time.time()
+        # finished spans: (name, start, duration, thread name, stack)
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._original_import = None
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, name):
+        self._stack().append((name, time.time()))
+
+    def end(self):
+        stack = self._stack()
+        path = tuple([name for name, start in stack])
+        name, start = stack.pop()
+        span = (name, start - self.start_time, time.time() - start,
+                threading.current_thread().name, path)
+        self._lock.acquire()
+        try:
+            self.spans.append(span)
+        finally:
+            self._lock.release()
+
+    def timed(self, name, f, *args, **kw):
+        ''' Calls f, timing it as the span name; returns what f returns '''
+        self.begin(name)
+        try:
+            return f(*args, **kw)
+        finally:
+            self.end()
+
+    def top_level_spans(self):
+        return [(name, duration) for name, start, duration, thread, path in self.spans \
+                    if len(path) == 1]
+
+    ###
+    # imports
+    def profile_imports(self):
+        ''' Times the (first) import of every module from now on '''
+        if self._original_import is not None:
+            return
+        self._original_import = original_import = __builtin__.__import__
+        profiler = self
+        def _timed_import(name, *args, **kw):
+            if name in sys.modules:
+                return original_import(name, *args, **kw)
+            return profiler.timed("import %s" % name, original_import, name, *args, **kw)
+        __builtin__.__import__ = _timed_import
+
+    def stop_profiling_imports(self):
+        if self._original_import is not None:
+            __builtin__.__import__ = self._original_import
+            self._original_import = None
+
+    ###
+    # reports
+    def trace_events(self):
+        ''' The spans as Chrome trace events '''
+        thread_ids = {}
+        events = []
+        for name, start, duration, thread, path in self.spans:
+            events.append({"name":name, "ph":"X", "pid":os.getpid(),
+                           "tid":thread_ids.setdefault(thread, len(thread_ids)),
+                           "ts":int(start*1e6), "dur":int(duration*1e6),
+                           "args":{"thread":thread}})
+        return {"traceEvents":events, "displayTimeUnit":"ms"}
+
+    def folded_stacks(self):
+        '''
+        The spans as collapsed stacks ("a;b;c <microseconds>"), where each
+        span only counts the time not spent in the spans nested in it
+        '''
+        self_times = {}
+        for name, start, duration, thread, path in self.spans:
+            self_times[path] = self_times.get(path, 0) + duration
+            if len(path) > 1:
+                self_times[path[:-1]] = self_times.get(path[:-1], 0) - duration
+        return ["%s %d" % (";".join(path), max(0, int(t*1e6))) \
+                    for path, t in sorted(self_times.items())]
+
+    def write_report(self, path):
+        f = open(path, "w")
+        try:
+            json.dump(self.trace_events(), f, indent=1)
+        finally:
+            f.close()
+        f = open(path + ".folded", "w")
+        try:
+            f.write("\n".join(self.folded_stacks()) + "\n")
+        finally:
+            f.close()
+        _get_logger().info("wrote the startup profile to %s", path)
+
+
+def _get_logger():
+    # (imported here, so that importing this module doesn't import any of
+    # ours before start is called)
+    import oma_logging
+    return oma_logging.get_logger(__name__)
+
+###
+# the profiler for this process
+PROFILER = StartupProfiler()
+_report_path = None
+
+class span(object):
+    ''' with span(name): ... times the block as a span '''
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        PROFILER.begin(self.name)
+    def __exit__(self, *exc_info):
+        PROFILER.end()
+        return False
+
+def timed(name, f, *args, **kw):
+    return PROFILER.timed(name, f, *args, **kw)
+
+def start(argv=None):
+    '''
+    Resets the clock; if a report was requested (see the top of this module)
+    module imports are timed as well. The CLI flag (and its argument) are
+    removed from argv. Call this before importing anything else.
+    '''
+    global _report_path
+    PROFILER.start_time = time.time()
+    _report_path = os.environ.get(ENV_VAR) or None
+    if argv is not None and CLI_FLAG in argv:
+        i = argv.index(CLI_FLAG)
+        _report_path = argv[i+1] if i+1 < len(argv) else "startup_profile.json"
+        del argv[i:i+2]
+    if _report_path is not None:
+        _report_path = os.path.abspath(_report_path)
+        PROFILER.profile_imports()
+
+def finish(timings_dir, **info):
+    '''
+    Called once we're done starting up: appends the top-level spans (and
+    info) to the timings log in timings_dir and writes the report, if one
+    was requested.
+    '''
+    PROFILER.stop_profiling_imports()
+    # (imported here, so that importing this module doesn't import any of
+    # ours before start is called)
+    import meta_globals
+    record = {"version":meta_globals.VERSION,
+              "started":time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(PROFILER.start_time)),
+              "phases":PROFILER.top_level_spans(),
+              "total":time.time() - PROFILER.start_time}
+    record.update(info)
+    _get_logger().info("startup timings: %s", record)
+    try:
+        f = open(os.path.join(timings_dir, TIMINGS_FILE_NAME), "a")
+        try:
+            f.write(json.dumps(record) + "\n")
+        finally:
+            f.close()
+    except IOError, e:
+        _get_logger().warning("couldn't write the startup timings: %s", e)
+
+    if _report_path is not None:
+        try:
+            PROFILER.write_report(_report_path)
+        except IOError, e:
+            _get_logger().warning("couldn't write the startup profile: %s", e)
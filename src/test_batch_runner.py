@@ -0,0 +1,107 @@
+####################################
+#                                  #
+# unit tests for reading specs,    #
+#  importing CSVs and writing      #
+#  results in the batch runner     #
+#                                  #
+####################################
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import nose
+from nose import tools
+import numpy as np
+
+import batch_runner
+import main_wizard
+
+_SPEC = {"method":"binary.random", "meta_f_str":"None",
+         "parameters":{"measure":"OR", "conf.level":95.0}}
+
+class TestLoadSpecs:
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, text):
+        path = os.path.join(self.tmp_dir, "specs.txt")
+        f = open(path, "w")
+        f.write(text)
+        f.close()
+        return path
+
+    def test_single_json_spec(self):
+        specs = batch_runner.load_specs(self._write(json.dumps(_SPEC)))
+        tools.assert_equal(len(specs), 1)
+        tools.assert_equal(specs[0]["method"], "binary.random")
+        tools.assert_equal(specs[0]["meta_f_str"], None)
+        tools.assert_equal(specs[0]["name"], "analysis_1")
+
+    def test_json_list_keeps_names(self):
+        named = dict(_SPEC, name="cumulative", meta_f_str="cum.ma.binary")
+        specs = batch_runner.load_specs(self._write(json.dumps([_SPEC, named])))
+        tools.assert_equal([spec["name"] for spec in specs], ["analysis_1", "cumulative"])
+        tools.assert_equal(specs[1]["meta_f_str"], "cum.ma.binary")
+
+    def test_method_and_params_records(self):
+        record = dict(_SPEC, results={"Summary":"..."})
+        text = "method_and_params = []\n%s%r)\n%s%r)\n" % (
+                    batch_runner.SPEC_FILE_RECORD, record,
+                    batch_runner.SPEC_FILE_RECORD, _SPEC)
+        specs = batch_runner.load_specs(self._write(text))
+        tools.assert_equal(len(specs), 2)
+        tools.assert_false("results" in specs[0])
+        tools.assert_equal(specs[0]["parameters"], _SPEC["parameters"])
+        tools.assert_equal(specs[1]["name"], "analysis_2")
+
+def test_jsonable():
+    value = {"est":np.float64(0.5), "k":np.int32(3), "lb":float("nan"),
+             "weights":np.array([0.25, np.nan]), "ci":(np.float32(1.5), 2)}
+    converted = batch_runner._jsonable(value)
+    tools.assert_equal(converted, {"est":0.5, "k":3, "lb":None,
+                                   "weights":[0.25, None], "ci":[1.5, 2]})
+    # plain python types only, so it must serialize
+    json.dumps(converted)
+
+def test_output_dir_names():
+    names = batch_runner._output_dir_names(["a/trial.oma", "b/trial.oma", "a/other.csv"])
+    tools.assert_equal(names, ["a_trial", "b_trial", "other"])
+
+    names = batch_runner._output_dir_names(["a/trial.oma", "a/trial.csv", "a_trial_1.csv"])
+    tools.assert_equal(len(set(names)), 3)
+    tools.assert_equal(names[2], "a_trial_1")
+    tools.assert_true(names[0].startswith("a_trial_"))
+
+def test_import_csv():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        headers = main_wizard.get_required_header_labels("binary", None, "OR")
+        n_outcome_cols = len(headers) - 6 # name, year, 4 raw data columns
+        rows = [["Smith", "1999", "10", "100", "20", "100"] + [""]*n_outcome_cols + ["1.5"],
+                ["Jones", "2004", "5", "50", "8", "60"] + [""]*n_outcome_cols + ["2.5"]]
+        path = os.path.join(tmp_dir, "trial.csv")
+        f = open(path, "w")
+        f.write("\n".join([",".join(headers + ["dose"])] + [",".join(row) for row in rows]))
+        f.close()
+
+        csv_options = argparse.Namespace(data_type="binary", sub_type=None, effect="OR",
+                        outcome_name=None, has_headers=True, from_excel=False,
+                        delimiter=",", quotechar='"')
+        model = batch_runner.import_csv(path, csv_options)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    tools.assert_equal(model.current_outcome, "trial")
+    tools.assert_equal(model.dataset.get_outcome_names(), ["trial"])
+    studies = [study for study in model.dataset.studies if study.name != ""]
+    tools.assert_equal([study.name for study in studies], ["Smith", "Jones"])
+    tools.assert_equal([study.covariate_dict["dose"] for study in studies], [1.5, 2.5])
+
+if __name__ == "__main__":
+    nose.main()
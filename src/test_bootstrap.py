@@ -0,0 +1,136 @@
+####################################
+#                                  #
+# unit tests for running           #
+#  bootstraps in seeded chunks,    #
+#  with R stubbed out              #
+#                                  #
+####################################
+
+import tempfile
+
+import nose
+from nose import tools
+import numpy as np
+
+import analysis_runner
+import meta_py_r
+import r_worker_pool
+
+_PARAMS = {"num.bootstrap.replicates":601, "conf.level":95.0}
+
+# what 'R' has been told (also in the workers, which are forked once the
+# stubs are in place)
+_r_state = {}
+
+class _Data(object):
+    var_name = "tmp_obj"
+    def create(self):
+        pass
+
+def _init_worker(working_dir):
+    pass
+
+def _execute_r_string(r_str):
+    if r_str.startswith("set.seed("):
+        _r_state["seed"] = int(r_str[len("set.seed("):-1])
+    return r_str
+
+def _run_bootstrap_replicates(function_name, params, n_replicates, data_name="tmp_obj"):
+    # the replicates depend only on the seed, as they do in R
+    t = np.random.RandomState(_r_state["seed"]).normal(size=(n_replicates, 2))
+    return {"t0":np.array([0.0, 1.0]), "t":t, "extra.attempts":0}
+
+def _assign_in_r(var_name, make_r_obj, size=1):
+    _r_state[var_name] = make_r_obj()
+
+_STUBS = [(meta_py_r, "execute_r_string", _execute_r_string),
+          (meta_py_r, "run_bootstrap_replicates", _run_bootstrap_replicates),
+          (meta_py_r, "assign_in_r", _assign_in_r),
+          (meta_py_r, "_bootstrap_replicates_robj", lambda chunks: chunks),
+          (meta_py_r, "r_data_frame_str", lambda data_dict: "params"),
+          (meta_py_r, "parse_out_results", lambda result: _r_state["boot.replicates"]),
+          (meta_py_r, "ma_dataset_to_simple_binary_robj", lambda model, execute=True: _Data()),
+          (r_worker_pool, "init_worker", _init_worker)]
+
+class TestBootstrap:
+    def setUp(self):
+        self.originals = [(module, name, getattr(module, name)) for module, name, stub in _STUBS]
+        for module, name, stub in _STUBS:
+            setattr(module, name, stub)
+        _r_state.clear()
+
+    def tearDown(self):
+        for module, name, original in self.originals:
+            setattr(module, name, original)
+
+    def _replicates(self, chunks):
+        return np.vstack([chunk["t"] for chunk in chunks])
+
+    def test_chunk_sizes(self):
+        tools.assert_equal(meta_py_r.bootstrap_chunk_sizes(1000, 250), [250]*4)
+        tools.assert_equal(meta_py_r.bootstrap_chunk_sizes(601, 250), [250, 250, 101])
+        tools.assert_equal(meta_py_r.bootstrap_chunk_sizes(100, 250), [100])
+        tools.assert_equal(meta_py_r.bootstrap_chunk_sizes(0, 250), [])
+
+    def test_replicates_depend_only_on_the_seed(self):
+        progress = []
+        chunks = meta_py_r.run_bootstrap("binary.random", _PARAMS, seed=7, chunk_size=250,
+                                         progress_f=lambda done, total: progress.append((done, total)))
+        tools.assert_equal([len(chunk["t"]) for chunk in chunks], [250, 250, 101])
+        tools.assert_equal(progress, [(250, 601), (500, 601), (601, 601)])
+        replicates = self._replicates(chunks)
+
+        for n_workers in (1, 3):
+            pool = r_worker_pool.RWorkerPool(n_workers, working_dir=tempfile.gettempdir())
+            try:
+                pool_chunks = pool.run_bootstrap(_Data(), "binary.random", _PARAMS, seed=7, chunk_size=250)
+            finally:
+                pool.close()
+            np.testing.assert_array_equal(self._replicates(pool_chunks), replicates)
+
+        other_chunks = meta_py_r.run_bootstrap("binary.random", _PARAMS, seed=8, chunk_size=250)
+        tools.assert_false(np.array_equal(self._replicates(other_chunks), replicates))
+
+    def test_cancel(self):
+        progress = []
+        def is_cancelled():
+            return len(progress) == 2
+        tools.assert_raises(meta_py_r.Cancelled, meta_py_r.run_bootstrap, "binary.random", _PARAMS,
+                            chunk_size=250, is_cancelled=is_cancelled,
+                            progress_f=lambda done, total: progress.append(done))
+        tools.assert_equal(progress, [250, 500])
+        # nothing was summarized
+        tools.assert_false("boot.replicates" in _r_state)
+
+    def test_cancel_pool(self):
+        pool = r_worker_pool.RWorkerPool(2, working_dir=tempfile.gettempdir())
+        try:
+            tools.assert_raises(meta_py_r.Cancelled, pool.run_bootstrap, _Data(), "binary.random",
+                                _PARAMS, chunk_size=100, is_cancelled=lambda: True)
+            # the workers were stopped, rather than left to finish the chunks
+            tools.assert_equal(pool._pool, None)
+        finally:
+            pool.close()
+
+    def test_bootstrap_job(self):
+        job = analysis_runner.make_bootstrap_job(None, "binary", "binary.random", _PARAMS)
+        labels = []
+        chunks = job.run(lambda done, total, label: labels.append(label))
+        tools.assert_equal(len(self._replicates(chunks)), 601)
+        tools.assert_true("bootstrap (binary.random): 601 of 601 replicates" in labels)
+
+        # cancelled between chunks
+        job = analysis_runner.make_bootstrap_job(None, "binary", "binary.random", _PARAMS)
+        def report_progress(done, total, label):
+            labels.append(label)
+            if label.endswith("250 of 601 replicates"):
+                job.cancel()
+        del labels[:]
+        tools.assert_raises(meta_py_r.Cancelled, job.run, report_progress)
+        tools.assert_false(any([label.endswith("500 of 601 replicates") for label in labels]))
+
+    def test_job_without_data(self):
+        # is made, but fails when it is run (i.e., on the runner's thread)
+        meta_py_r.ma_dataset_to_simple_binary_robj = lambda model, execute=True: None
+        job = analysis_runner.make_bootstrap_job(None, "binary", "binary.random", _PARAMS)
+        tools.assert_raises(analysis_runner.AnalysisError, job.run)
@@ -0,0 +1,128 @@
+####################################
+#                                  #
+# unit tests for packing datasets  #
+#  into the columnar store         #
+#                                  #
+####################################
+
+import cPickle as pickle
+import copy
+import os
+
+import nose
+from nose import tools
+
+import numpy as np
+
+import columnar_store
+import ma_dataset
+import meta_globals
+import oma_format
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_data")
+SAMPLE_FILES = ["BCG.oma", "amino.oma", "continuous.oma", "lymph.oma"]
+
+def _contents(dataset):
+    ''' everything in the studies of dataset, as nested lists '''
+    contents = []
+    for study in dataset.studies:
+        for outcome_name, follow_ups in sorted(study.outcomes_to_follow_ups.items()):
+            for follow_up, ma_unit in sorted(follow_ups.items()):
+                # (missing raw data, None or "", reads back as "")
+                raw_data = sorted([(name, ["" if x is None else x for x in group.raw_data]) \
+                                        for name, group in ma_unit.tx_groups.items()])
+                effects = sorted([(effect, sorted([(group_str, sorted(effect_d.items())) for \
+                                    group_str, effect_d in ma_unit.effects_dict[effect].items()])) \
+                                            for effect in ma_unit.effects_dict.keys()])
+                contents.append((study.id, outcome_name, follow_up, raw_data, effects))
+    return contents
+
+def _is_plain(dataset):
+    for study in dataset.studies:
+        for follow_ups in study.outcomes_to_follow_ups.values():
+            for ma_unit in follow_ups.values():
+                if type(ma_unit.effects_dict) is not dict:
+                    return False
+                if any([type(group.raw_data) is not list for group in ma_unit.tx_groups.values()]):
+                    return False
+    return True
+
+def _check_packed(dataset):
+    expected = _contents(dataset)
+    unpacked_pickle = pickle.dumps(dataset)
+    store = dataset.pack()
+    tools.assert_true(dataset.is_packed())
+    tools.assert_equal(_contents(dataset), expected)
+    # a packed dataset pickles (and copies) as the plain dataset it stands in for
+    for restored in (pickle.loads(pickle.dumps(dataset)), copy.deepcopy(dataset)):
+        tools.assert_true(_is_plain(restored))
+        tools.assert_equal(_contents(restored), expected)
+    tools.assert_equal(_contents(pickle.loads(unpacked_pickle)), expected)
+    dataset.unpack()
+    tools.assert_true(_is_plain(dataset))
+    tools.assert_equal(_contents(dataset), expected)
+    return store
+
+def _two_follow_up_dataset():
+    dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "BCG.oma"))
+    outcome_name = dataset.get_outcome_names()[0]
+    dataset.add_follow_up_to_outcome(outcome_name, "later")
+    dataset.add_outcome(ma_dataset.Outcome("second", meta_globals.BINARY))
+    group_names = dataset.get_group_names()
+    for i, study in enumerate(dataset.studies):
+        ma_unit = study.get_ma_unit(outcome_name, "later")
+        # some missing, some partly missing raw data
+        if i % 3 == 0:
+            ma_unit.set_raw_data_for_group(group_names[0], [i, 10*i + 10])
+        elif i % 3 == 1:
+            ma_unit.set_raw_data_for_group(group_names[0], [None, ""])
+        study.get_ma_unit("second", "first").set_raw_data_for_group(group_names[-1], [1, 2*i + 2])
+    return dataset, outcome_name, group_names
+
+def test_round_trip():
+    for file_name in SAMPLE_FILES:
+        yield check_round_trip, file_name
+
+def check_round_trip(file_name):
+    dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, file_name))
+    _check_packed(dataset)
+
+def test_empty():
+    _check_packed(ma_dataset.Dataset())
+    dataset = ma_dataset.Dataset()
+    dataset.add_study(ma_dataset.Study(1, name="only"))
+    store = _check_packed(dataset)
+    tools.assert_equal((store.n_rows, store.blocks), (1, {}))
+
+def test_outcomes_and_follow_ups():
+    dataset, outcome_name, group_names = _two_follow_up_dataset()
+    store = _check_packed(dataset)
+    follow_ups = dataset.studies[0].outcomes_to_follow_ups
+    tools.assert_true("later" in follow_ups[outcome_name])
+    tools.assert_equal(sorted(store.blocks.keys()),
+                       sorted([(name, follow_up) for name in follow_ups for follow_up in follow_ups[name]]))
+    events = store.get_raw_data_column(outcome_name, "later", group_names[0], 0)
+    tools.assert_equal(len(events), len(dataset.studies))
+    for i, x in enumerate(events):
+        if i % 3 == 0:
+            tools.assert_equal(x, i)
+        else:
+            tools.assert_true(np.isnan(x))
+
+def test_missing_values():
+    dataset, outcome_name, group_names = _two_follow_up_dataset()
+    dataset.pack()
+    study = dataset.studies[1]
+    raw_data = study.get_ma_unit(outcome_name, "later").get_raw_data_for_group(group_names[0])
+    tools.assert_equal(list(raw_data), ["", ""])
+    ma_unit = study.get_ma_unit(outcome_name, "first")
+    effect = ma_unit.effects_dict.keys()[0]
+    group_str = ma_unit.effects_dict[effect].keys()[0]
+    ma_unit.set_effect(effect, group_str, None)
+    tools.assert_true(ma_unit.get_estimate(effect, group_str) is None)
+    # studies added after packing are stored as usual
+    dataset.add_study(ma_dataset.Study(dataset.max_study_id() + 1))
+    tools.assert_raises(ValueError, dataset.columnar_store.row_for_study_id, dataset.max_study_id())
+    expected = _contents(dataset)
+    dataset.unpack()
+    tools.assert_equal(_contents(dataset), expected)
@@ -0,0 +1,81 @@
+####################################
+#                                  #
+# unit tests for (re)calculating   #
+#  the display scale values of     #
+#  many ma units at once           #
+#                                  #
+####################################
+
+import copy
+
+import nose
+from nose import tools
+
+import meta_globals
+import scale_conversion
+from ma_dataset import MetaAnalyticUnit, Outcome, calculate_display_effects_and_cis
+
+def _units():
+    outcome = Outcome("death", meta_globals.BINARY)
+    # (est, lower, upper, drop the SE?)
+    effects = [(0.1, -0.2, 0.4, False), (0.5, None, 1.2, True), (None, -1.0, 0.3, True),
+               (None, None, None, False), (-0.3, -0.9, None, True)]
+    units = []
+    for est, lower, upper, drop_se in effects:
+        unit = MetaAnalyticUnit(outcome)
+        unit.set_effect_and_ci("OR", "tx A-tx B", est, lower, upper, 1.96)
+        if drop_se:
+            unit.set_SE("OR", "tx A-tx B", None)
+        units.append(unit)
+    return units
+
+def test_same_as_one_at_a_time():
+    units = _units()
+    bulk_units = copy.deepcopy(units)
+    mult = 1.6448536269514722 # 90%
+    to_display_scale = lambda x: scale_conversion.convert_value(x, "OR", "binary")
+    for unit in units:
+        unit.calculate_display_effect_and_ci("OR", "tx A-tx B", to_display_scale,
+                                             conf_level=90.0, mult=mult, check_if_necessary=True)
+    tools.assert_equal(calculate_display_effects_and_cis(bulk_units, "OR", "tx A-tx B", "binary",
+                                                         90.0, mult, check_if_necessary=True), 5)
+
+    for unit, bulk_unit in zip(units, bulk_units):
+        expected = unit.get_effect_dict("OR", "tx A-tx B")
+        got = bulk_unit.get_effect_dict("OR", "tx A-tx B")
+        for key in ("display_est", "display_lower", "display_upper", "display_se", "display_conf_level"):
+            if expected[key] is None:
+                tools.assert_true(got[key] is None)
+            else:
+                tools.assert_almost_equal(expected[key], got[key])
+
+    # nothing to do at the same confidence level
+    tools.assert_equal(calculate_display_effects_and_cis(bulk_units, "OR", "tx A-tx B", "binary",
+                                                         90.0, mult, check_if_necessary=True), 0)
+
+def test_needs_n1():
+    # the Freeman-Tukey (PFT) display scale depends on each study's n1
+    outcome = Outcome("death", meta_globals.BINARY)
+    units, bulk_units = [], []
+    for est, n1 in [(0.3, 20), (0.5, 100), (0.2, "")]:
+        unit = MetaAnalyticUnit(outcome)
+        unit.add_group("tx A", raw_data=[5, n1])
+        unit.set_effect_and_ci("PFT", "tx A", est, est - 0.1, est + 0.1, 1.96)
+        bulk_units.append(copy.deepcopy(unit))
+        to_display_scale = lambda x: scale_conversion.convert_value(x, "PFT", "binary", n1=n1)
+        unit.calculate_display_effect_and_ci("PFT", "tx A", to_display_scale,
+                                             conf_level=95.0, mult=1.96)
+        units.append(unit)
+    tools.assert_raises(ValueError, calculate_display_effects_and_cis, bulk_units,
+                        "PFT", "tx A", "binary", 95.0, 1.96)
+    calculate_display_effects_and_cis(bulk_units, "PFT", "tx A", "binary", 95.0, 1.96, groups=["tx A"])
+
+    for unit, bulk_unit in zip(units, bulk_units):
+        expected = unit.get_effect_dict("PFT", "tx A")
+        got = bulk_unit.get_effect_dict("PFT", "tx A")
+        for key in ("display_est", "display_lower", "display_upper"):
+            if expected[key] is None:
+                tools.assert_true(got[key] is None)
+            else:
+                tools.assert_almost_equal(expected[key], got[key])
+    tools.assert_true(bulk_units[0].get_display_effect("PFT", "tx A") is not None)
@@ -0,0 +1,161 @@
+####################################
+#                                  #
+# unit tests for effect_sizes and  #
+#  scale_conversion; the numbers   #
+#  are cross-checked against R     #
+#  (metafor/openmetar)             #
+#                                  #
+####################################
+
+import nose
+from nose import tools
+import math
+
+import numpy as np
+
+import effect_sizes
+import scale_conversion
+
+# a few columns of raw data, including zero cells to exercise the
+# continuity correction and a study with missing data
+BINARY_DATA = {"e1":[10, 0, 25, 3, ""],
+               "n1":[100, 50, 80, 30, 40],
+               "e2":[15, 4, 20, 0, 12],
+               "n2":[110, 60, 75, 32, 44]}
+
+CONTINUOUS_DATA = {"n1":[20, 35, 50, 12],
+                   "m1":[5.5, 10.1, 7.0, 3.3],
+                   "sd1":[1.2, 3.4, 2.2, 0.9],
+                   "n2":[22, 31, 48, 15],
+                   "m2":[4.9, 11.0, 6.1, 2.8],
+                   "sd2":[1.4, 3.1, 2.0, 1.1]}
+
+DIAGNOSTIC_DATA = {"tp":[45, 30, 12, 0],
+                   "fn":[5, 10, 3, 7],
+                   "fp":[10, 0, 8, 4],
+                   "tn":[40, 60, 77, 39]}
+
+def _r_vec(values):
+    return "c(%s)" % ", ".join(["NA" if x in (None, "") else str(x) for x in values])
+
+def _r_column(r_str):
+    import meta_py_r
+    res = meta_py_r.execute_r_string(r_str)
+    return np.array([float(x) for x in res[0]]), np.array([float(x) for x in res[1]])
+
+def _assert_close(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    tools.assert_equal(a.shape, b.shape)
+    tools.assert_true(np.array_equal(np.isnan(a), np.isnan(b)))
+    ok = ~np.isnan(a)
+    tools.assert_true(np.allclose(a[ok], b[ok], rtol=1e-10, atol=1e-12))
+
+def test_mult():
+    for conf_level, expected in [(95, 1.959963984540054), (90, 1.6448536269514722),
+                                 (99, 2.5758293035489004), (80, 1.2815515655446004)]:
+        yield check_mult, conf_level, expected
+
+def check_mult(conf_level, expected):
+    tools.assert_almost_equal(effect_sizes.get_mult(conf_level), expected, places=12)
+
+def test_binary_two_arm_by_hand():
+    # a 2x2 table without zero cells, done by hand
+    e1, n1, e2, n2 = 10, 100, 15, 110
+    yi, vi = effect_sizes.binary_two_arm("OR", [e1], [n1], [e2], [n2])
+    tools.assert_almost_equal(yi[0], math.log((10.0*95)/(90*15)))
+    tools.assert_almost_equal(vi[0], 1/10.0 + 1/90.0 + 1/15.0 + 1/95.0)
+
+    # a zero cell; 1/2 is added to every cell of the table
+    yi, vi = effect_sizes.binary_two_arm("OR", [0], [50], [4], [60])
+    tools.assert_almost_equal(yi[0], math.log((0.5*56.5)/(50.5*4.5)))
+
+def test_missing_data_gives_nan():
+    ests, lowers, uppers, ses = effect_sizes.binary_effects("OR", [None], [10], [2], [10])
+    tools.assert_true(np.isnan(ests[0]) and np.isnan(ses[0]))
+    tools.assert_equal(effect_sizes.to_list(ests), [None])
+
+def test_one_arm_continuous_se():
+    ests, lowers, uppers, ses = effect_sizes.continuous_effects("TX Mean", [25], [3.0], [2.0])
+    tools.assert_almost_equal(ses[0], 2.0/5.0)
+
+def test_binary_against_escalc():
+    d = BINARY_DATA
+    for metric in effect_sizes.BINARY_TWO_ARM:
+        r_str = "escalc(measure='%s', ai=%s, n1i=%s, ci=%s, n2i=%s)" % \
+                    (metric, _r_vec(d["e1"]), _r_vec(d["n1"]), _r_vec(d["e2"]), _r_vec(d["n2"]))
+        yield check_against_r, effect_sizes.binary_two_arm(metric, d["e1"], d["n1"], d["e2"], d["n2"]), r_str
+    for metric in effect_sizes.BINARY_ONE_ARM:
+        r_str = "escalc(measure='%s', xi=%s, ni=%s)" % (metric, _r_vec(d["e1"]), _r_vec(d["n1"]))
+        yield check_against_r, effect_sizes.binary_one_arm(metric, d["e1"], d["n1"]), r_str
+
+def test_continuous_against_escalc():
+    d = CONTINUOUS_DATA
+    for metric in effect_sizes.CONTINUOUS_TWO_ARM:
+        r_str = "escalc('%s', n1i=%s, n2i=%s, m1i=%s, m2i=%s, sd1i=%s, sd2i=%s)" % \
+                    (metric, _r_vec(d["n1"]), _r_vec(d["n2"]), _r_vec(d["m1"]),
+                     _r_vec(d["m2"]), _r_vec(d["sd1"]), _r_vec(d["sd2"]))
+        py_res = effect_sizes.continuous_two_arm(metric, d["n1"], d["m1"], d["sd1"],
+                                                 d["n2"], d["m2"], d["sd2"])
+        yield check_against_r, py_res, r_str
+
+def check_against_r(py_res, r_str):
+    r_yi, r_vi = _r_column(r_str)
+    _assert_close(py_res[0], r_yi)
+    _assert_close(py_res[1], r_vi)
+
+def test_diagnostic_against_openmetar():
+    d = DIAGNOSTIC_DATA
+    for metric in effect_sizes.DIAGNOSTIC:
+        yield check_diagnostic_against_r, metric, 95.0
+    yield check_diagnostic_against_r, "Sens", 90.0
+
+def check_diagnostic_against_r(metric, conf_level):
+    import meta_py_r
+    d = DIAGNOSTIC_DATA
+    meta_py_r.execute_r_string("diag.tmp <- new('DiagnosticData', TP=%s, FN=%s, TN=%s, FP=%s)" % \
+                                (_r_vec(d["tp"]), _r_vec(d["fn"]), _r_vec(d["tn"]), _r_vec(d["fp"])))
+    r_res = meta_py_r.execute_r_string("get.res.for.one.diag.study(diag.tmp, \
+                    list('to'='only0', 'measure'='%s', 'conf.level'=%s, 'adjust'=.5))" % (metric, conf_level))
+    ests, lowers, uppers, ses = effect_sizes.diagnostic_effects(metric,
+                                    d["tp"], d["fn"], d["fp"], d["tn"], conf_level=conf_level)
+    for py_col, r_col in zip([ests, lowers, uppers, ses], r_res):
+        _assert_close(py_col, [float(x) for x in r_col])
+
+##################### display/calculation scales #######################
+SCALE_METRICS = [("binary", m) for m in effect_sizes.BINARY_TWO_ARM + effect_sizes.BINARY_ONE_ARM] + \
+                [("continuous", m) for m in effect_sizes.CONTINUOUS_TWO_ARM + effect_sizes.CONTINUOUS_ONE_ARM] + \
+                [("diagnostic", m) for m in effect_sizes.DIAGNOSTIC]
+
+def test_scale_round_trip():
+    for data_type, metric in SCALE_METRICS:
+        yield check_scale_round_trip, data_type, metric
+
+def check_scale_round_trip(data_type, metric):
+    calc_vals = [-0.4, 0.1, 0.6]
+    if metric in ("PFT", "PAS"):
+        # these are (inverse) arcsines of proportions
+        calc_vals = [0.2, 0.5, 0.9]
+    disp = scale_conversion.convert_scale(calc_vals, metric, data_type, n1=40)
+    back = scale_conversion.convert_scale(disp, metric, data_type, convert_to="calc.scale", n1=40)
+    if metric == "PFT":
+        # the freeman-tukey transformation is only approximately invertible
+        tools.assert_true(np.allclose(back, calc_vals, atol=1e-2))
+    else:
+        _assert_close(back, calc_vals)
+
+def test_scale_missing_values():
+    tools.assert_equal(scale_conversion.convert_value(None, "OR", "binary"), None)
+    tools.assert_equal(scale_conversion.convert_value("", "OR", "binary"), None)
+    tools.assert_true(np.isnan(scale_conversion.convert_scale([None, 0.0], "OR", "binary")[0]))
+
+def test_scale_against_transform_f():
+    for data_type, metric in SCALE_METRICS:
+        yield check_scale_against_r, data_type, metric
+
+def check_scale_against_r(data_type, metric):
+    import meta_py_r
+    calc_vals = [0.2, 0.5, 0.9]
+    meta_py_r.execute_r_string("trans.f <- %s.transform.f('%s')" % (data_type, metric))
+    r_vals = meta_py_r.execute_r_string("trans.f$display.scale(%s, ni=c(40, 40, 40))" % _r_vec(calc_vals))
+    _assert_close(scale_conversion.convert_scale(calc_vals, metric, data_type, n1=40),
+                  [float(x) for x in r_vals])
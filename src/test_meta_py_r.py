@@ -0,0 +1,124 @@
+####################################
+#                                  #
+# unit tests for the parts of      #
+#  meta_py_r that don't need R     #
+#                                  #
+####################################
+
+import re
+import threading
+
+import nose
+from nose import tools
+
+import meta_py_r
+import r_tracing
+
+@meta_py_r.NonBlockingRfunctionCaller
+def _gui_call(x):
+    return x
+
+def test_gui_calls_dont_wait_for_R():
+    tools.assert_equal(_gui_call(1), 1)
+
+    # while another thread (i.e., the analysis runner) has R...
+    has_R, done = threading.Event(), threading.Event()
+    def hold_R():
+        meta_py_r.R_LOCK.acquire()
+        try:
+            has_R.set()
+            done.wait()
+        finally:
+            meta_py_r.R_LOCK.release()
+    runner = threading.Thread(target=hold_R)
+    runner.start()
+    try:
+        has_R.wait()
+        tools.assert_raises(meta_py_r.RBusy, _gui_call, 1)
+    finally:
+        done.set()
+        runner.join()
+    tools.assert_equal(_gui_call(2), 2)
+
+    # ... but the thread holding R can always use it
+    meta_py_r.R_LOCK.acquire()
+    try:
+        tools.assert_equal(_gui_call(3), 3)
+    finally:
+        meta_py_r.R_LOCK.release()
+
+class _Covariate:
+    name, data_type = "dose", meta_py_r.CONTINUOUS
+
+class _Dataset:
+    def get_values_for_cov(self, cov_name, ids_for_keys=False):
+        return {1:0.5, 2:None}
+
+def test_covariate_values():
+    cov_values = meta_py_r._covariate_values(_Covariate(), [2, 1], _Dataset())
+    tools.assert_equal(cov_values["cov.vals"], [None, 0.5])
+    tools.assert_equal(cov_values["ref.var"], u"NA")
+
+    # no studies (e.g., every study was excluded)
+    cov_values = meta_py_r._covariate_values(_Covariate(), [], _Dataset())
+    tools.assert_equal(cov_values["cov.vals"], [])
+    tools.assert_equal(cov_values["ref.var"], u"NA")
+
+def test_R_calls_are_traced_and_locked():
+    r_tracing.reset()
+    holds_R = meta_py_r._traced_R_call("f(1, 2, 3)", 3, meta_py_r.R_LOCK._is_owned)
+    tools.assert_true(holds_R)
+    tools.assert_false(meta_py_r.R_LOCK._is_owned())
+
+    def fail():
+        raise ValueError("error in R")
+    tools.assert_raises(ValueError, meta_py_r._traced_R_call, "g()", 0, fail, reset_on_error=False)
+
+    totals = r_tracing.TRACER.totals()
+    tools.assert_equal((totals.count, totals.errors, totals.total_size), (2, 1, 3))
+    r_tracing.reset()
+
+class TestPermutationTest:
+    ''' run_permutation_test, with an R that has exact_iter distinct permutations '''
+    def setUp(self):
+        self.originals = dict([(name, getattr(meta_py_r, name)) for name in \
+                                    ("execute_r_string", "r_to_py", "parse_out_results")])
+        meta_py_r.execute_r_string = self._execute_r_string
+        meta_py_r.r_to_py = lambda r_obj, keep_names=False: r_obj
+        meta_py_r.parse_out_results = lambda result: result
+        self.counts = None
+
+    def tearDown(self):
+        for name, original in self.originals.items():
+            setattr(meta_py_r, name, original)
+
+    def _execute_r_string(self, r_str):
+        match = re.search(r"permutation.counts\(perm.model, (\d+), \d+, max.iter=(\d+)\)", r_str)
+        if match is not None:
+            size, max_iter = int(match.group(1)), int(match.group(2))
+            if self.exact_iter <= max_iter:
+                self.counts = {"iter":self.exact_iter, "exact":True}
+            else:
+                n_done = self.counts["iter"] if self.counts is not None else 0
+                self.counts = {"iter":n_done + size, "exact":False}
+        elif r_str.startswith("permutation.pvals("):
+            return dict(self.counts, **{"QMp":0.5, "QMp.se":0.1, "QMp.ci.lb":0.3, "QMp.ci.ub":0.7})
+        return r_str
+
+    def _run(self, iter):
+        progress = []
+        meta_py_r.run_permutation_test("permuted.ma", {}, iter, chunk_size=1000, ci_halfwidth=None,
+                                       progress_f=lambda done, total, pvals: progress.append((done, total)))
+        return progress
+
+    def test_random_permutations(self):
+        self.exact_iter = 2**20
+        tools.assert_equal(self._run(2500), [(1000, 2500), (2000, 2500), (2500, 2500)])
+
+    def test_exact_test(self):
+        # 2^k <= iter: all of the permutations, in one go
+        self.exact_iter = 2**11
+        tools.assert_equal(self._run(2500), [(2**11, 2**11)])
+        self.counts = None
+        self.exact_iter = 2**8
+        tools.assert_equal(self._run(2500), [(2**8, 2**8)])
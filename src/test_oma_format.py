@@ -0,0 +1,266 @@
+####################################
+#                                  #
+# unit tests for the oma_format    #
+#  and oma_journal modules         #
+#  (reading and writing .oma files)#
+#                                  #
+####################################
+
+import cPickle
+import mmap
+import os
+import shutil
+import tempfile
+
+import nose
+from nose import tools
+import numpy as np
+from PyQt4.QtCore import QString
+from PyQt4.QtGui import QUndoCommand, QUndoStack
+
+import ma_dataset
+import oma_format
+import oma_journal
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_data")
+SAMPLE_FILES = ["BCG.oma", "amino.oma", "continuous.oma", "lymph.oma"]
+
+def _contents(dataset):
+    ''' everything in the studies of dataset, as nested lists '''
+    contents = []
+    for study in dataset.studies:
+        for outcome_name, follow_ups in sorted(study.outcomes_to_follow_ups.items()):
+            for follow_up, ma_unit in sorted(follow_ups.items()):
+                raw_data = sorted([(name, list(group.raw_data)) for name, group in ma_unit.tx_groups.items()])
+                effects = sorted([(effect, sorted([(group_str, sorted(effect_d.items())) for \
+                                    group_str, effect_d in ma_unit.effects_dict[effect].items()])) \
+                                            for effect in ma_unit.effects_dict.keys()])
+                contents.append((study.id, study.name, study.year, study.include, study.covariate_dict,
+                                 outcome_name, follow_up, raw_data, effects))
+    return contents
+
+class TestOmaFormat:
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        for file_name in SAMPLE_FILES:
+            yield self.check_round_trip, file_name
+
+    def check_round_trip(self, file_name):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, file_name))
+        out_path = os.path.join(self.tmp_dir, file_name)
+        for compress in (False, True):
+            oma_format.save_dataset(dataset, out_path, state={"conf_level":90.0},
+                                    compress=compress, append=False)
+            tools.assert_true(oma_format.is_v2_file(out_path))
+            new_dataset, new_state = oma_format.load(out_path)
+            tools.assert_equal(_contents(new_dataset), _contents(dataset))
+            tools.assert_equal(new_dataset.get_outcome_names(), dataset.get_outcome_names())
+            tools.assert_equal(new_state, {"conf_level":90.0})
+
+    def test_append_save(self):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "BCG.oma"))
+        out_path = os.path.join(self.tmp_dir, "BCG.oma")
+        oma_format.save_dataset(dataset, out_path)
+        size = os.path.getsize(out_path)
+
+        # nothing changed, so only a new index is written
+        save_info = oma_format.save_dataset(dataset, out_path)
+        tools.assert_true(save_info["bytes_written"] < size/10)
+
+        study = dataset.studies[0]
+        ma_unit = study.get_ma_unit("tuberculosis", "first")
+        ma_unit.get_raw_data_for_group("tx A")[0] = 42.0
+        oma_format.save_dataset(dataset, out_path)
+        tools.assert_equal(_contents(oma_format.load(out_path)[0]), _contents(dataset))
+
+        # an interrupted save leaves us with the previous version
+        f = open(out_path, "ab")
+        f.write("\0" * 100)
+        f.close()
+        tools.assert_equal(_contents(oma_format.load(out_path)[0]), _contents(dataset))
+
+    def test_read_single_outcome(self):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "amino.oma"))
+        out_path = os.path.join(self.tmp_dir, "amino.oma")
+        oma_format.save_dataset(dataset, out_path)
+        reader = oma_format.OmaReader(out_path)
+        try:
+            tools.assert_equal(reader.get_outcome_names(), dataset.get_outcome_names())
+            partial = reader.read_dataset(outcome_names=["nephrotoxic"], packed=True)
+        finally:
+            reader.close()
+        tools.assert_true(partial.is_packed())
+        tools.assert_equal(partial.get_outcome_names(), ["nephrotoxic"])
+        tools.assert_equal(len(partial.studies), len(dataset.studies))
+
+    def test_outcomes_are_built_on_first_access(self):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "amino.oma"))
+        out_path = os.path.join(self.tmp_dir, "amino.oma")
+        oma_format.save_dataset(dataset, out_path)
+        lazy_dataset, state = oma_format.load(out_path)
+        studies = lazy_dataset.studies
+        tools.assert_true("nephrotoxic" in studies[0].outcomes_to_follow_ups._pending)
+        tools.assert_equal(sorted(studies[0].outcomes_to_follow_ups.keys()),
+                           sorted(dataset.studies[0].outcomes_to_follow_ups.keys()))
+
+        # looking an outcome up in one study builds it for all of them
+        studies[0].outcomes_to_follow_ups["nephrotoxic"]
+        for study in studies:
+            tools.assert_false("nephrotoxic" in study.outcomes_to_follow_ups._pending)
+            tools.assert_true(isinstance(study.get_ma_unit("nephrotoxic", "first").effects_dict, dict))
+        tools.assert_true(studies[0].outcomes_to_follow_ups._pending)
+        tools.assert_equal(_contents(lazy_dataset), _contents(dataset))
+        # which pickles as a plain dictionary
+        unpickled = cPickle.loads(cPickle.dumps(studies[1]))
+        tools.assert_equal(type(unpickled.outcomes_to_follow_ups), dict)
+        tools.assert_equal(sorted(unpickled.outcomes_to_follow_ups.keys()),
+                           sorted(dataset.studies[1].outcomes_to_follow_ups.keys()))
+
+    def test_packed_arrays_are_mapped(self):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "BCG.oma"))
+        out_path = os.path.join(self.tmp_dir, "BCG.oma")
+        oma_format.save_dataset(dataset, out_path)
+        reader = oma_format.OmaReader(out_path)
+        try:
+            packed = reader.read_dataset(packed=True)
+        finally:
+            reader.close()
+
+        ma_unit = packed.studies[0].get_ma_unit("tuberculosis", "first")
+        raw_data = ma_unit.get_raw_data_for_group("tx A")
+        if oma_format._MAP_IN_PLACE:
+            base = raw_data.array
+            while isinstance(base, np.ndarray):
+                base = base.base
+            tools.assert_true(isinstance(base, mmap.mmap))
+        # (the mapping is copy-on-write)
+        raw_data[0] = 42.0
+        tools.assert_equal(packed.studies[0].get_ma_unit("tuberculosis", "first").get_raw_data_for_group("tx A")[0],
+                           42.0)
+        tools.assert_equal(_contents(oma_format.load(out_path)[0]), _contents(dataset))
+
+    def test_state_round_trip(self):
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "BCG.oma"))
+        dataset.title = u"BCG vaccine \u2013 tuberculosis"
+        dataset.summary = QString(u"summary")
+        dataset.notes = "notes"
+        # as in DatasetModel.get_stateful_dict
+        state = {"NAME":0, "YEAR":1, "RAW_DATA":(2, 3, 4, 5), "OUTCOMES":(6, 7, 8),
+                 "HEADERS":["study name", "year", QString(u"tx A")],
+                 "current_outcome":"tuberculosis", "current_time_point":0,
+                 "current_txs":["tx A", "tx B"], "current_effect":"OR",
+                 "study_auto_added":None, "conf_level":95.0,
+                 "widths":{0:100, 1:50}, "__odd key__":"\xff"}
+        out_path = os.path.join(self.tmp_dir, "BCG.oma")
+        oma_format.save_dataset(dataset, out_path, state=state)
+        new_dataset, new_state = oma_format.load(out_path)
+
+        tools.assert_equal(new_state, state)
+        for key, value in state.items():
+            tools.assert_equal(type(new_state[key]), type(value))
+        tools.assert_equal(type(new_state["HEADERS"][2]), QString)
+        for attr in ("title", "summary", "notes", "is_diag", "num_outcomes"):
+            tools.assert_equal(getattr(new_dataset, attr), getattr(dataset, attr))
+            tools.assert_equal(type(getattr(new_dataset, attr)), type(getattr(dataset, attr)))
+
+    def test_non_ascii_round_trip(self):
+        # study names, notes and factor covariates' values are whatever was typed in
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "BCG.oma"))
+        dataset.add_covariate(ma_dataset.Covariate("city", "factor"))
+        studies = dataset.studies[:4]
+        studies[0].name, studies[0].notes = "M\xfcller", u"n\xf6tes"
+        studies[1].name, studies[1].notes = u"S\xf8rensen", QString(u"r\xe9sum\xe9")
+        studies[2].name, studies[2].notes = QString(u"Garc\xeda"), "plain"
+        for study, city in zip(studies, ["Z\xfcrich", u"K\xf8benhavn", QString(u"Malm\xf6"), "Bern"]):
+            study.covariate_dict["city"] = city
+        out_path = os.path.join(self.tmp_dir, "BCG.oma")
+        oma_format.save_dataset(dataset, out_path)
+        new_dataset = oma_format.load(out_path)[0]
+
+        for study, new_study in zip(studies, new_dataset.studies):
+            for old, new in [(study.name, new_study.name), (study.notes, new_study.notes),
+                             (study.covariate_dict["city"], new_study.covariate_dict["city"])]:
+                tools.assert_equal(new, old)
+                tools.assert_equal(type(new), type(old))
+
+class _CommandEditNotes(QUndoCommand):
+    ''' sets the notes of a study; like the spreadsheet's commands, records which study changed '''
+    def __init__(self, study, notes, record=True):
+        QUndoCommand.__init__(self, "edit notes")
+        self.study, self.notes, self.old_notes = study, notes, study.notes
+        self.record = record
+
+    def redo(self):
+        self.study.notes = self.notes
+        if self.record:
+            self.dirty_study_ids = [self.study.id]
+
+    def undo(self):
+        self.study.notes = self.old_notes
+        if self.record:
+            self.dirty_study_ids = [self.study.id]
+
+class TestJournal:
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "amino.oma")
+        dataset, state = oma_format.load(os.path.join(SAMPLE_DATA_DIR, "amino.oma"))
+        oma_journal.JournaledSaver(self.path).save(dataset)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_only_changed_studies_are_written(self):
+        dataset, state = oma_journal.load(self.path)
+        saver = oma_journal.JournaledSaver(self.path, dataset)
+        dataset.studies[2].name = u"renamed"
+        dataset.studies.pop(0)
+        dataset.add_study(ma_dataset.Study(1000, name=u"new study"))
+        save_info = saver.save(dataset, state={"conf_level":95.0})
+        tools.assert_false(save_info["checkpoint"])
+        tools.assert_equal(save_info["studies_written"], 2)
+
+        new_dataset, new_state = oma_journal.load(self.path)
+        tools.assert_equal(_contents(new_dataset), _contents(dataset))
+        tools.assert_equal(new_state, {"conf_level":95.0})
+
+        # a partially written journal entry is ignored
+        f = open(self.path + oma_journal.JOURNAL_EXTENSION, "ab")
+        f.write(oma_journal.JOURNAL_ENTRY + "\0" * 20)
+        f.close()
+        tools.assert_equal(_contents(oma_journal.load(self.path)[0]), _contents(dataset))
+
+    def test_dirty_studies_from_the_undo_stack(self):
+        dataset, state = oma_journal.load(self.path)
+        saver = oma_journal.JournaledSaver(self.path, dataset)
+        undo_stack = QUndoStack()
+        saver.attach_undo_stack(undo_stack)
+
+        undo_stack.push(_CommandEditNotes(dataset.studies[3], u"edited"))
+        tools.assert_equal(saver.save(dataset)["studies_written"], 1)
+        undo_stack.undo()
+        tools.assert_equal(saver.save(dataset)["studies_written"], 1)
+        tools.assert_equal(_contents(oma_journal.load(self.path)[0]), _contents(dataset))
+
+        # a change the undo stack does not know about is only picked up
+        # once a command that doesn't record its studies forces us to look
+        dataset.studies[5].notes = u"edited behind the back of the undo stack"
+        undo_stack.push(_CommandEditNotes(dataset.studies[4], u"edited", record=False))
+        tools.assert_equal(saver.save(dataset)["studies_written"], 2)
+        tools.assert_equal(_contents(oma_journal.load(self.path)[0]), _contents(dataset))
+        tools.assert_equal(oma_journal.load(self.path)[0].studies[5].notes,
+                           u"edited behind the back of the undo stack")
+
+    def test_compact(self):
+        dataset, state = oma_journal.load(self.path)
+        saver = oma_journal.JournaledSaver(self.path, dataset)
+        dataset.studies[0].notes = u"some notes"
+        saver.save(dataset)
+        saver.compact()
+        tools.assert_equal(_contents(oma_format.load(self.path)[0]), _contents(dataset))
+        tools.assert_equal(_contents(oma_journal.load(self.path)[0]), _contents(dataset))
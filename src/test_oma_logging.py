@@ -0,0 +1,30 @@
+####################################
+#                                  #
+# unit tests for the (per-module)  #
+#  log levels                      #
+#                                  #
+####################################
+
+import logging
+
+import nose
+from nose import tools
+
+import oma_logging
+
+def test_levels():
+    tools.assert_equal(oma_logging.parse_levels("info, meta_py_r=DEBUG,ma_dataset=bogus"),
+                       {None:logging.INFO, "meta_py_r":logging.DEBUG})
+
+    logger = oma_logging.get_logger("some.package.ma_data_table_model")
+    tools.assert_equal(logger.name, "oma.ma_data_table_model")
+    # quiet by default
+    tools.assert_false(logger.isEnabledFor(logging.INFO))
+    try:
+        oma_logging.set_levels("info,ma_data_table_model=debug")
+        tools.assert_true(logger.isEnabledFor(logging.DEBUG))
+        tools.assert_true(oma_logging.get_logger("meta_py_r").isEnabledFor(logging.INFO))
+        tools.assert_false(oma_logging.get_logger("meta_py_r").isEnabledFor(logging.DEBUG))
+    finally:
+        oma_logging.set_level(oma_logging.DEFAULT_LEVEL)
+        oma_logging.set_level(logging.NOTSET, "ma_data_table_model")
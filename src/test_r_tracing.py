@@ -0,0 +1,41 @@
+####################################
+#                                  #
+# unit tests for the tracing of    #
+#  the calls to R                  #
+#                                  #
+####################################
+
+import nose
+from nose import tools
+
+import r_tracing
+
+def test_stats():
+    tracer = r_tracing.RCallTracer()
+    tracer.record("a > impute_cont_data", 0.0005, 10)
+    tracer.record("a > impute_cont_data", 0.030, 30, error=True, snippet="x"*1000)
+    tracer.record("b > execute_r_string", 20.0, 5)
+
+    stats = tracer.stats()
+    tools.assert_equal(sorted(stats.keys()), ["a > impute_cont_data", "b > execute_r_string"])
+    impute = stats["a > impute_cont_data"]
+    tools.assert_equal((impute.count, impute.errors, impute.total_size), (2, 1, 40))
+    tools.assert_almost_equal(impute.max_time, 0.030)
+
+    totals = tracer.totals()
+    tools.assert_equal(totals.count, 3)
+    # <= 1ms, <= 50ms and > 10s
+    tools.assert_equal(totals.histogram[0], 1)
+    tools.assert_equal(totals.histogram[r_tracing.HISTOGRAM_BUCKETS_MS.index(50)], 1)
+    tools.assert_equal(totals.histogram[-1], 1)
+
+    tools.assert_equal(len(tracer.recent_calls()[1][-1]), r_tracing.SNIPPET_LENGTH)
+    tracer.reset()
+    tools.assert_equal(tracer.totals().count, 0)
+
+def _outer():
+    return r_tracing.find_caller(__name__)
+
+def test_find_caller():
+    # the outermost function in the module, and who called it
+    tools.assert_true(_outer().endswith(" > test_find_caller"))
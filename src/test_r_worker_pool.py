@@ -0,0 +1,51 @@
+####################################
+#                                  #
+# unit tests for splitting up and  #
+#  merging (diagnostic) analyses   #
+#  for the R worker pool           #
+#                                  #
+####################################
+
+import nose
+from nose import tools
+
+import r_worker_pool
+
+def _results(texts, image_order, values=None):
+    return {"images":dict([(name, "./r_tmp/%s.png" % name) for name in image_order]),
+            "image_var_names":{"forest plot":"forest.plot"},
+            "texts":texts,
+            "image_params_paths":dict([(name, "r_tmp/%s" % name) for name in image_order]),
+            "image_order":image_order,
+            "values":values or {}}
+
+def test_diagnostic_groups():
+    metrics = ["Sens", "Spec", "NLR", "PLR", "DOR"]
+    methods = ["diagnostic.dl"]*len(metrics)
+    params = [{"measure":metric} for metric in metrics]
+    groups = r_worker_pool.diagnostic_groups(methods, params)
+    tools.assert_equal([[p["measure"] for p in group_params] for group_methods, group_params in groups],
+                       [["Sens", "Spec"], ["NLR", "PLR"], ["DOR"]])
+
+    # unpaired metrics are analyzed on their own
+    params = [{"measure":metric} for metric in ["PLR", "Spec", "NLR"]]
+    groups = r_worker_pool.diagnostic_groups(methods[:3], params)
+    tools.assert_equal([[p["measure"] for p in group_params] for group_methods, group_params in groups],
+                       [["NLR", "PLR"], ["Spec"]])
+
+def test_merge_results():
+    sens_spec = _results({"Sensitivity Summary":"a", "Specificity Summary":"b",
+                          "References":"1. metafor\n2. DL\n"}, ["Sensitivity and Specificity Forest Plot", "SROC"],
+                         values={"Sensitivity":{"b":0.8}, "Specificity":{"b":0.7}})
+    dor = _results({"Diagnostic Odds Ratio Summary":"c", "References":"1. DL\n2. metafor\n3. DOR\n"},
+                   ["Diagnostic Odds Ratio Forest Plot"], values={"Diagnostic Odds Ratio":{"b":1.5, "tau2":0.0}})
+    merged = r_worker_pool.merge_results([sens_spec, dor])
+    tools.assert_equal(merged["image_order"], ["Sensitivity and Specificity Forest Plot", "SROC",
+                                               "Diagnostic Odds Ratio Forest Plot"])
+    tools.assert_equal(sorted(merged["texts"].keys()), ["Diagnostic Odds Ratio Summary", "References",
+                                                 "Sensitivity Summary", "Specificity Summary"])
+    tools.assert_equal(merged["texts"]["References"], "1. DL\n2. DOR\n3. metafor\n")
+    tools.assert_equal(len(merged["images"]), 3)
+    tools.assert_equal(merged["values"], {"Sensitivity":{"b":0.8}, "Specificity":{"b":0.7},
+                                          "Diagnostic Odds Ratio":{"b":1.5, "tau2":0.0}})
+    tools.assert_equal(r_worker_pool.merge_results([dor]), dor)
@@ -0,0 +1,27 @@
+####################################
+#                                  #
+# unit tests for the startup       #
+#  profiler                        #
+#                                  #
+####################################
+
+import nose
+from nose import tools
+
+import startup_profiler
+
+def test_spans():
+    profiler = startup_profiler.StartupProfiler()
+    profiler.begin("create main window")
+    profiler.timed("import forms", lambda: None)
+    profiler.end()
+    profiler.timed("first paint", lambda: None)
+
+    tools.assert_equal([name for name, duration in profiler.top_level_spans()],
+                       ["create main window", "first paint"])
+    folded = [line.rsplit(" ", 1)[0] for line in profiler.folded_stacks()]
+    tools.assert_equal(folded, ["create main window", "create main window;import forms",
+                                "first paint"])
+    events = profiler.trace_events()["traceEvents"]
+    tools.assert_equal(sorted([event["name"] for event in events]),
+                       ["create main window", "first paint", "import forms"])
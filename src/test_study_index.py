@@ -0,0 +1,59 @@
+####################################
+#                                  #
+# unit tests for the study id      #
+#  index kept by Dataset           #
+#                                  #
+####################################
+
+import copy
+import pickle
+
+import nose
+from nose import tools
+
+from ma_dataset import Dataset, Study, StudyList
+
+def _dataset(ids):
+    dataset = Dataset()
+    for study_id in ids:
+        dataset.add_study(Study(study_id, name="study %s" % study_id))
+    return dataset
+
+def test_lookups():
+    dataset = _dataset([3, 1, 7])
+    tools.assert_equal(dataset.get_study_index(7), 2)
+    tools.assert_equal(dataset.get_study_by_id(1).name, "study 1")
+    tools.assert_true(dataset.get_study_by_id(5) is None)
+    tools.assert_equal(dataset.max_study_id(), 7)
+    tools.assert_equal(Dataset().max_study_id(), -1)
+
+def test_kept_consistent():
+    dataset = _dataset([3, 1, 7])
+    dataset.max_study_id()
+    dataset.add_study(Study(9))
+    tools.assert_equal((dataset.max_study_id(), dataset.get_study_index(9)), (9, 3))
+    dataset.add_study(Study(4), study_index=0)
+    tools.assert_equal(dataset.get_study_index(3), 1)
+    dataset.remove_study(9)
+    tools.assert_equal(dataset.max_study_id(), 7)
+    dataset.studies.pop(0)
+    dataset.studies.reverse()
+    tools.assert_equal([dataset.get_study_index(an_id) for an_id in (7, 1, 3, 4)], [0, 1, 2, None])
+    dataset.sort_studies("name", reverse=False)
+    tools.assert_equal(dataset.get_study_index(7), 2)
+    # a plain list assigned to the studies is picked up, too
+    dataset.studies = [Study(2)]
+    tools.assert_equal(dataset.get_study_index(2), 0)
+    tools.assert_true(isinstance(dataset.studies, StudyList))
+
+def test_copies():
+    dataset = _dataset([3, 1, 7])
+    for copied in (copy.copy(dataset), copy.deepcopy(dataset),
+                   pickle.loads(pickle.dumps(dataset, 2)), dataset.copy()):
+        tools.assert_true(isinstance(copied.studies, StudyList))
+        tools.assert_equal(copied.get_study_index(1), 1)
+    # (saved as a plain list)
+    tools.assert_equal(type(dataset.__getstate__()["studies"]), list)
+
+if __name__ == "__main__":
+    nose.main()